@@ -7,6 +7,23 @@ import re
 from PIL import Image, ImageFile
 import natsort
 import traceback
+import zipfile
+
+# Add project root to sys.path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from backend.shared_utils.image_decode import apply_draft_for_width, DECODE_MODE_FAST
+from backend.shared_utils.image_backend import get_image_backend, BACKEND_AUTO
+from backend.shared_utils.page_color import is_effectively_grayscale
+from backend.shared_utils.image_archive import (
+    is_image_archive, archive_project_name, list_archive_images, open_image_source, source_display_name,
+    close_image_sources
+)
+from backend.shared_utils.output_profiles import OutputProfile, parse_output_profiles, profile_file_suffix
+from backend.shared_utils.page_dedup import (
+    PageDeduplicator, report_duplicates, DEDUP_OFF, DEDUP_SKIP, DEDUP_MODES, HASH_DHASH, DEFAULT_MAX_DISTANCE
+)
 
 # --- 全局配置 ---
 ImageFile.LOAD_TRUNCATED_IMAGES = True
@@ -18,6 +35,16 @@ IMAGE_EXTENSIONS_FOR_MERGE = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif',
 # --- PDF页面与图像质量设置 ---
 PDF_TARGET_PAGE_WIDTH_PIXELS = 1600
 PDF_DPI = 300
+PDF_IMAGE_JPEG_QUALITY = None  # None 表示使用 Pillow 默认的 JPEG 质量
+ENABLE_GRAYSCALE_PAGES = True  # 检测实际为灰度的页面并以 8 位灰度写入 PDF（更小、更快）
+# 源图解码模式: "fast" 对比目标宽度更宽的 JPEG 源图使用 draft 缩小解码（更快）；"quality" 始终全分辨率解码
+DECODE_SPEED_MODE = DECODE_MODE_FAST
+# 缩放使用的图片后端: "auto" 在安装了 pyvips / cv2 时自动使用多线程加速后端，否则使用 Pillow
+IMAGE_BACKEND = BACKEND_AUTO
+# 重复页面检测: "off" 关闭，"flag" 只报告，"skip" 不写入已在之前文件夹中出现过的页面（感知哈希，缓存在根目录）
+PAGE_DEDUP_MODE = DEDUP_OFF
+PAGE_DEDUP_HASH = HASH_DHASH  # "dhash" 或 "phash"（需要 numpy）
+PAGE_DEDUP_MAX_DISTANCE = DEFAULT_MAX_DISTANCE
 # --- 全局配置结束 ---
 
 
@@ -65,22 +92,66 @@ def find_image_folders(root_dir, excluded_dirs):
     return sorted_folders
 
 
-def create_pdf_from_images(image_paths_list, output_pdf_path,
-                           target_page_width_px, pdf_target_dpi):
+def find_image_archives(root_dir, excluded_dirs):
     """
-    从一系列图片文件路径创建一个PDF文件。
+    递归查找所有 CBZ / ZIP 压缩包，它们会被直接读取（不解压）并各自转换为一个PDF。
+    """
+    excluded_basenames = [os.path.basename(d) for d in excluded_dirs]
+    archives = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        if os.path.basename(dirpath) in excluded_basenames:
+            dirnames[:] = []
+            continue
+        archives.extend(os.path.join(dirpath, f) for f in filenames
+                        if not f.startswith('.') and is_image_archive(os.path.join(dirpath, f)))
+    sorted_archives = natsort.natsorted(archives)
+    if sorted_archives:
+        print(f"    📦 已找到 {len(sorted_archives)} 个 CBZ/ZIP 压缩包（将直接读取，无需解压）。")
+    return sorted_archives
+
+
+def _save_pdf(pil_images, output_pdf_path, profile):
+    """将已处理好的页面按输出规格的 DPI / JPEG 质量写入 PDF，返回路径；失败时返回 None。"""
+    save_kwargs = {"resolution": float(profile.dpi), "optimize": True}
+    if profile.jpeg_quality is not None:
+        save_kwargs["quality"] = profile.jpeg_quality
+    if len(pil_images) > 1:
+        save_kwargs["save_all"] = True
+        save_kwargs["append_images"] = pil_images[1:]
+    try:
+        pil_images[0].save(output_pdf_path, **save_kwargs)
+        print(f"    ✅ 成功创建 PDF: {os.path.basename(output_pdf_path)}")
+        return output_pdf_path
+    except Exception as e:
+        print(f"    ❌ 错误: 保存 PDF '{os.path.basename(output_pdf_path)}' 失败: {e}")
+        traceback.print_exc()
+        return None
+
+
+def create_pdfs_for_profiles(image_paths_list, output_pdf_paths, profiles, decode_mode=None):
     """
+    从一系列图片来源（文件路径或压缩包成员）为每个输出规格各创建一个PDF文件。
+    每张源图只解码、做一次灰度检测，再分别缩放到各规格的宽度。
+    output_pdf_paths 与 profiles 一一对应；返回同样顺序的结果列表（失败的规格为 None）。
+    decode_mode 为 None 时使用全局的 DECODE_SPEED_MODE。
+    """
+    if decode_mode is None:
+        decode_mode = DECODE_SPEED_MODE
     if not image_paths_list:
         print("    警告: 没有有效的图片可用于创建此PDF。")
-        return None
+        return [None] * len(profiles)
 
-    processed_pil_images = []
+    pages_by_profile = [[] for _ in profiles]
+    widest_target = max(profile.width for profile in profiles)
+    backend = get_image_backend(IMAGE_BACKEND)
+    gray_page_count = 0
     total_images_for_pdf = len(image_paths_list)
     print_progress_bar(0, total_images_for_pdf, prefix='      转换图片:', suffix='完成', length=40)
 
     for i, image_path in enumerate(image_paths_list):
         try:
-            with Image.open(image_path) as img:
+            with open_image_source(image_path) as img:
+                apply_draft_for_width(img, widest_target, decode_mode)
                 img_to_process = img
                 if img_to_process.mode in ['RGBA', 'P']:
                     background = Image.new("RGB", img_to_process.size, (255, 255, 255))
@@ -89,54 +160,58 @@ def create_pdf_from_images(image_paths_list, output_pdf_path,
                 elif img_to_process.mode != 'RGB':
                     img_to_process = img_to_process.convert('RGB')
 
+                is_gray = ENABLE_GRAYSCALE_PAGES and is_effectively_grayscale(img_to_process)
+                gray_page_count += is_gray
                 original_width, original_height = img_to_process.size
-                if original_width > target_page_width_px:
-                    ratio = target_page_width_px / original_width
-                    new_height = int(original_height * ratio)
-                    img_resized = img_to_process.resize((target_page_width_px, new_height), Image.Resampling.LANCZOS)
-                else:
-                    img_resized = img_to_process.copy()
-
-                processed_pil_images.append(img_resized)
+                for profile, pages in zip(profiles, pages_by_profile):
+                    if original_width > profile.width:
+                        new_height = int(original_height * (profile.width / original_width))
+                        img_resized = backend.resize(img_to_process, (profile.width, new_height))
+                    else:
+                        img_resized = img_to_process.copy()
+                    pages.append(img_resized.convert('L') if is_gray else img_resized)
         except Exception as e:
-            sys.stdout.write(f"\r      警告: 处理图片 '{os.path.basename(image_path)}' 失败: {e}。已跳过。\n")
+            sys.stdout.write(f"\r      警告: 处理图片 '{source_display_name(image_path)}' 失败: {e}。已跳过。\n")
         finally:
             print_progress_bar(i + 1, total_images_for_pdf, prefix='      转换图片:', suffix='完成', length=40)
+    close_image_sources(image_paths_list)
 
-    if not processed_pil_images:
+    if not pages_by_profile[0]:
         print("    错误: 没有图片成功处理，无法创建PDF。")
-        return None
+        return [None] * len(profiles)
 
+    if gray_page_count:
+        print(f"    检测到 {gray_page_count}/{len(pages_by_profile[0])} 个灰度页面，将以 8 位灰度写入 PDF。")
+
+    results = []
     try:
-        if len(processed_pil_images) == 1:
-            processed_pil_images[0].save(
-                output_pdf_path,
-                resolution=float(pdf_target_dpi),
-                optimize=True
-            )
-        else:
-            first_image = processed_pil_images[0]
-            other_images = processed_pil_images[1:]
-            first_image.save(
-                output_pdf_path,
-                save_all=True,
-                append_images=other_images,
-                resolution=float(pdf_target_dpi),
-                optimize=True
-            )
-        
-        print(f"    ✅ 成功创建 PDF: {os.path.basename(output_pdf_path)}")
-        return output_pdf_path
-    except Exception as e:
-        print(f"    ❌ 错误: 保存 PDF '{os.path.basename(output_pdf_path)}' 失败: {e}")
-        traceback.print_exc()
-        return None
+        for profile, pages, output_pdf_path in zip(profiles, pages_by_profile, output_pdf_paths):
+            if len(profiles) > 1:
+                print(f"    输出规格: {profile.describe()}")
+            results.append(_save_pdf(pages, output_pdf_path, profile))
     finally:
-        for img_obj in processed_pil_images:
-            try:
-                img_obj.close()
-            except Exception:
-                pass
+        for pages in pages_by_profile:
+            for img_obj in pages:
+                try:
+                    img_obj.close()
+                except Exception:
+                    pass
+    return results
+
+
+def create_pdf_from_images(image_paths_list, output_pdf_path,
+                           target_page_width_px, pdf_target_dpi, decode_mode=None):
+    """
+    从一系列图片文件路径创建一个PDF文件。
+    decode_mode 为 None 时使用全局的 DECODE_SPEED_MODE。
+    """
+    profile = OutputProfile("default", target_page_width_px, dpi=pdf_target_dpi)
+    return create_pdfs_for_profiles(image_paths_list, [output_pdf_path], [profile], decode_mode)[0]
+
+
+def default_output_profiles():
+    """未指定输出规格时使用的单一规格（即原有的全局配置）。"""
+    return [OutputProfile("default", PDF_TARGET_PAGE_WIDTH_PIXELS, PDF_IMAGE_JPEG_QUALITY, PDF_DPI)]
 
 
 def normalize_filenames(pdf_dir):
@@ -168,14 +243,20 @@ def normalize_filenames(pdf_dir):
             except OSError as e:
                 print(f"    ❌ 错误: 重命名 '{filename}' 失败: {e}")
                 
-def run_conversion_process(root_input_dir):
+def run_conversion_process(root_input_dir, output_profiles=None, dedup_mode=None):
     """
     运行整个批量转换流程。
+    output_profiles 为 OutputProfile 列表，每个文件夹的源图只解码一次，
+    按每个规格各输出一个 PDF；为 None 时使用全局配置的单一规格。
+    dedup_mode 为重复页面检测模式（off / flag / skip），为 None 时使用 PAGE_DEDUP_MODE。
     """
+    profiles = output_profiles or default_output_profiles()
+    dedup_mode = dedup_mode or PAGE_DEDUP_MODE
     # 1. 扫描文件夹
     # 排除输出目录，避免递归扫描
     excluded_dirs = ["processed_dir", SUCCESS_MOVE_SUBDIR_NAME]
     sorted_image_folders = find_image_folders(root_input_dir, excluded_dirs)
+    sorted_image_folders += find_image_archives(root_input_dir, excluded_dirs)
     
     total_folders = len(sorted_image_folders)
     if total_folders == 0:
@@ -199,39 +280,66 @@ def run_conversion_process(root_input_dir):
 
     # 3. 开始循环处理
     print(f"\n--- 步骤 3: 开始批量处理 {total_folders} 个文件夹 ---")
+    print(f"    图片处理后端: {get_image_backend(IMAGE_BACKEND).name}")
+    if len(profiles) > 1:
+        print(f"    输出规格: {'; '.join(profile.describe() for profile in profiles)}")
+    deduplicator = None
+    if dedup_mode != DEDUP_OFF:
+        deduplicator = PageDeduplicator(root_input_dir, PAGE_DEDUP_HASH, PAGE_DEDUP_MAX_DISTANCE, dedup_mode)
+        print(f"    重复页面检测: {dedup_mode} ({PAGE_DEDUP_HASH}, 汉明距离 ≤ {PAGE_DEDUP_MAX_DISTANCE})")
     
     for i, image_dir_path in enumerate(sorted_image_folders):
-        folder_name = os.path.basename(image_dir_path)
+        is_archive = is_image_archive(image_dir_path)
+        folder_name = archive_project_name(image_dir_path) if is_archive else os.path.basename(image_dir_path)
         print(f"\n--- ({i+1}/{total_folders}) 正在处理: {folder_name} ---")
 
-        # 3.1 规范化文件名
-        normalize_filenames(image_dir_path)
+        if is_archive:
+            # 3.1/3.2 直接读取压缩包中的页面成员（不解压，也不重命名）
+            try:
+                sorted_image_paths = list_archive_images(image_dir_path)
+            except (zipfile.BadZipFile, OSError) as e:
+                print(f"  ❌ 错误: 无法读取压缩包 '{os.path.basename(image_dir_path)}': {e}")
+                failed_tasks.append(folder_name)
+                continue
+            if not sorted_image_paths:
+                print("    压缩包内未找到符合条件的图片，已跳过。")
+                continue
+        else:
+            # 3.1 规范化文件名
+            normalize_filenames(image_dir_path)
 
-        # 3.2 读取图片列表
-        try:
-            image_filenames = [f for f in os.listdir(image_dir_path)
-                               if f.lower().endswith(IMAGE_EXTENSIONS_FOR_MERGE) and not f.startswith('.')]
-        except Exception as e:
-            print(f"  ❌ 错误: 无法读取文件夹 '{folder_name}' 的内容: {e}")
-            failed_tasks.append(folder_name)
-            continue
-            
-        if not image_filenames:
-            print("    文件夹内未找到符合条件的图片，已跳过。")
-            continue
+            # 3.2 读取图片列表
+            try:
+                image_filenames = [f for f in os.listdir(image_dir_path)
+                                   if f.lower().endswith(IMAGE_EXTENSIONS_FOR_MERGE) and not f.startswith('.')]
+            except Exception as e:
+                print(f"  ❌ 错误: 无法读取文件夹 '{folder_name}' 的内容: {e}")
+                failed_tasks.append(folder_name)
+                continue
+                
+            if not image_filenames:
+                print("    文件夹内未找到符合条件的图片，已跳过。")
+                continue
+            sorted_image_paths = [os.path.join(image_dir_path, f) for f in natsort.natsorted(image_filenames)]
+
+        if deduplicator:
+            kept_image_paths, duplicates = deduplicator.filter_pages(sorted_image_paths, folder_name)
+            report_duplicates(duplicates, dedup_mode)
+            if not kept_image_paths:
+                print("    ⚠️  所有页面都与之前的文件夹重复，将保留全部页面以免输出空文件。")
+            elif dedup_mode == DEDUP_SKIP:
+                sorted_image_paths = kept_image_paths
 
         # 3.3 生成PDF
-        sorted_image_paths = [os.path.join(image_dir_path, f) for f in natsort.natsorted(image_filenames)]
-        output_pdf_filename = f"{folder_name}.pdf"
-        output_pdf_filepath = os.path.join(overall_pdf_output_dir, output_pdf_filename)
-
-        result_path = create_pdf_from_images(
-            sorted_image_paths, output_pdf_filepath,
-            PDF_TARGET_PAGE_WIDTH_PIXELS, PDF_DPI
-        )
+        output_pdf_filepaths = [
+            os.path.join(overall_pdf_output_dir, f"{folder_name}{profile_file_suffix(profile, profiles)}.pdf")
+            for profile in profiles
+        ]
+
+        result_paths = create_pdfs_for_profiles(sorted_image_paths, output_pdf_filepaths, profiles)
         
-        # 3.4 处理结果
-        if result_path:
+        # 3.4 处理结果（所有规格都成功才算成功并移动源文件夹）
+        if all(result_paths):
             success_count += 1
             # 移动已成功处理的文件夹
             print(f"    移动已成功处理的文件夹: {folder_name}")
@@ -240,7 +348,7 @@ def run_conversion_process(root_input_dir):
                 if os.path.basename(image_dir_path) == os.path.basename(success_move_target_dir):
                     print(f"      -> 跳过移动，源与目标文件夹同名。")
                 else:
-                    target_move_path = os.path.join(success_move_target_dir, folder_name)
+                    target_move_path = os.path.join(success_move_target_dir, os.path.basename(image_dir_path))
                     # 如果目标已存在，先移除（或者可以改为重命名，这里选择覆盖/合并的逻辑需谨慎，简单起见如果存在则报错或覆盖）
                     # shutil.move 如果目标是已存在目录，会移动到该目录内部，所以最好确保目标路径不存在
                     if os.path.exists(target_move_path):
@@ -289,8 +397,19 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="图片转PDF工具")
     parser.add_argument("--input", help="输入根目录路径")
     parser.add_argument("--output", help="输出根目录路径 (可选)")
+    parser.add_argument("--profiles", help="输出规格列表，格式: 名称:宽度:JPEG质量:DPI[:最大页高]，多个用逗号分隔 (可选)")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default=None,
+                        help="重复页面检测: off 关闭，flag 只报告，skip 跳过之前出现过的页面 (可选)")
     args = parser.parse_args()
 
+    output_profiles = None
+    if args.profiles:
+        try:
+            output_profiles = parse_output_profiles(args.profiles)
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+
     root_input_dir = ""
     default_root_dir_name = ""
 
@@ -338,7 +457,7 @@ if __name__ == "__main__":
                 print(f"\n错误：路径 '{abs_path_to_check}' 不是一个有效的目录或不存在。请重试。\n")
     
     try:
-        run_conversion_process(root_input_dir)
+        run_conversion_process(root_input_dir, output_profiles, args.dedup)
     except Exception as e:
         print("\n" + "!"*70)
         print("脚本在执行过程中遇到意外的严重错误，已终止。")
@@ -1,13 +1,15 @@
 import os
 import shutil
-from PIL import Image, ImageFile
+from PIL import Image, ImageDraw, ImageFile
 import natsort
 import sys
 from collections import Counter
-import math
 import traceback
 import json
 import time
+import hashlib
+import io
+import zipfile
 
 try:
     import numpy as np
@@ -15,6 +17,31 @@ except ImportError:
     print("错误：此脚本需要 numpy 库。请使用 'pip install numpy' 命令进行安装。")
     sys.exit(1)
 
+# Add project root to sys.path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from backend.shared_utils.stage_profiler import StageProfiler, profile_stage, add_megapixels, set_active_profiler
+from backend.shared_utils.image_decode import apply_draft_for_width, DECODE_MODE_FAST
+from backend.shared_utils.image_backend import get_image_backend, BACKEND_AUTO
+from backend.shared_utils.intermediate_store import (
+    save_intermediate, open_intermediate, intermediate_dimensions, intermediate_size_estimate,
+    reference_png_size, INTERMEDIATE_FORMAT_NPY
+)
+from backend.shared_utils.page_color import is_effectively_grayscale
+from backend.shared_utils.image_archive import (
+    is_image_archive, archive_project_name, list_archive_images, open_image_source, source_display_name,
+    close_image_sources
+)
+from backend.shared_utils.memory_admission import (
+    resolve_memory_budget, probe_page_dimensions, plan_admission, split_batches_by_pixels, pdf_batch_pixels_for_budget,
+    ADMIT_CHUNK, ADMIT_DEFER
+)
+from backend.shared_utils.output_profiles import OutputProfile, parse_output_profiles, profile_file_suffix
+from backend.shared_utils.page_dedup import (
+    PageDeduplicator, report_duplicates, DEDUP_OFF, DEDUP_SKIP, DEDUP_MODES, HASH_DHASH, DEFAULT_MAX_DISTANCE
+)
+
 # --- 全局配置 ---
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 Image.MAX_IMAGE_PIXELS = None
@@ -24,11 +51,13 @@ MERGED_LONG_IMAGE_SUBDIR_NAME = "merged_long_img"
 SPLIT_IMAGES_SUBDIR_NAME = "split_by_solid_band"
 SUCCESS_MOVE_SUBDIR_NAME = "IMG"  # 成功处理的文件夹将被移动到此目录
 LONG_IMAGE_FILENAME_BASE = "stitched_long_strip"
+CHECKPOINT_FILENAME = ".v5_checkpoint.json"  # 项目级阶段检查点文件
 IMAGE_EXTENSIONS_FOR_MERGE = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tiff', '.tif')
 
 # --- V2 分割配置 ---
 MIN_SOLID_COLOR_BAND_HEIGHT = 50
 COLOR_MATCH_TOLERANCE = 45
+V2_ROW_BLOCK_SIZE = 512  # V2 纯色行检测每次向量化处理的行数（限制中间数组的内存占用）
 # 韩漫常见背景色配置（已扩展）
 SPLIT_BAND_COLORS_RGB = [
     # 基础色
@@ -129,12 +158,64 @@ MAX_UNIQUE_COLORS_IN_BG = 5
 MIN_SOLID_COLOR_BAND_HEIGHT_V4 = 30
 EDGE_MARGIN_PERCENT = 0.10
 
+# --- V6 分割配置（行统计分析，融合策略中最先尝试）---
+# 一次向量化扫描计算每行亮度的均值、方差与水平梯度能量，低能量的连续行构成可切割的空白带，
+# 可识别渐变色与带纹理的分隔带（V2 的固定色板与 V4 的量化色数都无法识别）
+ENABLE_V6_SPLITTER = True
+V6_MAX_ROW_STDDEV = 20.0  # 行内亮度标准差上限，允许平滑的横向渐变
+V6_MAX_GRADIENT_ENERGY = 8.0  # 行内相邻像素亮度差的绝对值的平均值上限，允许轻微纹理/噪点
+V6_MAX_ROW_RANGE = 96  # 行内亮度最大值与最小值之差上限，防止切过细线条等小面积内容
+V6_MAX_MEAN_STEP = 24.0  # 相邻两行平均亮度的跳变上限，超过时视为分隔带的边界（如空白与纯色画格的交界）
+V6_MIN_BAND_HEIGHT = 40
+V6_ROW_BLOCK_SIZE = 512  # 每次向量化处理的行数（限制中间数组的内存占用）
+
 # --- 重打包与PDF输出配置 ---
 MAX_REPACKED_FILESIZE_MB = 8
 MAX_REPACKED_PAGE_HEIGHT_PX = 30000
 PDF_TARGET_PAGE_WIDTH_PIXELS = 1500
 PDF_IMAGE_JPEG_QUALITY = 85
 PDF_DPI = 300
+ENABLE_GRAYSCALE_PAGES = True  # 检测实际为灰度的页面并以 8 位灰度写入 PDF（更小、更快）
+# 源图解码模式: "fast" 对比目标宽度更宽的 JPEG 源图使用 draft 缩小解码（更快）；"quality" 始终全分辨率解码
+DECODE_SPEED_MODE = DECODE_MODE_FAST
+# 缩放与 PNG 编码使用的图片后端: "auto" 在安装了 pyvips / cv2 时自动使用多线程加速后端，否则使用 Pillow
+IMAGE_BACKEND = BACKEND_AUTO
+# 输出容器: "pdf" 生成 PDF；"cbz" 把重打包后的页面直接存入 CBZ 压缩包（不做 PDF 编码，适用于支持 CBZ 的阅读器）
+OUTPUT_FORMAT_PDF = "pdf"
+OUTPUT_FORMAT_CBZ = "cbz"
+OUTPUT_FORMAT = OUTPUT_FORMAT_PDF
+CBZ_PAGE_JPEG_QUALITY = 90  # 输出规格未指定 JPEG 质量时，CBZ 页面使用的 JPEG 质量
+# 多目标输出: 为 None 时只输出上面配置的单一规格；也可设为 OutputProfile 列表（或使用 --profiles 参数），
+# 源图只解码、分割一次，再按每个规格各自重打包并写入一个 PDF（文件名带 "_规格名" 后缀）
+OUTPUT_PROFILES = None
+# 分割片段与重打包页面的中间格式（很快会被删除）: "npy" 未压缩（最快）、"png" 快速 PNG、"webp" 无损 WebP
+INTERMEDIATE_FORMAT = INTERMEDIATE_FORMAT_NPY
+
+# --- 内存准入控制 ---
+# 处理项目前仅凭图片文件头估算合并/分割/PDF 的内存峰值：超出预算时自动切分为多条长图并分批写入 PDF，
+# 连单张页面都超出预算时延后处理（保留在原位，不计为失败）
+ENABLE_MEMORY_ADMISSION = True
+MEMORY_BUDGET_MB = None  # None 表示使用当前可用物理内存的 60%（需要 psutil，否则为 4096MB）
+
+# --- 重复页面检测 ---
+# 用感知哈希在整个系列（根目录下的所有项目）中查找重复页面（汉化组声明、广告等）:
+# "off" 关闭，"flag" 只报告，"skip" 在合并前跳过。哈希按文件内容缓存在根目录的 .page_hash_cache.json 中
+PAGE_DEDUP_MODE = DEDUP_OFF
+PAGE_DEDUP_HASH = HASH_DHASH  # "dhash" 或 "phash"（需要 numpy）
+PAGE_DEDUP_MAX_DISTANCE = DEFAULT_MAX_DISTANCE  # 64 位哈希的汉明距离阈值
+
+# --- 试运行 (--dry-run) ---
+# 只在内存中合并长图并计算切割点，为每个项目输出 JSON 预览（切割点、片段高度、预计页数与 PDF 大小），
+# 不写入长图、分割片段或 PDF，也不移动项目文件夹，便于快速调整分割参数
+DRY_RUN_REPORT_SUBDIR_NAME = "dry_run_reports"  # 预览报告保存在 PDF 输出目录下的此子目录中
+DRY_RUN_THUMBNAIL_WIDTH = 240  # 标注切割点的低分辨率预览图宽度，设为 0 则不生成
+DRY_RUN_SIZE_SAMPLE_TILES = 8  # 估算 PDF 大小时抽样编码的图块数量
+DRY_RUN_SIZE_SAMPLE_TILE_HEIGHT = 1024
+
+# --- 性能分析配置 ---
+ENABLE_STAGE_PROFILING = True  # 记录每个阶段的耗时与内存峰值，并为每个项目输出 JSON 报告
+PROFILE_TRACE_PYTHON_ALLOCATIONS = False  # 使用 tracemalloc 追踪 Python/NumPy 分配（开销较大，按需用 --profile-memory 开启；进程 RSS 峰值始终采样）
+PROFILE_REPORT_SUBDIR_NAME = "profile_reports"  # 报告保存在 PDF 输出目录下的此子目录中
 # --- 配置结束 ---
 
 
@@ -178,17 +259,18 @@ def print_progress_bar(iteration, total, prefix='', suffix='', decimals=1, lengt
             sys.stdout.write('\n')
 
 
-def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_filename_only, target_width=None):
-    """将源目录中的所有图片（包括子目录）垂直合并成一个长图。"""
-    print(f"\n  --- 步骤 1: 合并项目 '{os.path.basename(source_project_dir)}' 中的所有图片以制作长图 ---")
-    if not os.path.isdir(source_project_dir):
-        print(f"    错误: 源项目目录 '{source_project_dir}' 未找到。")
-        return None
+def collect_project_images(source_project_dir):
+    """递归收集项目目录（包括子目录）中的所有图片，并按自然顺序排序。出错时返回 None。
 
-    os.makedirs(output_long_image_dir, exist_ok=True)
-    output_long_image_path = os.path.join(output_long_image_dir, long_image_filename_only)
+    source_project_dir 为 CBZ / ZIP 压缩包时，直接返回压缩包中的页面成员（ArchiveMember），不解压。
+    """
+    if is_image_archive(source_project_dir):
+        try:
+            return list_archive_images(source_project_dir)
+        except (zipfile.BadZipFile, OSError) as e:
+            print(f"    错误: 读取压缩包 '{os.path.basename(source_project_dir)}' 时发生错误: {e}")
+            return None
 
-    print(f"    ... 正在递归扫描 '{os.path.basename(source_project_dir)}' 及其所有子文件夹以查找图片 ...")
     image_filepaths = []
     try:
         for dirpath, _, filenames in os.walk(source_project_dir):
@@ -202,14 +284,16 @@ def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_fi
     except Exception as e:
         print(f"    错误: 扫描目录 '{source_project_dir}' 时发生错误: {e}")
         return None
-        
-    if not image_filepaths:
-        print(f"    在 '{os.path.basename(source_project_dir)}' 及其子目录中未找到符合条件的图片。")
-        return None
 
     # 对收集到的所有完整路径进行自然排序
-    sorted_image_filepaths = natsort.natsorted(image_filepaths)
+    return natsort.natsorted(image_filepaths)
+
 
+def compose_long_image(sorted_image_filepaths, target_width=None):
+    """把一组图片来源按顺序垂直拼接到内存中的 RGB 画布上并返回画布；没有可用图片时返回 None。
+
+    target_width 不为空时每张图片都缩放到该宽度，否则居中放置在最宽图片的宽度上。
+    """
     images_data = []
     total_calculated_height = 0
     max_calculated_width = 0
@@ -220,7 +304,7 @@ def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_fi
     
     for i, filepath in enumerate(sorted_image_filepaths):
         try:
-            with Image.open(filepath) as img:
+            with open_image_source(filepath, header_only=True) as img:
                 if target_width and img.width != target_width:
                     new_height = int(img.height * (target_width / img.width))
                     images_data.append({
@@ -244,17 +328,19 @@ def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_fi
                     if img.width > max_calculated_width:
                         max_calculated_width = img.width
         except Exception as e:
-            print(f"\n    警告: 打开或读取图片 '{os.path.basename(filepath)}' 失败: {e}。已跳过。")
+            print(f"\n    警告: 打开或读取图片 '{source_display_name(filepath)}' 失败: {e}。已跳过。")
             continue
         if total_files_to_analyze > 0:
             print_progress_bar(i + 1, total_files_to_analyze, prefix='    分析图片尺寸:', suffix='完成', length=40)
 
     if not images_data:
         print("    没有有效的图片可供合并。")
+        close_image_sources(sorted_image_filepaths)
         return None
 
     if max_calculated_width == 0 or total_calculated_height == 0:
         print(f"    计算出的画布尺寸为零 ({max_calculated_width}x{total_calculated_height})，无法创建长图。")
+        close_image_sources(sorted_image_filepaths)
         return None
 
     merged_canvas = Image.new('RGB', (max_calculated_width, total_calculated_height), (255, 255, 255))
@@ -265,10 +351,13 @@ def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_fi
         print_progress_bar(0, total_files_to_paste, prefix='    粘贴图片:    ', suffix='完成', length=40)
     for i, item_info in enumerate(images_data):
         try:
-            with Image.open(item_info["path"]) as img:
+            with open_image_source(item_info["path"]) as img:
+                if target_width:
+                    apply_draft_for_width(img, target_width, DECODE_SPEED_MODE)
+                add_megapixels(img.width, img.height)
                 img_rgb = img.convert("RGB")
                 if target_width and img_rgb.width != target_width:
-                    img_to_paste = img_rgb.resize((target_width, item_info['height']), Image.Resampling.LANCZOS)
+                    img_to_paste = get_image_backend(IMAGE_BACKEND).resize(img_rgb, (target_width, item_info['height']))
                 else:
                     img_to_paste = img_rgb
                 
@@ -279,13 +368,46 @@ def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_fi
                     merged_canvas.paste(img_to_paste, (x_offset, current_y_offset))
                 current_y_offset += item_info["height"]
         except Exception as e:
-            print(f"\n    警告: 粘贴图片 '{item_info['path']}' 失败: {e}。")
+            print(f"\n    警告: 粘贴图片 '{source_display_name(item_info['path'])}' 失败: {e}。")
             pass
         if total_files_to_paste > 0:
             print_progress_bar(i + 1, total_files_to_paste, prefix='    粘贴图片:    ', suffix='完成', length=40)
+    close_image_sources(sorted_image_filepaths)
+    return merged_canvas
+
+
+@profile_stage("merge")
+def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_filename_only, target_width=None, sources=None):
+    """将源目录中的所有图片（包括子目录）垂直合并成一个长图。
+
+    sources 为预先收集好的图片来源列表（例如分段处理时的一部分页面），提供时不再扫描目录。
+    """
+    print(f"\n  --- 步骤 1: 合并项目 '{os.path.basename(source_project_dir)}' 中的所有图片以制作长图 ---")
+    if not os.path.isdir(source_project_dir) and not is_image_archive(source_project_dir):
+        print(f"    错误: 源项目目录 '{source_project_dir}' 未找到。")
+        return None
+
+    os.makedirs(output_long_image_dir, exist_ok=True)
+    output_long_image_path = os.path.join(output_long_image_dir, long_image_filename_only)
+
+    if sources is not None:
+        sorted_image_filepaths = list(sources)
+    else:
+        print(f"    ... 正在递归扫描 '{os.path.basename(source_project_dir)}' 及其所有子文件夹以查找图片 ...")
+        sorted_image_filepaths = collect_project_images(source_project_dir)
+    if sorted_image_filepaths is None:
+        return None
+        
+    if not sorted_image_filepaths:
+        print(f"    在 '{os.path.basename(source_project_dir)}' 及其子目录中未找到符合条件的图片。")
+        return None
+
+    merged_canvas = compose_long_image(sorted_image_filepaths, target_width)
+    if merged_canvas is None:
+        return None
 
     try:
-        merged_canvas.save(output_long_image_path, format='PNG')
+        get_image_backend(IMAGE_BACKEND).save_png(merged_canvas, output_long_image_path)
         print(f"    成功合并图片到: {output_long_image_path}")
         return output_long_image_path
     except Exception as e:
@@ -296,41 +418,89 @@ def merge_to_long_image(source_project_dir, output_long_image_dir, long_image_fi
 # --- V2 分割相关函数 ---
 
 
-def are_colors_close(color1, color2, tolerance):
-    """根据欧氏距离检查两种RGB颜色是否接近。"""
-    if tolerance == 0:
-        return color1 == color2
-    r1, g1, b1 = color1
-    r2, g2, b2 = color2
-    distance = math.sqrt((r1 - r2)**2 + (g1 - g2)**2 + (b1 - b2)**2)
-    return distance <= tolerance
-
+def find_solid_color_rows(img, solid_colors_list, tolerance, block_rows=V2_ROW_BLOCK_SIZE):
+    """
+    返回每一行是否为纯色带的布尔数组（按行块向量化计算，结果与逐像素比较一致）。
 
-def is_solid_color_row(pixels, y, width, solid_colors_list, tolerance):
-    """检查给定行是否为纯色带，允许一定的容差。"""
-    if width == 0:
-        return False
+    一行是纯色带的条件：首个像素与 solid_colors_list 中某个颜色的欧氏距离不超过 tolerance，
+    且该行其余所有像素与首个像素的欧氏距离都不超过 tolerance。
+    """
+    img_width, img_height = img.size
+    solid_rows = np.zeros(img_height, dtype=bool)
+    if img_width == 0 or not solid_colors_list:
+        return solid_rows
+    band_colors = np.array([color[:3] for color in solid_colors_list], dtype=np.int32)
+    max_distance_sq = tolerance * tolerance
+    for block_start in range(0, img_height, block_rows):
+        block_end = min(block_start + block_rows, img_height)
+        block = np.asarray(img.crop((0, block_start, img_width, block_end)))[:, :, :3].astype(np.int32)
+        first_pixels = block[:, 0, :]
+        first_matches = (((first_pixels[:, None, :] - band_colors[None, :, :]) ** 2).sum(axis=2) <= max_distance_sq).any(axis=1)
+        row_distances_sq = ((block - first_pixels[:, None, :]) ** 2).sum(axis=2)
+        solid_rows[block_start:block_end] = first_matches & (row_distances_sq <= max_distance_sq).all(axis=1)
+    return solid_rows
+
+
+def find_split_segments_v2(img, min_solid_band_height, band_colors_list, tolerance):
+    """[V2] 逐行扫描图片，返回切割后每个片段的 (起始Y, 结束Y) 列表，不写任何文件。"""
+    if min_solid_band_height < 1: 
+        min_solid_band_height = 1
+
+    img_width, img_height = img.size
+    segments = []
+    current_segment_start_y = 0
+    solid_band_after_last_content_start_y = -1
+
+    print_progress_bar(0, img_height, prefix='    扫描长图:    ', suffix='完成', length=40)
+    solid_rows = find_solid_color_rows(img, band_colors_list, tolerance)
+    print_progress_bar(img_height, img_height, prefix='    扫描长图:    ', suffix=f'第 {img_height}/{img_height} 行', length=40)
+
+    for y in range(img_height):
+        is_solid = solid_rows[y]
+
+        if not is_solid:  # 这是一个 "内容" 行
+            if solid_band_after_last_content_start_y != -1:
+                solid_band_height = y - solid_band_after_last_content_start_y
+                if solid_band_height >= min_solid_band_height:
+                    cut_point_y = solid_band_after_last_content_start_y + (solid_band_height // 2)
+                    if cut_point_y > current_segment_start_y:
+                        segments.append((current_segment_start_y, cut_point_y))
+                    current_segment_start_y = cut_point_y
+            solid_band_after_last_content_start_y = -1
+        else:  # 这是一个 "纯色" 行
+            if solid_band_after_last_content_start_y == -1:
+                solid_band_after_last_content_start_y = y
+
+    if current_segment_start_y < img_height and img_height - current_segment_start_y > 10:  # 避免保存过小的切片
+        segments.append((current_segment_start_y, img_height))
+
+    return segments
+
+
+@profile_stage("encode_segments")
+def save_split_segments(img, segments, output_split_dir, original_basename):
+    """按 (起始Y, 结束Y) 列表从图片中裁剪片段并保存，返回成功保存的路径列表。"""
+    os.makedirs(output_split_dir, exist_ok=True)
+    img_width = img.width
+    backend = get_image_backend(IMAGE_BACKEND)
+    split_image_paths = []
+    for part_index, (start_y, end_y) in enumerate(segments, start=1):
+        segment = img.crop((0, start_y, img_width, end_y))
+        add_megapixels(img_width, end_y - start_y)
+        output_stem = f"{original_basename}_split_part_{part_index}"
+        try:
+            split_image_paths.append(save_intermediate(segment, output_split_dir, output_stem, INTERMEDIATE_FORMAT, backend))
+        except Exception as e_save:
+            print(f"      保存分割片段 '{output_stem}' 失败: {e_save}")
+    return split_image_paths
 
-    first_pixel_rgb = pixels[0, y][:3]
-    
-    base_color_match = None
-    for base_color in solid_colors_list:
-        if are_colors_close(first_pixel_rgb, base_color, tolerance):
-            base_color_match = first_pixel_rgb
-            break
-            
-    if base_color_match is None:
-        return False
-        
-    for x in range(1, width):
-        if not are_colors_close(pixels[x, y][:3], base_color_match, tolerance):
-            return False
-            
-    return True
 
+@profile_stage("split_v2")
+def split_long_image_v2(long_image_path, output_split_dir, min_solid_band_height, band_colors_list, tolerance, segments_out=None):
+    """V2 分割方法：基于在足够高的纯色带后找到内容行的逻辑来分割长图。
 
-def split_long_image_v2(long_image_path, output_split_dir, min_solid_band_height, band_colors_list, tolerance):
-    """V2 分割方法：基于在足够高的纯色带后找到内容行的逻辑来分割长图。"""
+    如果提供了 segments_out 列表，计算出的切割片段 (起始Y, 结束Y) 会被追加到其中。
+    """
     print(f"\n  --- 步骤 2 (V2 - 传统纯色带分析): 分割长图 '{os.path.basename(long_image_path)}' ---")
     if not os.path.isfile(long_image_path):
         print(f"    错误: 长图路径 '{long_image_path}' 未找到。")
@@ -340,61 +510,19 @@ def split_long_image_v2(long_image_path, output_split_dir, min_solid_band_height
     split_image_paths = []
 
     try:
-        if min_solid_band_height < 1: 
-            min_solid_band_height = 1
-
         img = Image.open(long_image_path).convert("RGBA")
-        pixels = img.load()
         img_width, img_height = img.size
+        add_megapixels(img_width, img_height)
 
         if img_height == 0 or img_width == 0:
             print(f"    图片 '{os.path.basename(long_image_path)}' 尺寸为零，无法分割。")
             return []
 
         original_basename, _ = os.path.splitext(os.path.basename(long_image_path))
-        part_index = 1
-        current_segment_start_y = 0
-        solid_band_after_last_content_start_y = -1
-
-        print_progress_bar(0, img_height, prefix='    扫描长图:    ', suffix='完成', length=40)
-
-        for y in range(img_height):
-            if y % 100 == 0 or y == img_height - 1:
-                print_progress_bar(y + 1, img_height, prefix='    扫描长图:    ', suffix=f'第 {y+1}/{img_height} 行', length=40)
-
-            is_solid = is_solid_color_row(pixels, y, img_width, band_colors_list, tolerance)
-
-            if not is_solid:  # 这是一个 "内容" 行
-                if solid_band_after_last_content_start_y != -1:
-                    solid_band_height = y - solid_band_after_last_content_start_y
-                    if solid_band_height >= min_solid_band_height:
-                        cut_point_y = solid_band_after_last_content_start_y + (solid_band_height // 2)
-                        if cut_point_y > current_segment_start_y:
-                            segment = img.crop((0, current_segment_start_y, img_width, cut_point_y))
-                            output_filename = f"{original_basename}_split_part_{part_index}.png"
-                            output_filepath = os.path.join(output_split_dir, output_filename)
-                            try:
-                                segment.save(output_filepath, "PNG")
-                                split_image_paths.append(output_filepath)
-                                part_index += 1
-                            except Exception as e_save:
-                                print(f"      保存分割片段 '{output_filename}' 失败: {e_save}")
-                        current_segment_start_y = cut_point_y
-                solid_band_after_last_content_start_y = -1
-            else:  # 这是一个 "纯色" 行
-                if solid_band_after_last_content_start_y == -1:
-                    solid_band_after_last_content_start_y = y
-
-        if current_segment_start_y < img_height:
-            segment = img.crop((0, current_segment_start_y, img_width, img_height))
-            if segment.height > 10:  # 避免保存过小的切片
-                output_filename = f"{original_basename}_split_part_{part_index}.png"
-                output_filepath = os.path.join(output_split_dir, output_filename)
-                try:
-                    segment.save(output_filepath, "PNG")
-                    split_image_paths.append(output_filepath)
-                except Exception as e_save:
-                    print(f"      保存最后一个分割片段 '{output_filename}' 失败: {e_save}")
+        segments = find_split_segments_v2(img, min_solid_band_height, band_colors_list, tolerance)
+        split_image_paths = save_split_segments(img, segments, output_split_dir, original_basename)
+        if segments_out is not None:
+            segments_out.extend(segments)
 
         if not split_image_paths and img_height > 0:
             print(f"    V2 方法未能根据指定的纯色带分割 '{os.path.basename(long_image_path)}'。")
@@ -413,19 +541,111 @@ def get_dominant_color_numpy(pixels_quantized):
     """[V4 性能核心] 使用纯NumPy从量化后的像素块中找到主色调。"""
     if pixels_quantized.size == 0:
         return None, 0
-    pixels_list = pixels_quantized.reshape(-1, 3)
-    unique_colors, counts = np.unique(pixels_list, axis=0, return_counts=True)
-    num_unique_colors = len(unique_colors)
+    pixels_list = pixels_quantized.reshape(-1, 3).astype(np.int32)
+    # 把每个 RGB 三元组打包成一个整数再做一维去重，排序顺序与按行去重一致，但快得多
+    packed = (pixels_list[:, 0] << 16) | (pixels_list[:, 1] << 8) | pixels_list[:, 2]
+    unique_codes, counts = np.unique(packed, return_counts=True)
+    num_unique_colors = len(unique_codes)
     if num_unique_colors == 0:
         return None, 0
-    dominant_color = tuple(unique_colors[np.argmax(counts)])
+    dominant_code = unique_codes[np.argmax(counts)]
+    dominant_color = tuple(np.array([dominant_code >> 16, (dominant_code >> 8) & 0xFF, dominant_code & 0xFF], dtype=pixels_quantized.dtype))
     return dominant_color, num_unique_colors
 
 
-def split_long_image_v4(long_image_path, output_split_dir, quantization_factor, max_unique_colors, min_band_height, edge_margin_percent):
-    """V4 分割方法：通过两阶段向量化分析来识别和分割图像，实现极致速度。"""
-    print(f"\n  --- 步骤 2 (V4 - 两阶段极速分析): 分割长图 '{os.path.basename(long_image_path)}' ---")
+def find_split_segments_v4(img_rgb, quantization_factor, max_unique_colors, min_band_height, edge_margin_percent):
+    """[V4] 两阶段向量化分析，返回切割后每个片段的 (起始Y, 结束Y) 列表，不写任何文件。
+
+    未找到任何合格空白区时返回空列表。
+    """
     start_time = time.time()
+    img_width, img_height = img_rgb.size
+    if img_height < min_band_height * 3:  # 如果图片太短，没必要分割
+        print("    图片太短，无需分割。")
+        return []
+
+    print(f"    分析一个 {img_width}x{img_height} 的图片...")
+    print("    [1/3] 色彩量化...")
+    quantized_array = np.array(img_rgb) // quantization_factor
+    
+    margin_width = int(img_width * edge_margin_percent)
+    center_start, center_end = margin_width, img_width - margin_width
+
+    # --- [V4 核心优化 1: 快速筛选阶段] ---
+    print("    [2/3] 快速筛选候选行...")
+    candidate_indices = []
+    candidate_dominant_colors = {}
+    # 依然逐行，但只做最快的中心区域分析
+    for y in range(img_height):
+        center_pixels = quantized_array[y, center_start:center_end]
+        dominant_color, color_count = get_dominant_color_numpy(center_pixels)
+        if color_count <= max_unique_colors and dominant_color is not None:
+            candidate_indices.append(y)
+            candidate_dominant_colors[y] = dominant_color
+    
+    if not candidate_indices:
+        print("    未能找到任何候选行，V4 方法无法分割。")
+        return []
+
+    # --- [V4 核心优化 2: 精准验证阶段] ---
+    print(f"    [3/3] 从 {len(candidate_indices)} 个候选行中精准验证边缘...")
+    row_types = np.full(img_height, 'complex', dtype=object)
+    # 只对少数候选行进行耗时的边缘分析
+    for y in candidate_indices:
+        center_dominant_color = candidate_dominant_colors[y]
+        
+        # 分析左边缘
+        left_pixels = quantized_array[y, :margin_width]
+        left_dominant_color, left_color_count = get_dominant_color_numpy(left_pixels)
+        if left_color_count > max_unique_colors or left_dominant_color != center_dominant_color:
+            continue
+
+        # 分析右边缘
+        right_pixels = quantized_array[y, -margin_width:]
+        right_dominant_color, right_color_count = get_dominant_color_numpy(right_pixels)
+        if right_color_count > max_unique_colors or right_dominant_color != center_dominant_color:
+            continue
+        
+        row_types[y] = 'simple'
+    
+    analysis_duration = time.time() - start_time
+    print(f"    分析完成，耗时: {analysis_duration:.2f} 秒。")
+
+    # --- 后续的切块逻辑 ---
+    blocks, last_y = [], 0
+    change_points = np.where(row_types[:-1] != row_types[1:])[0] + 1
+    for y_change in change_points:
+        blocks.append({'type': row_types[last_y], 'start': last_y, 'end': y_change})
+        last_y = y_change
+    blocks.append({'type': row_types[last_y], 'start': last_y, 'end': img_height})
+    
+    segments, last_cut_y = [], 0
+    
+    print(f"    正在从 {len(blocks)} 个内容/空白区块中寻找切割点...")
+    for i, block in enumerate(blocks):
+        if block['type'] == 'simple' and (block['end'] - block['start']) >= min_band_height:
+            if i > 0 and i < len(blocks) - 1:
+                cut_point_y = int(block['start'] + (block['end'] - block['start']) // 2)
+                segments.append((last_cut_y, cut_point_y))
+                print(f"      在 Y={cut_point_y} 处找到合格空白区。")
+                last_cut_y = cut_point_y
+
+    if not segments:
+        print("\n    [V4 诊断报告] 未能找到任何合格的空白区进行分割。")
+        print(f"    建议检查参数: MAX_UNIQUE_COLORS_IN_BG={max_unique_colors}, MIN_SOLID_COLOR_BAND_HEIGHT={min_band_height}")
+        return []
+
+    segments.append((last_cut_y, img_height))
+    return segments
+
+
+@profile_stage("split_v4")
+def split_long_image_v4(long_image_path, output_split_dir, quantization_factor, max_unique_colors, min_band_height, edge_margin_percent, segments_out=None):
+    """V4 分割方法：通过两阶段向量化分析来识别和分割图像，实现极致速度。
+
+    如果提供了 segments_out 列表，计算出的切割片段 (起始Y, 结束Y) 会被追加到其中。
+    """
+    print(f"\n  --- 步骤 2 (V4 - 两阶段极速分析): 分割长图 '{os.path.basename(long_image_path)}' ---")
     if not os.path.isfile(long_image_path):
         print(f"    错误: 长图路径 '{long_image_path}' 未找到。")
         return []
@@ -435,109 +655,141 @@ def split_long_image_v4(long_image_path, output_split_dir, quantization_factor,
     try:
         with Image.open(long_image_path) as img:
             img_rgb = img.convert("RGB")
-            img_width, img_height = img_rgb.size
-            if img_height < min_band_height * 3:  # 如果图片太短，没必要分割
-                print("    图片太短，无需分割。")
+            add_megapixels(img_rgb.width, img_rgb.height)
+            segments = find_split_segments_v4(img_rgb, quantization_factor, max_unique_colors, min_band_height, edge_margin_percent)
+            if not segments:
                 return []
 
-            print(f"    分析一个 {img_width}x{img_height} 的图片...")
-            print("    [1/3] 色彩量化...")
-            quantized_array = np.array(img_rgb) // quantization_factor
-            
-            margin_width = int(img_width * edge_margin_percent)
-            center_start, center_end = margin_width, img_width - margin_width
-
-            # --- [V4 核心优化 1: 快速筛选阶段] ---
-            print("    [2/3] 快速筛选候选行...")
-            candidate_indices = []
-            candidate_dominant_colors = {}
-            # 依然逐行，但只做最快的中心区域分析
-            for y in range(img_height):
-                center_pixels = quantized_array[y, center_start:center_end]
-                dominant_color, color_count = get_dominant_color_numpy(center_pixels)
-                if color_count <= max_unique_colors and dominant_color is not None:
-                    candidate_indices.append(y)
-                    candidate_dominant_colors[y] = dominant_color
-            
-            if not candidate_indices:
-                print("    未能找到任何候选行，V4 方法无法分割。")
-                return []
+            original_basename, _ = os.path.splitext(os.path.basename(long_image_path))
+            split_image_paths = save_split_segments(img_rgb, segments, output_split_dir, original_basename)
+            print(f"    已按 {len(segments) - 1} 个切割点保存 {len(split_image_paths)} 个片段。")
+            if segments_out is not None:
+                segments_out.extend(segments)
 
-            # --- [V4 核心优化 2: 精准验证阶段] ---
-            print(f"    [3/3] 从 {len(candidate_indices)} 个候选行中精准验证边缘...")
-            row_types = np.full(img_height, 'complex', dtype=object)
-            # 只对少数候选行进行耗时的边缘分析
-            for y in candidate_indices:
-                center_dominant_color = candidate_dominant_colors[y]
-                
-                # 分析左边缘
-                left_pixels = quantized_array[y, :margin_width]
-                left_dominant_color, left_color_count = get_dominant_color_numpy(left_pixels)
-                if left_color_count > max_unique_colors or left_dominant_color != center_dominant_color:
-                    continue
+            return natsort.natsorted(split_image_paths)
 
-                # 分析右边缘
-                right_pixels = quantized_array[y, -margin_width:]
-                right_dominant_color, right_color_count = get_dominant_color_numpy(right_pixels)
-                if right_color_count > max_unique_colors or right_dominant_color != center_dominant_color:
-                    continue
-                
-                row_types[y] = 'simple'
-            
-            analysis_duration = time.time() - start_time
-            print(f"    分析完成，耗时: {analysis_duration:.2f} 秒。")
-
-            # --- 后续的切块与保存逻辑 ---
-            blocks, last_y = [], 0
-            change_points = np.where(row_types[:-1] != row_types[1:])[0] + 1
-            for y_change in change_points:
-                blocks.append({'type': row_types[last_y], 'start': last_y, 'end': y_change})
-                last_y = y_change
-            blocks.append({'type': row_types[last_y], 'start': last_y, 'end': img_height})
-            
-            original_basename, _ = os.path.splitext(os.path.basename(long_image_path))
-            part_index, last_cut_y, cut_found = 1, 0, False
-            split_image_paths = []
-            
-            print(f"    正在从 {len(blocks)} 个内容/空白区块中寻找切割点...")
-            for i, block in enumerate(blocks):
-                if block['type'] == 'simple' and (block['end'] - block['start']) >= min_band_height:
-                    if i > 0 and i < len(blocks) - 1:
-                        cut_found = True
-                        cut_point_y = block['start'] + (block['end'] - block['start']) // 2
-                        segment = img_rgb.crop((0, last_cut_y, img_width, cut_point_y))
-                        output_filename = f"{original_basename}_split_part_{part_index}.png"
-                        output_filepath = os.path.join(output_split_dir, output_filename)
-                        segment.save(output_filepath, "PNG")
-                        split_image_paths.append(output_filepath)
-                        print(f"      在 Y={cut_point_y} 处找到合格空白区，已切割并保存: {output_filename}")
-                        part_index += 1
-                        last_cut_y = cut_point_y
-
-            segment = img_rgb.crop((0, last_cut_y, img_width, img_height))
-            output_filename = f"{original_basename}_split_part_{part_index}.png"
-            output_filepath = os.path.join(output_split_dir, output_filename)
-            segment.save(output_filepath, "PNG")
-            split_image_paths.append(output_filepath)
-            
-            if not cut_found:
-                print("\n    [V4 诊断报告] 未能找到任何合格的空白区进行分割。")
-                print(f"    建议检查参数: MAX_UNIQUE_COLORS_IN_BG={max_unique_colors}, MIN_SOLID_COLOR_BAND_HEIGHT={min_band_height}")
+    except Exception as e:
+        print(f"    V4 分割图片 '{os.path.basename(long_image_path)}' 时发生严重错误: {e}")
+        traceback.print_exc()
+        return []
+
+
+# --- V6 分割相关函数 ---
+def compute_row_statistics(img, block_rows=V6_ROW_BLOCK_SIZE):
+    """
+    [V6] 按行块向量化地计算每一行亮度的统计量，整条长图只扫描一次。
+
+    统计在亮度通道上进行（逐行在连续内存上归约，比在 RGB 三通道上快一个数量级）。
+    返回 (均值, 标准差, 水平梯度能量, 极差)，均为长度为图片高度的数组；梯度能量为相邻像素亮度差绝对值的行平均。
+    """
+    img_width, img_height = img.size
+    means = np.zeros(img_height, dtype=np.float32)
+    stddevs = np.zeros(img_height, dtype=np.float32)
+    gradients = np.zeros(img_height, dtype=np.float32)
+    ranges = np.zeros(img_height, dtype=np.int16)
+    for block_start in range(0, img_height, block_rows):
+        block_end = min(block_start + block_rows, img_height)
+        luma = np.asarray(img.crop((0, block_start, img_width, block_end)).convert("L"))
+        luma_float = luma.astype(np.float32)
+        row_means = luma_float.mean(axis=1)
+        mean_squares = np.einsum("ij,ij->i", luma_float, luma_float) / img_width
+        means[block_start:block_end] = row_means
+        stddevs[block_start:block_end] = np.sqrt(np.maximum(mean_squares - row_means * row_means, 0))
+        if img_width > 1:
+            gradients[block_start:block_end] = np.abs(np.diff(luma.astype(np.int16), axis=1)).mean(axis=1)
+        ranges[block_start:block_end] = luma.max(axis=1).astype(np.int16) - luma.min(axis=1)
+    return means, stddevs, gradients, ranges
+
+
+def find_low_energy_bands(means, stddevs, gradients, ranges, max_stddev, max_gradient, max_range, max_mean_step, min_band_height):
+    """[V6] 对低能量行做游程分析，返回高度不小于 min_band_height 的空白带 [(起始Y, 结束Y), ...]。"""
+    low_energy = (stddevs <= max_stddev) & (gradients <= max_gradient) & (ranges <= max_range)
+    # 相邻行均值跳变处断开游程，使空白带不会与相邻的纯色画格连成一片
+    mean_steps = np.zeros(len(means), dtype=bool)
+    mean_steps[1:] = np.abs(np.diff(means)) > max_mean_step
+    run_starts_mask = low_energy & (mean_steps | ~np.concatenate(([False], low_energy[:-1])))
+    run_ends_mask = low_energy & np.concatenate((mean_steps[1:] | ~low_energy[1:], [True]))
+    run_starts = np.flatnonzero(run_starts_mask)
+    run_ends = np.flatnonzero(run_ends_mask) + 1
+    return [(int(start), int(end)) for start, end in zip(run_starts, run_ends) if end - start >= min_band_height]
+
+
+def find_split_segments_v6(img, max_stddev, max_gradient, max_range, max_mean_step, min_band_height):
+    """[V6] 基于行统计的单次扫描分析，返回切割后每个片段的 (起始Y, 结束Y) 列表，不写任何文件。
+
+    空白带取中点作为切割点；紧贴长图顶部或底部的空白带不切割。未找到任何合格空白带时返回空列表。
+    """
+    start_time = time.time()
+    img_width, img_height = img.size
+    if img_height < min_band_height * 3:
+        print("    图片太短，无需分割。")
+        return []
+
+    print(f"    分析一个 {img_width}x{img_height} 的图片（行均值 / 方差 / 梯度能量）...")
+    bands = find_low_energy_bands(
+        *compute_row_statistics(img), max_stddev, max_gradient, max_range, max_mean_step, min_band_height
+    )
+    cut_points = [start + (end - start) // 2 for start, end in bands if start > 0 and end < img_height]
+    print(f"    分析完成，耗时: {time.time() - start_time:.2f} 秒，找到 {len(cut_points)} 个合格空白带。")
+    if not cut_points:
+        print("\n    [V6 诊断报告] 未能找到任何合格的低能量空白带进行分割。")
+        print(f"    建议检查参数: V6_MAX_ROW_STDDEV={max_stddev}, V6_MAX_GRADIENT_ENERGY={max_gradient}, V6_MIN_BAND_HEIGHT={min_band_height}")
+        return []
+
+    boundaries = [0] + cut_points + [img_height]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+@profile_stage("split_v6")
+def split_long_image_v6(long_image_path, output_split_dir, max_stddev, max_gradient, max_range, max_mean_step, min_band_height, segments_out=None):
+    """V6 分割方法：一次向量化扫描计算行统计量，在低能量空白带（含渐变与纹理分隔带）中切割。
+
+    如果提供了 segments_out 列表，计算出的切割片段 (起始Y, 结束Y) 会被追加到其中。
+    """
+    print(f"\n  --- 步骤 2 (V6 - 行统计分析): 分割长图 '{os.path.basename(long_image_path)}' ---")
+    if not os.path.isfile(long_image_path):
+        print(f"    错误: 长图路径 '{long_image_path}' 未找到。")
+        return []
+
+    os.makedirs(output_split_dir, exist_ok=True)
+
+    try:
+        with Image.open(long_image_path) as img:
+            img_rgb = img.convert("RGB")
+            add_megapixels(img_rgb.width, img_rgb.height)
+            segments = find_split_segments_v6(img_rgb, max_stddev, max_gradient, max_range, max_mean_step, min_band_height)
+            if not segments:
                 return []
 
+            original_basename, _ = os.path.splitext(os.path.basename(long_image_path))
+            split_image_paths = save_split_segments(img_rgb, segments, output_split_dir, original_basename)
+            print(f"    已按 {len(segments) - 1} 个切割点保存 {len(split_image_paths)} 个片段。")
+            if segments_out is not None:
+                segments_out.extend(segments)
+
             return natsort.natsorted(split_image_paths)
 
     except Exception as e:
-        print(f"    V4 分割图片 '{os.path.basename(long_image_path)}' 时发生严重错误: {e}")
+        print(f"    V6 分割图片 '{os.path.basename(long_image_path)}' 时发生严重错误: {e}")
         traceback.print_exc()
         return []
 
 
 # --- 融合分割函数 ---
 def split_long_image_hybrid(long_image_path, output_split_dir):
-    """融合分割方法：先尝试 V2，如果 PDF 创建失败则自动切换到 V4。"""
+    """融合分割方法：先尝试 V6（启用时）与 V2，都未能有效分割时自动切换到 V4。"""
     print(f"\n  --- 步骤 2 (V5 - 智能融合分割): 分割长图 '{os.path.basename(long_image_path)}' ---")
-    print("    🔄 采用智能双重分割策略：V2传统方法 → V4极速方法")
+    print(f"    🔄 采用智能分割策略：{' → '.join(method.upper() for method in hybrid_split_methods())}")
+
+    if ENABLE_V6_SPLITTER:
+        v6_result = split_long_image_v6(
+            long_image_path, output_split_dir,
+            V6_MAX_ROW_STDDEV, V6_MAX_GRADIENT_ENERGY, V6_MAX_ROW_RANGE, V6_MAX_MEAN_STEP, V6_MIN_BAND_HEIGHT
+        )
+        if v6_result and len(v6_result) > 1:
+            print(f"    ✅ V6 分割成功！共分割出 {len(v6_result)} 个片段。")
+            return v6_result
+        _remove_files(v6_result, " V6 分割文件")
     
     # 首先尝试 V2 方法
     print("\n    📋 第一阶段：尝试 V2 传统纯色带分析方法...")
@@ -591,231 +843,362 @@ def split_long_image_hybrid(long_image_path, output_split_dir):
     return [dest_path]
 
 
-def split_long_image_hybrid_with_pdf_fallback(long_image_path, output_split_dir, pdf_output_dir, pdf_filename, subdir_name):
-    """融合分割方法：先尝试 V2 + PDF 创建，如果 PDF 创建失败则清理 V2 文件并切换到 V4。
+def _remove_files(file_paths, label):
+    """删除一组中间文件，并打印每个文件的删除结果。"""
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+                print(f"      已删除{label}: {os.path.basename(file_path)}")
+            except Exception as e:
+                print(f"      删除失败 {os.path.basename(file_path)}: {e}")
+
+
+def _profile_pdf_filename(pdf_filename, profile, profiles):
+    stem, ext = os.path.splitext(pdf_filename)
+    return f"{stem}{profile_file_suffix(profile, profiles)}{ext}"
+
+
+def _flatten_profile_paths(paths_by_profile):
+    """把 {规格名: 路径列表} 展开为去重且保持顺序的路径列表。"""
+    if not paths_by_profile:
+        return []
+    return list(dict.fromkeys(p for paths in paths_by_profile.values() for p in paths))
+
+
+def _profile_repack_limits(profiles):
+    """
+    把每个规格的页面限制换算到长图（最宽规格）的像素尺度上，返回 {规格名: (大小上限MB, 高度上限px)}。
+
+    较窄的规格在写入 PDF 时还会按比例缩小，因此高度上限按宽度比例放大、大小上限按面积比例放大。
+    """
+    source_width = max(profile.width for profile in profiles)
+    limits = {}
+    for profile in profiles:
+        scale = source_width / profile.width
+        max_height_px = profile.max_page_height or MAX_REPACKED_PAGE_HEIGHT_PX
+        limits[profile.name] = (MAX_REPACKED_FILESIZE_MB * scale * scale, int(max_height_px * scale))
+    return limits
+
+
+def _split_repack_and_pdf(method, long_image_paths, output_split_dir, pdf_output_dir, pdf_filename, subdir_name, profiles, checkpoint=None, resume_stage=None, pdf_batch_pixels=None):
+    """执行一次 "分割 → 重打包 → 创建PDF" 尝试，每完成一个阶段就写入检查点。
+
+    long_image_paths 为一条或多条长图（分段处理时每条单独分割，片段按顺序合并后统一重打包）。
+    长图只分割一次，随后按每个输出规格分别重打包并写入各自的 PDF（PDF 按 pdf_batch_pixels 分批写入）。
+    resume_stage 为检查点中最后一个有效阶段时，会直接复用该阶段的产出，跳过已完成的步骤。
+    返回 (分割片段路径列表, {规格名: 重打包路径列表} 或 None, PDF 路径列表或 None)。
+    """
+    split_paths, repacked_by_profile = None, None
+    if resume_stage in ("repacked", "pdf"):
+        repacked_by_profile = checkpoint.outputs_by_profile("repacked")
+        split_paths = _flatten_profile_paths(repacked_by_profile)
+        if resume_stage == "pdf":
+            created_pdf_paths = checkpoint.outputs("pdf")
+            print(f"    ♻️  检查点显示 PDF 已创建，跳过分割、重打包与 PDF 步骤: {', '.join(os.path.basename(p) for p in created_pdf_paths)}")
+            return split_paths, repacked_by_profile, created_pdf_paths
+        print(f"    ♻️  从检查点恢复 {len(split_paths)} 个已重打包的图片块，跳过分割与重打包步骤。")
+    elif resume_stage == "cut_points":
+        split_paths = checkpoint.outputs("cut_points")
+        print(f"    ♻️  从检查点恢复 {len(split_paths)} 个已分割的片段，跳过分割步骤。")
+
+    if split_paths is None:
+        split_paths, segments_by_strip = [], []
+        for long_image_path in long_image_paths:
+            segments = []
+            if method == "v6":
+                strip_paths = split_long_image_v6(
+                    long_image_path, output_split_dir,
+                    V6_MAX_ROW_STDDEV, V6_MAX_GRADIENT_ENERGY, V6_MAX_ROW_RANGE, V6_MAX_MEAN_STEP, V6_MIN_BAND_HEIGHT,
+                    segments_out=segments
+                )
+            elif method == "v2":
+                strip_paths = split_long_image_v2(
+                    long_image_path, output_split_dir,
+                    MIN_SOLID_COLOR_BAND_HEIGHT, SPLIT_BAND_COLORS_RGB, COLOR_MATCH_TOLERANCE,
+                    segments_out=segments
+                )
+            elif method == "v4":
+                strip_paths = split_long_image_v4(
+                    long_image_path, output_split_dir,
+                    QUANTIZATION_FACTOR, MAX_UNIQUE_COLORS_IN_BG, MIN_SOLID_COLOR_BAND_HEIGHT_V4, EDGE_MARGIN_PERCENT,
+                    segments_out=segments
+                )
+            else:
+                # 不分割：直接复制原图作为唯一的片段
+                os.makedirs(output_split_dir, exist_ok=True)
+                dest_path = os.path.join(output_split_dir, os.path.basename(long_image_path))
+                shutil.copy2(long_image_path, dest_path)
+                strip_paths = [dest_path]
+            if not strip_paths:
+                # 任意一条长图分割失败都视为本方法失败，清理其他长图已产生的片段
+                _remove_files(split_paths, "分割文件")
+                return [], None, None
+            split_paths.extend(strip_paths)
+            segments_by_strip.append(segments)
+        if checkpoint:
+            checkpoint.mark("cut_points", split_paths, method=method, segments=segments_by_strip)
+
+    if repacked_by_profile is None:
+        repacked_by_profile = repack_split_images_for_profiles(
+            split_paths, output_split_dir, subdir_name, _profile_repack_limits(profiles)
+        )
+        if not all(repacked_by_profile.values()):
+            return split_paths, None, None
+        if checkpoint:
+            checkpoint.mark("repacked", _flatten_profile_paths(repacked_by_profile), by_profile=repacked_by_profile)
+
+    created_pdf_paths = []
+    gray_cache = {}
+    write_output = create_cbz_from_images if pdf_filename.lower().endswith(".cbz") else create_pdf_from_images
+    for profile in profiles:
+        created_pdf_path = write_output(
+            repacked_by_profile[profile.name], pdf_output_dir,
+            _profile_pdf_filename(pdf_filename, profile, profiles), profile=profile, gray_cache=gray_cache,
+            max_batch_pixels=pdf_batch_pixels
+        )
+        if not created_pdf_path:
+            return split_paths, repacked_by_profile, None
+        created_pdf_paths.append(created_pdf_path)
+    if checkpoint:
+        checkpoint.mark("pdf", created_pdf_paths)
+    return split_paths, repacked_by_profile, created_pdf_paths
+
+
+SPLIT_METHOD_LABELS = {
+    "v6": "V6 行统计分析方法",
+    "v2": "V2 传统纯色带分析方法",
+    "v4": "V4 两阶段极速分析方法",
+}
+
+
+def hybrid_split_methods():
+    """融合策略依次尝试的分割方法：V6（启用时）→ V2 → V4，全部失败时使用原图。"""
+    return (["v6"] if ENABLE_V6_SPLITTER else []) + ["v2", "v4"]
+
+
+def _remove_profile_outputs(pdf_output_dir, pdf_filename, profiles):
+    """删除失败尝试留下的输出文件（包括其他规格已成功写出的 PDF）。"""
+    for profile in profiles:
+        profile_pdf_filename = _profile_pdf_filename(pdf_filename, profile, profiles)
+        potential_pdf_path = os.path.join(pdf_output_dir, profile_pdf_filename)
+        if os.path.exists(potential_pdf_path):
+            try:
+                os.remove(potential_pdf_path)
+                print(f"      已删除失败的 PDF 文件: {profile_pdf_filename}")
+            except Exception as e:
+                print(f"      删除失败的 PDF 文件失败: {e}")
+
+
+def split_long_image_hybrid_with_pdf_fallback(long_image_path, output_split_dir, pdf_output_dir, pdf_filename, subdir_name, checkpoint=None, profiles=None, pdf_batch_pixels=None):
+    """融合分割方法：依次尝试 V6 → V2 → V4 分割 + PDF 创建，某种方法失败时清理其文件并切换到下一种。
     
     失败判定标准：
-    - V2 分割成功但 PDF 创建失败时，清除 V2 分割的图片，重新使用 V4 方式进行分割
-    - V2 分割成功但重打包失败时，清除 V2 分割的图片，重新使用 V4 方式进行分割
-    - V2 分割本身失败时，直接使用 V4 方式进行分割
+    - 分割成功但 PDF 创建失败时，清除该方法分割的图片，使用下一种方法重新分割
+    - 分割成功但重打包失败时，清除该方法分割的图片，使用下一种方法重新分割
+    - 分割本身失败（V6 / V4 未找到合格空白带）时，直接使用下一种方法
+    - 最后一种方法 (V4) 分割成功但 PDF 创建失败时直接返回失败；所有方法都未能分割时使用原图
+
+    提供 checkpoint (StageCheckpoint) 时，会从检查点中最后一个有效阶段继续，并在每个阶段完成后更新检查点。
+    profiles 为输出规格列表（默认使用全局配置的单一规格），任一规格的 PDF 创建失败都视为失败。
+    long_image_path 可以是单个路径，也可以是分段处理时的多条长图路径列表。
+    返回 (最终图片块路径列表, PDF 路径列表或 None)。
     """
-    print(f"\n  --- 步骤 2 (V5 - 智能融合分割): 分割长图 '{os.path.basename(long_image_path)}' ---")
-    print("    🔄 采用智能双重分割策略：V2传统方法 → V4极速方法")
+    profiles = profiles or default_output_profiles()
+    long_image_paths = [long_image_path] if isinstance(long_image_path, str) else list(long_image_path)
+    methods = hybrid_split_methods()
+    print(f"\n  --- 步骤 2 (V5 - 智能融合分割): 分割长图 {', '.join(repr(os.path.basename(p)) for p in long_image_paths)} ---")
+    print(f"    🔄 采用智能分割策略：{' → '.join(method.upper() for method in methods)}")
     print("    📋 失败判定标准：PDF 创建失败时自动切换方法")
-    
-    # 首先尝试 V2 方法
-    print("\n    📋 第一阶段：尝试 V2 传统纯色带分析方法...")
-    print("    🎨 使用预设的韩漫常见背景色进行分割，提高速度和效率...")
-    
-    v2_result = split_long_image_v2(
-        long_image_path,
-        output_split_dir,
-        MIN_SOLID_COLOR_BAND_HEIGHT,
-        SPLIT_BAND_COLORS_RGB,
-        COLOR_MATCH_TOLERANCE
-    )
-    
-    if v2_result and len(v2_result) >= 1:
-        print(f"    ✅ V2 分割成功！共分割出 {len(v2_result)} 个片段。")
-        print("    📄 正在尝试从 V2 分割结果创建 PDF...")
-        
-        # 尝试重打包
-        repacked_v2_paths = repack_split_images(
-            v2_result, output_split_dir, base_filename=subdir_name,
-            max_size_mb=MAX_REPACKED_FILESIZE_MB, max_height_px=MAX_REPACKED_PAGE_HEIGHT_PX
-        )
-        
-        if repacked_v2_paths:
-            # 尝试创建 PDF
-            created_pdf_path = create_pdf_from_images(
-                repacked_v2_paths, pdf_output_dir, pdf_filename
-            )
-            
-            if created_pdf_path:
-                print(f"    ✅ V2 方法完全成功！PDF 已创建: {os.path.basename(created_pdf_path)}")
-                return repacked_v2_paths, created_pdf_path
-            else:
-                print("    ❌ V2 分割成功但 PDF 创建失败，正在清理 V2 文件并切换到 V4 方法...")
-                # 清理 V2 产生的所有文件
-                print("    🧹 清理 V2 分割和重打包产生的所有文件...")
-                for file_path in v2_result:
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                            print(f"      已删除 V2 分割文件: {os.path.basename(file_path)}")
-                        except Exception as e:
-                            print(f"      删除失败 {os.path.basename(file_path)}: {e}")
-                
-                for file_path in repacked_v2_paths:
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                            print(f"      已删除 V2 重打包文件: {os.path.basename(file_path)}")
-                        except Exception as e:
-                            print(f"      删除失败 {os.path.basename(file_path)}: {e}")
-        else:
-            print("    ❌ V2 分割成功但重打包失败，正在清理 V2 文件并切换到 V4 方法...")
-            # 清理 V2 分割文件
-            print("    🧹 清理 V2 分割产生的文件...")
-            for file_path in v2_result:
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        print(f"      已删除 V2 分割文件: {os.path.basename(file_path)}")
-                    except Exception as e:
-                        print(f"      删除失败 {os.path.basename(file_path)}: {e}")
+
+    resume_stage = checkpoint.resume_stage if checkpoint else None
+    resumed_method = None
+    if resume_stage in ("cut_points", "repacked", "pdf"):
+        resumed_method = checkpoint.get("cut_points").get("method")
+        print(f"    ♻️  检查点记录的分割方法为 {resumed_method.upper()}，将从阶段 '{resume_stage}' 之后继续。")
     else:
-        print("    ⚠️  V2 方法分割失败，正在切换到 V4 方法...")
-    
-    # 清理可能创建的失败 PDF
-    potential_pdf_path = os.path.join(pdf_output_dir, pdf_filename)
-    if os.path.exists(potential_pdf_path):
-        try:
-            os.remove(potential_pdf_path)
-            print(f"      已删除失败的 PDF 文件: {pdf_filename}")
-        except Exception as e:
-            print(f"      删除失败的 PDF 文件失败: {e}")
-    
-    # 尝试 V4 方法
-    print("\n    🚀 第二阶段：启用 V4 两阶段极速分析方法...")
-    v4_result = split_long_image_v4(
-        long_image_path,
-        output_split_dir,
-        QUANTIZATION_FACTOR,
-        MAX_UNIQUE_COLORS_IN_BG,
-        MIN_SOLID_COLOR_BAND_HEIGHT_V4,
-        EDGE_MARGIN_PERCENT
-    )
-    
-    if v4_result and len(v4_result) >= 1:
-        print(f"    ✅ V4 分割成功！共分割出 {len(v4_result)} 个片段。")
-        print("    📄 正在从 V4 分割结果创建 PDF...")
-        
-        # 尝试重打包
-        repacked_v4_paths = repack_split_images(
-            v4_result, output_split_dir, base_filename=subdir_name,
-            max_size_mb=MAX_REPACKED_FILESIZE_MB, max_height_px=MAX_REPACKED_PAGE_HEIGHT_PX
+        resume_stage = None
+
+    if resumed_method == "none" or (resumed_method and resumed_method not in methods):
+        split_paths, repacked_by_profile, created_pdf_paths = _split_repack_and_pdf(
+            resumed_method, long_image_paths, output_split_dir, pdf_output_dir, pdf_filename, subdir_name, profiles,
+            checkpoint=checkpoint, resume_stage=resume_stage, pdf_batch_pixels=pdf_batch_pixels
         )
-        
-        if repacked_v4_paths:
-            # 尝试创建 PDF
-            created_pdf_path = create_pdf_from_images(
-                repacked_v4_paths, pdf_output_dir, pdf_filename
-            )
-            
-            if created_pdf_path:
-                print(f"    ✅ V4 方法完全成功！PDF 已创建: {os.path.basename(created_pdf_path)}")
-                return repacked_v4_paths, created_pdf_path
+        return (_flatten_profile_paths(repacked_by_profile) or split_paths), created_pdf_paths
+
+    remaining_methods = methods[methods.index(resumed_method):] if resumed_method else methods
+    for attempt_index, method in enumerate(remaining_methods):
+        method_name = method.upper()
+        is_last_method = method == methods[-1]
+        print(f"\n    📋 第 {attempt_index + 1} 阶段：尝试 {SPLIT_METHOD_LABELS[method]}...")
+        split_result, repacked_by_profile, created_pdf_paths = _split_repack_and_pdf(
+            method, long_image_paths, output_split_dir, pdf_output_dir, pdf_filename, subdir_name, profiles,
+            checkpoint=checkpoint, resume_stage=resume_stage if attempt_index == 0 else None,
+            pdf_batch_pixels=pdf_batch_pixels
+        )
+        repacked_paths = _flatten_profile_paths(repacked_by_profile)
+
+        if split_result:
+            print(f"    ✅ {method_name} 分割成功！共分割出 {len(split_result)} 个片段。")
+            if created_pdf_paths:
+                print(f"    ✅ {method_name} 方法完全成功！PDF 已创建: {', '.join(os.path.basename(p) for p in created_pdf_paths)}")
+                return repacked_paths, created_pdf_paths
+            if is_last_method:
+                print(f"    ❌ {method_name} 分割成功但{'PDF 创建' if repacked_paths else '重打包'}失败。")
+                return (repacked_paths or split_result), None
+            if repacked_paths:
+                print(f"    ❌ {method_name} 分割成功但 PDF 创建失败，正在清理 {method_name} 文件并切换到下一种方法...")
+                print(f"    🧹 清理 {method_name} 分割和重打包产生的所有文件...")
+                _remove_files(split_result, f" {method_name} 分割文件")
+                _remove_files(repacked_paths, f" {method_name} 重打包文件")
             else:
-                print("    ❌ V4 分割成功但 PDF 创建失败。")
-                return repacked_v4_paths, None
+                print(f"    ❌ {method_name} 分割成功但重打包失败，正在清理 {method_name} 文件并切换到下一种方法...")
+                print(f"    🧹 清理 {method_name} 分割产生的文件...")
+                _remove_files(split_result, f" {method_name} 分割文件")
         else:
-            print("    ❌ V4 分割成功但重打包失败。")
-            return v4_result, None
-    
-    print("    ❌ 两种分割方法都未能有效分割图片，将使用原图。")
+            print(f"    ⚠️  {method_name} 方法分割失败{'' if is_last_method else '，正在切换到下一种方法'}...")
+
+        if checkpoint:
+            checkpoint.invalidate("cut_points")
+        _remove_profile_outputs(pdf_output_dir, pdf_filename, profiles)
     
-    # 如果两种方法都失败，复制原图并尝试创建 PDF
-    dest_path = os.path.join(output_split_dir, os.path.basename(long_image_path))
-    shutil.copy2(long_image_path, dest_path)
+    print("    ❌ 所有分割方法都未能有效分割图片，将使用原图。")
     
-    created_pdf_path = create_pdf_from_images(
-        [dest_path], pdf_output_dir, pdf_filename
+    # 如果所有方法都失败，复制原图并尝试创建 PDF
+    original_paths, _, created_pdf_paths = _split_repack_and_pdf(
+        "none", long_image_paths, output_split_dir, pdf_output_dir, pdf_filename, subdir_name, profiles,
+        checkpoint=checkpoint, pdf_batch_pixels=pdf_batch_pixels
     )
     
-    return [dest_path], created_pdf_path
+    return original_paths, created_pdf_paths
 
 
-def _merge_image_list_for_repack(image_paths, output_path):
-    """一个专门用于重打包的内部合并函数。"""
+def _merge_image_list_for_repack(image_paths, output_dir, output_stem):
+    """一个专门用于重打包的内部合并函数。成功时返回写入的文件路径，否则返回 None。"""
     if not image_paths: 
-        return False
+        return None
     images_data, total_height, target_width = [], 0, 0
     for path in image_paths:
         try:
-            with Image.open(path) as img:
-                if target_width == 0: 
-                    target_width = img.width
-                images_data.append({"path": path, "height": img.height})
-                total_height += img.height
+            width, height = intermediate_dimensions(path)
+            if target_width == 0: 
+                target_width = width
+            images_data.append({"path": path, "height": height})
+            total_height += height
         except Exception: 
             continue
     if not images_data or target_width == 0: 
-        return False
+        return None
     merged_canvas = Image.new('RGB', (target_width, total_height))
+    add_megapixels(target_width, total_height)
     current_y = 0
     for item in images_data:
-        with Image.open(item["path"]) as img:
-            merged_canvas.paste(img.convert("RGB"), (0, current_y))
-            current_y += item["height"]
-    merged_canvas.save(output_path, "PNG")
-    return True
+        img = open_intermediate(item["path"])
+        merged_canvas.paste(img.convert("RGB"), (0, current_y))
+        img.close()
+        current_y += item["height"]
+    return save_intermediate(merged_canvas, output_dir, output_stem, INTERMEDIATE_FORMAT, get_image_backend(IMAGE_BACKEND))
 
 
-def repack_split_images(split_image_paths, output_dir, base_filename, max_size_mb, max_height_px):
-    """按"双重限制"重新打包分割后的图片。"""
-    print(f"\n  --- 步骤 2.5: 按双重限制重打包 (上限: {max_size_mb}MB, {max_height_px}px) ---")
+def _plan_repack_buckets(image_attributes, max_size_bytes, max_height_px):
+    """按"双重限制"把 [(路径, 大小, 高度), ...] 依次分组，返回路径分组列表。"""
+    buckets, current_bucket_paths, current_bucket_size, current_bucket_height = [], [], 0, 0
+    for img_path, file_size, img_height in image_attributes:
+        if current_bucket_paths and ((current_bucket_size + file_size > max_size_bytes) or (current_bucket_height + img_height > max_height_px)):
+            buckets.append(current_bucket_paths)
+            current_bucket_paths, current_bucket_size, current_bucket_height = [img_path], file_size, img_height
+        else:
+            current_bucket_paths.append(img_path)
+            current_bucket_size += file_size
+            current_bucket_height += img_height
+    if current_bucket_paths:
+        buckets.append(current_bucket_paths)
+    return buckets
+
+
+@profile_stage("repack")
+def repack_split_images_for_profiles(split_image_paths, output_dir, base_filename, profile_limits):
+    """按"双重限制"为每个输出规格分别重打包分割后的图片。
+
+    profile_limits 为 {规格名: (大小上限MB, 高度上限px)}（以分割片段自身的像素计）。
+    每个片段的属性只读取一次；不同规格分出的相同分组只合并一次并共享同一个文件。
+    大小限制按片段以默认压缩级别编码为 PNG 后的大小计算，与中间格式无关。
+    返回 {规格名: 重打包路径列表}。
+    """
+    limits_text = "; ".join(f"{max_size_mb:g}MB, {max_height_px}px" for max_size_mb, max_height_px in profile_limits.values())
+    print(f"\n  --- 步骤 2.5: 按双重限制重打包 (上限: {limits_text}) ---")
     if not split_image_paths or len(split_image_paths) <= 1:
         print("    仅有1个或没有图片块，无需重打包。")
-        return split_image_paths
+        return {name: split_image_paths for name in profile_limits}
 
-    max_size_bytes = max_size_mb * 1024 * 1024
     os.makedirs(output_dir, exist_ok=True)
-    repacked_paths, current_bucket_paths, current_bucket_size, current_bucket_height = [], [], 0, 0
-    repack_index = 1
-
+    image_attributes = []
     for img_path in split_image_paths:
         try:
-            file_size = os.path.getsize(img_path)
-            with Image.open(img_path) as img: 
-                img_height = img.height
+            image_attributes.append((img_path, intermediate_size_estimate(img_path), intermediate_dimensions(img_path)[1]))
         except Exception as e:
             print(f"\n    警告: 无法读取图片 '{os.path.basename(img_path)}' 的属性: {e}")
-            continue
-        
-        if current_bucket_paths and ((current_bucket_size + file_size > max_size_bytes) or (current_bucket_height + img_height > max_height_px)):
-            output_filename = f"{base_filename}_repacked_{repack_index}.png"
-            output_path = os.path.join(output_dir, output_filename)
-            if _merge_image_list_for_repack(current_bucket_paths, output_path):
-                repacked_paths.append(output_path)
-            repack_index += 1
-            current_bucket_paths, current_bucket_size, current_bucket_height = [img_path], file_size, img_height
-        else:
-            current_bucket_paths.append(img_path)
-            current_bucket_size += file_size
-            current_bucket_height += img_height
 
-    if current_bucket_paths:
-        output_filename = f"{base_filename}_repacked_{repack_index}.png"
-        output_path = os.path.join(output_dir, output_filename)
-        if _merge_image_list_for_repack(current_bucket_paths, output_path):
-            repacked_paths.append(output_path)
-    
-    print(f"    重打包完成，共生成 {len(repacked_paths)} 个新的图片块。")
+    merged_buckets = {}
+    repacked_by_profile = {}
+    for name, (max_size_mb, max_height_px) in profile_limits.items():
+        repacked_paths = []
+        for bucket in _plan_repack_buckets(image_attributes, max_size_mb * 1024 * 1024, max_height_px):
+            bucket_key = tuple(bucket)
+            if bucket_key not in merged_buckets:
+                merged_buckets[bucket_key] = _merge_image_list_for_repack(
+                    bucket, output_dir, f"{base_filename}_repacked_{len(merged_buckets) + 1}"
+                )
+            if merged_buckets[bucket_key]:
+                repacked_paths.append(merged_buckets[bucket_key])
+        repacked_by_profile[name] = repacked_paths
+
+    print(f"    重打包完成，共生成 {sum(1 for p in merged_buckets.values() if p)} 个新的图片块。")
     print("    ... 正在清理原始分割文件 ...")
-    original_files_to_clean = [p for p in split_image_paths if p not in repacked_paths]
+    all_repacked_paths = set(_flatten_profile_paths(repacked_by_profile))
+    original_files_to_clean = [p for p in split_image_paths if p not in all_repacked_paths]
     for path in original_files_to_clean:
         if os.path.exists(path): 
             os.remove(path)
             
-    return natsort.natsorted(repacked_paths)
+    return repacked_by_profile
 
 
-def create_pdf_from_images(image_paths_list, output_pdf_dir, pdf_filename_only):
-    """从图片列表创建PDF。"""
+def repack_split_images(split_image_paths, output_dir, base_filename, max_size_mb, max_height_px):
+    """按"双重限制"重新打包分割后的图片（单一规格）。"""
+    return repack_split_images_for_profiles(
+        split_image_paths, output_dir, base_filename, {base_filename: (max_size_mb, max_height_px)}
+    )[base_filename]
+
+
+@profile_stage("pdf")
+def create_pdf_from_images(image_paths_list, output_pdf_dir, pdf_filename_only, profile=None, gray_cache=None, max_batch_pixels=None):
+    """从图片列表创建PDF。
+
+    profile 为输出规格，比规格更宽的页面会先缩小到规格宽度；为 None 时按原尺寸使用全局的 DPI 与 JPEG 质量。
+    gray_cache 为 {图片路径: 是否灰度}，多个规格共享同一批页面时灰度检测只做一次。
+    max_batch_pixels 为每批最多同时加载的页面像素数：全部页面超出时分批追加写入同一个 PDF，以限制内存峰值。
+    """
+    if profile is None:
+        profile = OutputProfile("default", 0, PDF_IMAGE_JPEG_QUALITY, PDF_DPI)
+    if gray_cache is None:
+        gray_cache = {}
     print(f"\n  --- 步骤 3: 从图片片段创建 PDF '{pdf_filename_only}' ---")
     if not image_paths_list:
         print("    没有图片可用于创建 PDF。")
         return None
 
-    safe_image_paths = []
+    safe_image_paths, page_sizes = [], []
     for image_path in image_paths_list:
         try:
-            with Image.open(image_path) as img:
-                if img.height > 65500 or img.width > 65500:
-                    print(f"\n    警告: 图片 '{os.path.basename(image_path)}' 尺寸过大，已跳过。")
-                else:
-                    safe_image_paths.append(image_path)
+            width, height = intermediate_dimensions(image_path)
+            if profile.width and width > profile.width:
+                width, height = profile.width, int(height * (profile.width / width))
+            if height > 65500 or width > 65500:
+                print(f"\n    警告: 图片 '{os.path.basename(image_path)}' 尺寸过大，已跳过。")
+            else:
+                safe_image_paths.append(image_path)
+                page_sizes.append((width, height))
         except Exception as e:
             print(f"    警告: 无法打开图片 '{image_path}' 进行尺寸检查: {e}")
     
@@ -825,20 +1208,336 @@ def create_pdf_from_images(image_paths_list, output_pdf_dir, pdf_filename_only):
     os.makedirs(output_pdf_dir, exist_ok=True)
     pdf_full_path = os.path.join(output_pdf_dir, pdf_filename_only)
     
-    images_for_pdf = [Image.open(p).convert('RGB') for p in safe_image_paths]
-    if not images_for_pdf: 
+    backend = get_image_backend(IMAGE_BACKEND)
+    save_kwargs = {"resolution": float(profile.dpi), "optimize": True}
+    if profile.jpeg_quality is not None:
+        save_kwargs["quality"] = profile.jpeg_quality
+    batches = split_batches_by_pixels(page_sizes, max_batch_pixels)
+    if len(batches) > 1:
+        print(f"    页面总像素超出内存预算，将分 {len(batches)} 批追加写入 PDF。")
+
+    gray_page_count = 0
+    for batch_index, (batch_start, batch_end) in enumerate(batches):
+        images_for_pdf = []
+        try:
+            for image_path in safe_image_paths[batch_start:batch_end]:
+                img_obj = open_intermediate(image_path).convert("RGB")
+                if image_path not in gray_cache:
+                    gray_cache[image_path] = ENABLE_GRAYSCALE_PAGES and is_effectively_grayscale(img_obj)
+                if profile.width and img_obj.width > profile.width:
+                    img_obj = backend.resize(img_obj, (profile.width, int(img_obj.height * (profile.width / img_obj.width))))
+                images_for_pdf.append(img_obj.convert("L") if gray_cache[image_path] else img_obj)
+                add_megapixels(img_obj.width, img_obj.height)
+            gray_page_count += sum(1 for img_obj in images_for_pdf if img_obj.mode == 'L')
+            images_for_pdf[0].save(pdf_full_path, save_all=True, append_images=images_for_pdf[1:],
+                                   append=batch_index > 0, **save_kwargs)
+        except Exception as e:
+            print(f"    创建 PDF 失败: {e}")
+            if os.path.exists(pdf_full_path):
+                os.remove(pdf_full_path)
+            return None
+        finally:
+            for img_obj in images_for_pdf: 
+                img_obj.close()
+
+    if gray_page_count:
+        print(f"    检测到 {gray_page_count}/{len(safe_image_paths)} 个灰度页面，将以 8 位灰度写入 PDF。")
+    print(f"    成功创建 PDF: {pdf_full_path}")
+    return pdf_full_path
+
+
+@profile_stage("cbz")
+def create_cbz_from_images(image_paths_list, output_dir, cbz_filename_only, profile=None, gray_cache=None, max_batch_pixels=None):
+    """把重打包后的页面直接存入 CBZ（不压缩的 ZIP），不生成 PDF。
+
+    无需缩放的 PNG / WebP 中间文件原样存入；其余页面（如 npy）按规格宽度缩放后编码为 JPEG，
+    灰度页面编码为 8 位灰度 JPEG，超出 JPEG 尺寸上限的页面改用 PNG。参数含义同 create_pdf_from_images，
+    页面总是逐页写入，因此忽略 max_batch_pixels。
+    """
+    print(f"\n  --- 步骤 3: 将图片片段存入 CBZ '{cbz_filename_only}' ---")
+    if not image_paths_list:
+        print("    没有图片可用于创建 CBZ。")
         return None
+    if profile is None:
+        profile = OutputProfile("default", 0, PDF_IMAGE_JPEG_QUALITY, PDF_DPI)
+    if gray_cache is None:
+        gray_cache = {}
+    jpeg_quality = profile.jpeg_quality if profile.jpeg_quality is not None else CBZ_PAGE_JPEG_QUALITY
 
+    os.makedirs(output_dir, exist_ok=True)
+    cbz_full_path = os.path.join(output_dir, cbz_filename_only)
+    tmp_path = cbz_full_path + ".tmp"
+    backend = get_image_backend(IMAGE_BACKEND)
+    stored_count = 0
     try:
-        images_for_pdf[0].save(pdf_full_path, save_all=True, append_images=images_for_pdf[1:], resolution=float(PDF_DPI), quality=PDF_IMAGE_JPEG_QUALITY, optimize=True)
-        print(f"    成功创建 PDF: {pdf_full_path}")
-        return pdf_full_path
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as cbz:
+            for page_index, image_path in enumerate(image_paths_list, start=1):
+                width, height = intermediate_dimensions(image_path)
+                needs_resize = bool(profile.width) and width > profile.width
+                extension = os.path.splitext(image_path)[1].lower()
+                if extension in (".png", ".webp") and not needs_resize:
+                    cbz.write(image_path, f"{page_index:04d}{extension}")
+                    stored_count += 1
+                    continue
+
+                img_obj = open_intermediate(image_path).convert("RGB")
+                if image_path not in gray_cache:
+                    gray_cache[image_path] = ENABLE_GRAYSCALE_PAGES and is_effectively_grayscale(img_obj)
+                if needs_resize:
+                    img_obj = backend.resize(img_obj, (profile.width, int(height * (profile.width / width))))
+                if gray_cache[image_path]:
+                    img_obj = img_obj.convert("L")
+                add_megapixels(img_obj.width, img_obj.height)
+                buffer = io.BytesIO()
+                if max(img_obj.size) > 65500:
+                    img_obj.save(buffer, "PNG", compress_level=6)
+                    member_name = f"{page_index:04d}.png"
+                else:
+                    img_obj.save(buffer, "JPEG", quality=jpeg_quality, optimize=True)
+                    member_name = f"{page_index:04d}.jpg"
+                img_obj.close()
+                cbz.writestr(member_name, buffer.getvalue())
+        os.replace(tmp_path, cbz_full_path)
     except Exception as e:
-        print(f"    创建 PDF 失败: {e}")
+        print(f"    创建 CBZ 失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         return None
-    finally:
-        for img_obj in images_for_pdf: 
-            img_obj.close()
+    if stored_count:
+        print(f"    {stored_count}/{len(image_paths_list)} 个页面无需重新编码，已原样存入。")
+    print(f"    成功创建 CBZ: {cbz_full_path}")
+    return cbz_full_path
+
+
+# --- 试运行：只分析切割点，不写入任何片段或 PDF ---
+def _estimate_jpeg_bytes_per_pixel(canvas, profile, jpeg_quality):
+    """在画布上等间隔抽取若干图块，按规格宽度缩放后实际编码为 JPEG，返回平均每像素字节数。"""
+    backend = get_image_backend(IMAGE_BACKEND)
+    tile_height = min(DRY_RUN_SIZE_SAMPLE_TILE_HEIGHT, canvas.height)
+    tile_count = max(1, min(DRY_RUN_SIZE_SAMPLE_TILES, canvas.height // max(1, tile_height)))
+    step = (canvas.height - tile_height) / max(1, tile_count - 1)
+    total_bytes, total_pixels = 0, 0
+    for tile_index in range(tile_count):
+        top = int(tile_index * step)
+        tile = canvas.crop((0, top, canvas.width, top + tile_height))
+        if profile.width and tile.width > profile.width:
+            tile = backend.resize(tile, (profile.width, max(1, int(tile.height * (profile.width / tile.width)))))
+        if ENABLE_GRAYSCALE_PAGES and is_effectively_grayscale(tile):
+            tile = tile.convert("L")
+        buffer = io.BytesIO()
+        tile.save(buffer, "JPEG", quality=jpeg_quality if jpeg_quality is not None else 75)
+        total_bytes += buffer.tell()
+        total_pixels += tile.width * tile.height
+    return total_bytes / total_pixels if total_pixels else 0
+
+
+def _segment_records(canvas, segments, strip_index):
+    """为片段列表附加所在长图序号、高度与编码后大小（与正式流程的重打包大小限制相同，按默认 PNG 编码计算）。"""
+    return [
+        {"strip": strip_index, "start": start_y, "end": end_y, "height": end_y - start_y,
+         "estimated_bytes": reference_png_size(canvas.crop((0, start_y, canvas.width, end_y)))}
+        for start_y, end_y in segments
+    ]
+
+
+def _save_split_preview(thumbnail, scale, cut_points, page_cut_points, output_path):
+    """在低分辨率预览图上标注切割点并保存：红线为分割切割点，绿色粗线为（第一个规格）重打包后的页面边界。"""
+    draw = ImageDraw.Draw(thumbnail)
+    for y in cut_points:
+        draw.line([(0, int(y * scale)), (thumbnail.width, int(y * scale))], fill=(255, 0, 0), width=1)
+    for y in page_cut_points:
+        draw.line([(0, int(y * scale)), (thumbnail.width, int(y * scale))], fill=(0, 200, 0), width=3)
+    thumbnail.save(output_path, "JPEG", quality=80)
+    return output_path
+
+
+def preview_project_split(sources, subdir_name, report_dir, profiles, strips=None, admission=None):
+    """
+    试运行：在内存中合并项目图片并计算 V6 / V2 / V4 切割点，预测重打包后的页数与每个规格的 PDF 大小，
+    把结果写入 report_dir 中的 JSON 报告（以及可选的标注预览图），不写入长图、片段或 PDF。
+
+    strips 为分段处理时每条长图的页面下标范围（与正式运行一致，同一时间只在内存中保留一条长图）；
+    片段大小与正式流程一样按默认 PNG 编码计算（预测的页数与页高与正式运行一致），
+    PDF 大小按抽样图块的实际 JPEG 编码结果外推，为近似值。
+    每种分割方法在同一画布上的分析耗时也记录在报告中，可用于在同一批图片上对比各方法。
+    返回报告内容（dict，"report_path" 为报告路径），失败时返回 None。
+    """
+    start_time = time.time()
+    merge_width = max(profile.width for profile in profiles)
+    strips = strips or [(0, len(sources))]
+    profile_limits = _profile_repack_limits(profiles)
+    os.makedirs(report_dir, exist_ok=True)
+
+    segment_finders = {
+        "v6": lambda img: find_split_segments_v6(
+            img, V6_MAX_ROW_STDDEV, V6_MAX_GRADIENT_ENERGY, V6_MAX_ROW_RANGE, V6_MAX_MEAN_STEP, V6_MIN_BAND_HEIGHT
+        ),
+        "v2": lambda img: find_split_segments_v2(img, MIN_SOLID_COLOR_BAND_HEIGHT, SPLIT_BAND_COLORS_RGB, COLOR_MATCH_TOLERANCE),
+        "v4": lambda img: find_split_segments_v4(
+            img, QUANTIZATION_FACTOR, MAX_UNIQUE_COLORS_IN_BG, MIN_SOLID_COLOR_BAND_HEIGHT_V4, EDGE_MARGIN_PERCENT
+        ),
+    }
+
+    strip_results = []
+    for strip_index, (strip_start, strip_end) in enumerate(strips):
+        print(f"\n  --- 试运行: 在内存中合并第 {strip_index + 1}/{len(strips)} 条长图（第 {strip_start + 1}-{strip_end} 张图片）---")
+        canvas = compose_long_image(sources[strip_start:strip_end], merge_width)
+        if canvas is None:
+            return None
+        method_segments, method_seconds = {}, {}
+        for method, find_segments in segment_finders.items():
+            method_start = time.perf_counter()
+            method_segments[method] = find_segments(canvas)
+            method_seconds[method] = round(time.perf_counter() - method_start, 3)
+        method_segments["none"] = [(0, canvas.height)]
+        result = {
+            "pages": [strip_start, strip_end],
+            "width": canvas.width,
+            "height": canvas.height,
+            "segments": {
+                method: _segment_records(canvas, segments, strip_index) for method, segments in method_segments.items()
+            },
+            "method_seconds": method_seconds,
+            "bytes_per_pixel": {
+                profile.name: _estimate_jpeg_bytes_per_pixel(canvas, profile, profile.jpeg_quality) for profile in profiles
+            },
+        }
+        if DRY_RUN_THUMBNAIL_WIDTH:
+            result["thumbnail_scale"] = min(DRY_RUN_THUMBNAIL_WIDTH / canvas.width, 65000 / canvas.height)
+            result["thumbnail"] = canvas.resize(
+                (max(1, int(canvas.width * result["thumbnail_scale"])), max(1, int(canvas.height * result["thumbnail_scale"]))),
+                Image.Resampling.BILINEAR
+            )
+        canvas.close()
+        strip_results.append(result)
+
+    # 与正式流程一致：按融合策略的顺序选择第一种在每条长图上都得到片段的方法（后续方法只在 PDF 创建失败时启用）
+    selected_method = next(
+        (method for method in hybrid_split_methods() if all(result["segments"][method] for result in strip_results)),
+        "none"
+    )
+    segments = [segment for result in strip_results for segment in result["segments"][selected_method]]
+
+    profile_reports = {}
+    page_cut_points_by_strip = [[] for _ in strip_results]
+    attributes = [(index, segment["estimated_bytes"], segment["height"]) for index, segment in enumerate(segments)]
+    for profile in profiles:
+        max_size_mb, max_height_px = profile_limits[profile.name]
+        buckets = _plan_repack_buckets(attributes, max_size_mb * 1024 * 1024, max_height_px)
+        scale = min(1.0, profile.width / merge_width)
+        predicted_bytes = sum(
+            strip_results[segment["strip"]]["width"] * segment["height"] * scale * scale
+            * strip_results[segment["strip"]]["bytes_per_pixel"][profile.name]
+            for segment in segments
+        )
+        if profile is profiles[0]:
+            for bucket in buckets[1:]:
+                first_segment = segments[bucket[0]]
+                page_cut_points_by_strip[first_segment["strip"]].append(first_segment["start"])
+        profile_reports[profile.name] = {
+            "profile": profile.to_dict(),
+            "predicted_pages": len(buckets),
+            "page_heights": [int(sum(segments[index]["height"] for index in bucket) * scale) for bucket in buckets],
+            "predicted_pdf_bytes": int(predicted_bytes),
+            "predicted_pdf_mb": round(predicted_bytes / 1048576, 2),
+        }
+
+    strip_reports = []
+    for strip_index, result in enumerate(strip_results):
+        strip_report = {
+            "pages": result["pages"],
+            "width": result["width"],
+            "height": result["height"],
+            "v6_cut_points": [segment["start"] for segment in result["segments"]["v6"][1:]],
+            "v2_cut_points": [segment["start"] for segment in result["segments"]["v2"][1:]],
+            "v4_cut_points": [segment["start"] for segment in result["segments"]["v4"][1:]],
+            "method_seconds": result["method_seconds"],
+        }
+        if "thumbnail" in result:
+            suffix = f"_{strip_index + 1}" if len(strip_results) > 1 else ""
+            thumbnail_path = os.path.join(report_dir, f"{subdir_name}_split_preview{suffix}.jpg")
+            cut_points = [segment["start"] for segment in result["segments"][selected_method][1:]]
+            try:
+                strip_report["thumbnail"] = _save_split_preview(
+                    result["thumbnail"], result["thumbnail_scale"], cut_points,
+                    page_cut_points_by_strip[strip_index], thumbnail_path
+                )
+            except Exception as e:
+                print(f"    警告: 生成预览图失败: {e}")
+        strip_reports.append(strip_report)
+
+    report = {
+        "project": subdir_name,
+        "dry_run": True,
+        "parameters": {
+            "v6": {"V6_MAX_ROW_STDDEV": V6_MAX_ROW_STDDEV, "V6_MAX_GRADIENT_ENERGY": V6_MAX_GRADIENT_ENERGY,
+                   "V6_MAX_ROW_RANGE": V6_MAX_ROW_RANGE, "V6_MAX_MEAN_STEP": V6_MAX_MEAN_STEP,
+                   "V6_MIN_BAND_HEIGHT": V6_MIN_BAND_HEIGHT},
+            "v2": {"MIN_SOLID_COLOR_BAND_HEIGHT": MIN_SOLID_COLOR_BAND_HEIGHT, "COLOR_MATCH_TOLERANCE": COLOR_MATCH_TOLERANCE,
+                   "SPLIT_BAND_COLORS_RGB": SPLIT_BAND_COLORS_RGB},
+            "v4": {"QUANTIZATION_FACTOR": QUANTIZATION_FACTOR, "MAX_UNIQUE_COLORS_IN_BG": MAX_UNIQUE_COLORS_IN_BG,
+                   "MIN_SOLID_COLOR_BAND_HEIGHT_V4": MIN_SOLID_COLOR_BAND_HEIGHT_V4, "EDGE_MARGIN_PERCENT": EDGE_MARGIN_PERCENT},
+        },
+        "selected_method": selected_method,
+        "strips": strip_reports,
+        "segments": segments,
+        "profiles": profile_reports,
+        "admission": admission.to_dict() if admission else None,
+        "elapsed_seconds": round(time.time() - start_time, 2),
+    }
+    report_path = os.path.join(report_dir, f"{subdir_name}_split_preview.json")
+    try:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"    错误: 写入试运行报告失败: {e}")
+        return None
+    report["report_path"] = report_path
+
+    print(f"\n  🔍 试运行结果: 分割方法 {selected_method.upper()}，{len(segments)} 个片段")
+    for name, profile_report in profile_reports.items():
+        print(f"    - {name}: 预计 {profile_report['predicted_pages']} 页，PDF 约 {profile_report['predicted_pdf_mb']} MB")
+    print(f"    报告已保存: {report_path}")
+    return report
+
+
+def summarize_split_benchmark(reports, report_dir):
+    """
+    汇总多个项目的试运行报告，在同一批长图上对比各分割方法的分析耗时、吞吐量与找到的切割点数量，
+    打印对比表并保存为 report_dir 中的 split_benchmark.json。返回汇总内容。
+    """
+    methods = list(SPLIT_METHOD_LABELS)
+    summary = {method: {"seconds": 0.0, "cut_points": 0, "strips_split": 0} for method in methods}
+    total_megapixels, total_strips = 0.0, 0
+    for report in reports:
+        for strip in report["strips"]:
+            total_strips += 1
+            total_megapixels += strip["width"] * strip["height"] / 1_000_000
+            for method in methods:
+                cut_points = strip[f"{method}_cut_points"]
+                summary[method]["seconds"] += strip["method_seconds"][method]
+                summary[method]["cut_points"] += len(cut_points)
+                summary[method]["strips_split"] += 1 if cut_points else 0
+    for method in methods:
+        seconds = summary[method]["seconds"]
+        summary[method]["seconds"] = round(seconds, 3)
+        summary[method]["megapixels_per_second"] = round(total_megapixels / seconds, 1) if seconds else None
+
+    print(f"\n分割方法对比（{len(reports)} 个项目，{total_strips} 条长图，共 {total_megapixels:.1f} 百万像素）:")
+    for method in methods:
+        item = summary[method]
+        throughput = f"{item['megapixels_per_second']} MP/s" if item["megapixels_per_second"] else "-"
+        print(f"  - {method.upper()}: 耗时 {item['seconds']:.2f}s ({throughput})，切割点 {item['cut_points']} 个，"
+              f"成功分割 {item['strips_split']}/{total_strips} 条长图")
+
+    benchmark = {"projects": len(reports), "strips": total_strips, "megapixels": round(total_megapixels, 1), "methods": summary}
+    try:
+        os.makedirs(report_dir, exist_ok=True)
+        with open(os.path.join(report_dir, "split_benchmark.json"), "w", encoding="utf-8") as f:
+            json.dump(benchmark, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"    警告: 写入分割方法对比报告失败: {e}")
+    return benchmark
 
 
 def cleanup_intermediate_dirs(long_img_dir, split_img_dir):
@@ -852,7 +1551,196 @@ def cleanup_intermediate_dirs(long_img_dir, split_img_dir):
             except Exception as e:
                 print(f"    删除文件夹 '{dir_path}' 失败: {e}")
 
-def process_root_directory(root_input_dir):
+# --- 阶段检查点 ---
+PIPELINE_STAGES = ("merged", "cut_points", "repacked", "pdf")
+
+
+def default_output_profiles():
+    """未指定输出规格时使用的单一规格（即上面的全局配置）。"""
+    return list(OUTPUT_PROFILES or [OutputProfile(
+        "default", PDF_TARGET_PAGE_WIDTH_PIXELS, PDF_IMAGE_JPEG_QUALITY, PDF_DPI, MAX_REPACKED_PAGE_HEIGHT_PX
+    )])
+
+
+def get_stage_configs(profiles=None, output_format=OUTPUT_FORMAT, dedup_mode=DEDUP_OFF):
+    """返回每个阶段会影响其产出的配置项，配置变化时对应阶段及其后续阶段都会失效。"""
+    profiles = profiles or default_output_profiles()
+    merged_config = {"target_width": max(profile.width for profile in profiles)}
+    if dedup_mode == DEDUP_SKIP:
+        merged_config["dedup"] = [PAGE_DEDUP_HASH, PAGE_DEDUP_MAX_DISTANCE]
+    return {
+        "merged": merged_config,
+        "cut_points": {
+            "methods": hybrid_split_methods(),
+            "v6": [V6_MAX_ROW_STDDEV, V6_MAX_GRADIENT_ENERGY, V6_MAX_ROW_RANGE, V6_MAX_MEAN_STEP, V6_MIN_BAND_HEIGHT],
+            "v2": [MIN_SOLID_COLOR_BAND_HEIGHT, COLOR_MATCH_TOLERANCE, SPLIT_BAND_COLORS_RGB],
+            "v4": [QUANTIZATION_FACTOR, MAX_UNIQUE_COLORS_IN_BG, MIN_SOLID_COLOR_BAND_HEIGHT_V4, EDGE_MARGIN_PERCENT],
+        },
+        "repacked": {"limits": _profile_repack_limits(profiles)},
+        "pdf": {"profiles": [profile.to_dict() for profile in profiles], "grayscale": ENABLE_GRAYSCALE_PAGES,
+                "output_format": output_format},
+    }
+
+
+def fingerprint_files(file_paths, base_dir):
+    """根据文件的相对路径、大小和修改时间计算指纹（不读取文件内容）。任一文件缺失时返回 None。"""
+    hasher = hashlib.sha1()
+    for path in file_paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        rel_path = os.path.relpath(path, base_dir).replace(os.sep, '/')
+        hasher.update(f"{rel_path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class StageCheckpoint:
+    """
+    记录单个项目在 合并 → 切割点计算 → 重打包 → PDF 各阶段的完成标记。
+
+    每个阶段的标记包含输入指纹（上一阶段的产出指纹 + 本阶段配置）和产出文件指纹。
+    重跑时沿阶段链逐一校验，只要输入未变且产出文件完好，就从最后一个有效阶段继续。
+    """
+
+    def __init__(self, project_dir, stage_configs):
+        self.project_dir = project_dir
+        self.path = os.path.join(project_dir, CHECKPOINT_FILENAME)
+        self.stage_configs = stage_configs
+        self.source_fingerprint = None
+        self.resume_stage = None
+        self.stages = {}
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.stages = json.load(f).get("stages", {})
+        except (OSError, ValueError):
+            self.stages = {}
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"stages": self.stages}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"    警告: 写入检查点文件失败: {e}")
+
+    def _input_fingerprint(self, stage, upstream_fingerprint):
+        payload = json.dumps([upstream_fingerprint, self.stage_configs.get(stage)], sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _upstream_fingerprint(self, stage):
+        index = PIPELINE_STAGES.index(stage)
+        if index == 0:
+            return self.source_fingerprint
+        return self.stages.get(PIPELINE_STAGES[index - 1], {}).get("output")
+
+    def _outputs_intact(self, stage):
+        record = self.stages.get(stage)
+        if not record:
+            return False
+        return fingerprint_files(self.outputs(stage), self.project_dir) == record.get("output")
+
+    def prepare(self, source_fingerprint):
+        """载入检查点，返回可以继续的最后一个有效阶段名（无可用阶段时返回 None），并丢弃其后的阶段标记。"""
+        self.source_fingerprint = source_fingerprint
+        self._load()
+
+        valid_stages = []
+        for stage in PIPELINE_STAGES:
+            record = self.stages.get(stage)
+            if not record or record.get("input") != self._input_fingerprint(stage, self._upstream_fingerprint(stage)):
+                break
+            valid_stages.append(stage)
+
+        self.resume_stage = None
+        # 长图是 V4 回退分割的输入，因此任何阶段的恢复都要求长图仍然完好
+        if valid_stages and self._outputs_intact("merged"):
+            for stage in reversed(valid_stages):
+                if self._outputs_intact(stage):
+                    self.resume_stage = stage
+                    break
+
+        if self.resume_stage is None:
+            self.stages = {}
+        else:
+            self.invalidate(PIPELINE_STAGES[PIPELINE_STAGES.index(self.resume_stage) + 1:])
+        return self.resume_stage
+
+    def get(self, stage):
+        return self.stages.get(stage, {})
+
+    def outputs(self, stage):
+        """返回某阶段记录的产出文件绝对路径列表。"""
+        return [os.path.normpath(os.path.join(self.project_dir, p)) for p in self.get(stage).get("outputs", [])]
+
+    def outputs_by_profile(self, stage):
+        """返回某阶段按输出规格记录的产出 {规格名: 绝对路径列表}。"""
+        return {
+            name: [os.path.normpath(os.path.join(self.project_dir, p)) for p in paths]
+            for name, paths in self.get(stage).get("by_profile", {}).items()
+        }
+
+    def _relpath(self, path):
+        return os.path.relpath(path, self.project_dir).replace(os.sep, '/')
+
+    def mark(self, stage, output_paths, by_profile=None, **extra):
+        """记录某阶段已完成，并使其后续阶段的标记失效。"""
+        self.invalidate(PIPELINE_STAGES[PIPELINE_STAGES.index(stage) + 1:])
+        record = {
+            "input": self._input_fingerprint(stage, self._upstream_fingerprint(stage)),
+            "output": fingerprint_files(output_paths, self.project_dir),
+            "outputs": [self._relpath(p) for p in output_paths],
+            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if by_profile is not None:
+            record["by_profile"] = {name: [self._relpath(p) for p in paths] for name, paths in by_profile.items()}
+        record.update(extra)
+        self.stages[stage] = record
+        self._save()
+
+    def invalidate(self, stages):
+        """使指定阶段（单个阶段名或阶段名序列）的标记失效。"""
+        if not stages:
+            return
+        if isinstance(stages, str):
+            stages = PIPELINE_STAGES[PIPELINE_STAGES.index(stages):]
+        changed = False
+        for stage in stages:
+            if self.stages.pop(stage, None) is not None:
+                changed = True
+        if changed:
+            self._save()
+
+    def clear(self):
+        """项目处理成功后删除检查点文件。"""
+        self.stages = {}
+        if os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                print(f"    警告: 删除检查点文件失败: {e}")
+
+
+def process_root_directory(root_input_dir, output_profiles=None, output_format=None, memory_budget_mb=None,
+                           dedup_mode=None, dry_run=False, profile_memory=None):
+    """
+    处理根目录下的每个项目文件夹，以及根目录中的每个 CBZ / ZIP 压缩包（直接读取，不解压）。
+    output_profiles 为 OutputProfile 列表：每个项目的源图只合并、分割一次，再为每个规格各输出一个 PDF；
+    为 None 时使用 default_output_profiles()。output_format 为 "pdf" 或 "cbz"，为 None 时使用 OUTPUT_FORMAT。
+    memory_budget_mb 为内存准入控制的预算，为 None 时使用 MEMORY_BUDGET_MB。
+    dedup_mode 为重复页面检测模式（off / flag / skip），为 None 时使用 PAGE_DEDUP_MODE。
+    dry_run 为 True 时只计算切割点并为每个项目输出 JSON 预览报告，不写入任何片段或 PDF，也不移动项目。
+    profile_memory 为 True 时在性能报告中额外用 tracemalloc 追踪 Python/NumPy 分配，为 None 时使用 PROFILE_TRACE_PYTHON_ALLOCATIONS。
+    """
+    profiles = output_profiles or default_output_profiles()
+    output_format = output_format or OUTPUT_FORMAT
+    merge_width = max(profile.width for profile in profiles)
+    memory_budget = resolve_memory_budget(memory_budget_mb or MEMORY_BUDGET_MB) if ENABLE_MEMORY_ADMISSION else None
+    dedup_mode = dedup_mode or PAGE_DEDUP_MODE
+    profile_memory = PROFILE_TRACE_PYTHON_ALLOCATIONS if profile_memory is None else profile_memory
     # 根据根目录名称创建唯一的PDF输出文件夹
     overall_pdf_output_dir = os.path.join(root_input_dir, "processed_files")
     os.makedirs(overall_pdf_output_dir, exist_ok=True)
@@ -868,6 +1756,16 @@ def process_root_directory(root_input_dir):
                          d != "processed_files" and \
                          d != os.path.basename(overall_pdf_output_dir) and \
                          not d.startswith('.')]
+    # 根目录中的压缩包作为独立项目，项目名为去掉扩展名的文件名（与文件夹重名时使用完整文件名）
+    archive_sources = {}
+    for f in os.listdir(root_input_dir):
+        if f.startswith('.') or not is_image_archive(os.path.join(root_input_dir, f)):
+            continue
+        project_name = archive_project_name(f)
+        if project_name in subdirectories or project_name in archive_sources:
+            project_name = f
+        archive_sources[project_name] = os.path.join(root_input_dir, f)
+    subdirectories += list(archive_sources)
 
     # --- 智能单项目模式检测 ---
     if not subdirectories:
@@ -900,55 +1798,173 @@ def process_root_directory(root_input_dir):
             return
 
     sorted_subdirectories = natsort.natsorted(subdirectories)
+    print(f"\n🖼️  图片处理后端: {get_image_backend(IMAGE_BACKEND).name}")
+    if memory_budget:
+        print(f"🧮 内存预算: {memory_budget / 1048576:.0f} MB")
+    if len(profiles) > 1:
+        print(f"📐 输出规格: {'; '.join(profile.describe() for profile in profiles)}")
+    deduplicator = None
+    if dedup_mode != DEDUP_OFF:
+        deduplicator = PageDeduplicator(root_input_dir, PAGE_DEDUP_HASH, PAGE_DEDUP_MAX_DISTANCE, dedup_mode)
+        print(f"🔁 重复页面检测: {dedup_mode} ({PAGE_DEDUP_HASH}, 汉明距离 ≤ {PAGE_DEDUP_MAX_DISTANCE})")
     print(f"\n将按顺序处理以下 {len(sorted_subdirectories)} 个项目文件夹: {', '.join(sorted_subdirectories)}")
     failed_subdirs_list = []
+    deferred_subdirs_list = []
+    project_profilers = []
+    dry_run_reports = []
 
     for i, subdir_name in enumerate(sorted_subdirectories):
         print(f"\n\n{'='*15} 开始处理项目: {subdir_name} ({i+1}/{len(sorted_subdirectories)}) {'='*15}")
-        current_processing_subdir = os.path.join(root_input_dir, subdir_name)
+        archive_path = archive_sources.get(subdir_name)
+        if archive_path:
+            # 压缩包项目：直接读取成员，中间文件与检查点放在根目录下的隐藏工作文件夹中
+            current_processing_subdir = os.path.join(root_input_dir, f".{subdir_name}_v5_work")
+            if not dry_run:
+                os.makedirs(current_processing_subdir, exist_ok=True)
+            print(f"  📦 直接读取压缩包: {os.path.basename(archive_path)}（不解压）")
+        else:
+            current_processing_subdir = os.path.join(root_input_dir, subdir_name)
+        project_source = archive_path or current_processing_subdir
         path_long_image_output_dir = os.path.join(current_processing_subdir, MERGED_LONG_IMAGE_SUBDIR_NAME)
         path_split_images_output_dir = os.path.join(current_processing_subdir, SPLIT_IMAGES_SUBDIR_NAME)
-        
-        # 每次都清理旧的中间文件，以防上次失败残留
-        if os.path.isdir(path_long_image_output_dir): 
-            shutil.rmtree(path_long_image_output_dir)
-        if os.path.isdir(path_split_images_output_dir): 
-            shutil.rmtree(path_split_images_output_dir)
-
-        created_long_image_path = merge_to_long_image(
-            current_processing_subdir, path_long_image_output_dir,
-            f"{subdir_name}_{LONG_IMAGE_FILENAME_BASE}.png", PDF_TARGET_PAGE_WIDTH_PIXELS
-        )
+
+        checkpoint = StageCheckpoint(current_processing_subdir, get_stage_configs(profiles, output_format, dedup_mode))
+        source_image_paths = collect_project_images(project_source) or []
+        if archive_path:
+            source_fingerprint = fingerprint_files([archive_path], current_processing_subdir)
+        else:
+            source_fingerprint = fingerprint_files(source_image_paths, current_processing_subdir)
+        if deduplicator and source_image_paths:
+            # 即使随后从检查点继续，也要登记本项目的页面哈希，供后续项目比对
+            kept_sources, duplicates = deduplicator.filter_pages(source_image_paths, subdir_name)
+            report_duplicates(duplicates, dedup_mode, indent="  ")
+            if not kept_sources:
+                print("  ⚠️  该项目的所有页面都与之前的项目重复，将保留全部页面以免输出空文件。")
+            elif dedup_mode == DEDUP_SKIP and duplicates:
+                source_image_paths = kept_sources
+                if source_fingerprint:
+                    # 跳过的页面取决于之前的项目，把它们计入指纹，使跳过集合变化时合并结果失效
+                    skipped_names = "|".join(source_display_name(source) for source, _ in duplicates)
+                    source_fingerprint = hashlib.sha1(f"{source_fingerprint}|{skipped_names}".encode('utf-8')).hexdigest()
+
+        resume_stage = None if dry_run else checkpoint.prepare(source_fingerprint)
+
+        # 内存准入控制：仅读取文件头估算各阶段峰值，决定直接处理、分段处理或延后处理
+        admission = None
+        pdf_batch_pixels = pdf_batch_pixels_for_budget(memory_budget) if memory_budget else None
+        if memory_budget and resume_stage is None:
+            max_page_height = max(height for _, height in _profile_repack_limits(profiles).values())
+            admission = plan_admission(probe_page_dimensions(source_image_paths), memory_budget, merge_width, max_page_height)
+            pdf_batch_pixels = admission.pdf_batch_pixels
+            print(f"\n  🧮 内存准入: {admission.describe()}")
+            if admission.action == ADMIT_DEFER:
+                print(f"  ⏸️  项目 '{subdir_name}' 已延后处理并保留在原位，可提高 MEMORY_BUDGET_MB (--memory-budget-mb) 后重跑。")
+                close_image_sources(source_image_paths)
+                if archive_path:
+                    shutil.rmtree(current_processing_subdir, ignore_errors=True)
+                deferred_subdirs_list.append(subdir_name)
+                print(f"{'='*15} '{subdir_name}' 处理完毕 {'='*15}")
+                print_progress_bar(i + 1, len(sorted_subdirectories), prefix="总进度:", suffix='完成', length=40)
+                continue
+
+        if dry_run:
+            strips = admission.strips if admission and admission.action == ADMIT_CHUNK else None
+            preview_report = None
+            if source_image_paths:
+                preview_report = preview_project_split(
+                    source_image_paths, subdir_name, os.path.join(overall_pdf_output_dir, DRY_RUN_REPORT_SUBDIR_NAME),
+                    profiles, strips, admission
+                )
+            else:
+                print(f"  在 '{subdir_name}' 中未找到符合条件的图片。")
+            close_image_sources(source_image_paths)
+            if preview_report:
+                dry_run_reports.append(preview_report)
+            else:
+                failed_subdirs_list.append(subdir_name)
+            print(f"{'='*15} '{subdir_name}' 试运行完毕 {'='*15}")
+            print_progress_bar(i + 1, len(sorted_subdirectories), prefix="总进度:", suffix='完成', length=40)
+            continue
+
+        profiler = None
+        if ENABLE_STAGE_PROFILING:
+            profiler = StageProfiler(subdir_name, trace_python_allocations=profile_memory).start()
+            set_active_profiler(profiler)
+
+        if resume_stage is None:
+            # 没有可继续的检查点：清理旧的中间文件，以防上次失败残留
+            if os.path.isdir(path_long_image_output_dir): 
+                shutil.rmtree(path_long_image_output_dir)
+            if os.path.isdir(path_split_images_output_dir): 
+                shutil.rmtree(path_split_images_output_dir)
+
+            strips = admission.strips if admission and admission.action == ADMIT_CHUNK else [(0, len(source_image_paths))]
+            created_long_image_paths = []
+            for strip_index, (strip_start, strip_end) in enumerate(strips, start=1):
+                strip_suffix = f"_{strip_index}" if len(strips) > 1 else ""
+                if len(strips) > 1:
+                    print(f"\n  🧩 分段合并第 {strip_index}/{len(strips)} 条长图（第 {strip_start + 1}-{strip_end} 张图片）")
+                created_long_image_path = merge_to_long_image(
+                    project_source, path_long_image_output_dir,
+                    f"{subdir_name}_{LONG_IMAGE_FILENAME_BASE}{strip_suffix}.png", merge_width,
+                    sources=source_image_paths[strip_start:strip_end]
+                )
+                if not created_long_image_path:
+                    created_long_image_paths = []
+                    break
+                created_long_image_paths.append(created_long_image_path)
+            if created_long_image_paths:
+                checkpoint.mark("merged", created_long_image_paths)
+        else:
+            created_long_image_paths = checkpoint.outputs("merged")
+            print(f"\n  ♻️  检测到有效的检查点 (最后完成阶段: {resume_stage})，源图片与配置均未变化，跳过合并步骤。")
+            print(f"    复用长图: {', '.join(created_long_image_paths)}")
 
         pdf_created_for_this_subdir = False
-        created_pdf_path = None
+        created_pdf_paths = None
         
-        if created_long_image_path:
+        if created_long_image_paths:
             # ▼▼▼ 调用 V5 融合分割函数（包含 PDF 创建失败自动切换逻辑）▼▼▼
             # Note: split_long_image_hybrid_with_pdf_fallback needs to returns paths
             # In previous code it returned: repacked_final_paths, created_pdf_path
             # Let's ensure variable unpacking handles it safely
             result = split_long_image_hybrid_with_pdf_fallback(
-                created_long_image_path, 
+                created_long_image_paths, 
                 path_split_images_output_dir,
                 overall_pdf_output_dir,
-                f"{subdir_name}.pdf",
-                subdir_name
+                f"{subdir_name}.{output_format}",
+                subdir_name,
+                checkpoint=checkpoint,
+                profiles=profiles,
+                pdf_batch_pixels=pdf_batch_pixels
             )
-            created_pdf_path = result[1] if result else None
+            created_pdf_paths = result[1] if result else None
             
-            if created_pdf_path: 
+            if created_pdf_paths: 
                 pdf_created_for_this_subdir = True
-                print(f"\n  ✅ 项目 '{subdir_name}' 处理成功！PDF 已创建: {os.path.basename(created_pdf_path)}")
+                print(f"\n  ✅ 项目 '{subdir_name}' 处理成功！PDF 已创建: {', '.join(os.path.basename(p) for p in created_pdf_paths)}")
             else:
                 print(f"\n  ❌ 项目 '{subdir_name}' 处理失败：无法创建 PDF 文件。")
 
+        if profiler:
+            set_active_profiler(None)
+            profiler.stop()
+            project_profilers.append(profiler)
+            report_path = profiler.write_json(os.path.join(
+                overall_pdf_output_dir, PROFILE_REPORT_SUBDIR_NAME, f"{subdir_name}_profile.json"
+            ))
+            if report_path:
+                print(f"\n  📊 阶段性能报告已保存: {report_path}")
+
         if pdf_created_for_this_subdir:
             cleanup_intermediate_dirs(path_long_image_output_dir, path_split_images_output_dir)
+            checkpoint.clear()
+            if archive_path:
+                shutil.rmtree(current_processing_subdir, ignore_errors=True)
             
             # --- 新增功能：移动处理成功的文件夹 ---
             print(f"\n  --- 步骤 5: 移动已成功处理的项目文件夹 ---")
-            source_folder_to_move = current_processing_subdir
+            source_folder_to_move = project_source
             destination_parent_folder = success_move_target_dir
             
             try:
@@ -962,17 +1978,44 @@ def process_root_directory(root_input_dir):
                     failed_subdirs_list.append(f"{subdir_name} (移动失败)")
 
         else:
-            print(f"  ❌ 项目文件夹 '{subdir_name}' 未能成功生成PDF，将保留中间文件以供检查。")
+            print(f"  ❌ 项目文件夹 '{subdir_name}' 未能成功生成PDF，将保留中间文件与检查点，重跑时会从最后一个有效阶段继续。")
             failed_subdirs_list.append(subdir_name)
 
         print(f"{'='*15} '{subdir_name}' 处理完毕 {'='*15}")
         print_progress_bar(i + 1, len(sorted_subdirectories), prefix="总进度:", suffix='完成', length=40)
 
+    if dry_run:
+        print("\n" + "=" * 80 + "\n【试运行总结】\n" + "-" * 80)
+        print(f"已分析项目: {len(sorted_subdirectories) - len(failed_subdirs_list) - len(deferred_subdirs_list)} 个，"
+              f"失败: {len(failed_subdirs_list)} 个，延后: {len(deferred_subdirs_list)} 个")
+        if dry_run_reports:
+            summarize_split_benchmark(dry_run_reports, os.path.join(overall_pdf_output_dir, DRY_RUN_REPORT_SUBDIR_NAME))
+        print(f"预览报告已保存在: {os.path.join(overall_pdf_output_dir, DRY_RUN_REPORT_SUBDIR_NAME)}")
+        print("未写入任何分割片段或 PDF，项目文件夹保持原样。")
+        return
+
     print("\n" + "=" * 80 + "\n【任务总结报告】\n" + "-" * 80)
-    success_count = len(sorted_subdirectories) - len(failed_subdirs_list)
+    success_count = len(sorted_subdirectories) - len(failed_subdirs_list) - len(deferred_subdirs_list)
     print(f"总计处理项目: {len(sorted_subdirectories)} 个\n  - ✅ 成功: {success_count} 个\n  - ❌ 失败: {len(failed_subdirs_list)} 个")
+    if deferred_subdirs_list:
+        print(f"  - ⏸️  延后 (超出内存预算): {len(deferred_subdirs_list)} 个")
     if failed_subdirs_list:
         print("\n失败项目列表 (已保留在原位):\n" + "\n".join(f"  - {d}" for d in failed_subdirs_list))
+    if deferred_subdirs_list:
+        print("\n延后项目列表 (已保留在原位):\n" + "\n".join(f"  - {d}" for d in deferred_subdirs_list))
+    if project_profilers:
+        print("\n各项目耗时与内存峰值:")
+        for profiler in project_profilers:
+            slowest, peak = profiler.slowest_stage(), profiler.peak_rss_stage()
+            line = f"  - {profiler.project_name}: 总耗时 {profiler.wall_seconds:.2f}s (CPU {profiler.cpu_seconds:.2f}s)"
+            if slowest:
+                line += f", 最慢阶段 {slowest['stage']} ({slowest['wall_seconds']:.2f}s)"
+            if peak and peak["peak_rss_bytes"]:
+                line += f", RSS 峰值阶段 {peak['stage']} ({peak['peak_rss_bytes'] / 1048576:.1f} MB)"
+            print(line)
+        print("\n全部项目阶段汇总:")
+        print("\n".join(StageProfiler.combine("ALL", project_profilers).format_summary_lines(indent="  ")))
+        print(f"\n每个项目的详细 JSON 性能报告保存在: {os.path.join(overall_pdf_output_dir, PROFILE_REPORT_SUBDIR_NAME)}")
     print("-" * 80)
     print(f"所有成功生成的PDF文件（如有）已保存在: {overall_pdf_output_dir}")
     print(f"所有成功处理的原始项目文件夹（如有）已移至: {success_move_target_dir}")
@@ -984,10 +2027,11 @@ if __name__ == "__main__":
     import sys
 
     print("🚀 自动化图片批量处理流程 (V5 - 智能融合版)")
-    print("💡 特色：V2传统分割 + V4极速分割 双重保障，PDF创建失败时自动切换方法！")
+    print("💡 特色：V6行统计分割 → V2传统分割 → V4极速分割 多重保障，PDF创建失败时自动切换方法！")
     print("🎨 优化：使用预设韩漫常见背景色，提高分割速度和效率！")
     print("📋 工作流程: 1.合并 -> 2.智能分割+PDF创建 -> 3.清理 -> 4.移动成功项")
-    print("🔄 失败判定：V2方式分割后PDF创建失败时，清理V2分割文件并自动切换到V4方式")
+    print("♻️  断点续跑：每个项目记录阶段检查点，重跑时从最后一个有效阶段继续")
+    print("🔄 失败判定：某种方式分割后PDF创建失败时，清理其分割文件并自动切换到下一种方式")
     print("⚠️  注意：V2分割失败的判定标准为PDF创建失败，而非单纯的分割失败")
     print("-" * 80)
     
@@ -1004,8 +2048,29 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="Process Images V5")
     parser.add_argument("--input", help="Input directory")
+    parser.add_argument("--output-format", choices=[OUTPUT_FORMAT_PDF, OUTPUT_FORMAT_CBZ], default=OUTPUT_FORMAT,
+                        help="Output container: pdf, or cbz to store the repacked pages without building a PDF")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="Memory budget for admission control in MB (default: 60%% of available memory)")
+    parser.add_argument("--profiles", help="Output profiles, e.g. 'tablet:1500:85:300:30000,phone:900:70:200:12000' (name:width:jpeg_quality:dpi[:max_page_height])")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only compute cut points and write a JSON preview (segments, predicted pages and PDF size) per project, "
+                             "plus a V6/V2/V4 splitter benchmark over all projects; no segments or PDFs are written")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default=None,
+                        help="Perceptual-hash duplicate page detection across the series: off, flag (report only) or skip (drop before merging)")
+    parser.add_argument("--profile-memory", action="store_true", default=None,
+                        help="Also trace Python/NumPy allocations with tracemalloc in the stage profile reports (slower); "
+                             "process RSS peaks are always sampled")
     args = parser.parse_args()
 
+    output_profiles = None
+    if args.profiles:
+        try:
+            output_profiles = parse_output_profiles(args.profiles)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
     target_directory = ""
 
     if args.input:
@@ -1046,4 +2111,5 @@ if __name__ == "__main__":
             print("\n操作被用户中断。脚本退出。")
             sys.exit()
 
-    process_root_directory(target_directory)
+    process_root_directory(target_directory, output_profiles, args.output_format, args.memory_budget_mb, args.dedup,
+                           args.dry_run, args.profile_memory)
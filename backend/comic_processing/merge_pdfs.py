@@ -5,6 +5,10 @@ import natsort
 import logging
 import json  # 新增: 用于解析JSON
 import sys
+import time
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
 
 # Add project root to sys.path
@@ -19,6 +23,13 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # 定义合并后PDF存放的子目录名称
 MERGED_PDF_SUBDIR_NAME = "merged_pdf"
 
+# 每个进程同时打开的源PDF数量上限;超出时先合并为临时分卷
+SOURCE_BATCH_SIZE = 32
+# 是否线性化输出(Fast Web View),大文件在阅读器中可以更快地显示首页
+LINEARIZE_OUTPUT = False
+# 并行合并的子文件夹进程数(--jobs),1 表示在当前进程中逐个合并
+DEFAULT_JOBS = 1
+
 # 删除了旧的硬编码 DEFAULT_INPUT_DIR
 
 def natural_sort_key(s: str) -> list:
@@ -28,58 +39,297 @@ def natural_sort_key(s: str) -> list:
     return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
 
 
-def merge_pdfs_in_directory(root_dir: str):
+def collect_pdf_files(subfolder_path: str) -> list:
     """
-    合并指定目录结构下的PDF文件。
+    递归收集子文件夹(及其所有后代目录)中的PDF文件,按自然顺序排序。
     """
-    # 创建 merged_pdf 输出目录
-    output_dir = os.path.join(root_dir, MERGED_PDF_SUBDIR_NAME)
-    os.makedirs(output_dir, exist_ok=True)
-    logging.info(f"输出目录 '{output_dir}' 已准备就绪。")
+    pdf_files = []
+    for dirpath, _, filenames in os.walk(subfolder_path):
+        for filename in filenames:
+            if filename.lower().endswith('.pdf'):
+                pdf_files.append(os.path.join(dirpath, filename))
+    return natsort.natsorted(pdf_files)
 
-    subfolders = [d.path for d in os.scandir(root_dir) if d.is_dir() and d.name != MERGED_PDF_SUBDIR_NAME]
 
-    if not subfolders:
-        logging.warning(f"在根目录 '{root_dir}' 下没有找到需要处理的子文件夹。")
+def _save_options(final: bool, linearize: bool) -> dict:
+    """中间分卷追求写入速度；最终文件使用对象流压缩,并可选线性化(Fast Web View)。"""
+    if not final:
+        return {"object_stream_mode": pikepdf.ObjectStreamMode.disable}
+    return {
+        "object_stream_mode": pikepdf.ObjectStreamMode.generate,
+        "compress_streams": True,
+        "linearize": linearize,
+    }
+
+
+def _collect_icc_streams(color_space, candidates: dict, depth: int = 0):
+    """
+    在色彩空间定义中查找 ICC 配置流: [/ICCBased 流] 本身,以及 /Indexed、/Separation、/DeviceN
+    等以数组形式嵌套的基础色彩空间。
+    """
+    if depth > 4 or not isinstance(color_space, pikepdf.Array):
+        return
+    if len(color_space) >= 2 and color_space[0] == pikepdf.Name.ICCBased:
+        icc = color_space[1]
+        if isinstance(icc, pikepdf.Stream) and icc.is_indirect:
+            candidates[icc.objgen] = "icc"
         return
+    for item in color_space:
+        if isinstance(item, pikepdf.Array):
+            _collect_icc_streams(item, candidates, depth + 1)
+
+
+def _collect_dedupe_candidates(pdf) -> dict:
+    """
+    找出所有图片、嵌入字体文件与 ICC 色彩配置流,返回 {(对象号, 代号): 类型}。
+    ICC 流通常直接写在图片的 /ColorSpace 或资源字典的 /ColorSpace 中(而不是独立的数组对象),
+    因此从这两处的色彩空间定义中查找。
+    """
+    candidates = {}
+    for obj in pdf.objects:
+        if not isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+            if isinstance(obj, pikepdf.Array):
+                _collect_icc_streams(obj, candidates)
+            continue
+        if isinstance(obj, pikepdf.Dictionary) and obj.get("/Type") == pikepdf.Name.FontDescriptor:
+            for key in ("/FontFile", "/FontFile2", "/FontFile3"):
+                font_file = obj.get(key)
+                if font_file is not None and font_file.is_indirect:
+                    candidates[font_file.objgen] = "font"
+            continue
+        if isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == pikepdf.Name.Image:
+            candidates[obj.objgen] = "image"
+            _collect_icc_streams(obj.get("/ColorSpace"), candidates)
+        resources = obj.get("/Resources")
+        color_spaces = resources.get("/ColorSpace") if isinstance(resources, pikepdf.Dictionary) else None
+        if isinstance(color_spaces, pikepdf.Dictionary):
+            for color_space in color_spaces.values():
+                _collect_icc_streams(color_space, candidates)
+    return candidates
 
-    print(f"\n--- 发现 {len(subfolders)} 个子文件夹,准备开始合并 ---")
 
-    for subfolder_path in natsort.natsorted(subfolders):
-        subfolder_name = os.path.basename(subfolder_path)
-        logging.info(f"===== 开始处理子文件夹: {subfolder_name} =====")
+def _canonical_repr(value, replacements: dict) -> str:
+    """生成对象的规范文本表示;间接引用按保留副本的对象号表示,使引用了重复对象的字典也能判定为相同。"""
+    if not isinstance(value, pikepdf.Object):
+        return repr(value)
+    if value.is_indirect:
+        return "ref:%d:%d" % replacements.get(value.objgen, value.objgen)
+    if isinstance(value, pikepdf.Array):
+        return "[" + ",".join(_canonical_repr(item, replacements) for item in value) + "]"
+    if isinstance(value, pikepdf.Dictionary):
+        return "{" + ",".join(f"{key}:{_canonical_repr(value[key], replacements)}" for key in sorted(value.keys())) + "}"
+    return repr(value)
 
-        pdf_files_to_merge = []
-        logging.info(f"正在 '{subfolder_name}' 及其所有子目录中搜索PDF文件...")
-        for dirpath, _, filenames in os.walk(subfolder_path):
-            for filename in filenames:
-                if filename.lower().endswith('.pdf'):
-                    pdf_path = os.path.join(dirpath, filename)
-                    pdf_files_to_merge.append(pdf_path)
-                    logging.info(f"  [找到文件] {os.path.relpath(pdf_path, subfolder_path)}")
 
-        pdf_files_to_merge = natsort.natsorted(pdf_files_to_merge)
-        if not pdf_files_to_merge:
-            logging.info("  [提示] 此文件夹中未找到PDF文件,跳过。")
+def _stream_digest(stream, kind: str, replacements: dict) -> str:
+    """按流的原始(未解码)数据与字典内容计算哈希。"""
+    hasher = hashlib.sha256(kind.encode('ascii'))
+    for key in sorted(stream.keys()):
+        if key != "/Length":
+            hasher.update(f"{key}={_canonical_repr(stream[key], replacements)};".encode('utf-8'))
+    hasher.update(stream.read_raw_bytes())
+    return hasher.hexdigest()
+
+
+def _rewrite_references(pdf, container, replacements: dict) -> int:
+    """把容器(字典/数组/流字典)中指向重复流的间接引用改为指向保留副本,返回修改的引用数。"""
+    changed = 0
+    items = enumerate(list(container)) if isinstance(container, pikepdf.Array) else list(container.items())
+    for key, value in items:
+        if not isinstance(value, pikepdf.Object):
             continue
+        if value.is_indirect:
+            target = replacements.get(value.objgen)
+            if target is not None:
+                container[key] = pdf.get_object(target)
+                changed += 1
+        elif isinstance(value, (pikepdf.Dictionary, pikepdf.Array)):
+            changed += _rewrite_references(pdf, value, replacements)
+    return changed
+
+
+def deduplicate_streams(pdf) -> tuple:
+    """
+    按内容哈希合并跨章节重复的图片、字体与 ICC 流。
+
+    重复的流不再被引用,保存时会被 qpdf 自动丢弃。返回 (去重的流数量, 节省的原始字节数)。
+    """
+    candidates = _collect_dedupe_candidates(pdf)
+    replacements = {}
+    saved_bytes = 0
+    # ICC 与字体先处理,图片的 /ColorSpace、/SMask 等引用才能映射到保留副本后再比较;
+    # 带 /SMask 的图片依赖蒙版图片的去重结果,因此重复扫描直到没有新的重复为止
+    for _ in range(3):
+        canonical = {}
+        found = 0
+        for kind in ("icc", "font", "image"):
+            for objgen, candidate_kind in candidates.items():
+                if candidate_kind != kind or objgen in replacements:
+                    continue
+                stream = pdf.get_object(objgen)
+                try:
+                    digest = _stream_digest(stream, kind, replacements)
+                except Exception:
+                    continue
+                if digest in canonical:
+                    replacements[objgen] = canonical[digest]
+                    saved_bytes += len(stream.read_raw_bytes())
+                    found += 1
+                else:
+                    canonical[digest] = objgen
+        if not found:
+            break
 
-        output_pdf_name = f"{subfolder_name}.pdf"
-        output_pdf_path = os.path.join(output_dir, output_pdf_name)
-        logging.info(f"  [准备合并] 将合并 {len(pdf_files_to_merge)} 个文件 -> {output_pdf_name}")
+    if replacements:
+        for obj in pdf.objects:
+            if isinstance(obj, (pikepdf.Dictionary, pikepdf.Array, pikepdf.Stream)):
+                _rewrite_references(pdf, obj, replacements)
+    return len(replacements), saved_bytes
 
-        try:
-            pdf = pikepdf.Pdf.new()
-            for file_path in pdf_files_to_merge:
+
+def _merge_batch(pdf_paths: list, output_path: str, final: bool, linearize: bool, dedupe: bool) -> dict:
+    """
+    把一批PDF合并到 output_path。源文件在保存完成后立即关闭(pikepdf 在保存时才读取源文件的流数据)。
+    """
+    stats = {"pages": 0, "failed": [], "deduplicated": 0, "saved_bytes": 0}
+    opened = []
+    try:
+        with pikepdf.Pdf.new() as merged:
+            for file_path in pdf_paths:
                 try:
                     src_pdf = pikepdf.Pdf.open(file_path)
-                    pdf.pages.extend(src_pdf.pages)
                 except Exception as e:
                     logging.error(f"    [错误] 无法读取文件 '{file_path}': {e}")
-            
-            pdf.save(output_pdf_path)
-            logging.info(f"  [完成] 成功保存: {output_pdf_path}")
-        except Exception as e:
-            logging.error(f"  [失败] 合并过程出错: {e}")
+                    stats["failed"].append(file_path)
+                    continue
+                opened.append(src_pdf)
+                merged.pages.extend(src_pdf.pages)
+            stats["pages"] = len(merged.pages)
+            if not stats["pages"]:
+                return stats
+            if dedupe:
+                stats["deduplicated"], stats["saved_bytes"] = deduplicate_streams(merged)
+            merged.save(output_path, **_save_options(final, linearize))
+    finally:
+        for src_pdf in opened:
+            src_pdf.close()
+    return stats
+
+
+def merge_pdf_files(pdf_paths: list, output_pdf_path: str, batch_size: int = SOURCE_BATCH_SIZE,
+                    linearize: bool = False, dedupe: bool = True) -> dict:
+    """
+    分批合并PDF文件:同时打开的源文件不超过 batch_size 个。
+
+    文件数超过 batch_size 时,先把每批合并为临时分卷(关闭该批源文件),再逐级合并分卷;
+    最终一级执行跨章节去重并以对象流写入。返回统计信息字典。
+    """
+    batch_size = max(2, batch_size)
+    parts_dir = os.path.join(os.path.dirname(output_pdf_path), f".{os.path.basename(output_pdf_path)}.parts")
+    failed = []
+    level = 0
+    current = list(pdf_paths)
+    try:
+        while len(current) > batch_size:
+            os.makedirs(parts_dir, exist_ok=True)
+            next_level = []
+            for index in range(0, len(current), batch_size):
+                part_path = os.path.join(parts_dir, f"level{level}_part{index // batch_size:05d}.pdf")
+                part_stats = _merge_batch(current[index:index + batch_size], part_path, final=False, linearize=False, dedupe=False)
+                failed.extend(part_stats["failed"])
+                if part_stats["pages"]:
+                    next_level.append(part_path)
+            logging.info(f"    [分卷] 第 {level + 1} 级: {len(current)} 个文件 -> {len(next_level)} 个临时分卷")
+            current = next_level
+            level += 1
+
+        stats = _merge_batch(current, output_pdf_path, final=True, linearize=linearize, dedupe=dedupe)
+        stats["failed"] = failed + stats["failed"]
+        return stats
+    finally:
+        if os.path.isdir(parts_dir):
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def _merge_subfolder(task: tuple) -> dict:
+    """进程池工作函数:合并一个子文件夹中的所有PDF。"""
+    subfolder_path, output_dir, batch_size, linearize, dedupe = task
+    subfolder_name = os.path.basename(subfolder_path)
+    result = {"name": subfolder_name, "status": "skipped", "pages": 0, "failed": [], "deduplicated": 0, "saved_bytes": 0}
+    logging.info(f"===== 开始处理子文件夹: {subfolder_name} =====")
+
+    pdf_files_to_merge = collect_pdf_files(subfolder_path)
+    for pdf_path in pdf_files_to_merge:
+        logging.info(f"  [找到文件] {subfolder_name}/{os.path.relpath(pdf_path, subfolder_path)}")
+    if not pdf_files_to_merge:
+        logging.info(f"  [提示] '{subfolder_name}' 中未找到PDF文件,跳过。")
+        return result
+
+    output_pdf_name = f"{subfolder_name}.pdf"
+    output_pdf_path = os.path.join(output_dir, output_pdf_name)
+    logging.info(f"  [准备合并] 将合并 {len(pdf_files_to_merge)} 个文件 -> {output_pdf_name}")
+    start_time = time.time()
+    try:
+        stats = merge_pdf_files(pdf_files_to_merge, output_pdf_path, batch_size, linearize, dedupe)
+    except Exception as e:
+        logging.error(f"  [失败] '{subfolder_name}' 合并过程出错: {e}")
+        result["status"] = "error"
+        return result
+
+    result.update(stats)
+    result["status"] = "ok" if stats["pages"] else "error"
+    if stats["pages"]:
+        dedupe_text = f", 去重 {stats['deduplicated']} 个重复流 (节省 {stats['saved_bytes'] / 1048576:.1f} MB)" if stats["deduplicated"] else ""
+        logging.info(f"  [完成] 成功保存: {output_pdf_path} ({stats['pages']} 页, 耗时 {time.time() - start_time:.1f}s{dedupe_text})")
+    return result
+
+
+def merge_pdfs_in_directory(root_dir: str, jobs: int = DEFAULT_JOBS, linearize: bool = LINEARIZE_OUTPUT,
+                            dedupe: bool = True, batch_size: int = SOURCE_BATCH_SIZE):
+    """
+    合并指定目录结构下的PDF文件。
+
+    jobs 大于 1 时每个子文件夹在独立进程中合并(默认为 1,即在当前进程中逐个合并;0 表示 CPU 核数;
+    打包后的程序中始终逐个合并);
+    同一时间每个进程最多打开 batch_size 个源文件,重复的图片/字体/ICC 流按内容哈希去重。
+    """
+    # 创建 merged_pdf 输出目录
+    output_dir = os.path.join(root_dir, MERGED_PDF_SUBDIR_NAME)
+    os.makedirs(output_dir, exist_ok=True)
+    logging.info(f"输出目录 '{output_dir}' 已准备就绪。")
+
+    subfolders = [d.path for d in os.scandir(root_dir) if d.is_dir() and d.name != MERGED_PDF_SUBDIR_NAME]
+
+    if not subfolders:
+        logging.warning(f"在根目录 '{root_dir}' 下没有找到需要处理的子文件夹。")
+        return
+
+    jobs = max(1, min(jobs if jobs > 0 else (os.cpu_count() or 1), len(subfolders)))
+    if jobs > 1 and getattr(sys, 'frozen', False):
+        # 打包后的程序中,spawn 出的工作进程会重新进入程序入口而不是执行合并任务
+        logging.warning("打包环境下不支持多进程合并,改为逐个合并。")
+        jobs = 1
+    print(f"\n--- 发现 {len(subfolders)} 个子文件夹,准备开始合并 (并行进程数: {jobs}) ---")
+
+    tasks = [(path, output_dir, batch_size, linearize, dedupe) for path in natsort.natsorted(subfolders)]
+    if jobs == 1:
+        results = [_merge_subfolder(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_merge_subfolder, tasks))
+
+    merged = [r for r in results if r["status"] == "ok"]
+    errors = [r for r in results if r["status"] == "error"]
+    print(f"\n--- 合并完成: 成功 {len(merged)} 个, 失败 {len(errors)} 个, "
+          f"跳过 {len(results) - len(merged) - len(errors)} 个 ---")
+    total_saved = sum(r["saved_bytes"] for r in merged)
+    if total_saved:
+        print(f"    跨章节去重共节省 {total_saved / 1048576:.1f} MB 原始流数据。")
+    for r in results:
+        for file_path in r["failed"]:
+            print(f"    [无法读取] {r['name']}: {file_path}")
+    for r in errors:
+        print(f"    [失败] {r['name']}")
 
 def main():
     import argparse
@@ -88,6 +338,10 @@ def main():
     parser = argparse.ArgumentParser(description="PDF 合并工具")
     parser.add_argument("--input", help="输入根目录路径")
     parser.add_argument("--output", help="输出文件路径 (未使用，仅兼容接口)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help=f"并行合并的子文件夹进程数 (默认: {DEFAULT_JOBS}，0 表示 CPU 核数)")
+    parser.add_argument("--batch-size", type=int, default=SOURCE_BATCH_SIZE, help=f"每个进程同时打开的源PDF数量上限 (默认: {SOURCE_BATCH_SIZE})")
+    parser.add_argument("--linearize", action="store_true", default=LINEARIZE_OUTPUT, help="线性化输出 (Fast Web View)")
+    parser.add_argument("--no-dedupe", action="store_true", help="不对重复的图片/字体/ICC 流去重")
     args = parser.parse_args()
 
     print("\n--- PDF 合并工具 ---")
@@ -131,7 +385,8 @@ def main():
         # --------------------------
 
     print(f"\n--- 开始处理, 根目录: {root_dir} ---")
-    merge_pdfs_in_directory(root_dir)
+    merge_pdfs_in_directory(root_dir, jobs=args.jobs, linearize=args.linearize,
+                            dedupe=not args.no_dedupe, batch_size=args.batch_size)
     print("\n--- 所有操作完成 ---")
 
 if __name__ == "__main__":
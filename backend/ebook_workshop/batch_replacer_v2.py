@@ -1,4 +1,3 @@
-import pandas as pd
 import re
 import os
 import warnings
@@ -6,12 +5,12 @@ import tempfile
 import zipfile
 import shutil
 from pathlib import Path
-from ebooklib import epub, ITEM_DOCUMENT, ITEM_STYLE
 from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
 from tqdm import tqdm
-import html
 import sys
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import css_fixer
 
 # --- 解决 Windows 控制台编码问题 (Fix Encoding Issues) ---
@@ -33,6 +32,9 @@ if sys.platform.startswith('win'):
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.rule_engine import ReplacementRule, RuleEngine
+from backend.shared_utils.change_report import REPORT_FORMAT_AUTO, REPORT_FORMATS, ReportWriter, build_change_entry
+from backend.shared_utils.epub_rewriter import EpubRewriter
 
 # --- 屏蔽已知警告 ---
 warnings.filterwarnings("ignore", category=UserWarning, module='ebooklib')
@@ -43,6 +45,26 @@ warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 PROCESSED_DIR_NAME = "processed_files"
 REPORT_DIR_NAME = "compare_reference"
 HIGHLIGHT_STYLE = "background-color: #f1c40f; color: #000; padding: 2px; border-radius: 3px;"
+# 整章扫描：一章（TXT 为整个文件）的所有段落一起交给规则引擎，文本规则对整章只扫描一次，
+# 再把匹配位置映射回段落用于报告与段落更新；关闭后退回逐段落调用
+WHOLE_DOCUMENT_PASS = True
+# 并行处理的进程数（--jobs），1 表示在主进程中逐个处理
+DEFAULT_JOBS = 1
+# 并行模式下超过该大小的 EPUB 按章节拆分到多个工作进程处理
+EPUB_SPLIT_THRESHOLD_MB = 20
+# 按章节拆分时每个任务包含的章节数
+EPUB_CHAPTERS_PER_TASK = 8
+
+# 解析并编译后的规则缓存（保存在系统临时目录的子目录中，文件名为规则文件内容的哈希，不在用户的书籍文件夹中留下文件）
+RULES_CACHE_DIRNAME = "contentforge_rules_cache"
+RULES_CACHE_VERSION = 1
+# 旧版本保存在规则文件旁的缓存文件名（加载规则时顺带删除）
+LEGACY_RULES_CACHE_FILENAME = ".rules_cache.json"
+
+# 工作进程中的规则引擎（由 _init_worker 设置）
+_worker_engine = None
+# 变更报告写出器（main 根据 --report-format 重新创建，并行时由 _init_worker 传给工作进程）
+_report_writer = ReportWriter()
 
 def read_content_auto(file_path_or_bytes) -> str:
     """尝试多种编码读取内容 (UTF-8, UTF-8-SIG, CP949, GBK, etc)"""
@@ -88,7 +110,7 @@ def find_rules_file(directory: Path) -> Path:
             
     return None
 
-def load_rules(rules_file: Path) -> pd.DataFrame:
+def load_rules(rules_file: Path) -> list:
     """加载替换规则, 支持标准格式及 Moon Reader (#->#) 格式。"""
     print(f"[*] 正在从 {rules_file.name} 加载替换规则...")
     rules_list = []
@@ -128,11 +150,7 @@ def load_rules(rules_file: Path) -> pd.DataFrame:
                 new_line_str = f"{original} -> {replacement} (Mode: {mode})\n"
                 lines_to_write.append(new_line_str)
                 
-                rules_list.append({
-                    'Original': original,
-                    'Replacement': replacement,
-                    'Mode': mode
-                })
+                rules_list.append(ReplacementRule(original, replacement, mode))
 
             elif standard_match:
                 original, replacement, mode_group = standard_match.groups()
@@ -148,20 +166,12 @@ def load_rules(rules_file: Path) -> pd.DataFrame:
                 else:
                      lines_to_write.append(original_line)
 
-                rules_list.append({
-                    'Original': original.strip(),
-                    'Replacement': replacement.strip(),
-                    'Mode': mode.strip().capitalize()
-                })
+                rules_list.append(ReplacementRule(original.strip(), replacement.strip(), mode.strip().capitalize()))
 
             elif legacy_no_repl_match:
                 original, mode = legacy_no_repl_match.groups()
                 lines_to_write.append(original_line)
-                rules_list.append({
-                    'Original': original.strip(),
-                    'Replacement': "",
-                    'Mode': mode.strip().capitalize()
-                })
+                rules_list.append(ReplacementRule(original.strip(), "", mode.strip().capitalize()))
 
             else:
                 print(f"[!] 警告: 第 {i} 行规则格式不正确，已忽略: \"{line}\"")
@@ -177,194 +187,92 @@ def load_rules(rules_file: Path) -> pd.DataFrame:
             except Exception as e:
                 print(f"[!] 警告: 无法更新规则文件格式: {e}")
 
-        df = pd.DataFrame(rules_list)
-        
-        if df.empty:
+        if not rules_list:
             print("[!] 警告: 规则文件为空或所有规则均无效。")
         
-        return df
+        return rules_list
 
     except Exception as e:
         print(f"[!] 加载规则文件失败: {e}")
         # Return empty DF or exit? Original code exits.
         sys.exit(1)
 
-def process_and_get_changes(content: str, rules: pd.DataFrame) -> tuple[str, list]:
+def compile_rules(rules: list) -> RuleEngine:
+    """把 load_rules 得到的规则列表编译为规则引擎（每次运行只编译一次）。"""
+    return RuleEngine(rules)
+
+def _rules_file_digest(rules_file: Path) -> str:
+    return hashlib.blake2b(rules_file.read_bytes(), digest_size=16).hexdigest()
+
+def _rules_cache_path(digest: str) -> Path:
+    return Path(tempfile.gettempdir()) / RULES_CACHE_DIRNAME / f"{digest}.json"
+
+def load_compiled_rules(rules_file: Path) -> tuple[list, RuleEngine]:
+    """
+    加载并编译规则，返回 (规则列表, 规则引擎)。
+    解析与编译结果按规则文件内容的哈希缓存在系统临时目录中，规则文件内容未变时直接复用。
+    """
+    legacy_cache_path = rules_file.parent / LEGACY_RULES_CACHE_FILENAME
+    if legacy_cache_path.is_file():
+        try:
+            legacy_cache_path.unlink()
+        except OSError:
+            pass
+    try:
+        digest = _rules_file_digest(rules_file)
+        with open(_rules_cache_path(digest), 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('version') == RULES_CACHE_VERSION and cached.get('digest') == digest:
+            rules = [ReplacementRule(*record) for record in cached['rules']]
+            engine = RuleEngine.from_dict(cached['engine'])
+            print(f"[*] 规则文件 {rules_file.name} 未变化，已使用缓存的编译结果。")
+            return rules, engine
+    except (OSError, ValueError, KeyError, TypeError, re.error):
+        pass
+
+    rules = load_rules(rules_file)
+    engine = compile_rules(rules)
+    try:
+        # load_rules 可能把文件改写为标准格式，因此按改写后的内容计算哈希
+        digest = _rules_file_digest(rules_file)
+        payload = {
+            'version': RULES_CACHE_VERSION,
+            'digest': digest,
+            'rules': [list(rule) for rule in rules],
+            'engine': engine.to_dict(),
+        }
+        cache_path = _rules_cache_path(digest)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[!] 警告: 无法写入规则缓存: {e}")
+    return rules, engine
+
+def process_and_get_changes(content: str, engine: RuleEngine) -> tuple[str, list]:
     """
-    核心处理函数：对传入的纯文本进行所有替换。
+    核心处理函数：对传入的纯文本按顺序链式执行所有替换。
     返回元组: (修改后的文本, 原子化变更列表)
     原子化变更: [{'original_text': '...','replacement_text': '...'}]
     """
-    modified_content = content
-    atomic_changes = []
+    return engine.apply(content)
 
-    for _, rule in rules.iterrows():
-        original, replacement, mode = rule['Original'], rule['Replacement'], rule['Mode']
-        if pd.isna(original) or original == "" or original == "nan":
-            continue
-        
-        search_pattern = re.escape(original) if mode.lower() == 'text' else original
-        
-        try:
-            # 必须在最新版本的字符串上查找，以处理链式替换
-            matches = list(re.finditer(search_pattern, modified_content))
-            if matches:
-                # 记录下每次匹配到的原文和它将被替换成的新文本
-                for match in matches:
-                    original_text = match.group(0)
-                    replacement_text = match.expand(replacement)
-                    if original_text != replacement_text:
-                        atomic_changes.append({
-                            "original_text": original_text,
-                            "replacement_text": replacement_text
-                        })
-                # 应用本条规则的替换
-                modified_content = re.sub(search_pattern, replacement, modified_content)
-        except re.error as e:
-            print(f"\n[!] 正则表达式错误: '{search_pattern}'. 错误: {e}. 跳过。")
-            continue
-
-    unique_atomic_changes = [dict(t) for t in {tuple(d.items()) for d in atomic_changes}]
-    return modified_content, unique_atomic_changes
+def process_paragraphs(paragraphs: list, engine: RuleEngine) -> list:
+    """
+    对一章的所有段落执行替换，返回与 paragraphs 一一对应的 [(修改后的文本, 原子化变更列表, 变更位置列表), ...]。
+    变更位置用于在报告中按偏移高亮（见 change_report.build_change_entry）。
+    """
+    if WHOLE_DOCUMENT_PASS:
+        return engine.apply_segments(paragraphs, with_spans=True)
+    return [engine.apply(p, with_spans=True) for p in paragraphs]
 
 def generate_report(report_path: Path, changes_log: list, source_filename: str):
-    """生成HTML格式的变更报告。"""
-    if not changes_log:
-        print(f"[!] 没有变更记录，跳过报告生成: {report_path}")
-        return
-    
-    # 获取项目根目录和模板路径
-    project_root = Path(__file__).parent.parent
-    template_path = project_root / 'shared_assets' / 'report_template.html'
-    
-    if not template_path.exists():
-        print(f"[!] 模板文件不存在: {template_path}")
-        return
-    
-    # 获取CSS和JS内容
-    shared_assets_dir = project_root / 'shared_assets'
-    css_file_path = shared_assets_dir / 'report_styles.css'
-    js_file_path = shared_assets_dir / 'report_scripts.js'
-    
-    css_content = ""
-    try:
-        css_content = css_file_path.read_text(encoding='utf-8')
-    except Exception as e:
-        print(f"[!] 读取CSS文件失败: {e}")
-        css_content = "/* CSS load failed */"
-
-    js_content = ""
-    try:
-        js_content = js_file_path.read_text(encoding='utf-8')
-    except Exception as e:
-        print(f"[!] 读取JS文件失败: {e}")
-        js_content = "// JS load failed"
-    
-    # ... (rule groups logic unchanged) ...
-    # 按替换规则归类
-    rule_groups = {}
-    for change in changes_log:
-        # 提取高亮的原文和替换文本
-        original_match = re.search(r'<span class="highlight">([^<]+)</span>', change['original'])
-        modified_match = re.search(r'<span class="highlight">([^<]+)</span>', change['modified'])
-        
-        if original_match and modified_match:
-            original_text = original_match.group(1)
-            replacement_text = modified_match.group(1)
-            rule_key = f"{original_text} → {replacement_text}"
-            
-            if rule_key not in rule_groups:
-                rule_groups[rule_key] = {
-                    'original_text': original_text,
-                    'replacement_text': replacement_text,
-                    'instances': []
-                }
-            
-            rule_groups[rule_key]['instances'].append(change)
-    
-    # 按实例数量排序
-    sorted_rule_groups = sorted(rule_groups.values(), key=lambda x: len(x['instances']), reverse=True)
-    total_instances = sum(len(group['instances']) for group in sorted_rule_groups)
-    
-    # 读取模板文件
-    template_content = template_path.read_text(encoding='utf-8')
-    
-    # 生成规则列表项
-    rules_list_items = ""
-    for i, group in enumerate(sorted_rule_groups):
-        rules_list_items += f'''
-                    <div class="rule-list-item" onclick="jumpToRule({i})">
-                        <div class="rule-text">
-                            <span class="rule-original">{html.escape(group["original_text"])}</span> → 
-                            <span class="rule-replacement">{html.escape(group["replacement_text"])}</span>
-                        </div>
-                        <div class="rule-count">{len(group["instances"])} 次</div>
-                    </div>
-        '''
-    
-    # 生成内容区域
-    content_sections = ""
-    for group_index, group in enumerate(sorted_rule_groups):
-        instance_count = len(group['instances'])
-        content_sections += f'''
-            <div class="rule-group" data-group-index="{group_index}">
-                <div class="rule-header" onclick="toggleInstances({group_index})">
-                    <div class="rule-title">
-                        <span class="rule-badge">{instance_count} 次</span>
-                        <span class="toggle-icon" id="toggle-{group_index}">▼</span>
-                    </div>
-                    <div class="rule-description">
-                        <span><strong>{html.escape(group['original_text'])}</strong></span>
-                        <span class="rule-arrow">→</span>
-                        <span><strong>{html.escape(group['replacement_text'])}</strong></span>
-                    </div>
-                </div>
-                <div class="instances-container" id="instances-{group_index}">
-        '''
-        
-        # 按位置排序实例
-        sorted_instances = sorted(group['instances'], key=lambda x: x.get('position', 0))
-        
-        for instance in sorted_instances:
-            content_sections += f'''
-                    <div class="instance-item">
-                        <div class="instance-content">
-                            <div class="original-section">
-                                <div class="section-title">原文</div>
-                                <div class="text-content">{instance['original']}</div>
-                            </div>
-                            <div class="modified-section">
-                                <div class="section-title">修改后</div>
-                                <div class="text-content">{instance['modified']}</div>
-                            </div>
-                        </div>
-                    </div>
-            '''
-        
-        content_sections += '''
-                </div>
-            </div>
-        '''
-    
-    # 替换模板中的占位符
-    html_content = template_content.replace('{{source_filename}}', html.escape(source_filename))
-    html_content = html_content.replace('{{rules_count}}', str(len(sorted_rule_groups)))
-    html_content = html_content.replace('{{total_instances}}', str(total_instances))
-    html_content = html_content.replace('{{rules_list_items}}', rules_list_items)
-    html_content = html_content.replace('{{content_sections}}', content_sections)
-    html_content = html_content.replace('{{generation_time}}', html.escape(str(__import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S'))))
-    
-    # 嵌入CSS和JS（替换标签）
-    html_content = html_content.replace('<link rel="stylesheet" href="shared_assets/report_styles.css">', f'<style>\n{css_content}\n</style>')
-    html_content = html_content.replace('<script src="shared_assets/report_scripts.js"></script>', f'<script>\n{js_content}\n</script>')
-    
-    try:
-        report_path.write_text(html_content, encoding='utf-8')
-        print(f"[✓] 报告已生成: {report_path}")
-    except Exception as e:
-        print(f"[!] 无法写入报告文件 {report_path}: {e}")
+    """生成HTML格式的变更报告（格式由 --report-format 决定，见 change_report.ReportWriter）。"""
+    _report_writer.write(report_path, changes_log, source_filename)
 
-def process_txt_file(file_path: Path, rules: pd.DataFrame, processed_dir: Path, report_dir: Path):
+def process_txt_file(file_path: Path, engine: RuleEngine, processed_dir: Path, report_dir: Path):
     """处理单个 .txt 文件。"""
     replacement_count = 0
     try:
@@ -375,27 +283,15 @@ def process_txt_file(file_path: Path, rules: pd.DataFrame, processed_dir: Path,
         file_was_modified = False
         current_position = 0
 
-        for paragraph_index, p_original in enumerate(paragraphs):
-            p_modified, atomic_changes = process_and_get_changes(p_original, rules)
+        paragraph_results = process_paragraphs(paragraphs, engine)
+        for paragraph_index, (p_original, (p_modified, atomic_changes, spans)) in enumerate(zip(paragraphs, paragraph_results)):
             processed_paragraphs.append(p_modified)
 
             if atomic_changes:
                 file_was_modified = True
                 replacement_count += len(atomic_changes)
-                original_report = html.escape(p_original)
-                modified_report = html.escape(p_modified)
-
-                for change in atomic_changes:
-                    orig_esc = html.escape(change["original_text"])
-                    repl_esc = html.escape(change["replacement_text"])
-                    original_report = original_report.replace(orig_esc, f'<span class="highlight">{orig_esc}</span>')
-                    modified_report = modified_report.replace(repl_esc, f'<span class="highlight">{repl_esc}</span>')
-                
-                changes_log_for_report.append({
-                    'original': original_report.replace('\n', '<br>'),
-                    'modified': modified_report.replace('\n', '<br>'),
-                    'position': current_position + paragraph_index
-                })
+                changes_log_for_report.append(
+                    build_change_entry(p_original, p_modified, spans, current_position + paragraph_index, line_break='<br>'))
             
             current_position += len(p_original) + 2
 
@@ -412,88 +308,103 @@ def process_txt_file(file_path: Path, rules: pd.DataFrame, processed_dir: Path,
         return {'modified': False, 'replacement_count': 0, 'css_fixed': False, 'error': str(e)}
     return {'modified': False, 'replacement_count': 0, 'css_fixed': False, 'error': None}
 
-def process_epub_file(file_path: Path, rules: pd.DataFrame, processed_dir: Path, report_dir: Path):
-    """处理EPUB文件，采用两阶段处理：1.文本替换 2.CSS链接修复"""
+def replace_in_document(content_bytes: bytes, engine: RuleEngine, css_hrefs: list = None, name: str = ''):
+    """
+    对 EPUB 中的一个 XHTML 章节执行文本替换，并在同一棵文档树上补上缺失的样式表链接（css_hrefs 不为 None 时）。
+    章节只解析一次、序列化一次。
+    返回元组: (修改后的章节内容字节，未修改时为 None, 变更记录列表, 替换次数, 章节段落文本总长度, 是否补了样式表链接)
+    变更记录中的 position 为章节内的偏移，由调用方加上章节起点。
+    """
+    content = read_content_auto(content_bytes)
+    soup = BeautifulSoup(content, 'xml')
+    changes_log = []
+    replacement_count = 0
+    position = 0
+
+    css_fixed = css_hrefs is not None and css_fixer.add_css_links(soup, css_hrefs, name)
+
+    if soup.body:
+        p_tags = [p_tag for p_tag in soup.body.find_all('p') if p_tag.get_text(strip=True)]
+        p_texts = [p_tag.get_text() for p_tag in p_tags]
+        paragraph_results = process_paragraphs(p_texts, engine)
+
+        for p_tag, p_text_original, (p_text_modified, atomic_changes, spans) in zip(p_tags, p_texts, paragraph_results):
+            if atomic_changes:
+                replacement_count += len(atomic_changes)
+
+                p_tag.string = p_text_modified
+                changes_log.append(build_change_entry(p_text_original, p_text_modified, spans, position, line_break='<br>'))
+
+            position += len(p_text_original)
+
+    # 如果章节被修改，返回新的章节内容
+    new_content = str(soup).encode('utf-8') if changes_log or css_fixed else None
+    return new_content, changes_log, replacement_count, position, css_fixed
+
+def _init_worker(engine: RuleEngine, report_writer: ReportWriter):
+    """工作进程初始化：接收主进程编译好的规则引擎与报告写出器（每个进程只传输一次）。"""
+    global _worker_engine, _report_writer
+    _worker_engine = engine
+    _report_writer = report_writer
+
+def _replace_documents_task(documents: list) -> list:
+    """工作进程任务：处理一个 EPUB 的一组章节，documents 为 [(成员名, 章节内容, 样式表链接列表或 None), ...]。"""
+    return [replace_in_document(content, _worker_engine, css_hrefs, name) for name, content, css_hrefs in documents]
+
+def process_epub_file(file_path: Path, engine: RuleEngine, processed_dir: Path, report_dir: Path, chapter_executor=None):
+    """
+    处理EPUB文件：每个 XHTML 章节只解析一次，文本替换与缺失样式表链接的补全在同一棵文档树上完成，
+    修改后的章节直接写回 zip（见 EpubRewriter），其余成员原样复制。
+    传入 chapter_executor（进程池）时，章节按组分发到各工作进程并行处理。
+    """
     
     changes_log = []
     book_is_modified = False
     global_position = 0
     replacement_count = 0
+    css_fixed = False
     
     try:
-        # 第一阶段：使用BeautifulSoup进行文本替换
-        book = epub.read_epub(str(file_path))
-        
-        for item in book.get_items():
-            if item.get_type() == ITEM_DOCUMENT:
-                content = read_content_auto(item.get_content())
-                soup = BeautifulSoup(content, 'xml')
-                item_is_modified = False
-                
-                if not soup.body:
-                    continue
-                
-                for p_tag in soup.body.find_all('p'):
-                    if not p_tag.get_text(strip=True):
-                        continue
-
-                    p_text_original = p_tag.get_text()
-                    p_text_modified, atomic_changes = process_and_get_changes(p_text_original, rules)
-
-                    if atomic_changes:
-                        book_is_modified = True
-                        item_is_modified = True
-                        replacement_count += len(atomic_changes)
-                        
-                        p_tag.string = p_text_modified
-
-                        original_report = html.escape(p_text_original)
-                        modified_report = html.escape(p_text_modified)
-
-                        for change in atomic_changes:
-                            orig_esc = html.escape(change["original_text"])
-                            repl_esc = html.escape(change["replacement_text"])
-                            original_report = original_report.replace(orig_esc, f'<span class="highlight">{orig_esc}</span>')
-                            modified_report = modified_report.replace(repl_esc, f'<span class="highlight">{repl_esc}</span>')
-                        
-                        changes_log.append({
-                            'original': original_report.replace('\n', '<br>'),
-                            'modified': modified_report.replace('\n', '<br>'),
-                            'position': global_position
-                        })
-                    
-                    global_position += len(p_text_original)
-
-                # 如果文件被修改，更新item内容
-                if item_is_modified:
-                    item.set_content(str(soup).encode('utf-8'))
-
-        # 保存第一阶段修复后的EPUB文件
-        temp_epub_path = processed_dir / f"temp_{file_path.name}"
-        if book_is_modified:
-            # 检查并确保EPUB有必需的identifier元数据
-            if not book.get_metadata('DC', 'identifier'):
-                # 如果没有identifier，添加一个默认的
-                import uuid
-                default_identifier = f"urn:uuid:{uuid.uuid4()}"
-                book.add_metadata('DC', 'identifier', default_identifier)
-            
-            epub.write_epub(str(temp_epub_path), book, {})
-        else:
-            # 如果没有修改，复制原文件作为临时文件
-            shutil.copy2(file_path, temp_epub_path)
-        
-        # 第二阶段：修复CSS链接 (使用 css_fixer 模块)
-        fix_status, _ = css_fixer.fix_epub_css(str(temp_epub_path), str(temp_epub_path.parent))
-        css_fixed = (fix_status == "fixed")
-        
-        if css_fixed:
-            book_is_modified = True
-        
-        # 将最终文件移动到目标位置
-        final_epub_path = processed_dir / file_path.name
-        if temp_epub_path.exists():
-            shutil.move(str(temp_epub_path), str(final_epub_path))
+        with EpubRewriter(file_path) as book:
+            documents = book.manifest_documents()
+            css_paths = css_fixer.get_unique_css_files(book)
+            # 与 css_fixer 一致：只为 .html/.xhtml 成员补链接，没有 CSS 文件时不补
+            tasks = []
+            for name in documents:
+                css_hrefs = css_fixer.css_hrefs_for(css_paths, name) if css_paths and css_fixer.is_html_document(name) else None
+                tasks.append((name, book.read(name), css_hrefs))
+
+            if chapter_executor is not None:
+                chunks = [tasks[i:i + EPUB_CHAPTERS_PER_TASK] for i in range(0, len(tasks), EPUB_CHAPTERS_PER_TASK)]
+                futures = [chapter_executor.submit(_replace_documents_task, chunk) for chunk in chunks]
+                document_results = (result for future in futures for result in future.result())
+            else:
+                document_results = (replace_in_document(content, engine, css_hrefs, name) for name, content, css_hrefs in tasks)
+
+            for name, (new_content, item_changes, item_count, item_length, item_css_fixed) in zip(documents, document_results):
+                if new_content is not None:
+                    book.write(name, new_content)
+                css_fixed = css_fixed or item_css_fixed
+                for change in item_changes:
+                    change['position'] += global_position
+                    changes_log.append(change)
+                replacement_count += item_count
+                global_position += item_length
+
+            # 不在 manifest 中的 HTML 成员只需检查样式表链接
+            if css_paths:
+                document_names = set(documents)
+                others = [name for name in book.names() if name not in document_names]
+                if css_fixer.fix_css_links(book, css_paths, others):
+                    css_fixed = True
+
+            book_is_modified = book.modified
+            final_epub_path = processed_dir / file_path.name
+            if book_is_modified:
+                book.save(final_epub_path)
+        if not book_is_modified:
+            # 没有修改时直接复制原文件
+            shutil.copy2(file_path, final_epub_path)
         
         # 生成报告
         if book_is_modified and changes_log:
@@ -505,20 +416,76 @@ def process_epub_file(file_path: Path, rules: pd.DataFrame, processed_dir: Path,
         
     except Exception as e:
         print(f"\n[!] 处理EPUB文件失败 {file_path.name}: {e}")
-        # 清理临时文件
-        temp_epub_path = processed_dir / f"temp_{file_path.name}"
-        if temp_epub_path.exists():
-            temp_epub_path.unlink()
         return {'modified': False, 'replacement_count': 0, 'css_fixed': False, 'error': str(e)}
 
 
+def process_file(file_path: Path, engine: RuleEngine, processed_dir: Path, report_dir: Path, chapter_executor=None) -> dict:
+    """按文件类型处理单个文件，返回带文件信息的结果字典。"""
+    if file_path.suffix == '.txt':
+        result = process_txt_file(file_path, engine, processed_dir, report_dir)
+    elif file_path.suffix == '.epub':
+        result = process_epub_file(file_path, engine, processed_dir, report_dir, chapter_executor)
+    else:
+        result = {'modified': False, 'replacement_count': 0, 'css_fixed': False, 'error': '不支持的文件类型'}
+    
+    # 添加文件信息到结果中
+    result['filename'] = file_path.name
+    result['file_type'] = file_path.suffix.upper()[1:]  # 去掉点号并转大写
+    return result
+
+def _process_file_task(file_path: Path, processed_dir: Path, report_dir: Path) -> dict:
+    """工作进程任务：处理一个完整文件（各自写出处理后文件与报告）。"""
+    return process_file(file_path, _worker_engine, processed_dir, report_dir)
+
+def process_files_parallel(files_to_process: list, engine: RuleEngine, processed_dir: Path, report_dir: Path, jobs: int, pbar) -> list:
+    """
+    用进程池并行处理文件，返回与 files_to_process 顺序一致的结果列表。
+    规则引擎只在每个工作进程启动时传输一次；超过 EPUB_SPLIT_THRESHOLD_MB 的 EPUB 在主进程中读写，
+    其章节分组分发到同一个进程池，避免单个大文件拖住整个批次。
+    """
+    split_threshold = EPUB_SPLIT_THRESHOLD_MB * 1024 * 1024
+    large_epubs = [f for f in files_to_process if f.suffix == '.epub' and f.stat().st_size > split_threshold]
+    results = {}
+
+    def record(file_path, result):
+        results[file_path] = result
+        pbar.set_postfix_str(file_path.name, refresh=True)
+        pbar.update(1)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(engine, _report_writer)) as executor:
+        futures = {
+            executor.submit(_process_file_task, file_path, processed_dir, report_dir): file_path
+            for file_path in files_to_process if file_path not in large_epubs
+        }
+        for file_path in large_epubs:
+            record(file_path, process_file(file_path, engine, processed_dir, report_dir, chapter_executor=executor))
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"\n[!] 工作进程处理失败 {file_path.name}: {e}")
+                result = {'modified': False, 'replacement_count': 0, 'css_fixed': False, 'error': str(e),
+                          'filename': file_path.name, 'file_type': file_path.suffix.upper()[1:]}
+            record(file_path, result)
+
+    return [results[file_path] for file_path in files_to_process]
+
+
 def main():
     """主函数"""
     import argparse
     parser = argparse.ArgumentParser(description="Batch Replacer Tool")
     parser.add_argument("--input", "-i", help="Directory containing files and rules.txt")
+    parser.add_argument("--jobs", "-j", type=int, default=DEFAULT_JOBS, help=f"并行处理的进程数 (默认: {DEFAULT_JOBS}，0 表示 CPU 核数)")
+    parser.add_argument("--report-format", choices=REPORT_FORMATS, default=REPORT_FORMAT_AUTO,
+                        help="变更报告格式: inline 为单文件，chunked 为分块按需加载，auto 按变更数量自动选择 (默认: auto)")
+    parser.add_argument("--report-search", action="store_true", help="为分块报告生成搜索索引")
     args = parser.parse_args()
 
+    global _report_writer
+    _report_writer = ReportWriter(args.report_format, search_index=args.report_search)
+
     # --- 1. 获取目标目录 ---
     if args.input:
         directory_path = args.input
@@ -564,9 +531,9 @@ def main():
         return
     
     print("[*] 正在从 rules.txt 加载替换规则...")
-    rules = load_rules(rules_file)
+    rules, engine = load_compiled_rules(rules_file)
 
-    if rules.empty:
+    if not rules:
         print("[!] 规则为空，未执行任何替换。")
         return
 
@@ -577,34 +544,30 @@ def main():
         print("[!] 在指定文件夹中没有找到任何需要处理的 .txt 或 .epub 文件。")
         return
 
-    print(f"[+] 成功加载 {len(rules)} 条规则。")
+    print(f"[+] 成功加载 {len(rules)} 条规则（编译为 {len(engine.stages)} 个扫描阶段）。")
     print(f"[*] 发现 {len(files_to_process)} 个待处理文件。")
     print()
 
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if jobs > 1 and getattr(sys, 'frozen', False):
+        # 打包后的程序通过 runpy 以 __main__ 运行本脚本，工作进程无法找到其中定义的任务函数
+        print("[!] 警告: 打包环境下不支持多进程处理，改为逐个处理。")
+        jobs = 1
+    if jobs > 1:
+        print(f"[*] 并行进程数: {jobs}")
+
     # 收集处理统计信息
-    processing_results = []
-    modified_count = 0
-    
     with tqdm(total=len(files_to_process), desc="处理进度", unit="个文件", file=sys.stdout) as pbar:
-        for file_path in files_to_process:
-            pbar.set_postfix_str(file_path.name, refresh=True)
-            
-            if file_path.suffix == '.txt':
-                result = process_txt_file(file_path, rules, processed_dir, report_dir)
-            elif file_path.suffix == '.epub':
-                result = process_epub_file(file_path, rules, processed_dir, report_dir)
-            else:
-                result = {'modified': False, 'replacement_count': 0, 'css_fixed': False, 'error': '不支持的文件类型'}
-            
-            # 添加文件信息到结果中
-            result['filename'] = file_path.name
-            result['file_type'] = file_path.suffix.upper()[1:]  # 去掉点号并转大写
-            processing_results.append(result)
-            
-            if result['modified']:
-                modified_count += 1
-            
-            pbar.update(1)
+        if jobs > 1:
+            processing_results = process_files_parallel(files_to_process, engine, processed_dir, report_dir, jobs, pbar)
+        else:
+            processing_results = []
+            for file_path in files_to_process:
+                pbar.set_postfix_str(file_path.name, refresh=True)
+                processing_results.append(process_file(file_path, engine, processed_dir, report_dir))
+                pbar.update(1)
+
+    modified_count = sum(1 for result in processing_results if result['modified'])
 
     # 以表格形式显示处理结果
     print("\n" + "="*80)
@@ -635,7 +598,10 @@ def main():
         print(f"{filename:<40} {file_type:<6} {replacement_count:<8} {css_fixed:<8} {status:<10}")
     
     print("-"*80)
-    print(f"总计: {len(files_to_process)} 个文件 | 修改: {modified_count} 个 | 总替换次数: {sum(r['replacement_count'] for r in processing_results)}")
+    css_fixed_count = sum(1 for r in processing_results if r['css_fixed'])
+    error_count = sum(1 for r in processing_results if r['error'])
+    print(f"总计: {len(files_to_process)} 个文件 | 修改: {modified_count} 个 | 总替换次数: {sum(r['replacement_count'] for r in processing_results)}"
+          f" | CSS修复: {css_fixed_count} 个 | 失败: {error_count} 个")
     print(f"结果已保存至 '{PROCESSED_DIR_NAME}' 和 '{REPORT_DIR_NAME}' 文件夹")
     print("="*80)
 
@@ -1,7 +1,6 @@
 import os
 import sys
-import zipfile
-import tempfile
+import posixpath
 import re
 from xml.etree import ElementTree as ET
 import json
@@ -10,21 +9,14 @@ import json
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.epub_rewriter import EpubRewriter, parse_xml, resolve_href
 
-def find_opf_file(unzip_dir):
-    """在解压目录中找到 .opf 文件。"""
-    for root, _, files in os.walk(unzip_dir):
-        for file in files:
-            if file.endswith('.opf'):
-                return os.path.join(root, file)
-    return None
-
-def get_cover_info(opf_path):
+def get_cover_info(opf_data):
     """
-    从 .opf 文件中解析出封面图片和封面页面的信息。
-    返回一个包含封面图片路径和封面HTML文件路径的字典。
+    从 .opf 文件内容中解析出封面图片和封面页面的信息。
+    返回一个包含封面图片路径和封面HTML文件路径的字典（路径相对于 OPF 所在目录）。
     """
-    if not opf_path:
+    if not opf_data:
         return None
 
     cover_info = {'image_path': None, 'html_path': None}
@@ -37,7 +29,7 @@ def get_cover_info(opf_path):
         ET.register_namespace('opf', namespaces['opf'])
         ET.register_namespace('dc', namespaces['dc'])
 
-        tree = ET.parse(opf_path)
+        tree = parse_xml(opf_data)
         root = tree.getroot()
         
         # --- 步骤 1: 找到封面图片的ID ---
@@ -83,25 +75,18 @@ def get_cover_info(opf_path):
         print(f"  - [错误] 解析OPF文件时出错: {e}")
         return None
 
-def create_and_write_cover_html(unzip_dir, cover_info):
+def build_cover_html(cover_info):
     """
-    创建或覆盖封面HTML文件，写入标准化的内容。
+    生成标准化的封面HTML内容。
     """
-    # 计算封面图片相对于封面HTML的路径
-    html_full_path = os.path.join(os.path.dirname(os.path.join(unzip_dir, 'DUMMY')), cover_info['html_path'])
-    image_full_path = os.path.join(os.path.dirname(os.path.join(unzip_dir, 'DUMMY')), cover_info['image_path'])
-    
-    # 获取两个文件的目录路径
-    html_dir = os.path.dirname(html_full_path)
-    image_dir = os.path.dirname(image_full_path)
-    
-    # 计算相对路径
-    relative_image_path = os.path.relpath(image_dir, html_dir)
+    # 计算封面图片相对于封面HTML的路径（两者都相对于 OPF 所在目录）
+    relative_image_path = posixpath.relpath(posixpath.dirname(cover_info['image_path']) or '.',
+                                            posixpath.dirname(cover_info['html_path']) or '.')
     # 组合成最终的src路径
-    final_image_src = os.path.join(relative_image_path, os.path.basename(image_full_path)).replace('\\', '/')
+    final_image_src = posixpath.join(relative_image_path, posixpath.basename(cover_info['image_path']))
     
     # 兼容性最好的封面HTML模板
-    cover_html_template = f"""<?xml version='1.0' encoding='utf-8'?>
+    return f"""<?xml version='1.0' encoding='utf-8'?>
 <html xmlns="http://www.w3.org/1999/xhtml">
 <head>
   <title>Cover</title>
@@ -119,60 +104,37 @@ def create_and_write_cover_html(unzip_dir, cover_info):
 </body>
 </html>"""
 
-    # 找到OPF文件所在的目录，通常是内容文件的根目录
-    opf_path = find_opf_file(unzip_dir)
-    content_root = os.path.dirname(opf_path)
-    
-    # 写入新的封面HTML文件
-    target_html_path = os.path.join(content_root, cover_info['html_path'])
-    os.makedirs(os.path.dirname(target_html_path), exist_ok=True)
-    with open(target_html_path, 'w', encoding='utf-8') as f:
-        f.write(cover_html_template)
-    print(f"  - [修复] 已生成标准化封面文件: {cover_info['html_path']}")
-
 
 def fix_cover(epub_path, output_dir):
     """
     修复单个EPUB文件的封面。
     """
     print(f"\n[处理] {os.path.basename(epub_path)}")
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            with zipfile.ZipFile(epub_path, 'r') as zf:
-                zf.extractall(temp_dir)
-            
-            opf_path = find_opf_file(temp_dir)
-            if not opf_path:
+    try:
+        # 只读取 OPF 并写入封面页面，其余成员原样复制
+        with EpubRewriter(epub_path) as book:
+            opf_name = book.find_opf()
+            if not opf_name:
                 print("  - [错误] 未找到 .opf 文件，无法处理。")
                 return
 
-            cover_info = get_cover_info(opf_path)
+            cover_info = get_cover_info(book.read(opf_name))
             if not cover_info or not cover_info.get('image_path'):
                 print("  - [跳过] 未能识别出封面信息。")
                 return
 
-            create_and_write_cover_html(os.path.dirname(opf_path), cover_info)
+            book.write(resolve_href(opf_name, cover_info['html_path']), build_cover_html(cover_info))
+            print(f"  - [修复] 已生成标准化封面文件: {cover_info['html_path']}")
             
             # 重新打包
             base_name, _ = os.path.splitext(os.path.basename(epub_path))
             new_epub_path = os.path.join(output_dir, f"{base_name}-cover-fixed.epub")
-            
-            with zipfile.ZipFile(new_epub_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                mimetype_path = os.path.join(temp_dir, 'mimetype')
-                if os.path.exists(mimetype_path):
-                    zf.write(mimetype_path, 'mimetype', compress_type=zipfile.ZIP_STORED)
-                
-                for root, _, files in os.walk(temp_dir):
-                    for file in files:
-                        if file != 'mimetype':
-                            full_path = os.path.join(root, file)
-                            arcname = os.path.relpath(full_path, temp_dir)
-                            zf.write(full_path, arcname)
+            book.save(new_epub_path)
             
             print(f"  -> [成功] 封面已修复, 新文件保存至: {os.path.basename(output_dir)}")
-        
-        except Exception as e:
-            print(f"  - [严重错误] 处理过程中发生意外: {e}")
+    
+    except Exception as e:
+        print(f"  - [严重错误] 处理过程中发生意外: {e}")
 
 # --- 新增：函数用于从 settings.json 加载默认路径 ---
 
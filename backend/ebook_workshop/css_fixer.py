@@ -1,9 +1,8 @@
 import os
 import sys
-import shutil
-import zipfile
 import hashlib
 import json
+import posixpath
 from bs4 import BeautifulSoup
 from ebooklib import epub
 
@@ -11,28 +10,32 @@ from ebooklib import epub
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.epub_rewriter import EpubRewriter, relative_href
 
-def get_unique_css_files(unzip_dir):
-    """获取解压目录中所有唯一的CSS文件。"""
+# 需要检查样式表链接的 HTML 成员后缀（区分大小写）
+HTML_DOCUMENT_SUFFIXES = ('.html', '.xhtml')
+
+def get_unique_css_files(book):
+    """获取 EPUB 中所有唯一的CSS文件（zip 内路径）。"""
     css_files = {}
-    for root, _, files in os.walk(unzip_dir):
-        for file in files:
-            if file.endswith('.css'):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'rb') as f:
-                    file_hash = hashlib.sha256(f.read()).hexdigest()
-                if file_hash not in css_files:
-                    css_files[file_hash] = os.path.relpath(file_path, unzip_dir)
+    for name in book.names():
+        if name.endswith('.css'):
+            file_hash = hashlib.sha256(book.read(name)).hexdigest()
+            if file_hash not in css_files:
+                css_files[file_hash] = name
     return list(css_files.values())
 
-def read_content_auto(file_path) -> str:
+def read_content_auto(file_path_or_bytes) -> str:
     """尝试多种编码读取内容"""
     encodings = ['utf-8', 'utf-8-sig', 'cp949', 'euc-kr', 'gb18030', 'gbk', 'shift_jis', 'latin1']
-    try:
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-    except Exception:
-        return ""
+    if isinstance(file_path_or_bytes, bytes):
+        raw_data = file_path_or_bytes
+    else:
+        try:
+            with open(file_path_or_bytes, 'rb') as f:
+                raw_data = f.read()
+        except Exception:
+            return ""
 
     for enc in encodings:
         try:
@@ -41,71 +44,80 @@ def read_content_auto(file_path) -> str:
             continue
     return raw_data.decode('utf-8', errors='replace')
 
+def is_html_document(name):
+    """是否为需要检查样式表链接的 HTML 成员（按后缀区分大小写）。"""
+    return name.endswith(HTML_DOCUMENT_SUFFIXES)
+
+def css_hrefs_for(css_paths, name):
+    """CSS 成员相对于 HTML 成员 name 的链接地址列表。"""
+    return [relative_href(css_path, name) for css_path in css_paths]
+
+def _is_stylesheet_rel(rel):
+    # html.parser 把 rel 解析为列表，xml 解析器保留原始字符串
+    if not rel:
+        return False
+    return 'stylesheet' in (rel if isinstance(rel, list) else rel.split())
+
+def add_css_links(soup, css_hrefs, name):
+    """
+    在已解析的文档树上补上缺失的样式表链接：<head> 中已有样式表链接时不做修改。
+    返回是否修改了文档树（供其它脚本在同一棵树上先做替换、再补链接，只解析和写出一次）。
+    """
+    if soup.head and soup.head.find_all('link', rel=_is_stylesheet_rel):
+        return False
+
+    head = soup.head
+    # 如果没有 <head> 标签，则创建一个
+    if not head:
+        head = soup.new_tag('head')
+        html_tag = soup.find('html')
+        if html_tag:
+            html_tag.insert(0, head)
+        else:
+            # 如果没有<html>标签，这是一个格式不正确的文件，但我们仍尝试处理
+            soup.insert(0, head)
+            print(f"  - 警告: 文件 {posixpath.basename(name)} 缺少 <html> 标签，已尝试创建 <head> 标签。")
+
+    for href in css_hrefs:
+        link_tag = soup.new_tag('link', rel='stylesheet', type='text/css', href=href)
+        head.append(link_tag)
+    return True
+
+def fix_css_links(book, css_paths, names=None):
+    """为 book 中的 HTML 成员补上样式表链接（names 为 None 时检查全部 HTML 成员），返回被修改的成员名列表。"""
+    def fix_member(name, data):
+        soup = BeautifulSoup(read_content_auto(data), 'html.parser')
+        if not add_css_links(soup, css_hrefs_for(css_paths, name), name):
+            return None
+        return str(soup)
+
+    if names is None:
+        match = is_html_document
+    else:
+        selected = set(names)
+        match = lambda name: name in selected and is_html_document(name)
+    return book.transform(match, fix_member)
+
 def fix_epub_css(epub_path, output_dir):
     """修复单个EPUB文件中的CSS链接。"""
-    temp_dir = os.path.join(output_dir, 'temp_epub_unpack')
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
-    os.makedirs(temp_dir)
-
     try:
-        with zipfile.ZipFile(epub_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-
-        unique_css_paths = get_unique_css_files(temp_dir)
-        if not unique_css_paths:
-            print(f"  - 在 {os.path.basename(epub_path)} 中未找到CSS文件，跳过。")
-            return "skipped", "No CSS files found"
-
-        modified = False
-        for root, _, files in os.walk(temp_dir):
-            for file in files:
-                if file.endswith(('.html', '.xhtml')):
-                    file_path = os.path.join(root, file)
-                    content = read_content_auto(file_path)
-                    soup = BeautifulSoup(content, 'html.parser')
-
-                    # 检查是否没有样式表链接
-                    if not (soup.head and soup.head.find_all('link', rel='stylesheet')):
-                        head = soup.head
-                        # 如果没有 <head> 标签，则创建一个
-                        if not head:
-                            head = soup.new_tag('head')
-                            html_tag = soup.find('html')
-                            if html_tag:
-                                html_tag.insert(0, head)
-                            else:
-                                # 如果没有<html>标签，这是一个格式不正确的文件，但我们仍尝试处理
-                                soup.insert(0, head)
-                                print(f"  - 警告: 文件 {file} 缺少 <html> 标签，已尝试创建 <head> 标签。")
-
-                        for css_path in unique_css_paths:
-                            relative_css_path = os.path.relpath(os.path.join(temp_dir, css_path), root).replace('\\', '/')
-                            link_tag = soup.new_tag('link', rel='stylesheet', type='text/css', href=relative_css_path)
-                            head.append(link_tag)
-                        
-                        with open(file_path, 'w', encoding='utf-8') as f:
-                            f.write(str(soup))
-                        modified = True
-
-        if modified:
-            fixed_epub_path = os.path.join(output_dir, os.path.basename(epub_path))
-            shutil.make_archive(fixed_epub_path.replace('.epub', ''), 'zip', temp_dir)
-            
-            # Windows: os.rename fails if destination exists
-            if os.path.exists(fixed_epub_path):
-                os.remove(fixed_epub_path)
-                
-            os.rename(fixed_epub_path.replace('.epub', '.zip'), fixed_epub_path)
-            return "fixed", None
-        else:
-            return "skipped", "All HTML files already have CSS links"
+        # 直接在 zip 内读写：只解析 HTML 成员，其余成员（图片、字体等）原样复制
+        with EpubRewriter(epub_path) as book:
+            unique_css_paths = get_unique_css_files(book)
+            if not unique_css_paths:
+                print(f"  - 在 {os.path.basename(epub_path)} 中未找到CSS文件，跳过。")
+                return "skipped", "No CSS files found"
+
+            modified = fix_css_links(book, unique_css_paths)
+
+            if modified:
+                book.save(os.path.join(output_dir, os.path.basename(epub_path)))
+                return "fixed", None
+            else:
+                return "skipped", "All HTML files already have CSS links"
 
     except Exception as e:
         return "failed", str(e)
-    finally:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
 
 def main():
     """主函数，处理所有EPUB文件。"""
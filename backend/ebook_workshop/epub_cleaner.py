@@ -9,8 +9,7 @@ EPUB 清理工具
 import os
 import sys
 import zipfile
-import shutil
-import tempfile
+import posixpath
 import re
 import json
 import xml.etree.ElementTree as ET
@@ -43,6 +42,9 @@ real_project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.absp
 if real_project_root not in sys.path:
     sys.path.insert(0, real_project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.epub_rewriter import (
+    CONTAINER_NAME, MIMETYPE_NAME, EpubRewriter, parse_xml, resolve_href, serialize_xml
+)
 
 def get_unique_filepath(path):
     """检查文件路径是否存在，如果存在则添加数字使其唯一"""
@@ -95,22 +97,21 @@ def clean_css_fonts(css_content):
     
     return css_content, removed_count
 
-def remove_cover_from_epub(temp_dir, opf_abs_path, namespaces):
+def remove_cover_from_epub(book, opf_name, namespaces):
     """
     从 EPUB 中删除封面
     
     Args:
-        temp_dir (str): 临时解压目录
-        opf_abs_path (str): OPF 文件绝对路径
+        book (EpubRewriter): 打开的 EPUB
+        opf_name (str): OPF 文件在 zip 内的路径
         namespaces (dict): XML 命名空间
         
     Returns:
         tuple: (是否成功, 处理信息)
     """
     try:
-        opf_tree = ET.parse(opf_abs_path)
+        opf_tree = parse_xml(book.read(opf_name))
         opf_root = opf_tree.getroot()
-        opf_dir = os.path.dirname(opf_abs_path)
         
         # 查找封面元数据
         meta_cover = opf_root.find('.//opf:meta[@name="cover"]', namespaces)
@@ -130,20 +131,19 @@ def remove_cover_from_epub(temp_dir, opf_abs_path, namespaces):
             return False, f"无法找到 ID 为 '{cover_id}' 的封面项目"
         
         cover_href = unquote(cover_item.get('href'))
-        cover_image_path = os.path.join(opf_dir, cover_href)
+        cover_image_name = resolve_href(opf_name, cover_href)
         print(f"  -> 找到封面图片: '{cover_href}'")
         
         # 查找并删除封面 HTML 文件
         cover_html_item = None
         html_items = manifest.findall('.//opf:item[@media-type="application/xhtml+xml"]', namespaces)
         for item in html_items:
-            html_rel_path = unquote(item.get('href'))
-            html_abs_path = os.path.join(opf_dir, html_rel_path)
-            if not os.path.exists(html_abs_path):
+            html_name = resolve_href(opf_name, unquote(item.get('href')))
+            if not book.exists(html_name):
                 continue
             
             try:
-                html_tree = ET.parse(html_abs_path)
+                html_tree = parse_xml(book.read(html_name))
                 # 搜索指向封面的 <img> 或 <svg:image>
                 for img in html_tree.findall('.//xhtml:img', namespaces):
                     if img.get('src') and os.path.basename(unquote(img.get('src'))) == os.path.basename(cover_href):
@@ -164,7 +164,7 @@ def remove_cover_from_epub(temp_dir, opf_abs_path, namespaces):
         if cover_html_item is not None:
             cover_html_id = cover_html_item.get('id')
             cover_html_href = unquote(cover_html_item.get('href'))
-            cover_html_path = os.path.join(opf_dir, cover_html_href)
+            cover_html_name = resolve_href(opf_name, cover_html_href)
             print(f"  -> 找到封面 HTML 页面: '{cover_html_href}'")
             
             # 从 manifest 中删除
@@ -180,14 +180,14 @@ def remove_cover_from_epub(temp_dir, opf_abs_path, namespaces):
                     print("  -> 已从 spine 中删除封面 HTML")
             
             # 删除文件
-            if os.path.exists(cover_html_path):
-                os.remove(cover_html_path)
+            if book.exists(cover_html_name):
+                book.delete(cover_html_name)
                 print("  -> 已删除封面 HTML 文件")
         
         # 删除封面图片文件
-        if os.path.exists(cover_image_path):
-            os.remove(cover_image_path)
-            print(f"  -> 已删除封面图片: {os.path.basename(cover_image_path)}")
+        if book.exists(cover_image_name):
+            book.delete(cover_image_name)
+            print(f"  -> 已删除封面图片: {posixpath.basename(cover_image_name)}")
         
         # 从 manifest 中删除封面图片项目
         manifest.remove(cover_item)
@@ -200,19 +200,19 @@ def remove_cover_from_epub(temp_dir, opf_abs_path, namespaces):
             print("  -> 已删除封面元数据")
         
         # 保存修改后的 OPF 文件
-        opf_tree.write(opf_abs_path, encoding='utf-8', xml_declaration=True)
+        book.write(opf_name, serialize_xml(opf_tree))
         
         return True, "封面删除成功"
         
     except Exception as e:
         return False, f"删除封面时出错: {e}"
 
-def remove_fonts_from_epub_content(temp_dir):
+def remove_fonts_from_epub_content(book):
     """
-    从解压的 EPUB 内容中删除字体文件和 CSS 字体声明
+    从 EPUB 中删除字体文件和 CSS 字体声明
     
     Args:
-        temp_dir (str): 临时解压目录
+        book (EpubRewriter): 打开的 EPUB
         
     Returns:
         tuple: (字体文件删除数量, CSS文件处理数量, CSS声明删除数量)
@@ -221,41 +221,34 @@ def remove_fonts_from_epub_content(temp_dir):
     css_files_processed = 0
     total_css_declarations_removed = 0
     
-    # 扫描并删除字体文件
-    for root, dirs, files in os.walk(temp_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_ext = Path(file).suffix.lower()
-            
-            if file_ext in FONT_EXTENSIONS:
-                os.remove(file_path)
-                font_files_removed += 1
-                print(f"  -> 已删除字体文件: {os.path.relpath(file_path, temp_dir)}")
+    # 删除字体文件
+    for name in book.names():
+        if Path(name).suffix.lower() in FONT_EXTENSIONS:
+            book.delete(name)
+            font_files_removed += 1
+            print(f"  -> 已删除字体文件: {name}")
     
     # 处理 CSS 文件
-    for root, dirs, files in os.walk(temp_dir):
-        for file in files:
-            if file.endswith('.css'):
-                css_file_path = os.path.join(root, file)
-                
-                try:
-                    with open(css_file_path, 'r', encoding='utf-8') as f:
-                        original_content = f.read()
-                    
-                    cleaned_content, removed_count = clean_css_fonts(original_content)
-                    
-                    if removed_count > 0:
-                        with open(css_file_path, 'w', encoding='utf-8') as f:
-                            f.write(cleaned_content)
-                        
-                        css_files_processed += 1
-                        total_css_declarations_removed += removed_count
-                        print(f"  -> 已清理 CSS 文件: {os.path.relpath(css_file_path, temp_dir)} (删除 {removed_count} 个字体声明)")
-                
-                except UnicodeDecodeError:
-                    print(f"  -> 警告: 无法读取 CSS 文件 {file} (编码问题)")
-                except Exception as e:
-                    print(f"  -> 警告: 处理 CSS 文件 {file} 时出错: {e}")
+    def clean_css(name, data):
+        nonlocal css_files_processed, total_css_declarations_removed
+        try:
+            cleaned_content, removed_count = clean_css_fonts(data.decode('utf-8'))
+        except UnicodeDecodeError:
+            print(f"  -> 警告: 无法读取 CSS 文件 {posixpath.basename(name)} (编码问题)")
+            return None
+        except Exception as e:
+            print(f"  -> 警告: 处理 CSS 文件 {posixpath.basename(name)} 时出错: {e}")
+            return None
+        
+        if removed_count == 0:
+            return None
+        css_files_processed += 1
+        total_css_declarations_removed += removed_count
+        print(f"  -> 已清理 CSS 文件: {name} (删除 {removed_count} 个字体声明)")
+        return cleaned_content
+    
+    # endswith 区分大小写，与原先按文件名筛选一致
+    book.transform(lambda name: name.endswith('.css'), clean_css)
     
     return font_files_removed, css_files_processed, total_css_declarations_removed
 
@@ -274,78 +267,54 @@ def process_single_epub(epub_path, output_dir, mode):
     base_name = os.path.basename(epub_path)
     output_epub_path = get_unique_filepath(os.path.join(output_dir, base_name))
     
-    # 创建临时目录
-    temp_extract_dir = tempfile.mkdtemp(prefix=f"{os.path.splitext(base_name)[0]}_")
-    
     print(f"\n[+] 正在处理: {base_name}")
     
     try:
-        # 1. 解压 EPUB 文件
-        with zipfile.ZipFile(epub_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_extract_dir)
-            print(f"  -> 已解压到临时目录")
-        
-        # 2. 根据模式处理内容
-        cover_success = True
-        cover_info = ""
-        font_files_removed = 0
-        css_files_processed = 0
-        total_css_declarations_removed = 0
-        
-        if mode in ['c', 'b']:  # 处理封面
-            # 查找 OPF 文件
-            container_path = os.path.join(temp_extract_dir, 'META-INF', 'container.xml')
-            if os.path.exists(container_path):
-                container_tree = ET.parse(container_path)
-                container_root = container_tree.getroot()
-                ns_cn = {'cn': 'urn:oasis:names:tc:opendocument:xmlns:container'}
-                opf_path_element = container_root.find('cn:rootfiles/cn:rootfile', ns_cn)
-                
-                if opf_path_element is not None:
-                    opf_rel_path = opf_path_element.get('full-path')
-                    opf_abs_path = os.path.join(temp_extract_dir, opf_rel_path)
-                    
-                    # 定义命名空间
-                    namespaces = {
-                        'opf': 'http://www.idpf.org/2007/opf',
-                        'dc': 'http://purl.org/dc/elements/1.1/',
-                        'xhtml': 'http://www.w3.org/1999/xhtml',
-                        'svg': 'http://www.w3.org/2000/svg',
-                        'xlink': 'http://www.w3.org/1999/xlink'
-                    }
-                    for prefix, uri in namespaces.items():
-                        ET.register_namespace(prefix, uri)
+        # 1. 打开 EPUB 文件（不解压，只读取需要修改的成员）
+        with EpubRewriter(epub_path) as book:
+            # 2. 根据模式处理内容
+            cover_success = True
+            cover_info = ""
+            font_files_removed = 0
+            css_files_processed = 0
+            total_css_declarations_removed = 0
+            
+            if mode in ['c', 'b']:  # 处理封面
+                # 查找 OPF 文件
+                if book.exists(CONTAINER_NAME):
+                    container_root = parse_xml(book.read(CONTAINER_NAME)).getroot()
+                    ns_cn = {'cn': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+                    opf_path_element = container_root.find('cn:rootfiles/cn:rootfile', ns_cn)
                     
-                    cover_success, cover_info = remove_cover_from_epub(temp_extract_dir, opf_abs_path, namespaces)
-                    print(f"  -> {cover_info}")
+                    if opf_path_element is not None:
+                        opf_rel_path = opf_path_element.get('full-path')
+                        
+                        # 定义命名空间
+                        namespaces = {
+                            'opf': 'http://www.idpf.org/2007/opf',
+                            'dc': 'http://purl.org/dc/elements/1.1/',
+                            'xhtml': 'http://www.w3.org/1999/xhtml',
+                            'svg': 'http://www.w3.org/2000/svg',
+                            'xlink': 'http://www.w3.org/1999/xlink'
+                        }
+                        for prefix, uri in namespaces.items():
+                            ET.register_namespace(prefix, uri)
+                        
+                        cover_success, cover_info = remove_cover_from_epub(book, opf_rel_path, namespaces)
+                        print(f"  -> {cover_info}")
+                    else:
+                        print("  -> 警告: 无法找到 OPF 文件路径")
                 else:
-                    print("  -> 警告: 无法找到 OPF 文件路径")
-            else:
-                print("  -> 警告: 无法找到 container.xml 文件")
-        
-        if mode in ['f', 'b']:  # 处理字体
-            font_files_removed, css_files_processed, total_css_declarations_removed = remove_fonts_from_epub_content(temp_extract_dir)
-        
-        # 3. 重新打包 EPUB
-        print(f"  -> 正在重新打包...")
-        with zipfile.ZipFile(output_epub_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-            # 首先添加 mimetype 文件（必须不压缩）
-            mimetype_path = os.path.join(temp_extract_dir, 'mimetype')
-            if os.path.exists(mimetype_path):
-                zip_out.write(mimetype_path, 'mimetype', compress_type=zipfile.ZIP_STORED)
-            else:
-                print("  -> 警告: 未找到 mimetype 文件")
+                    print("  -> 警告: 无法找到 container.xml 文件")
             
-            # 添加其他文件
-            for root, dirs, files in os.walk(temp_extract_dir):
-                for file in files:
-                    if file == 'mimetype':
-                        continue
-                    
-                    file_path = os.path.join(root, file)
-                    if os.path.exists(file_path):  # 确保文件存在（可能已被删除）
-                        arcname = os.path.relpath(file_path, temp_extract_dir)
-                        zip_out.write(file_path, arcname)
+            if mode in ['f', 'b']:  # 处理字体
+                font_files_removed, css_files_processed, total_css_declarations_removed = remove_fonts_from_epub_content(book)
+            
+            # 3. 写出新 EPUB（mimetype 不压缩且位于首位，未修改的成员原样复制）
+            print(f"  -> 正在重新打包...")
+            if not book.exists(MIMETYPE_NAME):
+                print("  -> 警告: 未找到 mimetype 文件，已写入默认值")
+            book.save(output_epub_path)
         
         # 4. 显示处理结果
         print(f"  -> 处理完成!")
@@ -367,10 +336,6 @@ def process_single_epub(epub_path, output_dir, mode):
         import traceback
         traceback.print_exc()
         return False
-    finally:
-        # 清理临时文件
-        if temp_extract_dir and os.path.exists(temp_extract_dir):
-            shutil.rmtree(temp_extract_dir)
 
 def process_epub_directory(input_dir, mode):
     """
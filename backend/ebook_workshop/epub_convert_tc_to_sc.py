@@ -1,7 +1,7 @@
 import os
 import sys
 import zipfile
-import tempfile
+import posixpath
 import re
 from xml.etree import ElementTree as ET
 import json
@@ -10,6 +10,9 @@ import json
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.epub_rewriter import EpubRewriter
+from backend.shared_utils.tc_detector import TraditionalChineseDetector
+from backend.shared_utils.opencc_service import OpenCCService
 
 # 导入 OpenCC 模块，如果失败则提供清晰的安装指引
 try:
@@ -20,11 +23,11 @@ except ImportError:
     print("错误: 无法导入 OpenCC。请先安装库: pip install opencc-python-reimplemented", file=sys.stderr)
     sys.exit(1)
 
-def initialize_opencc():
-    """初始化OpenCC转换器，包含健壮的后备方案。"""
+def initialize_opencc(jobs=1):
+    """初始化OpenCC转换器（包装为 OpenCCService），包含健壮的后备方案。"""
     try:
         # 优先尝试标准初始化方法，传入不带 .json 的文件名
-        return OpenCC('t2s')
+        return OpenCCService(OpenCC('t2s'), 't2s', jobs)
     except Exception as e_simple:
         print("[警告] 标准 OpenCC 初始化失败，尝试使用后备方案...")
         try:
@@ -35,7 +38,7 @@ def initialize_opencc():
                  raise FileNotFoundError("在 OpenCC 包目录中找不到配置文件 (t2s.json)。")
 
             print(f"[信息] 成功找到配置文件路径: {config_path}")
-            return OpenCC(config_path)
+            return OpenCCService(OpenCC(config_path), config_path, jobs)
             
         except Exception as e_fallback:
             print("错误：无法初始化 OpenCC 转换器。", file=sys.stderr)
@@ -44,107 +47,76 @@ def initialize_opencc():
             print(f"- 后备模式错误: {e_fallback}", file=sys.stderr)
             sys.exit(1)
 
-def check_if_translation_needed(temp_dir, cc):
+def check_if_translation_needed(book, detector):
     """
     检查 EPUB 是否包含需要转换为简体的内容。
+    扫描全部文本成员中的繁体专用字（见 tc_detector），找到足够多的繁体字即提前结束。
     """
-    for root, _, files in os.walk(temp_dir):
-        # 优先检查内容文件
-        content_files = [f for f in files if f.endswith(('.xhtml', '.html', '.opf'))]
-        if not content_files:
-            continue
-        
-        # 抽样检查第一个找到的内容文件
-        sample_file_path = os.path.join(root, content_files[0])
-        try:
-            with open(sample_file_path, 'r', encoding='utf-8') as f:
-                sample_text = f.read(2048)  # 读取 2KB 样本
-                if sample_text != cc.convert(sample_text):
-                    return True # 发现繁体字，需要转换
-        except Exception:
-            continue # 如果读取失败，尝试下一个文件
-            
-    return False # 未发现需要转换的内容
+    result = detector.scan_epub(book)
+    if result.han_chars:
+        print(f"  - [检测] {result.describe()}")
+    return result.needs_conversion
 
-def translate_text_files_in_epub(temp_dir, cc):
+def translate_text_files_in_epub(book, cc):
     """
-    遍历临时目录，翻译所有文本文件的内容。
+    遍历 EPUB 中的文本成员，翻译其内容（未改动的成员不会被重新压缩）。
+    只转换文本节点；整本书的文本节点一起交给 OpenCCService 去重、分批转换。
     """
-    # 需要处理的文件类型
-    text_extensions = ('.xhtml', '.html', '.opf', '.ncx', '.css')
-    
-    for root, _, files in os.walk(temp_dir):
-        for filename in files:
-            if filename.endswith(text_extensions):
-                file_path = os.path.join(root, filename)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # 仅当文件是XML/HTML类型时才进行内容转换
-                    if not filename.endswith('.css'):
-                        converted_content = cc.convert(content)
-                    else:
-                        converted_content = content
-
-                    # 仅当内容有变化时才写回文件
-                    if converted_content != content:
-                        with open(file_path, 'w', encoding='utf-8') as f:
-                            f.write(converted_content)
-                        print(f"  - [翻译] 已更新文件: {os.path.relpath(file_path, temp_dir)}")
-                        
-                except Exception as e:
-                    print(f"  - [警告] 处理文件 {filename} 时跳过，原因: {e}")
-
-def repack_epub(temp_dir, new_epub_path):
+    names = []
+    contents = []
+    # 仅转换 XML/HTML 类型的文件，CSS 保持不变
+    for name in book.names():
+        if not name.endswith(('.xhtml', '.html', '.opf', '.ncx')):
+            continue
+        try:
+            contents.append(book.read(name).decode('utf-8'))
+            names.append(name)
+        except Exception as e:
+            print(f"  - [警告] 处理文件 {posixpath.basename(name)} 时跳过，原因: {e}")
+
+    for name, content, converted_content in zip(names, contents, cc.convert_markup_many(contents)):
+        # 仅当内容有变化时才写回
+        if converted_content == content:
+            continue
+        book.write(name, converted_content)
+        print(f"  - [翻译] 已更新文件: {name}")
+
+def repack_epub(book, new_epub_path):
     """
-    将修改后的文件重新打包成 EPUB。
+    写出修改后的 EPUB（mimetype 不压缩且位于首位，未修改的成员原样复制）。
     """
     try:
-        mimetype_path = os.path.join(temp_dir, 'mimetype')
-        with zipfile.ZipFile(new_epub_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            # mimetype 文件必须是第一个且不能压缩
-            zf.write(mimetype_path, 'mimetype', compress_type=zipfile.ZIP_STORED)
-            for root_dir, _, files in os.walk(temp_dir):
-                for filename in files:
-                    if filename != 'mimetype':
-                        file_path = os.path.join(root_dir, filename)
-                        arcname = os.path.relpath(file_path, temp_dir)
-                        zf.write(file_path, arcname)
+        book.save(new_epub_path)
         print(f"  -> [成功] 新文件已保存: {os.path.basename(new_epub_path)}")
     except Exception as e:
         print(f"  - [错误] 重新打包 EPUB 失败: {e}")
 
-def process_epub(epub_path, output_dir, cc):
+def process_epub(epub_path, output_dir, cc, detector):
     """
-    处理单个 EPUB 文件的完整流程：解压、判断、翻译、重新打包。
+    处理单个 EPUB 文件的完整流程：判断、翻译、写出新文件。
     """
     print(f"\n[检查] {os.path.basename(epub_path)}")
     
-    # 在临时目录中解压并检查
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            with zipfile.ZipFile(epub_path, 'r') as zf:
-                zf.extractall(temp_dir)
-
-            if not check_if_translation_needed(temp_dir, cc):
+    try:
+        with EpubRewriter(epub_path) as book:
+            if not check_if_translation_needed(book, detector):
                 print("  - [跳过] 文件内容已是简体或无需转换。")
                 return
 
             print("  - [任务] 检测到繁体内容，开始转换...")
             
             # 翻译所有文本文件
-            translate_text_files_in_epub(temp_dir, cc)
+            translate_text_files_in_epub(book, cc)
 
             # 创建新文件名并打包
             base_name, _ = os.path.splitext(os.path.basename(epub_path))
             new_epub_path = os.path.join(output_dir, f"{base_name}-zhCN.epub")
-            repack_epub(temp_dir, new_epub_path)
+            repack_epub(book, new_epub_path)
 
-        except zipfile.BadZipFile:
-            print(f"  - [错误] '{os.path.basename(epub_path)}' 不是一个有效的 EPUB 文件。")
-        except Exception as e:
-            print(f"  - [严重错误] 处理 EPUB 时发生未知问题: {e}")
+    except zipfile.BadZipFile:
+        print(f"  - [错误] '{os.path.basename(epub_path)}' 不是一个有效的 EPUB 文件。")
+    except Exception as e:
+        print(f"  - [严重错误] 处理 EPUB 时发生未知问题: {e}")
 
 # --- 新增：函数用于从 settings.json 加载默认路径 ---
 
@@ -155,10 +127,13 @@ def main():
     import argparse
     parser = argparse.ArgumentParser(description="EPUB TC to SC Converter")
     parser.add_argument("--input", help="Input directory")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="繁简转换的并行进程数 (默认: 1，0 表示 CPU 核数)")
     args = parser.parse_args()
 
-    cc = initialize_opencc()
-    print("[信息] OpenCC 初始化成功。")
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    cc = initialize_opencc(jobs)
+    print(f"[信息] OpenCC 初始化成功{'（原生实现）' if cc.native else ''}。")
+    detector = TraditionalChineseDetector.from_converter(cc.converter)
 
     target_directory = None
     if args.input:
@@ -190,7 +165,8 @@ def main():
                 if '-zhCN' in filename:
                     continue
                 file_path = os.path.join(root, filename)
-                process_epub(file_path, output_dir, cc)
+                process_epub(file_path, output_dir, cc, detector)
+    cc.close()
     
     print("\n[*] 所有操作完成。")
 
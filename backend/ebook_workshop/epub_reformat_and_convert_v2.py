@@ -1,7 +1,7 @@
 import os
 import sys
 import zipfile
-import tempfile
+import posixpath
 import re
 from xml.etree import ElementTree as ET
 import json
@@ -10,6 +10,9 @@ import json
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.epub_rewriter import EpubRewriter, parse_xml, serialize_xml
+from backend.shared_utils.tc_detector import TraditionalChineseDetector
+from backend.shared_utils.opencc_service import OpenCCService
 
 # 导入 OpenCC 模块，如果失败则提供清晰的安装指引
 try:
@@ -20,79 +23,45 @@ except ImportError:
     print("错误: 无法导入 OpenCC。请先安装库: pip install opencc-python-reimplemented", file=sys.stderr)
     sys.exit(1)
 
-def check_epub_needs_processing(epub_path, cc):
+def check_epub_needs_processing(book, detector):
     """
-    检查 EPUB 文件是否需要处理。
+    检查 EPUB 文件是否需要处理（直接读取 zip 成员，不解压到磁盘）。
+    book 为打开的 EpubRewriter，检测后可直接交给处理步骤使用。
     返回: (是否需要格式转换, 是否需要文字转换)
     """
     needs_layout_change = False
     needs_char_conversion = False
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            with zipfile.ZipFile(epub_path, 'r') as zf:
-                zf.extractall(temp_dir)
-            
-            opf_path = find_opf_file(temp_dir)
-            if not opf_path:
-                return False, False
-
-            # 1. 检查是否需要格式转换 (竖排 -> 横排)
-            tree = ET.parse(opf_path)
-            root = tree.getroot()
-            ns = {'opf': 'http://www.idpf.org/2007/opf'}
-            spine = root.find('opf:spine', ns)
-            if spine is not None and spine.get('page-progression-direction') == 'rtl':
-                needs_layout_change = True
-            
-            # --- START: 优化后的繁简内容检测逻辑 ---
-            for root_dir, _, files in os.walk(temp_dir):
-                content_files = [f for f in files if f.endswith(('.xhtml', '.html', '.opf'))]
-                if not content_files:
-                    continue
-                
-                for filename in content_files:
-                    sample_file_path = os.path.join(root_dir, filename)
-                    sample_text = ""
-                    try:
-                        with open(sample_file_path, 'r', encoding='utf-8') as f:
-                            sample_text = f.read(2048)
-                    except UnicodeDecodeError:
-                        try:
-                            with open(sample_file_path, 'r', encoding='gbk', errors='ignore') as f:
-                                sample_text = f.read(2048)
-                        except Exception:
-                            continue
-                    
-                    if sample_text and sample_text != cc.convert(sample_text):
-                        needs_char_conversion = True
-                        break
-                
-                if needs_char_conversion:
-                    break
-            # --- END: 优化后的繁简内容检测逻辑 ---
+        opf_name = book.find_opf()
+        if not opf_name:
+            return False, False
+
+        # 1. 检查是否需要格式转换 (竖排 -> 横排)
+        root = parse_xml(book.read(opf_name)).getroot()
+        ns = {'opf': 'http://www.idpf.org/2007/opf'}
+        spine = root.find('opf:spine', ns)
+        if spine is not None and spine.get('page-progression-direction') == 'rtl':
+            needs_layout_change = True
+
+        # 2. 扫描内容文件中的繁体专用字（见 tc_detector），找到足够多的繁体字即提前结束
+        result = detector.scan_epub(book, suffixes=('.xhtml', '.html', '.opf'))
+        if result.han_chars:
+            print(f"  - [检测] {result.describe()}")
+        needs_char_conversion = result.needs_conversion
 
     except Exception:
         return False, False
 
     return needs_layout_change, needs_char_conversion
 
-
-def find_opf_file(temp_dir):
-    """在解压后的目录中查找 .opf 文件路径。"""
-    for root, _, files in os.walk(temp_dir):
-        for filename in files:
-            if filename.endswith('.opf'):
-                return os.path.join(root, filename)
-    return None
-
-def modify_opf_file(opf_path, cc, do_layout, do_chars):
+def modify_opf_file(book, opf_name, cc, do_layout, do_chars):
     """修改 .opf 文件，根据需要转换格式和文字。"""
     if not do_layout and not do_chars:
         return
     try:
         ET.register_namespace('dc', "http://purl.org/dc/elements/1.1/")
         ET.register_namespace('opf', "http://www.idpf.org/2007/opf")
-        tree = ET.parse(opf_path)
+        tree = parse_xml(book.read(opf_name))
         root = tree.getroot()
         ns = {'opf': 'http://www.idpf.org/2007/opf', 'dc': 'http://purl.org/dc/elements/1.1/'}
 
@@ -114,89 +83,91 @@ def modify_opf_file(opf_path, cc, do_layout, do_chars):
 
         if sys.version_info >= (3, 9):
             ET.indent(tree)
-        tree.write(opf_path, encoding='utf-8', xml_declaration=True)
+        book.write(opf_name, serialize_xml(tree))
     except Exception as e:
         print(f"  - [错误] 修改 OPF 文件时出错: {e}")
 
-def modify_content_files(temp_dir, cc, do_layout, do_chars):
-    """修改内容文件，根据需要转换格式和文字。"""
-    for root_dir, _, files in os.walk(temp_dir):
-        for filename in files:
-            if not filename.endswith(('.xhtml', '.html', '.css', '.ncx')):
-                continue
-
-            file_path = os.path.join(root_dir, filename)
+def modify_content_files(book, cc, do_layout, do_chars):
+    """
+    修改内容文件，根据需要转换格式和文字（未改动的成员不会被重新压缩）。
+    文字转换只处理文本节点，整本书的文本节点一起交给 OpenCCService 去重、分批转换。
+    """
+    originals = {}
+    contents = {}
+    for name in book.names():
+        if not name.endswith(('.xhtml', '.html', '.css', '.ncx')):
+            continue
+        try:
+            data = book.read(name)
             try:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    with open(file_path, 'r', encoding='gbk', errors='ignore') as f:
-                        content = f.read()
-                        
-                original_content = content
-                
-                if do_layout and filename.endswith('.css'):
-                    content = content.replace('vertical-rl', 'horizontal-tb')
-                    content = content.replace(".vrtl", ".hltr")
-                    content = re.sub(r'local\("@(.*?)"\)', r'local("\1")', content)
-
-                if filename.endswith(('.xhtml', '.html', '.ncx')):
-                    if do_layout:
-                         content = content.replace('class="vrtl"', 'class="hltr"')
-                    if do_chars:
-                        content = cc.convert(content)
-
-                if content != original_content:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                    print(f"  - [修改] 已更新: {os.path.relpath(file_path, temp_dir)}")
-            except Exception as e:
-                print(f"  - [错误] 处理文件 {filename} 失败: {e}")
-
-def repack_epub(temp_dir, new_epub_path):
-    """将修改后的文件重新打包成 EPUB。"""
+                content = data.decode('utf-8')
+            except UnicodeDecodeError:
+                content = data.decode('gbk', errors='ignore')
+
+            originals[name] = content
+
+            if do_layout and name.endswith('.css'):
+                content = content.replace('vertical-rl', 'horizontal-tb')
+                content = content.replace(".vrtl", ".hltr")
+                content = re.sub(r'local\("@(.*?)"\)', r'local("\1")', content)
+
+            if do_layout and name.endswith(('.xhtml', '.html', '.ncx')):
+                content = content.replace('class="vrtl"', 'class="hltr"')
+            contents[name] = content
+        except Exception as e:
+            print(f"  - [错误] 处理文件 {posixpath.basename(name)} 失败: {e}")
+
+    if do_chars:
+        text_names = [name for name in contents if name.endswith(('.xhtml', '.html', '.ncx'))]
+        try:
+            converted = cc.convert_markup_many([contents[name] for name in text_names])
+            contents.update(zip(text_names, converted))
+        except Exception as e:
+            print(f"  - [错误] 繁简转换失败: {e}")
+
+    for name, content in contents.items():
+        if content != originals[name]:
+            book.write(name, content)
+            print(f"  - [修改] 已更新: {name}")
+
+def repack_epub(book, new_epub_path):
+    """写出修改后的 EPUB（mimetype 不压缩且位于首位，未修改的成员原样复制）。"""
     try:
-        mimetype_path = os.path.join(temp_dir, 'mimetype')
-        with zipfile.ZipFile(new_epub_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.write(mimetype_path, 'mimetype', compress_type=zipfile.ZIP_STORED)
-            for root_dir, _, files in os.walk(temp_dir):
-                for filename in files:
-                    if filename != 'mimetype':
-                        file_path = os.path.join(root_dir, filename)
-                        arcname = os.path.relpath(file_path, temp_dir)
-                        zf.write(file_path, arcname)
+        book.save(new_epub_path)
         print(f"  -> [成功] 新文件已保存至: {os.path.basename(os.path.dirname(new_epub_path))}{os.sep}{os.path.basename(new_epub_path)}")
     except Exception as e:
         print(f"  - [错误] 重新打包 EPUB 失败: {e}")
 
-def process_epub_file(epub_path, output_dir, cc):
-    """处理单个EPUB文件，包含检测和按需转换。"""
+def process_epub_file(epub_path, output_dir, cc, detector):
+    """处理单个EPUB文件，包含检测和按需转换（检测与处理共用同一个打开的文件，只读取一次）。"""
     print(f"\n[检查] {os.path.basename(epub_path)}")
-    needs_layout, needs_chars = check_epub_needs_processing(epub_path, cc)
-
-    if not needs_layout and not needs_chars:
-        print("  - [跳过] 文件无需转换。")
+    try:
+        book = EpubRewriter(epub_path)
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"  - [错误] 无法打开 EPUB 文件: {e}")
         return
 
-    print(f"  - [任务] 检测到需要进行: {'格式转换 ' if needs_layout else ''}{'文字转换' if needs_chars else ''}")
-    
-    base_name, _ = os.path.splitext(os.path.basename(epub_path))
-    new_epub_path = os.path.join(output_dir, f"{base_name}.epub")
+    with book:
+        needs_layout, needs_chars = check_epub_needs_processing(book, detector)
+
+        if not needs_layout and not needs_chars:
+            print("  - [跳过] 文件无需转换。")
+            return
+
+        print(f"  - [任务] 检测到需要进行: {'格式转换 ' if needs_layout else ''}{'文字转换' if needs_chars else ''}")
+        
+        base_name, _ = os.path.splitext(os.path.basename(epub_path))
+        new_epub_path = os.path.join(output_dir, f"{base_name}.epub")
 
-    with tempfile.TemporaryDirectory() as temp_dir:
         try:
-            with zipfile.ZipFile(epub_path, 'r') as zf:
-                zf.extractall(temp_dir)
-            
-            opf_path = find_opf_file(temp_dir)
-            if not opf_path:
+            opf_name = book.find_opf()
+            if not opf_name:
                 print("  - [错误] 无法找到 .opf 配置文件！")
                 return
 
-            modify_opf_file(opf_path, cc, needs_layout, needs_chars)
-            modify_content_files(temp_dir, cc, needs_layout, needs_chars)
-            repack_epub(temp_dir, new_epub_path)
+            modify_opf_file(book, opf_name, cc, needs_layout, needs_chars)
+            modify_content_files(book, cc, needs_layout, needs_chars)
+            repack_epub(book, new_epub_path)
 
         except Exception as e:
             print(f"  - [严重错误] 处理EPUB时发生未知问题: {e}")
@@ -226,10 +197,10 @@ def process_txt_file(txt_path, output_dir, cc):
     except Exception as e:
         print(f"  - [错误] 处理TXT文件时出错: {e}")
 
-def initialize_opencc():
-    """初始化OpenCC转换器，包含健壮的后备方案。"""
+def initialize_opencc(jobs=1):
+    """初始化OpenCC转换器（包装为 OpenCCService），包含健壮的后备方案。"""
     try:
-        return OpenCC('t2s')
+        return OpenCCService(OpenCC('t2s'), 't2s', jobs)
     except Exception as e_simple:
         print("[警告] 标准 OpenCC 初始化失败，尝试使用后备方案...")
         try:
@@ -251,7 +222,7 @@ def initialize_opencc():
                  raise FileNotFoundError("在 OpenCC 包目录中找不到配置文件 (t2s.json)。")
 
             print(f"[信息] 成功找到配置文件路径: {config_path}")
-            return OpenCC(config_path)
+            return OpenCCService(OpenCC(config_path), config_path, jobs)
             
         except Exception as e_fallback:
             print("错误：无法初始化 OpenCC 转换器。", file=sys.stderr)
@@ -268,10 +239,13 @@ def main():
     import argparse
     parser = argparse.ArgumentParser(description="EPUB Reformat and Convert Tool V2")
     parser.add_argument("--input", "-i", type=str, help="Directory containing EPUB files")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="繁简转换的并行进程数 (默认: 1，0 表示 CPU 核数)")
     args = parser.parse_args()
 
-    cc = initialize_opencc()
-    print("[信息] OpenCC 初始化成功。")
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    cc = initialize_opencc(jobs)
+    print(f"[信息] OpenCC 初始化成功{'（原生实现）' if cc.native else ''}。")
+    detector = TraditionalChineseDetector.from_converter(cc.converter)
 
     target_directory = None
     if args.input:
@@ -300,9 +274,10 @@ def main():
         for filename in files:
             file_path = os.path.join(root, filename)
             if filename.endswith('.epub'):
-                process_epub_file(file_path, output_dir, cc)
+                process_epub_file(file_path, output_dir, cc, detector)
             elif filename.endswith('.txt'):
                 process_txt_file(file_path, output_dir, cc)
+    cc.close()
     
     print("\n[*] 所有操作完成。")
 
@@ -1,8 +1,6 @@
 import os
 import sys
-import zipfile
-import shutil
-import tempfile
+import posixpath
 import json
 
 # Add project root to sys.path
@@ -14,6 +12,7 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.epub_rewriter import EpubRewriter, relative_href
 
 # --- 配置 ---
 NEW_CSS_FILENAME = "new_style.css"
@@ -38,138 +37,94 @@ def get_new_css_content(custom_css_path=None):
 
 def modify_single_epub(epub_path, output_dir, new_css_content):
     """
-    修改单个ePub文件:
-    1. 解压
-    2. 添加/替换 CSS 文件
-    3. 更新所有 HTML 文件引入该 CSS
-    4. 重新打包
+    修改单个ePub文件（直接在 zip 内读写，未改动的成员原样复制）:
+    1. 添加/替换 CSS 文件
+    2. 更新所有 HTML 文件引入该 CSS
+    3. 写出新文件
     """
     filename = os.path.basename(epub_path)
     print(f"处理: {filename}")
     
-    # 创建临时解压目录
-    temp_dir = tempfile.mkdtemp(prefix=f"styler_{filename}_")
-    
     try:
-        # 1. 解压
-        with zipfile.ZipFile(epub_path, 'r') as zf:
-            zf.extractall(temp_dir)
-            
-        # 2. 确定 CSS 存放位置 (通常在 OEBPS/Styles 或 OEBPS/css，或者直接在根目录)
-        # 我们尝试找一个现有的 css 目录，如果没找到就在 OEBPS 下创建，或者根目录下
-        # 简单起见，我们搜索 OEBPS 目录
-        oebps_dir = None
-        for root, dirs, files in os.walk(temp_dir):
-            if "content.opf" in files:
-                oebps_dir = root
-                break
-        
-        if not oebps_dir:
-            # 如果没找到 standard structure, use root
-            oebps_dir = temp_dir
-            
-        styles_dir = os.path.join(oebps_dir, "Styles")
-        if not os.path.exists(styles_dir):
-            # 尝试找 css 目录
-            styles_dir = os.path.join(oebps_dir, "css")
-            if not os.path.exists(styles_dir):
-                # 默认创建 Styles
-                styles_dir = os.path.join(oebps_dir, "Styles")
-                os.makedirs(styles_dir, exist_ok=True)
-                
-        # 写入新 CSS 文件
-        css_file_path = os.path.join(styles_dir, NEW_CSS_FILENAME)
-        with open(css_file_path, 'w', encoding='utf-8') as f:
-            f.write(new_css_content)
-            
-        # 计算 CSS 相对路径 (用于 HTML 引用)
-        # 注意: HTML 可能在 OEBPS/Text, OEBPS/, 等等.
-        
-        # 3. 遍历所有 HTML 文件并添加/更新链接
-        from bs4 import BeautifulSoup
-        
-        for root, dirs, files in os.walk(temp_dir):
-            for file in files:
-                if file.lower().endswith(('.html', '.xhtml', '.htm')):
-                    html_path = os.path.join(root, file)
-                    
-                    # 计算从 HTML 到 CSS 的相对路径
-                    rel_css_path = os.path.relpath(css_file_path, root).replace("\\", "/")
-                    
-                    with open(html_path, 'r', encoding='utf-8') as f:
-                        soup = BeautifulSoup(f, 'html.parser')
-                    
-                    # 检查是否已有该 link
-                    head = soup.find('head')
-                    if not head:
-                        # 如果没有 head, 创建一个 (针对不规范文档)
-                        head = soup.new_tag('head')
-                        if soup.html:
-                            soup.html.insert(0, head)
-                        else:
-                            # 极度不规范，跳过或整个包裹
-                            continue
-                            
-                    # 移除旧的同名 link (如果我们需要强制替换)
-                    # 或者我们只追加新的?
-                    # 现在的逻辑是追加/确保存在
-                    
-                    link_exists = False
-                    for link in head.find_all('link', rel='stylesheet'):
-                        if link.get('href') == rel_css_path:
-                            link_exists = True
-                            break
-                    
-                    if not link_exists:
-                        new_link = soup.new_tag('link', rel='stylesheet', type='text/css', href=rel_css_path)
-                        head.append(new_link)
-                        
-                        # 保存修改
-                        with open(html_path, 'w', encoding='utf-8') as f:
-                            f.write(str(soup))
-
-        # 4. 重新打包
-        output_file_path = os.path.join(output_dir, filename)
-        
-        # 确保 manifest (content.opf) 包含新的 CSS 文件
-        # 这步比较复杂，因为需要解析 XML。
-        # 如果不加到 manifest，某些阅读器可能不加载。
-        # 简单起见，我们使用 epub_toolkit 的逻辑或尝试 patch content.opf
-        
-        # 简易版：先不改 content.opf，很多阅读器容错。
-        # 但为了稳健，我们应该尝试添加。
-        if oebps_dir:
-            opf_path = os.path.join(oebps_dir, "content.opf")
-            if os.path.exists(opf_path):
-                 update_manifest(opf_path, os.path.relpath(css_file_path, oebps_dir).replace("\\", "/"))
+        with EpubRewriter(epub_path) as book:
+            names = book.names()
 
-        # Zip it up
-        with zipfile.ZipFile(output_file_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, temp_dir)
-                    zf.write(file_path, arcname)
-                    
+            # 1. 确定 CSS 存放位置 (通常在 OEBPS/Styles 或 OEBPS/css，或者直接在根目录)
+            # 我们尝试找一个现有的 css 目录，如果没找到就在 OEBPS 下创建，或者根目录下
+            # 简单起见，我们搜索 content.opf 所在目录
+            opf_name = next((name for name in names if posixpath.basename(name) == "content.opf"), None)
+            # 如果没找到 standard structure, use root
+            oebps_dir = posixpath.dirname(opf_name) if opf_name else ""
+
+            def dir_exists(directory):
+                prefix = directory.rstrip('/') + '/'
+                return any(name.startswith(prefix) for name in names)
+
+            styles_dir = posixpath.join(oebps_dir, "Styles")
+            if not dir_exists(styles_dir):
+                # 尝试找 css 目录
+                css_dir = posixpath.join(oebps_dir, "css")
+                if dir_exists(css_dir):
+                    styles_dir = css_dir
+
+            # 写入新 CSS 文件
+            css_name = posixpath.join(styles_dir, NEW_CSS_FILENAME)
+            book.write(css_name, new_css_content)
+
+            # 2. 遍历所有 HTML 文件并添加/更新链接
+            from bs4 import BeautifulSoup
+
+            def add_css_link(name, data):
+                # 计算从 HTML 到 CSS 的相对路径
+                rel_css_path = relative_href(css_name, name)
+                soup = BeautifulSoup(data.decode('utf-8'), 'html.parser')
+
+                # 检查是否已有该 link
+                head = soup.find('head')
+                if not head:
+                    # 如果没有 head, 创建一个 (针对不规范文档)
+                    head = soup.new_tag('head')
+                    if soup.html:
+                        soup.html.insert(0, head)
+                    else:
+                        # 极度不规范，跳过
+                        return None
+
+                for link in head.find_all('link', rel='stylesheet'):
+                    if link.get('href') == rel_css_path:
+                        return None
+
+                new_link = soup.new_tag('link', rel='stylesheet', type='text/css', href=rel_css_path)
+                head.append(new_link)
+                return str(soup)
+
+            book.transform(('.html', '.xhtml', '.htm'), add_css_link)
+
+            # 3. 确保 manifest (content.opf) 包含新的 CSS 文件
+            # 如果不加到 manifest，某些阅读器可能不加载。
+            if opf_name:
+                new_opf = update_manifest(book.read(opf_name), posixpath.relpath(css_name, oebps_dir or '.'))
+                if new_opf is not None:
+                    book.write(opf_name, new_opf)
+
+            book.save(os.path.join(output_dir, filename))
         return True
         
     except Exception as e:
         print(f"处理失败 {filename}: {e}")
         return False
-    finally:
-        shutil.rmtree(temp_dir)
 
-def update_manifest(opf_path, css_rel_path):
-    """简单的 XML 处理以添加 item 到 manifest"""
+def update_manifest(opf_data, css_rel_path):
+    """简单的 XML 处理以添加 item 到 manifest，返回新的 OPF 内容（无需修改时返回 None）"""
     try:
-        from xml.dom.minidom import parse
-        dom = parse(opf_path)
+        from xml.dom.minidom import parseString
+        dom = parseString(opf_data)
         manifest = dom.getElementsByTagName('manifest')[0]
         
         # 检查是否已存在
         for item in manifest.getElementsByTagName('item'):
             if item.getAttribute('href') == css_rel_path:
-                return # 已存在
+                return None # 已存在
         
         # 添加 item
         item = dom.createElement('item')
@@ -178,10 +133,10 @@ def update_manifest(opf_path, css_rel_path):
         item.setAttribute('media-type', 'text/css')
         manifest.appendChild(item)
         
-        with open(opf_path, 'w', encoding='utf-8') as f:
-            dom.writexml(f)
+        return dom.toxml()
     except Exception as e:
         print(f"无法更新 manifest: {e}")
+        return None
 
 
 def process_epub_directory(root_dir, css_file=None):
@@ -5,18 +5,20 @@ import tempfile
 import zipfile
 import shutil
 from pathlib import Path
-from ebooklib import epub, ITEM_DOCUMENT, ITEM_STYLE
 from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
 from tqdm import tqdm
-import html
 import sys
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import css_fixer
 
 # Add project root to sys.path
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 from backend.utils import get_default_work_dir
+from backend.shared_utils.rule_engine import EditTrace
+from backend.shared_utils.change_report import REPORT_FORMAT_AUTO, REPORT_FORMATS, ReportWriter, build_change_entry
+from backend.shared_utils.epub_rewriter import EpubRewriter
 
 # --- 屏蔽已知警告 ---
 warnings.filterwarnings("ignore", category=UserWarning, module='ebooklib')
@@ -27,149 +29,19 @@ warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 PROCESSED_DIR_NAME = "processed_files"
 REPORT_DIR_NAME = "compare_reference"
 HIGHLIGHT_STYLE = "background-color: #f1c40f; color: #000; padding: 2px; border-radius: 3px;"
+# 并行处理的进程数（--jobs），1 表示在主进程中逐个处理
+DEFAULT_JOBS = 1
+# 并行模式下超过该大小的 EPUB 按章节拆分到多个工作进程处理
+EPUB_SPLIT_THRESHOLD_MB = 20
+# 按章节拆分时每个任务包含的章节数
+EPUB_CHAPTERS_PER_TASK = 8
 
-def generate_report(report_path: Path, changes_log: list, source_filename: str):
-    """
-    生成HTML格式的变更报告。
-    
-    Args:
-        report_path: 报告文件路径
-        changes_log: 变更记录列表，每个元素包含 'original' 和 'modified' 键
-        source_filename: 源文件名
-    """
-    if not changes_log:
-        print(f"[!] 没有变更记录，跳过报告生成: {report_path}")
-        return
-    
-    # 获取项目根目录和模板路径
-    project_root = Path(__file__).parent.parent
-    template_path = project_root / 'shared_assets' / 'report_template.html'
-    
-    if not template_path.exists():
-        print(f"[!] 模板文件不存在: {template_path}")
-        return
-    
-    # 获取CSS和JS内容
-    shared_assets_dir = project_root / 'shared_assets'
-    css_file_path = shared_assets_dir / 'report_styles.css'
-    js_file_path = shared_assets_dir / 'report_scripts.js'
-    
-    css_content = ""
-    try:
-        css_content = css_file_path.read_text(encoding='utf-8')
-    except Exception as e:
-        print(f"[!] 读取CSS文件失败: {e}")
-        css_content = "/* CSS load failed */"
+# 变更报告写出器（main 根据 --report-format 重新创建，并行时由 _init_worker 传给工作进程）
+_report_writer = ReportWriter()
 
-    js_content = ""
-    try:
-        js_content = js_file_path.read_text(encoding='utf-8')
-    except Exception as e:
-        print(f"[!] 读取JS文件失败: {e}")
-        js_content = "// JS load failed"
-    
-    # 按替换规则归类
-    rule_groups = {}
-    for change in changes_log:
-        # 提取高亮的原文和替换文本
-        original_match = re.search(r'<span class="highlight">([^<]+)</span>', change['original'])
-        modified_match = re.search(r'<span class="highlight">([^<]+)</span>', change['modified'])
-        
-        if original_match and modified_match:
-            original_text = original_match.group(1)
-            replacement_text = modified_match.group(1)
-            rule_key = f"{original_text} → {replacement_text}"
-            
-            if rule_key not in rule_groups:
-                rule_groups[rule_key] = {
-                    'original_text': original_text,
-                    'replacement_text': replacement_text,
-                    'instances': []
-                }
-            
-            rule_groups[rule_key]['instances'].append(change)
-    
-    # 按实例数量排序
-    sorted_rule_groups = sorted(rule_groups.values(), key=lambda x: len(x['instances']), reverse=True)
-    total_instances = sum(len(group['instances']) for group in sorted_rule_groups)
-    
-    # 读取模板文件
-    template_content = template_path.read_text(encoding='utf-8')
-    
-    # 生成规则列表项
-    rules_list_items = ""
-    for i, group in enumerate(sorted_rule_groups):
-        rules_list_items += f'''
-                    <div class="rule-list-item" onclick="jumpToRule({i})">
-                        <div class="rule-text">
-                            <span class="rule-original">{html.escape(group["original_text"])}</span> → 
-                            <span class="rule-replacement">{html.escape(group["replacement_text"])}</span>
-                        </div>
-                        <div class="rule-count">{len(group["instances"])} 次</div>
-                    </div>
-        '''
-    
-    # 生成内容区域
-    content_sections = ""
-    for group_index, group in enumerate(sorted_rule_groups):
-        instance_count = len(group['instances'])
-        content_sections += f'''
-            <div class="rule-group" data-group-index="{group_index}">
-                <div class="rule-header" onclick="toggleInstances({group_index})">
-                    <div class="rule-title">
-                        <span class="rule-badge">{instance_count} 次</span>
-                        <span class="toggle-icon" id="toggle-{group_index}">▼</span>
-                    </div>
-                    <div class="rule-description">
-                        <span><strong>{html.escape(group['original_text'])}</strong></span>
-                        <span class="rule-arrow">→</span>
-                        <span><strong>{html.escape(group['replacement_text'])}</strong></span>
-                    </div>
-                </div>
-                <div class="instances-container" id="instances-{group_index}">
-        '''
-        
-        # 按位置排序实例
-        sorted_instances = sorted(group['instances'], key=lambda x: x.get('position', 0))
-        
-        for instance in sorted_instances:
-            content_sections += f'''
-                    <div class="instance-item">
-                        <div class="instance-content">
-                            <div class="original-section">
-                                <div class="section-title">原文</div>
-                                <div class="text-content">{instance['original']}</div>
-                            </div>
-                            <div class="modified-section">
-                                <div class="section-title">修改后</div>
-                                <div class="text-content">{instance['modified']}</div>
-                            </div>
-                        </div>
-                    </div>
-            '''
-        
-        content_sections += '''
-                </div>
-            </div>
-        '''
-    
-    # 替换模板中的占位符
-    html_content = template_content.replace('{{source_filename}}', html.escape(source_filename))
-    html_content = html_content.replace('{{rules_count}}', str(len(sorted_rule_groups)))
-    html_content = html_content.replace('{{total_instances}}', str(total_instances))
-    html_content = html_content.replace('{{rules_list_items}}', rules_list_items)
-    html_content = html_content.replace('{{content_sections}}', content_sections)
-    html_content = html_content.replace('{{generation_time}}', html.escape(str(__import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S'))))
-    
-    # 嵌入CSS和JS（替换标签）
-    html_content = html_content.replace('<link rel="stylesheet" href="shared_assets/report_styles.css">', f'<style>\n{css_content}\n</style>')
-    html_content = html_content.replace('<script src="shared_assets/report_scripts.js"></script>', f'<script>\n{js_content}\n</script>')
-    
-    try:
-        report_path.write_text(html_content, encoding='utf-8')
-        print(f"[✓] 报告已生成: {report_path}")
-    except Exception as e:
-        print(f"[!] 无法写入报告文件 {report_path}: {e}")
+def generate_report(report_path: Path, changes_log: list, source_filename: str):
+    """生成HTML格式的变更报告（格式由 --report-format 决定，见 change_report.ReportWriter）。"""
+    _report_writer.write(report_path, changes_log, source_filename)
 
 def is_main_content(content: str) -> bool:
     """
@@ -225,20 +97,22 @@ def is_main_content(content: str) -> bool:
     
     return False
 
-def fix_punctuation_and_get_changes(content: str) -> tuple[str, list]:
+def fix_punctuation_and_get_changes(content: str, with_spans: bool = False) -> tuple:
     """
     基于中文语法规范修复标点符号问题并返回修改记录
     参考《标点符号用法》国家标准GB/T 15834-2011
     只补全逗号，不补全句号，并跳过非正文内容。
     返回元组: (修改后的文本, 原子化变更列表)
     原子化变更: [{'original_text': '...','replacement_text': '...'}]
+    with_spans=True 时追加第三项：每处变更在原文与结果中的位置（见 EditTrace.spans），用于报告高亮。
     """
     # 首先判断是否为正文内容
     if not is_main_content(content):
-        return content, []
+        return (content, [], []) if with_spans else (content, [])
     
     modified_content = content
     atomic_changes = []
+    trace = EditTrace()
     
     # 简化的标点符号和空格修复规则（简单粗暴版本）
     punctuation_rules = [
@@ -319,7 +193,11 @@ def fix_punctuation_and_get_changes(content: str) -> tuple[str, list]:
                             "replacement_text": replacement_text
                         })
                         
-                        # 应用替换
+                        # 应用替换（替换的是当前文本中第一次出现的位置，按该位置记录编辑）
+                        start = modified_content.find(original_text)
+                        if start >= 0:
+                            trace.add_stage([(start, start + len(original_text), start, start + len(replacement_text),
+                                              original_text, replacement_text)])
                         modified_content = modified_content.replace(original_text, replacement_text, 1)
         except re.error as e:
             print(f"\n[!] 正则表达式错误: '{pattern}'. 错误: {e}. 跳过。")
@@ -327,6 +205,8 @@ def fix_punctuation_and_get_changes(content: str) -> tuple[str, list]:
     
     # 去重
     unique_atomic_changes = [dict(t) for t in {tuple(d.items()) for d in atomic_changes}]
+    if with_spans:
+        return modified_content, unique_atomic_changes, trace.spans()
     return modified_content, unique_atomic_changes
 
 def process_txt_file(file_path: Path, processed_dir: Path, report_dir: Path):
@@ -340,25 +220,13 @@ def process_txt_file(file_path: Path, processed_dir: Path, report_dir: Path):
         current_position = 0  # 记录当前在原文中的位置
 
         for paragraph_index, p_original in enumerate(paragraphs):
-            p_modified, atomic_changes = fix_punctuation_and_get_changes(p_original)
+            p_modified, atomic_changes, spans = fix_punctuation_and_get_changes(p_original, with_spans=True)
             processed_paragraphs.append(p_modified)
 
             if atomic_changes:
                 file_was_modified = True
-                original_report = html.escape(p_original)
-                modified_report = html.escape(p_modified)
-
-                for change in atomic_changes:
-                    orig_esc = html.escape(change["original_text"])
-                    repl_esc = html.escape(change["replacement_text"])
-                    original_report = original_report.replace(orig_esc, f'<span class="highlight">{orig_esc}</span>')
-                    modified_report = modified_report.replace(repl_esc, f'<span class="highlight">{repl_esc}</span>')
-                
-                changes_log_for_report.append({
-                    'original': original_report.replace('\n', '<br>'),
-                    'modified': modified_report.replace('\n', '<br>'),
-                    'position': current_position + paragraph_index  # 添加位置信息
-                })
+                changes_log_for_report.append(
+                    build_change_entry(p_original, p_modified, spans, current_position + paragraph_index, line_break='<br>'))
             
             current_position += len(p_original) + 2  # +2 for \n\n separator
 
@@ -374,133 +242,161 @@ def process_txt_file(file_path: Path, processed_dir: Path, report_dir: Path):
         print(f"\n[!] 处理TXT文件失败 {file_path.name}: {e}")
     return False
 
-def process_epub_file(file_path: Path, processed_dir: Path, report_dir: Path):
-    """处理单个 .epub 文件。使用 css_fixer 进行后期 CSS 修复。"""
-    
-    try:
-        book = epub.read_epub(str(file_path))
-        changes_log = []
-        book_is_modified = False
-        global_position = 0  # 记录全局位置
-        
-        # 使用ebooklib处理EPUB文件内容
-        for item in book.get_items_of_type(ITEM_DOCUMENT):
-            # item_name = item.get_name()
-            original_content_bytes = item.get_content()
-            # original_content = original_content_bytes.decode('utf-8')
-            
-            # 使用BeautifulSoup解析
-            soup = BeautifulSoup(original_content_bytes, 'xml') # 使用 xml 解析器更安全
-            if not soup.body:
+def fix_document(content_bytes: bytes, css_hrefs: list = None, name: str = ''):
+    """
+    修复 EPUB 中一个 XHTML 章节的标点符号，并在同一棵文档树上补上缺失的样式表链接（css_hrefs 不为 None 时）。
+    返回元组: (修改后的章节内容字节，未修改时为 None, 变更记录列表, 章节段落文本总长度, 是否补了样式表链接)
+    变更记录中的 position 为章节内的偏移，由调用方加上章节起点。
+    """
+    # 使用BeautifulSoup解析
+    soup = BeautifulSoup(content_bytes, 'xml') # 使用 xml 解析器更安全
+    changes_log = []
+    position = 0
+
+    css_fixed = css_hrefs is not None and css_fixer.add_css_links(soup, css_hrefs, name)
+
+    if soup.body:
+        for p_tag in soup.body.find_all('p'):
+            if not p_tag.get_text(strip=True): 
                 continue
 
-            item_is_modified = False
-            for p_tag in soup.body.find_all('p'):
-                if not p_tag.get_text(strip=True): 
-                    continue
+            p_text_original = p_tag.get_text()
 
-                original_p_html = str(p_tag)
-                p_text_original = p_tag.get_text()
+            p_text_modified, atomic_changes, spans = fix_punctuation_and_get_changes(p_text_original, with_spans=True)
 
-                p_text_modified, atomic_changes = fix_punctuation_and_get_changes(p_text_original)
+            if atomic_changes:
+                p_tag.string = p_text_modified  # 更安全地替换段落内容
+                changes_log.append(build_change_entry(p_text_original, p_text_modified, spans, position))
+            
+            position += len(p_text_original)  # 更新位置
 
-                if atomic_changes:
-                    book_is_modified = True
-                    item_is_modified = True
-                    
-                    p_tag.string = p_text_modified  # 更安全地替换段落内容
-                    modified_p_html = str(p_tag)
+    # 如果章节被修改，返回新的章节内容
+    new_content = str(soup).encode('utf-8') if changes_log or css_fixed else None
+    return new_content, changes_log, position, css_fixed
 
-                    original_report = original_p_html
-                    modified_report = modified_p_html
+def _fix_documents_task(documents: list) -> list:
+    """工作进程任务：修复一个 EPUB 的一组章节，documents 为 [(成员名, 章节内容, 样式表链接列表或 None), ...]。"""
+    return [fix_document(content, css_hrefs, name) for name, content, css_hrefs in documents]
 
-                    for change in atomic_changes:
-                        orig_esc = html.escape(change["original_text"])
-                        repl_esc = html.escape(change["replacement_text"])
-                        original_report = original_report.replace(orig_esc, f'<span class="highlight">{orig_esc}</span>')
-                        modified_report = modified_report.replace(repl_esc, f'<span class="highlight">{repl_esc}</span>')
-                    
-                    changes_log.append({
-                        'original': original_report,
-                        'modified': modified_report,
-                        'position': global_position  # 添加位置信息
-                    })
-                
-                global_position += len(p_text_original)  # 更新全局位置
-
-            # 如果文件被修改，则更新item内容
-            if item_is_modified:
-                item.set_content(str(soup).encode('utf-8'))
-
-        # 保存预处理后的EPUB (仅标点修复)
-        temp_epub_path = processed_dir / f"temp_{file_path.name}"
-        
-        try:
-            if book_is_modified:
-                # 检查并确保EPUB有必需的identifier元数据
-                if not book.get_metadata('DC', 'identifier'):
-                    import uuid
-                    default_identifier = f"urn:uuid:{uuid.uuid4()}"
-                    book.add_metadata('DC', 'identifier', default_identifier)
-                
-                epub.write_epub(str(temp_epub_path), book, {})
+def process_epub_file(file_path: Path, processed_dir: Path, report_dir: Path, chapter_executor=None):
+    """
+    处理单个 .epub 文件。每个 XHTML 章节只解析一次，标点修复与缺失样式表链接的补全（css_fixer）
+    在同一棵文档树上完成，修改后的章节直接写回 zip（见 EpubRewriter）。
+    传入 chapter_executor（进程池）时，章节分组分发到各工作进程并行修复。
+    """
+    
+    try:
+        changes_log = []
+        global_position = 0  # 记录全局位置
+        final_target_path = processed_dir / file_path.name
+
+        with EpubRewriter(file_path) as book:
+            documents = book.manifest_documents()
+            css_paths = css_fixer.get_unique_css_files(book)
+            # 与 css_fixer 一致：只为 .html/.xhtml 成员补链接，没有 CSS 文件时不补
+            tasks = []
+            for name in documents:
+                css_hrefs = css_fixer.css_hrefs_for(css_paths, name) if css_paths and css_fixer.is_html_document(name) else None
+                tasks.append((name, book.read(name), css_hrefs))
+
+            if chapter_executor is not None:
+                chunks = [tasks[i:i + EPUB_CHAPTERS_PER_TASK] for i in range(0, len(tasks), EPUB_CHAPTERS_PER_TASK)]
+                futures = [chapter_executor.submit(_fix_documents_task, chunk) for chunk in chunks]
+                document_results = (result for future in futures for result in future.result())
             else:
-                # 如果没修改，直接复制原文件
-                shutil.copy2(file_path, temp_epub_path)
-
-            # 调用 css_fixer 进行 CSS 修复
-            # fix_epub_css 会原地修改 temp_epub_path (如果修复成功) 或者保持不变
-            fix_status, reason = css_fixer.fix_epub_css(str(temp_epub_path), str(processed_dir))
-            
-            if fix_status == "failed":
-                print(f"  [!] CSS修复模块报告错误: {reason}")
-            elif fix_status == "skipped":
-                pass # 没什么可做的，继续使用当前文件
-            
-            # 将最终文件移动到目标位置
-            final_target_path = processed_dir / file_path.name
-            
-            if final_target_path.exists():
-                try:
-                    final_target_path.unlink()
-                except Exception as e:
-                    print(f"  [!] 无法删除现有的目标文件: {e}")
-            
-            # 使用 move 将 temp 文件重命名为最终文件
-            shutil.move(str(temp_epub_path), str(final_target_path))
-            
-            if book_is_modified or fix_status == "fixed":
-                unique_changes = [dict(t) for t in {tuple(d.items()) for d in changes_log}]
-                generate_report(report_dir / f"{file_path.name}.html", unique_changes, file_path.name)
-                return True
-                
+                document_results = (fix_document(content, css_hrefs, name) for name, content, css_hrefs in tasks)
+
+            for name, (new_content, item_changes, item_length, _) in zip(documents, document_results):
+                # 如果章节被修改，则写回新内容
+                if new_content is not None:
+                    book.write(name, new_content)
+                for change in item_changes:
+                    change['position'] += global_position
+                    changes_log.append(change)
+                global_position += item_length
+
+            # 不在 manifest 中的 HTML 成员只需检查样式表链接
+            if css_paths:
+                document_names = set(documents)
+                css_fixer.fix_css_links(book, css_paths, [name for name in book.names() if name not in document_names])
+
+            book_is_modified = book.modified
+            if book_is_modified:
+                book.save(final_target_path)
+        if not book_is_modified:
+            # 如果没修改，直接复制原文件
+            shutil.copy2(file_path, final_target_path)
             return False
 
-        finally:
-            # 确保清理临时文件
-            try:
-                if temp_epub_path.exists():
-                    temp_epub_path.unlink()
-                
-                # 同时清理可能残留的zip文件（css_fixer产生的中间文件）
-                temp_zip_path = temp_epub_path.with_suffix('.zip')
-                if temp_zip_path.exists():
-                    temp_zip_path.unlink()
-            except Exception:
-                pass
+        unique_changes = [dict(t) for t in {tuple(d.items()) for d in changes_log}]
+        generate_report(report_dir / f"{file_path.name}.html", unique_changes, file_path.name)
+        return True
 
     except Exception as e:
         print(f"\n[!] 处理EPUB文件失败 {file_path.name}: {e}")
         return False
 
 
+def process_file(file_path: Path, processed_dir: Path, report_dir: Path, chapter_executor=None) -> bool:
+    """按文件类型处理单个文件，返回文件是否被修改。"""
+    if file_path.suffix == '.txt':
+        return process_txt_file(file_path, processed_dir, report_dir)
+    if file_path.suffix == '.epub':
+        return process_epub_file(file_path, processed_dir, report_dir, chapter_executor)
+    return False
+
+def _init_worker(report_writer: ReportWriter):
+    """工作进程初始化：接收主进程的报告写出器。"""
+    global _report_writer
+    _report_writer = report_writer
+
+def process_files_parallel(files_to_process: list, processed_dir: Path, report_dir: Path, jobs: int, pbar) -> list:
+    """
+    用进程池并行处理文件，返回与 files_to_process 顺序一致的"是否被修改"列表。
+    超过 EPUB_SPLIT_THRESHOLD_MB 的 EPUB 在主进程中读写，其章节分组分发到同一个进程池。
+    """
+    split_threshold = EPUB_SPLIT_THRESHOLD_MB * 1024 * 1024
+    large_epubs = [f for f in files_to_process if f.suffix == '.epub' and f.stat().st_size > split_threshold]
+    results = {}
+
+    def record(file_path, was_modified):
+        results[file_path] = was_modified
+        pbar.set_postfix_str(file_path.name, refresh=True)
+        pbar.update(1)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(_report_writer,)) as executor:
+        futures = {
+            executor.submit(process_file, file_path, processed_dir, report_dir): file_path
+            for file_path in files_to_process if file_path not in large_epubs
+        }
+        for file_path in large_epubs:
+            record(file_path, process_file(file_path, processed_dir, report_dir, chapter_executor=executor))
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                was_modified = future.result()
+            except Exception as e:
+                print(f"\n[!] 工作进程处理失败 {file_path.name}: {e}")
+                was_modified = False
+            record(file_path, was_modified)
+
+    return [results[file_path] for file_path in files_to_process]
+
+
 def main():
     """主函数"""
     import argparse
     parser = argparse.ArgumentParser(description="Punctuation Fixer Tool")
     parser.add_argument("--input", "-i", type=str, help="Directory containing files to fix")
+    parser.add_argument("--jobs", "-j", type=int, default=DEFAULT_JOBS, help=f"并行处理的进程数 (默认: {DEFAULT_JOBS}，0 表示 CPU 核数)")
+    parser.add_argument("--report-format", choices=REPORT_FORMATS, default=REPORT_FORMAT_AUTO,
+                        help="变更报告格式: inline 为单文件，chunked 为分块按需加载，auto 按变更数量自动选择 (默认: auto)")
+    parser.add_argument("--report-search", action="store_true", help="为分块报告生成搜索索引")
     args = parser.parse_args()
 
+    global _report_writer
+    _report_writer = ReportWriter(args.report_format, search_index=args.report_search)
+
     print("[*] 标点符号补全工具")
     print("[*] 支持自动修复中文文本中缺失的标点符号")
     print("[*] 支持处理 .txt 和 .epub 文件")
@@ -556,21 +452,25 @@ def main():
     print(f"[*] 发现 {len(files_to_process)} 个待处理文件。", flush=True)
     print("[*] 开始标点符号补全处理...", flush=True)
 
-    modified_count = 0
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if jobs > 1 and getattr(sys, 'frozen', False):
+        # 打包后的程序通过 runpy 以 __main__ 运行本脚本，工作进程无法找到其中定义的任务函数
+        print("[!] 警告: 打包环境下不支持多进程处理，改为逐个处理。")
+        jobs = 1
+    if jobs > 1:
+        print(f"[*] 并行进程数: {jobs}", flush=True)
+
     with tqdm(total=len(files_to_process), desc="处理进度", unit="个文件") as pbar:
-        for file_path in files_to_process:
-            pbar.set_postfix_str(file_path.name, refresh=True)
-            # print(f"Processing: {file_path.name}", flush=True) # Optional debugging
-
-            was_modified = False
-            if file_path.suffix == '.txt':
-                was_modified = process_txt_file(file_path, processed_dir, report_dir)
-            elif file_path.suffix == '.epub':
-                was_modified = process_epub_file(file_path, processed_dir, report_dir)
-            
-            if was_modified:
-                modified_count += 1
-            pbar.update(1)
+        if jobs > 1:
+            modified_flags = process_files_parallel(files_to_process, processed_dir, report_dir, jobs, pbar)
+        else:
+            modified_flags = []
+            for file_path in files_to_process:
+                pbar.set_postfix_str(file_path.name, refresh=True)
+                modified_flags.append(process_file(file_path, processed_dir, report_dir))
+                pbar.update(1)
+
+    modified_count = sum(modified_flags)
 
     print("\n----------------------------------------", flush=True)
     print(f"[✓] 标点符号补全任务完成！", flush=True)
@@ -437,25 +437,34 @@ def get_toc_rules():
     # 直接返回默认规则，移除修改功能
     return r'^[\s　]*#\s*(.*)', r'^[\s　]*##\s*(.*)'
 
-def extract_toc_from_text(txt_path, level1_regex, level2_regex):
-    """根据正则表达式从TXT文件中提取目录结构。"""
-    toc = []
+def read_txt_file(txt_path):
+    """读取并解码整个 TXT 文件（每个文件只读取一次，目录提取与章节切分共用），失败时返回 None。"""
     try:
         with open(txt_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if level2_regex:
-                    match_l2 = re.match(level2_regex, line)
-                    if match_l2:
-                        toc.append((match_l2.group(1).strip(), 2))
-                        continue
-                match_l1 = re.match(level1_regex, line)
-                if match_l1:
-                    toc.append((match_l1.group(1).strip(), 1))
+            return f.read()
     except Exception as e:
         print(f"\n[错误] 读取或解析TXT文件 '{txt_path}' 时出错: {e}")
         return None
-    return toc
+
+def build_heading_index(full_text, level1_regex, level2_regex):
+    """
+    用一个编译后的正则扫描全文，建立标题索引: [(起始偏移, 结束偏移, 级别, 标题), ...]（按出现顺序）。
+    结束偏移为标题行匹配的结尾，即章节正文的起点；目录提取与章节切分都基于这份索引。
+    """
+    combined_regex_str = f"({level2_regex})|({level1_regex})" if level2_regex else f"({level1_regex})"
+    pattern = re.compile(combined_regex_str, re.MULTILINE)
+
+    heading_index = []
+    for match in pattern.finditer(full_text):
+        if level2_regex and match.group(1):
+            heading_index.append((match.start(), match.end(), 2, match.group(2).strip()))
+        elif match.group(3):
+            heading_index.append((match.start(), match.end(), 1, match.group(4).strip()))
+    return heading_index
+
+def extract_toc_from_text(heading_index):
+    """从标题索引得到目录结构: [(标题, 级别), ...]。"""
+    return [(title, level) for _start, _end, level, title in heading_index]
 
 def print_toc_for_confirmation(toc):
     """友好地打印出目录结构供用户确认。"""
@@ -471,12 +480,11 @@ def print_toc_for_confirmation(toc):
             print(f"    - {title}")
     print("="*50)
 
-def confirm_and_edit_toc(current_txt_file, l1_regex, l2_regex):
+def confirm_and_edit_toc(heading_index):
     """让用户确认目录，如果用户选择否则提供交互式修改功能。"""
     print("\n--- 步骤 2: 确认与修改目录 ---")
     
-    toc = extract_toc_from_text(current_txt_file, l1_regex, l2_regex)
-    if toc is None: return None
+    toc = extract_toc_from_text(heading_index)
 
     while True:
         print_toc_for_confirmation(toc)
@@ -543,8 +551,8 @@ def text_to_html(text):
     html_paragraphs = [f'<p>{p.replace(os.linesep, "<br/>").strip()}</p>' for p in paragraphs if p.strip()]
     return '\n'.join(html_paragraphs)
 
-def create_epub(txt_path, final_toc, css_content, cover_path, l1_regex, l2_regex, output_dir, selected_style_key, reader_type_info):
-    """核心函数：创建 EPUB 文件。"""
+def create_epub(txt_path, full_text, heading_index, final_toc, css_content, cover_path, output_dir, selected_style_key, reader_type_info):
+    """核心函数：创建 EPUB 文件。full_text 与 heading_index 为已读取的全文及其标题索引（见 build_heading_index）。"""
     default_book_name = os.path.splitext(os.path.basename(txt_path))[0]
     print(f"\n--- 步骤 3: 确认电子书标题 ---")
     print(f"当前默认标题为: '{default_book_name}'")
@@ -639,26 +647,14 @@ body {{
             print(f"[警告] 添加封面失败: {e}")
             cover_item = None
 
-    with open(txt_path, 'r', encoding='utf-8') as f:
-        full_text = f.read()
-
     print("[LOG] 开始在原文中定位所有章节标题...")
-    all_headings_map = []
-    combined_regex_str = f"({l2_regex})|({l1_regex})" if l2_regex else f"({l1_regex})"
-    pattern = re.compile(combined_regex_str, re.MULTILINE)
-
-    for match in pattern.finditer(full_text):
-        title, level = None, None
-        if l2_regex and match.group(1):
-            title = match.group(2).strip()
-            level = 2
-        elif match.group(3):
-            title = match.group(4).strip()
-            level = 1
-        
-        if title is not None and any(toc_title == title for toc_title, toc_level in final_toc if toc_level == level):
-            all_headings_map.append({'title': title, 'level': level, 'start': match.start(), 'end': match.end()})
-            
+    # 只保留确认后的目录中存在的标题（按 标题+级别 查集合，不再逐个遍历目录）
+    toc_entries = set(final_toc)
+    all_headings_map = [
+        {'title': title, 'level': level, 'start': start, 'end': end}
+        for start, end, level, title in heading_index
+        if (title, level) in toc_entries
+    ]
     print(f"[LOG] 定位完成，共找到 {len(all_headings_map)} 个有效标题。")
     
     chapters = []
@@ -822,19 +818,26 @@ if __name__ == "__main__":
         
         if is_interactive:
             l1_regex, l2_regex = get_toc_rules()
-            final_toc_list = confirm_and_edit_toc(current_txt_file, l1_regex, l2_regex)
         else:
              # Default TOC rules for automation: # and ##
              l1_regex = r'^[\s　]*#\s*(.*)'
              l2_regex = r'^[\s　]*##\s*(.*)'
              print(f"  [自动化] 使用默认目录规则: # (一级), ## (二级)")
-             final_toc_list = extract_toc_from_text(current_txt_file, l1_regex, l2_regex)
+
+        # 全文只读取一次，标题索引同时用于目录确认和章节切分
+        full_text = read_txt_file(current_txt_file)
+        if full_text is not None:
+            heading_index = build_heading_index(full_text, l1_regex, l2_regex)
+            if is_interactive:
+                final_toc_list = confirm_and_edit_toc(heading_index)
+            else:
+                final_toc_list = extract_toc_from_text(heading_index)
 
         if final_toc_list is None:
             print("因读取文件失败或未确认目录，跳过此文件。")
             continue
             
-        create_epub(current_txt_file, final_toc_list, css_data, cover_image, l1_regex, l2_regex, output_dir, style_key, reader_info)
+        create_epub(current_txt_file, full_text, heading_index, final_toc_list, css_data, cover_image, output_dir, style_key, reader_info)
         print("-" * 60)
 
     print("\n所有任务已完成！")
\ No newline at end of file
@@ -0,0 +1,281 @@
+// 分块报告查看器
+// 报告外壳只包含统计信息，变更实例保存在数据目录下的 chunk_XXXX.js 中，展开规则组或滚动到底部时才加载。
+// 数据文件是包在回调里的 JSON（reportLoadIndex / reportLoadChunk / reportLoadSearch），
+// 通过 <script> 标签加载，直接以 file:// 打开报告时也能工作（fetch 在 file:// 下会被浏览器拦截）。
+(function () {
+    const dataDir = document.body.dataset.reportData;
+    const state = {
+        index: null,
+        chunks: {},
+        waiting: {},
+        groups: [],
+        search: null,
+        searchWaiting: [],
+    };
+    const SEARCH_RESULT_LIMIT = 200;
+
+    function escapeHtml(text) {
+        return String(text)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;');
+    }
+
+    function loadScript(src) {
+        const script = document.createElement('script');
+        script.src = src;
+        script.onerror = function () {
+            console.error('报告数据加载失败: ' + src);
+        };
+        document.body.appendChild(script);
+    }
+
+    function chunkPath(chunkIndex) {
+        return dataDir + '/chunk_' + String(chunkIndex).padStart(4, '0') + '.js';
+    }
+
+    function withChunk(chunkIndex, callback) {
+        if (state.chunks[chunkIndex]) {
+            callback(state.chunks[chunkIndex]);
+            return;
+        }
+        if (state.waiting[chunkIndex]) {
+            state.waiting[chunkIndex].push(callback);
+            return;
+        }
+        state.waiting[chunkIndex] = [callback];
+        loadScript(chunkPath(chunkIndex));
+    }
+
+    window.reportLoadIndex = function (index) {
+        state.index = index;
+        renderGroups();
+    };
+
+    window.reportLoadChunk = function (chunkIndex, items) {
+        state.chunks[chunkIndex] = items;
+        const callbacks = state.waiting[chunkIndex] || [];
+        delete state.waiting[chunkIndex];
+        callbacks.forEach(function (callback) { callback(items); });
+    };
+
+    window.reportLoadSearch = function (entries) {
+        state.search = entries;
+        state.searchWaiting.splice(0).forEach(function (callback) { callback(); });
+    };
+
+    // 每个规则组一个哨兵元素，进入视口时加载该组的下一页实例
+    const observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                loadMore(Number(entry.target.dataset.groupIndex));
+            }
+        });
+    }, { rootMargin: '400px 0px' });
+
+    function renderGroups() {
+        const groups = state.index.groups;
+        state.groups = groups.map(function (group) {
+            return { next: group.start, end: group.start + group.count, loading: false, callbacks: [] };
+        });
+
+        document.getElementById('rules-list-content').innerHTML = groups.map(function (group, i) {
+            return '<div class="rule-list-item" onclick="jumpToRule(' + i + ')">' +
+                '<div class="rule-text">' +
+                '<span class="rule-original">' + escapeHtml(group.original_text) + '</span> → ' +
+                '<span class="rule-replacement">' + escapeHtml(group.replacement_text) + '</span>' +
+                '</div>' +
+                '<div class="rule-count">' + group.count + ' 次</div>' +
+                '</div>';
+        }).join('');
+
+        const content = document.getElementById('report-content');
+        content.innerHTML = groups.map(function (group, i) {
+            return '<div class="rule-group" data-group-index="' + i + '">' +
+                '<div class="rule-header" onclick="toggleInstances(' + i + ')">' +
+                '<div class="rule-title">' +
+                '<span class="rule-badge">' + group.count + ' 次</span>' +
+                '<span class="toggle-icon" id="toggle-' + i + '">▼</span>' +
+                '</div>' +
+                '<div class="rule-description">' +
+                '<span><strong>' + escapeHtml(group.original_text) + '</strong></span>' +
+                '<span class="rule-arrow">→</span>' +
+                '<span><strong>' + escapeHtml(group.replacement_text) + '</strong></span>' +
+                '</div>' +
+                '</div>' +
+                '<div class="instances-container paged" id="instances-' + i + '">' +
+                '<div class="instances-sentinel" data-group-index="' + i + '"></div>' +
+                '</div>' +
+                '</div>';
+        }).join('');
+
+        content.querySelectorAll('.instances-sentinel').forEach(function (sentinel) {
+            observer.observe(sentinel);
+        });
+
+        if (state.index.search) {
+            initSearch();
+        }
+    }
+
+    function renderInstance(instanceIndex, item) {
+        return '<div class="instance-item" id="instance-' + instanceIndex + '">' +
+            '<div class="instance-content">' +
+            '<div class="original-section">' +
+            '<div class="section-title">原文</div>' +
+            '<div class="text-content">' + item.original + '</div>' +
+            '</div>' +
+            '<div class="modified-section">' +
+            '<div class="section-title">修改后</div>' +
+            '<div class="text-content">' + item.modified + '</div>' +
+            '</div>' +
+            '</div>' +
+            '</div>';
+    }
+
+    // 渲染规则组中下一个数据块覆盖的实例，完成后调用 callback
+    function loadMore(groupIndex, callback) {
+        const group = state.groups[groupIndex];
+        if (callback) {
+            group.callbacks.push(callback);
+        }
+        if (group.loading) {
+            return;
+        }
+        if (group.next >= group.end) {
+            group.callbacks.splice(0).forEach(function (cb) { cb(); });
+            return;
+        }
+        group.loading = true;
+        const chunkSize = state.index.chunk_size;
+        const chunkIndex = Math.floor(group.next / chunkSize);
+        withChunk(chunkIndex, function (items) {
+            const chunkStart = chunkIndex * chunkSize;
+            const stop = Math.min(group.end, chunkStart + items.length);
+            const html = [];
+            for (let i = group.next; i < stop; i++) {
+                html.push(renderInstance(i, items[i - chunkStart]));
+            }
+            const container = document.getElementById('instances-' + groupIndex);
+            const sentinel = container.querySelector('.instances-sentinel');
+            sentinel.insertAdjacentHTML('beforebegin', html.join(''));
+            group.next = stop;
+            group.loading = false;
+            if (group.next >= group.end) {
+                observer.unobserve(sentinel);
+                sentinel.remove();
+            } else {
+                // 哨兵仍在视口内时不会再触发回调，重新观察以便继续加载
+                observer.unobserve(sentinel);
+                observer.observe(sentinel);
+            }
+            group.callbacks.splice(0).forEach(function (cb) { cb(); });
+        });
+    }
+
+    function expandGroup(groupIndex) {
+        const container = document.getElementById('instances-' + groupIndex);
+        const icon = document.getElementById('toggle-' + groupIndex);
+        if (container && !container.classList.contains('expanded')) {
+            container.classList.add('expanded');
+            icon.classList.add('expanded');
+        }
+    }
+
+    // 展开规则组并持续加载，直到指定实例已渲染，然后滚动到该实例
+    function showInstance(instanceIndex) {
+        const groups = state.index.groups;
+        let groupIndex = 0;
+        while (groupIndex + 1 < groups.length && groups[groupIndex + 1].start <= instanceIndex) {
+            groupIndex++;
+        }
+        expandGroup(groupIndex);
+        (function step() {
+            if (state.groups[groupIndex].next > instanceIndex) {
+                const element = document.getElementById('instance-' + instanceIndex);
+                element.scrollIntoView({ behavior: 'smooth', block: 'center' });
+                element.style.boxShadow = 'inset 0 0 0 3px rgba(233, 30, 99, 0.4)';
+                setTimeout(function () { element.style.boxShadow = ''; }, 2000);
+                return;
+            }
+            loadMore(groupIndex, step);
+        })();
+    }
+
+    function initSearch() {
+        const panel = document.getElementById('report-search');
+        const input = document.getElementById('report-search-input');
+        const results = document.getElementById('report-search-results');
+        panel.hidden = false;
+
+        function runSearch() {
+            const query = input.value.trim().toLowerCase();
+            if (!query) {
+                results.innerHTML = '';
+                return;
+            }
+            const hits = [];
+            let total = 0;
+            state.search.forEach(function (text, instanceIndex) {
+                if (text.toLowerCase().indexOf(query) !== -1) {
+                    total++;
+                    if (hits.length < SEARCH_RESULT_LIMIT) {
+                        hits.push(instanceIndex);
+                    }
+                }
+            });
+            const summary = '<div class="report-search-summary">找到 ' + total + ' 处' +
+                (total > hits.length ? '（显示前 ' + hits.length + ' 处）' : '') + '</div>';
+            results.innerHTML = summary + hits.map(function (instanceIndex) {
+                const text = state.search[instanceIndex];
+                const at = text.toLowerCase().indexOf(query);
+                const snippet = text.slice(Math.max(0, at - 30), at + query.length + 30);
+                return '<div class="report-search-hit" data-instance-index="' + instanceIndex + '">' +
+                    escapeHtml(snippet) + '</div>';
+            }).join('');
+        }
+
+        let timer = null;
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                if (state.search) {
+                    runSearch();
+                    return;
+                }
+                // 搜索索引只在第一次搜索时加载
+                if (state.searchWaiting.length === 0) {
+                    loadScript(dataDir + '/search.js');
+                }
+                state.searchWaiting.push(runSearch);
+            }, 200);
+        });
+
+        results.addEventListener('click', function (e) {
+            const hit = e.target.closest('.report-search-hit');
+            if (hit) {
+                showInstance(Number(hit.dataset.instanceIndex));
+            }
+        });
+    }
+
+    window.toggleInstances = function (groupIndex) {
+        const container = document.getElementById('instances-' + groupIndex);
+        const icon = document.getElementById('toggle-' + groupIndex);
+        const expanded = container.classList.toggle('expanded');
+        icon.classList.toggle('expanded', expanded);
+    };
+
+    window.jumpToRule = function (groupIndex) {
+        toggleRulesList();
+        const ruleGroup = document.querySelector('[data-group-index="' + groupIndex + '"].rule-group');
+        if (!ruleGroup) {
+            return;
+        }
+        ruleGroup.scrollIntoView({ behavior: 'smooth', block: 'center' });
+        expandGroup(groupIndex);
+        ruleGroup.style.boxShadow = '0 0 20px rgba(233, 30, 99, 0.3)';
+        setTimeout(function () { ruleGroup.style.boxShadow = ''; }, 2000);
+    };
+})();
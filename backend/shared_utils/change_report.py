@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+变更报告辅助函数
+根据规则引擎返回的变更位置生成高亮 HTML：按位置一次线性遍历完成转义与包裹，
+不再对每处变更在整段 HTML 上做一次 str.replace（那样既是 O(变更数 × 段落长度)，
+还会把未改动的同名文本一起高亮，或在已有的高亮标签里再次嵌套）。
+
+报告写出由 ReportWriter 负责，支持两种格式:
+- "inline": 单个 HTML 文件，内嵌 CSS/JS 与全部变更（适合变更不多的文件）
+- "chunked": 体积固定的 HTML 外壳 + 数据目录（index.js、分页的 chunk_XXXX.js、可选的 search.js），
+  实例在展开规则组/滚动时才加载，打开报告的耗时与变更数量无关
+"auto"（默认）按变更数量在两者间选择。模板与静态资源在每个 ReportWriter 中只读取一次。
+"""
+
+import datetime
+import html
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+
+HIGHLIGHT_OPEN = '<span class="highlight">'
+HIGHLIGHT_CLOSE = '</span>'
+
+REPORT_FORMAT_AUTO = "auto"
+REPORT_FORMAT_INLINE = "inline"
+REPORT_FORMAT_CHUNKED = "chunked"
+REPORT_FORMATS = (REPORT_FORMAT_AUTO, REPORT_FORMAT_INLINE, REPORT_FORMAT_CHUNKED)
+
+# auto 模式下变更实例超过该数量时改用分块报告
+INLINE_REPORT_MAX_INSTANCES = 2000
+# 分块报告中每个数据块包含的变更实例数
+REPORT_CHUNK_SIZE = 200
+# 分块报告共用的 CSS/JS 复制到报告目录下的该子目录（每次运行只复制一次）
+REPORT_ASSETS_DIRNAME = "report_assets"
+
+SHARED_ASSETS_DIR = Path(__file__).resolve().parent.parent / 'shared_assets'
+INLINE_TEMPLATE_NAME = 'report_template.html'
+CHUNKED_TEMPLATE_NAME = 'report_chunked_template.html'
+REPORT_ASSET_NAMES = ('report_styles.css', 'report_scripts.js', 'report_viewer.js')
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _merge_spans(spans):
+    """排序并合并重叠的 (起, 止) 区间，丢弃空区间（纯插入/纯删除在该侧没有可高亮的文字）。"""
+    merged = []
+    for start, end in sorted(span for span in spans if span[1] > span[0]):
+        if merged and start < merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def render_highlighted(text, spans, line_break=None):
+    """
+    返回转义后的 text，其中 spans [(起, 止), ...] 覆盖的文字包在高亮 span 中。
+    line_break 不为 None 时把换行替换为该字符串（如 "<br>"）。
+    """
+    pieces = []
+    last_end = 0
+    for start, end in _merge_spans(spans):
+        pieces.append(html.escape(text[last_end:start]))
+        pieces.append(HIGHLIGHT_OPEN + html.escape(text[start:end]) + HIGHLIGHT_CLOSE)
+        last_end = end
+    pieces.append(html.escape(text[last_end:]))
+    rendered = "".join(pieces)
+    if line_break is not None:
+        rendered = rendered.replace("\n", line_break)
+    return rendered
+
+
+def build_change_entry(original, modified, spans, position, line_break=None):
+    """
+    为一个被修改的段落生成报告条目。
+
+    spans 为规则引擎返回的 [(原文起, 原文止, 结果起, 结果止, 原文, 替换文本), ...]；
+    条目中的 original_text / replacement_text 取原文中位置最靠前的变更，用于报告按规则归类。
+    """
+    first = min(spans, key=lambda span: (span[0], span[2]))
+    return {
+        'original': render_highlighted(original, [span[0:2] for span in spans], line_break),
+        'modified': render_highlighted(modified, [span[2:4] for span in spans], line_break),
+        'position': position,
+        'original_text': first[4],
+        'replacement_text': first[5],
+    }
+
+
+def group_changes(changes_log):
+    """
+    按条目中的 original_text / replacement_text 把变更归类。
+    返回按实例数降序排列的 [{'original_text', 'replacement_text', 'instances'}, ...]，组内实例按位置排序。
+    """
+    rule_groups = {}
+    for change in changes_log:
+        rule_key = (change['original_text'], change['replacement_text'])
+        if rule_key not in rule_groups:
+            rule_groups[rule_key] = {
+                'original_text': change['original_text'],
+                'replacement_text': change['replacement_text'],
+                'instances': []
+            }
+        rule_groups[rule_key]['instances'].append(change)
+
+    sorted_rule_groups = sorted(rule_groups.values(), key=lambda x: len(x['instances']), reverse=True)
+    for group in sorted_rule_groups:
+        group['instances'].sort(key=lambda x: x.get('position', 0))
+    return sorted_rule_groups
+
+
+def _plain_text(rendered):
+    """把报告中的高亮 HTML 还原为纯文本（用于搜索索引）。"""
+    return html.unescape(_TAG_RE.sub('', rendered.replace('<br>', '\n')))
+
+
+def _write_text_atomic(path, text):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+class ReportWriter:
+    """
+    变更报告写出器。一次运行创建一个（并行时随进程池初始化传给各工作进程），
+    模板与 CSS/JS 在第一次写报告时读取并缓存，之后的文件不再重复读取。
+
+    report_format: "auto" / "inline" / "chunked"
+    search_index:  分块报告是否额外生成搜索索引 search.js（第一次搜索时才加载）
+    """
+
+    def __init__(self, report_format=REPORT_FORMAT_AUTO, search_index=False, chunk_size=REPORT_CHUNK_SIZE):
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"未知的报告格式: {report_format}")
+        self.report_format = report_format
+        self.search_index = search_index
+        self.chunk_size = chunk_size
+        self._assets = None
+        self._assets_copied = set()
+
+    def __getstate__(self):
+        # 传给工作进程时不携带已读取的资源，由各进程自行读取一次
+        state = self.__dict__.copy()
+        state['_assets'] = None
+        state['_assets_copied'] = set()
+        return state
+
+    def _load_assets(self):
+        if self._assets is None:
+            assets = {}
+            for name in (INLINE_TEMPLATE_NAME, CHUNKED_TEMPLATE_NAME) + REPORT_ASSET_NAMES:
+                try:
+                    assets[name] = (SHARED_ASSETS_DIR / name).read_text(encoding='utf-8')
+                except Exception as e:
+                    print(f"[!] 读取报告资源失败 {name}: {e}")
+                    assets[name] = None
+            self._assets = assets
+        return self._assets
+
+    def resolve_format(self, instance_count):
+        if self.report_format != REPORT_FORMAT_AUTO:
+            return self.report_format
+        return REPORT_FORMAT_CHUNKED if instance_count > INLINE_REPORT_MAX_INSTANCES else REPORT_FORMAT_INLINE
+
+    def write(self, report_path, changes_log, source_filename):
+        """为一个源文件写出变更报告（report_path 为报告 HTML 路径）。"""
+        report_path = Path(report_path)
+        if not changes_log:
+            print(f"[!] 没有变更记录，跳过报告生成: {report_path}")
+            return
+
+        sorted_rule_groups = group_changes(changes_log)
+        total_instances = sum(len(group['instances']) for group in sorted_rule_groups)
+        data_dir = report_path.with_name(report_path.stem + '_data')
+        # 清理上次运行留下的数据目录，避免残留旧数据块
+        if data_dir.is_dir():
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        try:
+            if self.resolve_format(total_instances) == REPORT_FORMAT_CHUNKED:
+                self._write_chunked(report_path, data_dir, sorted_rule_groups, total_instances, source_filename)
+            else:
+                self._write_inline(report_path, sorted_rule_groups, total_instances, source_filename)
+            print(f"[✓] 报告已生成: {report_path}")
+        except Exception as e:
+            print(f"[!] 无法写入报告文件 {report_path}: {e}")
+
+    def _write_inline(self, report_path, sorted_rule_groups, total_instances, source_filename):
+        assets = self._load_assets()
+        template_content = assets[INLINE_TEMPLATE_NAME]
+        if template_content is None:
+            raise FileNotFoundError(SHARED_ASSETS_DIR / INLINE_TEMPLATE_NAME)
+        css_content = assets['report_styles.css'] or "/* CSS load failed */"
+        js_content = assets['report_scripts.js'] or "// JS load failed"
+
+        # 生成规则列表项
+        rules_list_items = []
+        for i, group in enumerate(sorted_rule_groups):
+            rules_list_items.append(f'''
+                    <div class="rule-list-item" onclick="jumpToRule({i})">
+                        <div class="rule-text">
+                            <span class="rule-original">{html.escape(group["original_text"])}</span> → 
+                            <span class="rule-replacement">{html.escape(group["replacement_text"])}</span>
+                        </div>
+                        <div class="rule-count">{len(group["instances"])} 次</div>
+                    </div>
+        ''')
+
+        # 生成内容区域
+        content_sections = []
+        for group_index, group in enumerate(sorted_rule_groups):
+            instance_count = len(group['instances'])
+            content_sections.append(f'''
+            <div class="rule-group" data-group-index="{group_index}">
+                <div class="rule-header" onclick="toggleInstances({group_index})">
+                    <div class="rule-title">
+                        <span class="rule-badge">{instance_count} 次</span>
+                        <span class="toggle-icon" id="toggle-{group_index}">▼</span>
+                    </div>
+                    <div class="rule-description">
+                        <span><strong>{html.escape(group['original_text'])}</strong></span>
+                        <span class="rule-arrow">→</span>
+                        <span><strong>{html.escape(group['replacement_text'])}</strong></span>
+                    </div>
+                </div>
+                <div class="instances-container" id="instances-{group_index}">
+        ''')
+            for instance in group['instances']:
+                content_sections.append(f'''
+                    <div class="instance-item">
+                        <div class="instance-content">
+                            <div class="original-section">
+                                <div class="section-title">原文</div>
+                                <div class="text-content">{instance['original']}</div>
+                            </div>
+                            <div class="modified-section">
+                                <div class="section-title">修改后</div>
+                                <div class="text-content">{instance['modified']}</div>
+                            </div>
+                        </div>
+                    </div>
+            ''')
+            content_sections.append('''
+                </div>
+            </div>
+        ''')
+
+        # 替换模板中的占位符
+        html_content = template_content.replace('{{source_filename}}', html.escape(source_filename))
+        html_content = html_content.replace('{{rules_count}}', str(len(sorted_rule_groups)))
+        html_content = html_content.replace('{{total_instances}}', str(total_instances))
+        html_content = html_content.replace('{{rules_list_items}}', "".join(rules_list_items))
+        html_content = html_content.replace('{{content_sections}}', "".join(content_sections))
+        html_content = html_content.replace('{{generation_time}}', html.escape(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+        # 嵌入CSS和JS（替换标签）
+        html_content = html_content.replace('<link rel="stylesheet" href="shared_assets/report_styles.css">', f'<style>\n{css_content}\n</style>')
+        html_content = html_content.replace('<script src="shared_assets/report_scripts.js"></script>', f'<script>\n{js_content}\n</script>')
+
+        report_path.write_text(html_content, encoding='utf-8')
+
+    def _copy_assets(self, report_dir):
+        """把分块报告共用的 CSS/JS 写入报告目录（每个目录每次运行只写一次，内容未变时不重写）。"""
+        if report_dir in self._assets_copied:
+            return
+        assets = self._load_assets()
+        assets_dir = report_dir / REPORT_ASSETS_DIRNAME
+        assets_dir.mkdir(exist_ok=True)
+        for name in REPORT_ASSET_NAMES:
+            if assets[name] is None:
+                continue
+            target = assets_dir / name
+            try:
+                if target.read_text(encoding='utf-8') == assets[name]:
+                    continue
+            except (OSError, UnicodeDecodeError):
+                pass
+            _write_text_atomic(target, assets[name])
+        self._assets_copied.add(report_dir)
+
+    def _write_chunked(self, report_path, data_dir, sorted_rule_groups, total_instances, source_filename):
+        template_content = self._load_assets()[CHUNKED_TEMPLATE_NAME]
+        if template_content is None:
+            raise FileNotFoundError(SHARED_ASSETS_DIR / CHUNKED_TEMPLATE_NAME)
+        self._copy_assets(report_path.parent)
+        data_dir.mkdir()
+
+        # 实例按 (规则组, 位置) 排成一个序列，每组记录起点与数量，数据块按序列等长切分
+        groups_index = []
+        items = []
+        for group in sorted_rule_groups:
+            groups_index.append({
+                'original_text': group['original_text'],
+                'replacement_text': group['replacement_text'],
+                'start': len(items),
+                'count': len(group['instances']),
+            })
+            items.extend(group['instances'])
+
+        def dump(value):
+            return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+        for chunk_index, start in enumerate(range(0, len(items), self.chunk_size)):
+            chunk = [{'original': item['original'], 'modified': item['modified']}
+                     for item in items[start:start + self.chunk_size]]
+            (data_dir / f"chunk_{chunk_index:04d}.js").write_text(
+                f"reportLoadChunk({chunk_index},{dump(chunk)});\n", encoding='utf-8')
+
+        if self.search_index:
+            entries = [_plain_text(item['original']) + '\n' + _plain_text(item['modified']) for item in items]
+            (data_dir / "search.js").write_text(f"reportLoadSearch({dump(entries)});\n", encoding='utf-8')
+
+        index = {'groups': groups_index, 'chunk_size': self.chunk_size, 'search': self.search_index}
+        (data_dir / "index.js").write_text(f"reportLoadIndex({dump(index)});\n", encoding='utf-8')
+
+        html_content = template_content.replace('{{source_filename}}', html.escape(source_filename))
+        html_content = html_content.replace('{{rules_count}}', str(len(sorted_rule_groups)))
+        html_content = html_content.replace('{{total_instances}}', str(total_instances))
+        html_content = html_content.replace('{{assets_dir}}', REPORT_ASSETS_DIRNAME)
+        html_content = html_content.replace('{{data_dir}}', html.escape(quote(data_dir.name)))
+        html_content = html_content.replace('{{generation_time}}', html.escape(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        report_path.write_text(html_content, encoding='utf-8')
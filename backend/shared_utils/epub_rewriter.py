@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EPUB 流式重写（zip 到 zip）
+各 EPUB 工具过去的做法是 extractall 整本书到临时目录、改几个文件、再 os.walk 把所有条目
+（包括图片和字体）重新压缩一遍。EpubRewriter 直接打开源 zip：
+- 只有通过 read()/transform() 取出的成员才会被解压，write() 写入的成员才会重新压缩
+- 其余成员把压缩后的字节原样复制到输出文件（不解压、不重新压缩，CRC 与压缩数据保持不变）
+- 输出文件中 mimetype 始终是第一个条目且不压缩（源文件缺失时写入默认值）
+
+用法:
+    with EpubRewriter(epub_path) as book:
+        opf_name = book.find_opf()
+        book.transform(('.xhtml', '.html'), lambda name, data: data.replace(b'a', b'b'))
+        book.delete('OEBPS/Fonts/a.ttf')
+        book.save(output_path)
+"""
+
+import io
+import os
+import posixpath
+import struct
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote
+
+MIMETYPE_NAME = "mimetype"
+EPUB_MIMETYPE = b"application/epub+zip"
+CONTAINER_NAME = "META-INF/container.xml"
+CONTAINER_NS = {'cn': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+XHTML_MEDIA_TYPE = "application/xhtml+xml"
+
+_LOCAL_HEADER_SIZE = 30
+_LOCAL_HEADER_NAME_LENGTHS = struct.Struct('<HH')  # 本地文件头中偏移 26 处的文件名长度与扩展字段长度
+_COPY_BUFFER_SIZE = 1024 * 1024
+_ZIP64_EXTRA_ID = 0x0001
+_FLAG_DATA_DESCRIPTOR = 0x08
+
+
+def _strip_zip64_extra(extra):
+    """去掉扩展字段中的 zip64 记录（写本地文件头时按需重新生成）。"""
+    kept = []
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, size = struct.unpack_from('<HH', extra, offset)
+        if header_id != _ZIP64_EXTRA_ID:
+            kept.append(extra[offset:offset + 4 + size])
+        offset += 4 + size
+    return b"".join(kept)
+
+
+def member_dir(name):
+    """成员所在目录（zip 内路径，根目录为空字符串）。"""
+    return posixpath.dirname(name)
+
+
+def resolve_href(base_name, href):
+    """把相对 base_name 所在目录的 href 解析为 zip 内的成员名。"""
+    return posixpath.normpath(posixpath.join(member_dir(base_name), href)).lstrip('/')
+
+
+def relative_href(target_name, from_name):
+    """返回从 from_name 所在目录指向 target_name 的相对路径。"""
+    return posixpath.relpath(target_name, member_dir(from_name) or '.')
+
+
+class EpubRewriter:
+    """
+    以源 EPUB 为基础生成新 EPUB，未改动的成员按原始压缩字节复制。
+
+    修改只在 save() 时写出；save() 之后源文件即被关闭（输出路径可以与源路径相同，先写临时文件再替换）。
+    """
+
+    def __init__(self, epub_path):
+        self.epub_path = os.fspath(epub_path)
+        self.zip = zipfile.ZipFile(self.epub_path, 'r')
+        self._infos = {}
+        self._order = []
+        for info in self.zip.infolist():
+            if info.filename not in self._infos:
+                self._order.append(info.filename)
+            self._infos[info.filename] = info
+        self._replaced = {}
+        self._deleted = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+
+    @property
+    def modified(self):
+        """是否有成员被写入或删除。"""
+        return bool(self._replaced or self._deleted)
+
+    def names(self):
+        """当前的成员名列表（源文件顺序，新增成员排在最后，已删除的不含）。"""
+        names = [name for name in self._order if name not in self._deleted]
+        names.extend(name for name in self._replaced if name not in self._infos)
+        return names
+
+    def exists(self, name):
+        return name in self._replaced or (name in self._infos and name not in self._deleted)
+
+    def read(self, name):
+        """读取成员内容（bytes），已写入新内容的返回新内容。"""
+        if name in self._replaced:
+            return self._replaced[name]
+        if name in self._deleted or name not in self._infos:
+            raise KeyError(name)
+        return self.zip.read(self._infos[name])
+
+    def write(self, name, data):
+        """写入（替换或新增）成员内容；str 按 UTF-8 编码。"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._deleted.discard(name)
+        self._replaced[name] = data
+
+    def delete(self, name):
+        self._replaced.pop(name, None)
+        if name in self._infos:
+            self._deleted.add(name)
+
+    def transform(self, match, callback):
+        """
+        对名称匹配的成员调用 callback(name, data)，返回新内容（bytes/str）时写回，返回 None 表示不变。
+        match 为后缀元组（不区分大小写）或接收成员名的函数。返回被修改的成员名列表。
+        """
+        if isinstance(match, (tuple, str)):
+            suffixes = tuple(suffix.lower() for suffix in ((match,) if isinstance(match, str) else match))
+            match = lambda name: name.lower().endswith(suffixes)
+        changed = []
+        for name in self.names():
+            if name.endswith('/') or not match(name):
+                continue
+            data = self.read(name)
+            new_data = callback(name, data)
+            if new_data is None:
+                continue
+            if isinstance(new_data, str):
+                new_data = new_data.encode('utf-8')
+            if new_data != data:
+                self.write(name, new_data)
+                changed.append(name)
+        return changed
+
+    def find_opf(self):
+        """返回 OPF 文件的成员名：优先读取 container.xml，失败时取第一个 .opf 成员；找不到返回 None。"""
+        if self.exists(CONTAINER_NAME):
+            try:
+                root = ET.fromstring(self.read(CONTAINER_NAME))
+                rootfile = root.find('cn:rootfiles/cn:rootfile', CONTAINER_NS)
+                if rootfile is not None and self.exists(rootfile.get('full-path', '')):
+                    return rootfile.get('full-path')
+            except ET.ParseError:
+                pass
+        return next((name for name in self.names() if name.lower().endswith('.opf')), None)
+
+    def manifest_documents(self, opf_name=None):
+        """
+        按 OPF manifest 顺序返回 XHTML 文档的成员名（media-type 为 application/xhtml+xml 且成员存在）。
+        顺序与 ebooklib 的 get_items_of_type(ITEM_DOCUMENT) 一致；找不到或无法解析 OPF 时返回空列表。
+        """
+        opf_name = opf_name or self.find_opf()
+        if not opf_name:
+            return []
+        try:
+            root = ET.fromstring(self.read(opf_name))
+        except ET.ParseError:
+            return []
+        documents = []
+        seen = set()
+        for item in root.iterfind('{*}manifest/{*}item'):
+            if item.get('media-type') != XHTML_MEDIA_TYPE or not item.get('href'):
+                continue
+            name = resolve_href(opf_name, unquote(item.get('href')))
+            if self.exists(name) and name not in seen:
+                seen.add(name)
+                documents.append(name)
+        return documents
+
+    def save(self, output_path):
+        """写出新 EPUB：mimetype（不压缩）在前，改动的成员重新压缩，其余成员原样复制压缩字节。"""
+        output_path = os.fspath(output_path)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+                mimetype = self.read(MIMETYPE_NAME) if self.exists(MIMETYPE_NAME) else EPUB_MIMETYPE
+                zout.writestr(zipfile.ZipInfo(MIMETYPE_NAME, date_time=self._date_time(MIMETYPE_NAME)),
+                              mimetype, compress_type=zipfile.ZIP_STORED)
+                with open(self.epub_path, 'rb') as source:
+                    for name in self.names():
+                        if name == MIMETYPE_NAME:
+                            continue
+                        if name in self._replaced:
+                            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                            info.compress_type = zipfile.ZIP_DEFLATED
+                            info.external_attr = self._infos[name].external_attr if name in self._infos else 0o644 << 16
+                            zout.writestr(info, self._replaced[name])
+                        else:
+                            self._copy_raw(source, zout, self._infos[name])
+            self.close()
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _date_time(self, name):
+        info = self._infos.get(name)
+        return info.date_time if info is not None else (1980, 1, 1, 0, 0, 0)
+
+    @staticmethod
+    def _copy_raw(source, zout, info):
+        """
+        把一个成员的本地文件头与压缩数据原样写入 zout。
+        zipfile 没有公开的"复制压缩数据"接口，这里写入本地文件头和数据后把条目登记到 zout，
+        中央目录在 zout 关闭时照常写出。
+        """
+        source.seek(info.header_offset)
+        header = source.read(_LOCAL_HEADER_SIZE)
+        name_length, extra_length = _LOCAL_HEADER_NAME_LENGTHS.unpack_from(header, 26)
+        source.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+
+        copied = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+        for attr in ('compress_type', 'comment', 'create_system', 'create_version', 'extract_version',
+                     'flag_bits', 'volume', 'internal_attr', 'external_attr', 'CRC', 'compress_size', 'file_size'):
+            setattr(copied, attr, getattr(info, attr))
+        # CRC 与大小已知，直接写在本地文件头中，不再需要数据描述符
+        copied.flag_bits &= ~_FLAG_DATA_DESCRIPTOR
+        copied.extra = _strip_zip64_extra(info.extra)
+        copied.header_offset = zout.fp.tell()
+
+        zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+        zout.fp.write(copied.FileHeader(zip64))
+        remaining = info.compress_size
+        while remaining > 0:
+            block = source.read(min(remaining, _COPY_BUFFER_SIZE))
+            if not block:
+                raise zipfile.BadZipFile(f"成员数据不完整: {info.filename}")
+            zout.fp.write(block)
+            remaining -= len(block)
+
+        zout.filelist.append(copied)
+        zout.NameToInfo[copied.filename] = copied
+        zout.start_dir = zout.fp.tell()
+        zout._didModify = True
+
+
+def parse_xml(data):
+    """从成员内容解析 ElementTree（供 OPF/NCX 等 XML 成员使用）。"""
+    return ET.parse(io.BytesIO(data))
+
+
+def serialize_xml(tree):
+    """把 ElementTree 序列化为带 XML 声明的 UTF-8 字节。"""
+    buffer = io.BytesIO()
+    tree.write(buffer, encoding='utf-8', xml_declaration=True)
+    return buffer.getvalue()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CBZ / ZIP 漫画压缩包读取
+直接从压缩包中按成员流式读取页面图片，无需先解压到临时文件夹:
+- 尺寸探测只读取成员开头的图片文件头（ZIP 成员按需解压，不会读完整个文件）
+- 完整解码时把单个成员读入内存后交给 Pillow，避免在压缩流上反复回退定位
+漫画脚本统一通过 open_image_source() 打开"图片来源"，来源可以是普通文件路径或 ArchiveMember。
+"""
+
+import io
+import os
+import zipfile
+
+import natsort
+from PIL import Image
+
+ARCHIVE_EXTENSIONS = ('.cbz', '.zip')
+ARCHIVE_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tiff', '.tif')
+
+
+def is_image_archive(path):
+    """判断路径是否为 CBZ / ZIP 压缩包文件。"""
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def archive_project_name(path):
+    """压缩包作为项目处理时使用的名称（去掉扩展名的文件名）。"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class ImageArchive:
+    """一个 CBZ / ZIP 压缩包。ZipFile 句柄在首次读取时打开，并由其所有成员共享。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = None
+
+    @property
+    def zip(self):
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.path)
+        return self._zip
+
+    def image_members(self, image_extensions=ARCHIVE_IMAGE_EXTENSIONS):
+        """返回压缩包中所有页面图片成员（按自然顺序排序），忽略目录、隐藏文件与 __MACOSX 元数据。"""
+        members = []
+        for info in self.zip.infolist():
+            name = info.filename
+            base_name = os.path.basename(name.rstrip('/'))
+            if info.is_dir() or base_name.startswith('.') or '__MACOSX/' in name:
+                continue
+            if name.lower().endswith(image_extensions):
+                members.append(ArchiveMember(self, name, info.file_size))
+        return natsort.natsorted(members, key=lambda m: m.name)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class ArchiveMember:
+    """压缩包中的一张页面图片。"""
+
+    __slots__ = ("archive", "name", "file_size")
+
+    def __init__(self, archive, name, file_size):
+        self.archive = archive
+        self.name = name
+        self.file_size = file_size
+
+    def __repr__(self):
+        return f"ArchiveMember({os.path.basename(self.archive.path)!r}, {self.name!r})"
+
+    @property
+    def basename(self):
+        return os.path.basename(self.name)
+
+    def open(self):
+        """返回成员的流式文件对象（按需解压）。"""
+        return self.archive.zip.open(self.name)
+
+    def read(self):
+        return self.archive.zip.read(self.name)
+
+
+def list_archive_images(archive_path):
+    """打开压缩包并返回其页面图片成员列表；压缩包损坏时抛出 zipfile.BadZipFile。"""
+    return ImageArchive(archive_path).image_members()
+
+
+def open_image_source(source, header_only=False):
+    """
+    打开一个图片来源（文件路径或 ArchiveMember），返回 PIL 图片。
+
+    header_only=True 时只用于读取尺寸/格式：压缩包成员以流的方式打开，只会解压文件头附近的数据。
+    """
+    if not isinstance(source, ArchiveMember):
+        return Image.open(source)
+    if header_only:
+        return Image.open(source.open())
+    return Image.open(io.BytesIO(source.read()))
+
+
+def source_display_name(source):
+    """用于日志输出的来源名称。"""
+    return source.basename if isinstance(source, ArchiveMember) else os.path.basename(source)
+
+
+def close_image_sources(sources):
+    """关闭一组来源所引用的压缩包句柄（普通文件路径会被忽略）。"""
+    for archive in {id(s.archive): s.archive for s in sources if isinstance(s, ArchiveMember)}.values():
+        archive.close()
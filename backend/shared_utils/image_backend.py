@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可插拔的图片处理后端
+漫画处理脚本中的缩放与 PNG 编码统一通过这里完成。默认使用 Pillow；
+安装了 pyvips 或 OpenCV (cv2) 时自动切换到多线程的加速实现。
+所有后端都以 PIL.Image 作为输入输出，调用方的裁剪、粘贴等逻辑无需改动。
+
+直接运行本模块可检查各后端输出是否一致（黄金图像对比）并查看耗时:
+    python -m backend.shared_utils.image_backend --verify
+同样的对比也以 pytest 测试的形式在 tests/test_image_backend.py 中自动运行。
+"""
+
+import os
+import time
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    import pyvips
+except (ImportError, OSError):  # 未安装 libvips 时 pyvips 会抛出 OSError
+    pyvips = None
+
+# 后端名称
+BACKEND_AUTO = "auto"
+BACKEND_PILLOW = "pillow"
+BACKEND_OPENCV = "opencv"
+BACKEND_VIPS = "vips"
+
+# 自动选择时的优先顺序
+AUTO_BACKEND_ORDER = (BACKEND_VIPS, BACKEND_OPENCV, BACKEND_PILLOW)
+
+# 加速后端支持的像素模式，其余模式回退到 Pillow
+ACCELERATED_MODES = {"L": 1, "RGB": 3, "RGBA": 4}
+
+# 黄金图像对比时允许的平均逐像素误差（0-255 灰阶）
+EQUIVALENCE_MEAN_TOLERANCE = 2.0
+
+_backend_cache = {}
+
+
+class PillowBackend:
+    """默认后端：单线程的 Pillow 实现。"""
+
+    name = BACKEND_PILLOW
+
+    def resize(self, img, size):
+        """按 LANCZOS 缩放到 size=(宽, 高)。"""
+        return img.resize(size, Image.Resampling.LANCZOS)
+
+    def save_png(self, img, path, compress_level=6):
+        img.save(path, "PNG", compress_level=compress_level)
+
+
+class OpenCVBackend(PillowBackend):
+    """OpenCV 后端：cv2.resize 与 cv2.imencode 内部使用多线程，PNG 编码也比 Pillow 快。"""
+
+    name = BACKEND_OPENCV
+
+    def __init__(self):
+        cv2.setNumThreads(os.cpu_count() or 1)
+
+    def resize(self, img, size):
+        if img.mode not in ACCELERATED_MODES:
+            return super().resize(img, size)
+        # 缩小时使用 INTER_AREA 以获得与 Pillow LANCZOS 相同的抗锯齿效果
+        interpolation = cv2.INTER_AREA if size[0] < img.width else cv2.INTER_LANCZOS4
+        resized = cv2.resize(np.asarray(img), size, interpolation=interpolation)
+        return Image.fromarray(resized)
+
+    def save_png(self, img, path, compress_level=6):
+        if img.mode not in ACCELERATED_MODES:
+            return super().save_png(img, path, compress_level)
+        pixels = np.asarray(img)
+        if img.mode == "RGB":
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+        elif img.mode == "RGBA":
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGRA)
+        try:
+            ok, encoded = cv2.imencode(".png", pixels, [cv2.IMWRITE_PNG_COMPRESSION, compress_level])
+        except cv2.error:
+            ok = False
+        if not ok:
+            return super().save_png(img, path, compress_level)
+        # 使用 imencode + 普通文件写入，避免 cv2.imwrite 在 Windows 上不支持中文路径
+        with open(path, "wb") as f:
+            f.write(encoded.tobytes())
+
+
+class VipsBackend(PillowBackend):
+    """libvips 后端：按需流式处理并自动使用多线程。"""
+
+    name = BACKEND_VIPS
+
+    def _to_vips(self, img):
+        return pyvips.Image.new_from_memory(img.tobytes(), img.width, img.height, ACCELERATED_MODES[img.mode], "uchar")
+
+    def resize(self, img, size):
+        if img.mode not in ACCELERATED_MODES:
+            return super().resize(img, size)
+        vimg = self._to_vips(img)
+        resized = vimg.resize(size[0] / img.width, vscale=size[1] / img.height, kernel="lanczos3")
+        # vips 按比例缩放时可能与目标尺寸相差 1 像素，这里裁剪/补齐到精确尺寸
+        if (resized.width, resized.height) != tuple(size):
+            resized = resized.gravity("north-west", size[0], size[1], extend="copy")
+        return Image.frombytes(img.mode, size, resized.write_to_memory())
+
+    def save_png(self, img, path, compress_level=6):
+        if img.mode not in ACCELERATED_MODES:
+            return super().save_png(img, path, compress_level)
+        data = self._to_vips(img).pngsave_buffer(compression=compress_level)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def available_backends():
+    """返回当前环境可用的后端名称列表（按自动选择的优先顺序）。"""
+    names = []
+    if pyvips is not None and np is not None:
+        names.append(BACKEND_VIPS)
+    if cv2 is not None and np is not None:
+        names.append(BACKEND_OPENCV)
+    names.append(BACKEND_PILLOW)
+    return names
+
+
+def get_image_backend(name=BACKEND_AUTO):
+    """
+    返回指定名称的后端实例（同名实例会被复用）。
+
+    name 为 "auto" 时按 vips → opencv → pillow 的顺序选择第一个可用的后端；
+    指定的后端不可用时回退到 Pillow。
+    """
+    available = available_backends()
+    if name == BACKEND_AUTO:
+        name = next(n for n in AUTO_BACKEND_ORDER if n in available)
+    elif name not in available:
+        print(f"    警告: 图片后端 '{name}' 不可用（缺少依赖），已回退到 Pillow。")
+        name = BACKEND_PILLOW
+
+    if name not in _backend_cache:
+        backend_class = {BACKEND_PILLOW: PillowBackend, BACKEND_OPENCV: OpenCVBackend, BACKEND_VIPS: VipsBackend}[name]
+        _backend_cache[name] = backend_class()
+    return _backend_cache[name]
+
+
+def _golden_images():
+    """生成用于对比的确定性测试图：带噪声的渐变漫画页（RGB、RGBA、灰度）。"""
+    rng = np.random.default_rng(42)
+    height, width = 1200, 900
+    gradient = np.linspace(40, 220, width, dtype=np.float32)[None, :, None]
+    rgb = np.clip(gradient + rng.normal(0, 4, (height, width, 3)), 0, 255).astype(np.uint8)
+    rgb[400:440, :, :] = 255  # 模拟分镜之间的白色空白带
+    rgb[[60, 61, 62, 380, 381, 382], 40:860, :] = 0  # 分镜边框
+    rgb[60:383, [40, 41, 42, 857, 858, 859], :] = 0
+    for y in range(120, 340, 24):  # 模拟对白文字的细笔画
+        rgb[y:y + 2, 300:600, :] = 20
+    alpha = np.full((height, width, 1), 255, dtype=np.uint8)
+    return {
+        "RGB": Image.fromarray(rgb),
+        "RGBA": Image.fromarray(np.concatenate([rgb, alpha], axis=2)),
+        "L": Image.fromarray(np.ascontiguousarray(rgb[:, :, 0])),
+    }
+
+
+def verify_backend_equivalence(target_width=600, tmp_dir=None):
+    """
+    黄金图像对比：检查每个可用后端的缩放与 PNG 编码结果是否与 Pillow 等价。
+
+    缩放结果允许 EQUIVALENCE_MEAN_TOLERANCE 以内的平均误差（插值核略有差异），
+    PNG 编码是无损的，解码后必须逐像素一致。返回 [{"backend", "mode", ...}, ...]。
+    """
+    import tempfile
+
+    reference = get_image_backend(BACKEND_PILLOW)
+    results = []
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir:
+        for mode, golden in _golden_images().items():
+            size = (target_width, int(golden.height * target_width / golden.width))
+            expected = np.asarray(reference.resize(golden, size), dtype=np.int16)
+            for name in available_backends():
+                backend = get_image_backend(name)
+                start = time.perf_counter()
+                resized = backend.resize(golden, size)
+                resize_ms = (time.perf_counter() - start) * 1000
+
+                png_path = os.path.join(work_dir, f"{name}_{mode}.png")
+                start = time.perf_counter()
+                backend.save_png(golden, png_path)
+                encode_ms = (time.perf_counter() - start) * 1000
+                with Image.open(png_path) as decoded:
+                    png_identical = decoded.mode == golden.mode and np.array_equal(np.asarray(decoded), np.asarray(golden))
+
+                mean_diff = float(np.abs(np.asarray(resized, dtype=np.int16) - expected).mean()) if resized.size == size else float("inf")
+                results.append({
+                    "backend": name,
+                    "mode": mode,
+                    "resize_mean_diff": mean_diff,
+                    "resize_ms": resize_ms,
+                    "png_encode_ms": encode_ms,
+                    "png_identical": png_identical,
+                    "equivalent": png_identical and mean_diff <= EQUIVALENCE_MEAN_TOLERANCE,
+                })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="图片后端检查工具")
+    parser.add_argument("--verify", action="store_true", help="对比各后端与 Pillow 的输出（黄金图像对比）")
+    args = parser.parse_args()
+
+    print(f"可用后端: {', '.join(available_backends())}；自动选择: {get_image_backend().name}")
+    if args.verify:
+        if np is None:
+            print("错误：黄金图像对比需要 numpy 库。")
+            sys.exit(1)
+        all_ok = True
+        for row in verify_backend_equivalence():
+            status = "✅" if row["equivalent"] else "❌"
+            all_ok = all_ok and row["equivalent"]
+            print(f"  {status} {row['backend']:<7} {row['mode']:<5} 缩放平均误差 {row['resize_mean_diff']:.3f} | "
+                  f"缩放 {row['resize_ms']:.1f}ms | PNG 编码 {row['png_encode_ms']:.1f}ms | PNG 无损一致: {row['png_identical']}")
+        sys.exit(0 if all_ok else 1)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片快速解码工具
+当目标宽度小于源图宽度时，对 JPEG 源图使用 Pillow 的 draft 模式在 DCT 域直接按
+1/2、1/4 或 1/8 比例解码，再做最终的 LANCZOS 缩放，省去全分辨率解码的开销。
+
+直接运行本模块可对典型的 2K–4K 宽扫描页进行基准测试:
+    python -m backend.shared_utils.image_decode --benchmark
+"""
+
+import io
+import math
+import time
+
+from PIL import Image
+
+# 解码速度模式
+DECODE_MODE_QUALITY = "quality"  # 始终全分辨率解码后再缩放（原有行为）
+DECODE_MODE_FAST = "fast"        # JPEG 源图使用 draft 缩小解码，再缩放到目标宽度
+DECODE_MODES = (DECODE_MODE_QUALITY, DECODE_MODE_FAST)
+
+# JPEG 解码器支持的 DCT 缩放比例（从大到小）
+DRAFT_SCALES = (8, 4, 2)
+
+
+def choose_draft_scale(source_width, target_width):
+    """返回解码宽度仍不小于 target_width 的最大 draft 缩放比例；无法缩小时返回 1。"""
+    if not target_width or source_width <= target_width:
+        return 1
+    for scale in DRAFT_SCALES:
+        if math.ceil(source_width / scale) >= target_width:
+            return scale
+    return 1
+
+
+def apply_draft_for_width(img, target_width, decode_mode=DECODE_MODE_FAST):
+    """
+    在图片真正解码之前，为 JPEG 源图启用按目标宽度缩小的 draft 解码。
+
+    必须在 Image.open 之后、任何 load/convert/resize 之前调用。
+    返回实际使用的缩放比例（未启用时为 1），调用后 img.size 即为缩小解码后的尺寸。
+    """
+    if decode_mode != DECODE_MODE_FAST or img.format != "JPEG":
+        return 1
+    scale = choose_draft_scale(img.width, target_width)
+    if scale == 1:
+        return 1
+    original_width = img.width
+    # 请求尺寸取下整，确保 Pillow 内部按 原尺寸 // 请求尺寸 算出的比例正好等于 scale
+    requested_size = (img.width // scale, img.height // scale)
+    try:
+        img.draft(img.mode, requested_size)
+    except Exception:
+        return 1
+    return original_width // img.width if img.width else 1
+
+
+def decode_resized(path, target_width, decode_mode=DECODE_MODE_FAST, mode="RGB"):
+    """打开图片并按目标宽度等比缩放（源图不比目标宽时保持原尺寸），返回已解码的新图片。"""
+    with Image.open(path) as img:
+        original_width, original_height = img.size
+        apply_draft_for_width(img, target_width, decode_mode)
+        converted = img.convert(mode)
+    if target_width and original_width > target_width:
+        new_height = int(original_height * (target_width / original_width))
+        return converted.resize((target_width, new_height), Image.Resampling.LANCZOS)
+    return converted
+
+
+def benchmark_draft_decode(widths=(2048, 3072, 4096), target_width=1500, aspect_ratio=1.45, repeats=3, jpeg_quality=90):
+    """
+    用合成的扫描页（带噪声的渐变）对比全分辨率解码与 draft 解码的耗时。
+
+    返回 [{"width", "height", "quality_ms", "fast_ms", "speedup", "draft_scale"}, ...]。
+    """
+    import numpy as np
+
+    results = []
+    rng = np.random.default_rng(0)
+    for width in widths:
+        height = int(width * aspect_ratio)
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 24, (height, width, 3)).astype(np.float32)
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=jpeg_quality)
+        data = buffer.getvalue()
+
+        timings = {}
+        for decode_mode in DECODE_MODES:
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                decode_resized(io.BytesIO(data), target_width, decode_mode).close()
+                best = min(best, time.perf_counter() - start)
+            timings[decode_mode] = best * 1000
+        results.append({
+            "width": width,
+            "height": height,
+            "quality_ms": timings[DECODE_MODE_QUALITY],
+            "fast_ms": timings[DECODE_MODE_FAST],
+            "speedup": timings[DECODE_MODE_QUALITY] / timings[DECODE_MODE_FAST] if timings[DECODE_MODE_FAST] else 0.0,
+            "draft_scale": choose_draft_scale(width, target_width),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="JPEG draft 解码基准测试")
+    parser.add_argument("--benchmark", action="store_true", help="运行 draft 解码基准测试")
+    parser.add_argument("--target-width", type=int, default=1500, help="目标页面宽度 (默认: 1500)")
+    parser.add_argument("--repeats", type=int, default=3, help="每种模式重复次数，取最快一次 (默认: 3)")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+    else:
+        print(f"目标宽度: {args.target_width}px，每项取 {args.repeats} 次中的最快值")
+        print(f"{'源图尺寸':<14}{'draft比例':>10}{'全分辨率(ms)':>16}{'draft(ms)':>12}{'加速比':>10}")
+        for row in benchmark_draft_decode(target_width=args.target_width, repeats=args.repeats):
+            print(f"{row['width']}x{row['height']:<9}{'1/' + str(row['draft_scale']):>10}"
+                  f"{row['quality_ms']:>16.1f}{row['fast_ms']:>12.1f}{row['speedup']:>9.2f}x")
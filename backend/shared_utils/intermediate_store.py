@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+中间图片存储
+分割片段与重打包页面只在流程内部短暂存在，写完很快就会被删除。
+这里提供几种比默认 PNG 更省 CPU 的无损格式：
+- "npy":  未压缩的 NumPy 数组，几乎没有编码开销（默认）
+- "png":  compress_level=1 的快速 PNG
+- "webp": 无损 WebP（超过 WebP 尺寸上限 16383px 时自动改用快速 PNG）
+所有格式都是无损的，最终 PDF 中的像素内容与使用 PNG 时完全一致。
+重打包的大小上限始终按片段的默认 PNG 编码大小计算（与中间格式无关），因此 PDF 的分页也保持不变。
+"""
+
+import os
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INTERMEDIATE_FORMAT_NPY = "npy"
+INTERMEDIATE_FORMAT_PNG_FAST = "png"
+INTERMEDIATE_FORMAT_WEBP = "webp"
+INTERMEDIATE_EXTENSIONS = {
+    INTERMEDIATE_FORMAT_NPY: ".npy",
+    INTERMEDIATE_FORMAT_PNG_FAST: ".png",
+    INTERMEDIATE_FORMAT_WEBP: ".webp",
+}
+
+FAST_PNG_COMPRESS_LEVEL = 1
+WEBP_MAX_DIMENSION = 16383
+
+
+def save_intermediate(img, output_dir, stem, intermediate_format=INTERMEDIATE_FORMAT_NPY, backend=None):
+    """
+    以指定的中间格式保存图片，返回实际写入的文件路径。
+
+    backend 为 image_backend 中的后端实例，用于 PNG 编码；为 None 时使用 Pillow。
+    npy 格式需要 numpy，不可用或图片模式不受支持时自动改用快速 PNG。
+    """
+    if intermediate_format == INTERMEDIATE_FORMAT_NPY and (np is None or img.mode not in ("L", "RGB", "RGBA")):
+        intermediate_format = INTERMEDIATE_FORMAT_PNG_FAST
+    if intermediate_format == INTERMEDIATE_FORMAT_WEBP and max(img.size) > WEBP_MAX_DIMENSION:
+        intermediate_format = INTERMEDIATE_FORMAT_PNG_FAST
+
+    output_path = os.path.join(output_dir, stem + INTERMEDIATE_EXTENSIONS.get(intermediate_format, ".png"))
+    if intermediate_format == INTERMEDIATE_FORMAT_NPY:
+        with open(output_path, "wb") as f:
+            np.save(f, np.asarray(img), allow_pickle=False)
+    elif intermediate_format == INTERMEDIATE_FORMAT_WEBP:
+        img.save(output_path, "WEBP", lossless=True, quality=0, method=0)
+    elif backend is not None:
+        backend.save_png(img, output_path, compress_level=FAST_PNG_COMPRESS_LEVEL)
+    else:
+        img.save(output_path, "PNG", compress_level=FAST_PNG_COMPRESS_LEVEL)
+    return output_path
+
+
+def is_npy(path):
+    return path.lower().endswith(".npy")
+
+
+def open_intermediate(path):
+    """打开中间文件（npy 或任何 Pillow 支持的格式），返回已解码的 PIL 图片。"""
+    if is_npy(path):
+        pixels = np.load(path, allow_pickle=False)
+        return Image.fromarray(pixels)
+    with Image.open(path) as img:
+        img.load()
+        return img.copy()
+
+
+def _read_npy_shape(path):
+    with open(path, "rb") as f:
+        major, _ = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+        shape, _, _ = read_header(f)
+    return shape
+
+
+def intermediate_dimensions(path):
+    """只读取文件头，返回中间文件的 (宽, 高)。"""
+    if is_npy(path):
+        shape = _read_npy_shape(path)
+        return shape[1], shape[0]
+    with Image.open(path) as img:
+        return img.size
+
+
+class _ByteCounter:
+    """只统计写入字节数的文件对象，用于计算编码后的大小而不保留编码结果。"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+
+def reference_png_size(img):
+    """返回图片以 Pillow 默认压缩级别编码为 PNG 后的大小（字节），即引入中间格式之前分割片段的文件大小。"""
+    counter = _ByteCounter()
+    img.save(counter, "PNG")
+    return counter.size
+
+
+def intermediate_size_estimate(path):
+    """
+    返回用于重打包大小限制的"编码后大小"（字节）。
+
+    无论中间文件是哪种格式，都按默认压缩级别 PNG 的大小计算，使重打包的分组与使用 PNG 中间文件时完全一致。
+    """
+    img = open_intermediate(path)
+    try:
+        return reference_png_size(img)
+    finally:
+        img.close()
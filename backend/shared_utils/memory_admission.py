@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存准入控制
+在开始处理一个漫画项目之前，仅凭图片文件头（不解码像素）估算合并、分割与 PDF 各阶段的内存峰值，
+并据此决定:
+- run:   直接处理
+- chunk: 把项目切成若干条长图分别合并、分割，PDF 分批写入，使每一段的估算峰值都在预算内
+- defer: 连单张页面都放不进预算时延后处理，避免处理到一半被系统 OOM 终止
+
+各阶段每像素字节数是按现有实现的中间数组数量保守估算的（RGB 为 3 字节/像素）:
+- 合并: 画布 + 编码时的一份拷贝 + 编码缓冲
+- 分割: V4 需要 RGB 图像、NumPy 数组和量化数组三份；V2 需要 RGBA 副本
+- PDF:  所有页面的 RGB 数据 + 灰度页面的 8 位副本
+"""
+
+from backend.shared_utils.image_archive import open_image_source
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ADMIT_RUN = "run"
+ADMIT_CHUNK = "chunk"
+ADMIT_DEFER = "defer"
+
+MERGE_BYTES_PER_PIXEL = 7
+SPLIT_BYTES_PER_PIXEL = 9
+PDF_BYTES_PER_PIXEL = 4
+REPACK_BYTES_PER_PIXEL = 6
+SOURCE_DECODE_BYTES_PER_PIXEL = 8  # 单张源图解码 (RGBA) + 转换后的 RGB 副本
+
+# 未安装 psutil 时使用的默认预算与解释器基础占用
+DEFAULT_BUDGET_FRACTION = 0.6
+FALLBACK_BUDGET_MB = 4096
+FALLBACK_BASELINE_MB = 150
+
+_MB = 1024 * 1024
+
+
+def resolve_memory_budget(budget_mb=None, fraction=DEFAULT_BUDGET_FRACTION):
+    """返回内存预算（字节）。未指定时取当前可用物理内存的 fraction（需要 psutil），否则为 FALLBACK_BUDGET_MB。"""
+    if budget_mb:
+        return int(budget_mb * _MB)
+    if psutil is not None:
+        return int(psutil.virtual_memory().available * fraction)
+    return FALLBACK_BUDGET_MB * _MB
+
+
+def baseline_memory_bytes():
+    """当前进程已占用的内存（RSS），作为各阶段估算的基础值。"""
+    if psutil is not None:
+        try:
+            return psutil.Process().memory_info().rss
+        except Exception:
+            pass
+    return FALLBACK_BASELINE_MB * _MB
+
+
+def probe_page_dimensions(sources):
+    """只读取文件头，返回每个图片来源的 (宽, 高)；无法读取的来源记为 (0, 0)，保持与 sources 一一对应。"""
+    dimensions = []
+    for source in sources:
+        try:
+            with open_image_source(source, header_only=True) as img:
+                dimensions.append(img.size)
+        except Exception:
+            dimensions.append((0, 0))
+    return dimensions
+
+
+def _scaled_height(width, height, target_width):
+    if not width or not height:
+        return 0
+    return int(height * (target_width / width)) if target_width else height
+
+
+class MemoryEstimate:
+    """一段长图（整个项目或其中一条）各阶段的内存峰值估算（字节，不含基础占用）。"""
+
+    __slots__ = ("canvas_width", "canvas_height", "merge_bytes", "split_bytes", "repack_bytes", "pdf_bytes", "baseline_bytes")
+
+    def __init__(self, canvas_width, canvas_height, merge_bytes, split_bytes, repack_bytes, pdf_bytes, baseline_bytes):
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.merge_bytes = merge_bytes
+        self.split_bytes = split_bytes
+        self.repack_bytes = repack_bytes
+        self.pdf_bytes = pdf_bytes
+        self.baseline_bytes = baseline_bytes
+
+    def stage_bytes(self):
+        return {"merge": self.merge_bytes, "split": self.split_bytes, "repack": self.repack_bytes, "pdf": self.pdf_bytes}
+
+    @property
+    def peak_stage(self):
+        stages = self.stage_bytes()
+        return max(stages, key=stages.get)
+
+    @property
+    def peak_bytes(self):
+        return self.baseline_bytes + max(self.stage_bytes().values())
+
+    def to_dict(self):
+        result = {slot: getattr(self, slot) for slot in self.__slots__}
+        result.update(peak_bytes=self.peak_bytes, peak_stage=self.peak_stage)
+        return result
+
+    def describe(self):
+        parts = [f"{stage} {value / _MB:.0f}MB" for stage, value in self.stage_bytes().items()]
+        return f"{self.canvas_width}x{self.canvas_height} 画布，估算峰值 {self.peak_bytes / _MB:.0f}MB ({', '.join(parts)})"
+
+
+def estimate_strip_memory(dimensions, target_width=None, max_page_height=None, pdf_batch_pixels=None, baseline_bytes=None):
+    """
+    根据页面尺寸估算把这些页面合并成一条长图并完成分割、重打包与 PDF 的内存峰值。
+
+    pdf_batch_pixels 为 PDF 分批写入时每批最多加载的像素数（None 表示一次性写入全部页面）。
+    """
+    if baseline_bytes is None:
+        baseline_bytes = baseline_memory_bytes()
+    valid = [(w, h) for w, h in dimensions if w and h]
+    if not valid:
+        return MemoryEstimate(0, 0, 0, 0, 0, 0, baseline_bytes)
+
+    canvas_width = target_width or max(w for w, _ in valid)
+    heights = [_scaled_height(w, h, target_width) for w, h in valid]
+    canvas_height = sum(heights)
+    canvas_pixels = canvas_width * canvas_height
+    largest_source_pixels = max(w * h for w, h in valid)
+
+    merge_bytes = canvas_pixels * MERGE_BYTES_PER_PIXEL + largest_source_pixels * SOURCE_DECODE_BYTES_PER_PIXEL
+    split_bytes = canvas_pixels * SPLIT_BYTES_PER_PIXEL
+    page_height = min(canvas_height, max_page_height) if max_page_height else canvas_height
+    repack_bytes = canvas_width * page_height * REPACK_BYTES_PER_PIXEL
+    pdf_pixels = canvas_pixels if not pdf_batch_pixels else min(canvas_pixels, max(pdf_batch_pixels, canvas_width * page_height))
+    pdf_bytes = pdf_pixels * PDF_BYTES_PER_PIXEL
+    return MemoryEstimate(canvas_width, canvas_height, merge_bytes, split_bytes, repack_bytes, pdf_bytes, baseline_bytes)
+
+
+def pdf_batch_pixels_for_budget(budget_bytes, baseline_bytes=None):
+    """PDF 分批写入时每批最多加载的像素数，使 PDF 阶段的估算峰值不超过预算。"""
+    if baseline_bytes is None:
+        baseline_bytes = baseline_memory_bytes()
+    return max(1, (budget_bytes - baseline_bytes) // PDF_BYTES_PER_PIXEL)
+
+
+class AdmissionDecision:
+    """准入决定：action 为 run / chunk / defer；strips 为每条长图对应的页面下标范围 [(起, 止), ...]。"""
+
+    __slots__ = ("action", "strips", "budget_bytes", "estimate", "strip_estimates", "pdf_batch_pixels")
+
+    def __init__(self, action, strips, budget_bytes, estimate, strip_estimates, pdf_batch_pixels):
+        self.action = action
+        self.strips = strips
+        self.budget_bytes = budget_bytes
+        self.estimate = estimate
+        self.strip_estimates = strip_estimates
+        self.pdf_batch_pixels = pdf_batch_pixels
+
+    def describe(self):
+        budget_text = f"预算 {self.budget_bytes / _MB:.0f}MB"
+        if self.action == ADMIT_DEFER:
+            return f"延后处理：{self.estimate.describe()}，单张页面已超出{budget_text}"
+        if self.action == ADMIT_CHUNK:
+            worst = max(self.strip_estimates, key=lambda e: e.peak_bytes)
+            return (f"分段处理：整体{self.estimate.describe()}，超出{budget_text}；"
+                    f"切分为 {len(self.strips)} 条长图，单条估算峰值不超过 {worst.peak_bytes / _MB:.0f}MB")
+        return f"直接处理：{self.estimate.describe()}，{budget_text}"
+
+    def to_dict(self):
+        return {
+            "action": self.action,
+            "strips": self.strips,
+            "budget_bytes": self.budget_bytes,
+            "estimate": self.estimate.to_dict(),
+            "strip_estimates": [e.to_dict() for e in self.strip_estimates],
+            "pdf_batch_pixels": self.pdf_batch_pixels,
+        }
+
+
+def plan_admission(dimensions, budget_bytes, target_width=None, max_page_height=None):
+    """
+    根据页面尺寸与内存预算给出准入决定（流程逐个项目串行处理，估算的是单个项目的峰值）。
+
+    1. 整体估算峰值在预算内时直接处理；
+    2. 否则按页面顺序贪心地切分为多条长图，每条的估算峰值都在预算内，PDF 分批写入；
+    3. 单张页面（或单个重打包页面）就超出预算时延后处理。
+    """
+    baseline = baseline_memory_bytes()
+    pdf_batch_pixels = pdf_batch_pixels_for_budget(budget_bytes, baseline)
+    estimate = estimate_strip_memory(dimensions, target_width, max_page_height, None, baseline)
+    all_pages = [(0, len(dimensions))]
+
+    if estimate.peak_bytes <= budget_bytes:
+        return AdmissionDecision(ADMIT_RUN, all_pages, budget_bytes, estimate, [estimate], pdf_batch_pixels)
+
+    def strip_estimate(start, end):
+        return estimate_strip_memory(dimensions[start:end], target_width, max_page_height, pdf_batch_pixels, baseline)
+
+    strips, strip_estimates = [], []
+    start = 0
+    while start < len(dimensions):
+        end = start + 1
+        current = strip_estimate(start, end)
+        if current.peak_bytes > budget_bytes:
+            return AdmissionDecision(ADMIT_DEFER, [], budget_bytes, estimate, [current], pdf_batch_pixels)
+        while end < len(dimensions):
+            candidate = strip_estimate(start, end + 1)
+            if candidate.peak_bytes > budget_bytes:
+                break
+            end, current = end + 1, candidate
+        strips.append((start, end))
+        strip_estimates.append(current)
+        start = end
+    return AdmissionDecision(ADMIT_CHUNK, strips, budget_bytes, estimate, strip_estimates, pdf_batch_pixels)
+
+
+def split_batches_by_pixels(page_sizes, max_batch_pixels):
+    """把页面按顺序分批，每批的总像素数不超过 max_batch_pixels（单页超出时独占一批）。返回下标范围列表。"""
+    if not page_sizes:
+        return []
+    if not max_batch_pixels:
+        return [(0, len(page_sizes))]
+    batches, start, batch_pixels = [], 0, 0
+    for index, (width, height) in enumerate(page_sizes):
+        pixels = width * height
+        if index > start and batch_pixels + pixels > max_batch_pixels:
+            batches.append((start, index))
+            start, batch_pixels = index, 0
+        batch_pixels += pixels
+    batches.append((start, len(page_sizes)))
+    return batches
+
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OpenCC 繁简转换服务
+opencc-python-reimplemented 是纯 Python 实现，是转换大量 EPUB/TXT 时最慢的一环；过去的做法是对每个
+XHTML 成员的完整内容（连同标签和属性）依次调用 cc.convert。OpenCCService 包装一个转换器:
+- 只转换文本节点：标签、属性、注释和 CDATA 原样保留；不含非 ASCII 字符的文本（如标签之间的空白）直接跳过
+- 一本书的所有文本节点（或一个 TXT 的所有行）汇总后去重，重复的段落只转换一次，结果在内存中缓存
+- 待转换文本用分隔符拼接成批，减少转换器调用次数；纯 Python 转换器遇到大批量文本时，
+  按段落边界分块交给进程池并行转换（每个工作进程只初始化一次转换器）
+- 安装的是 OpenCC 官方 C++ 绑定（pip install opencc）时自动识别为原生实现，直接在当前进程中转换
+
+用法:
+    with OpenCCService(OpenCC('t2s'), 't2s', jobs=4) as service:
+        converted = service.convert_markup_many([xhtml1, xhtml2])
+        text = service.convert(txt_content)
+
+性能对比（旧做法：逐成员整体 cc.convert）:
+    python -m backend.shared_utils.opencc_service --benchmark book.epub [--jobs 4]
+"""
+
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 标签、注释、CDATA、处理指令等标记（其余部分为文本节点）
+_MARKUP_RE = re.compile(r'(<!--.*?-->|<!\[CDATA\[.*?\]\]>|<[^>]*>)', re.DOTALL)
+# 批量转换时拼接文本用的分隔符（私用区字符，不会出现在任何转换词组中）
+SEGMENT_SEPARATOR = '\ue000'
+# 每个并行任务包含的字符数
+CHUNK_CHARS = 64 * 1024
+# 待转换文本少于该字符数时不启用进程池（进程间传输的开销大于收益）
+PARALLEL_MIN_CHARS = 256 * 1024
+# 段落缓存的最大条目数（超出后在下一次转换前清空重建）
+MEMO_MAX_ENTRIES = 200_000
+# 超过该长度的段落不放入缓存
+MEMO_MAX_SEGMENT_CHARS = 4096
+
+# 工作进程中的转换器（由 _init_worker 创建）
+_worker_converter = None
+
+
+def is_native_converter(converter):
+    """转换器是否来自 OpenCC 官方 C++ 绑定（其 OpenCC 类继承自扩展模块 opencc_clib 中的类型）。"""
+    return any('clib' in getattr(cls, '__module__', '') for cls in type(converter).__mro__)
+
+
+def _create_converter(config):
+    from opencc import OpenCC
+    return OpenCC(config)
+
+
+def _convert_batch(converter, segments):
+    """把一批文本用分隔符拼接后一次转换，再按分隔符拆回；拼接结果无法对齐时逐段转换。"""
+    if len(segments) > 1 and not any(SEGMENT_SEPARATOR in segment for segment in segments):
+        converted = converter.convert(SEGMENT_SEPARATOR.join(segments)).split(SEGMENT_SEPARATOR)
+        if len(converted) == len(segments):
+            return converted
+    return [converter.convert(segment) for segment in segments]
+
+
+def _init_worker(config):
+    global _worker_converter
+    _worker_converter = _create_converter(config)
+
+
+def _convert_batch_task(segments):
+    """工作进程任务：转换一批文本。"""
+    return _convert_batch(_worker_converter, segments)
+
+
+def _pack_batches(segments, chunk_chars):
+    """把文本按顺序打包成总长度约为 chunk_chars 的批次（单个超长段落单独成批）。"""
+    batches = []
+    current = []
+    size = 0
+    for segment in segments:
+        if current and size + len(segment) > chunk_chars:
+            batches.append(current)
+            current = []
+            size = 0
+        current.append(segment)
+        size += len(segment)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class OpenCCService:
+    """
+    繁简转换服务。converter 为已初始化的 OpenCC 转换器，config 为其配置（工作进程据此各自创建转换器），
+    jobs 为并行转换的进程数（1 表示只在当前进程中转换；原生转换器始终在当前进程中转换）。
+    对外提供与转换器相同的 convert(text) 接口，可直接替换原来的 cc 使用。
+    """
+
+    def __init__(self, converter, config='t2s', jobs=1):
+        self.converter = converter
+        self.config = config
+        self.jobs = max(1, jobs)
+        self.native = is_native_converter(converter)
+        self._memo = {}
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def convert_segments(self, segments):
+        """转换一组相互独立的文本，返回一一对应的结果（重复文本只转换一次）。"""
+        memo = self._memo
+        if len(memo) > MEMO_MAX_ENTRIES:
+            memo.clear()
+        pending = []
+        seen = set()
+        for segment in segments:
+            if segment.isascii() or segment in memo or segment in seen:
+                continue
+            seen.add(segment)
+            pending.append(segment)
+
+        if pending:
+            for segment, converted in zip(pending, self._convert_pending(pending)):
+                memo[segment] = converted
+
+        results = [segment if segment.isascii() else memo[segment] for segment in segments]
+        # 超长段落不长期占用缓存
+        for segment in pending:
+            if len(segment) > MEMO_MAX_SEGMENT_CHARS:
+                memo.pop(segment, None)
+        return results
+
+    def _convert_pending(self, pending):
+        batches = _pack_batches(pending, CHUNK_CHARS)
+        total_chars = sum(map(len, pending))
+        if self.native or self.jobs <= 1 or len(batches) < 2 or total_chars < PARALLEL_MIN_CHARS:
+            return [converted for batch in batches for converted in _convert_batch(self.converter, batch)]
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker, initargs=(self.config,))
+        return [converted for batch_result in self._executor.map(_convert_batch_task, batches) for converted in batch_result]
+
+    def convert(self, text):
+        """转换纯文本（如 TXT 全文）：按行拆分后转换，行是安全的分块边界，重复的行只转换一次。"""
+        if text.isascii():
+            return text
+        return '\n'.join(self.convert_segments(text.split('\n')))
+
+    def convert_markup_many(self, contents):
+        """转换多个 XHTML/XML 文档的文本节点，标签与属性保持不变。所有文档的文本节点一起去重、分批转换。"""
+        split_contents = [_MARKUP_RE.split(content) for content in contents]
+        # split 的结果中偶数下标为文本节点，奇数下标为标记
+        texts = [part for parts in split_contents for part in parts[0::2]]
+        converted = iter(self.convert_segments(texts))
+        results = []
+        for parts in split_contents:
+            parts[0::2] = [next(converted) for _ in range(len(parts[0::2]))]
+            results.append(''.join(parts))
+        return results
+
+    def convert_markup(self, content):
+        """转换单个 XHTML/XML 文档的文本节点。"""
+        return self.convert_markup_many([content])[0]
+
+
+def _benchmark(path, jobs):
+    """对比旧做法（逐成员整体 cc.convert）与 OpenCCService 的耗时。"""
+    from opencc import OpenCC
+
+    if path.lower().endswith('.epub'):
+        import zipfile
+        with zipfile.ZipFile(path) as archive:
+            contents = [archive.read(name).decode('utf-8', errors='ignore') for name in archive.namelist()
+                        if name.endswith(('.xhtml', '.html', '.opf', '.ncx'))]
+        markup = True
+    else:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            contents = [f.read()]
+        markup = False
+    print(f"[基准] {os.path.basename(path)}: {len(contents)} 个文本成员，共 {sum(map(len, contents))} 个字符")
+
+    cc = OpenCC('t2s')
+    start = time.perf_counter()
+    legacy = [cc.convert(content) for content in contents]
+    legacy_seconds = time.perf_counter() - start
+    print(f"  - 旧做法（整体 cc.convert）: {legacy_seconds:.2f}s")
+
+    for service_jobs in sorted({1, max(1, jobs)}):
+        label = "单进程" if service_jobs == 1 else f"{service_jobs} 进程"
+        with OpenCCService(OpenCC('t2s'), 't2s', jobs=service_jobs) as service:
+            start = time.perf_counter()
+            converted = service.convert_markup_many(contents) if markup else [service.convert(c) for c in contents]
+            seconds = time.perf_counter() - start
+        same = sum(1 for a, b in zip(legacy, converted) if a == b)
+        speedup = legacy_seconds / seconds if seconds else float('inf')
+        print(f"  - OpenCCService（{label}{'，原生' if service.native else ''}）: {seconds:.2f}s，"
+              f"加速 {speedup:.1f}x，与旧结果一致的成员 {same}/{len(contents)}")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="OpenCC 转换服务性能对比")
+    parser.add_argument("--benchmark", required=True, help="用于对比的 EPUB 或 TXT 文件")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="并行转换的进程数")
+    args = parser.parse_args()
+    sys.exit(_benchmark(args.benchmark, args.jobs))
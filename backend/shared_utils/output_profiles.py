@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+输出规格 (Output Profile)
+同一章节常常需要以多种尺寸发布（例如平板用 1500px 全尺寸、手机用更小更省空间的版本）。
+漫画脚本对源图只解码、分析一次，然后把结果分发给每个输出规格各自的编码与 PDF 写入。
+
+命令行格式: --profiles "tablet:1500:85:300:30000,phone:900:70:200:12000"
+即 名称:宽度:JPEG质量:DPI[:最大页高]，多个规格用逗号分隔。
+"""
+
+
+class OutputProfile:
+    """一个输出规格：页面宽度、JPEG 质量、DPI 与最大页面高度（均以该规格自身的像素计）。"""
+
+    __slots__ = ("name", "width", "jpeg_quality", "dpi", "max_page_height")
+
+    def __init__(self, name, width, jpeg_quality=None, dpi=300, max_page_height=None):
+        self.name = name
+        self.width = int(width)
+        self.jpeg_quality = int(jpeg_quality) if jpeg_quality is not None else None
+        self.dpi = int(dpi)
+        self.max_page_height = int(max_page_height) if max_page_height is not None else None
+
+    def __repr__(self):
+        return (f"OutputProfile({self.name!r}, width={self.width}, jpeg_quality={self.jpeg_quality}, "
+                f"dpi={self.dpi}, max_page_height={self.max_page_height})")
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def describe(self):
+        parts = [f"{self.width}px", f"{self.dpi}DPI"]
+        if self.jpeg_quality is not None:
+            parts.append(f"JPEG质量 {self.jpeg_quality}")
+        if self.max_page_height is not None:
+            parts.append(f"最大页高 {self.max_page_height}px")
+        return f"{self.name} ({', '.join(parts)})"
+
+
+def parse_output_profiles(spec):
+    """
+    解析 "名称:宽度:JPEG质量:DPI[:最大页高]" 格式（逗号分隔多个）的规格字符串。
+
+    格式错误时抛出 ValueError。
+    """
+    profiles = []
+    for chunk in spec.split(","):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        fields = chunk.split(":")
+        if len(fields) not in (4, 5):
+            raise ValueError(f"输出规格 '{chunk}' 格式错误，应为 名称:宽度:JPEG质量:DPI[:最大页高]")
+        name, width, quality, dpi = fields[:4]
+        max_page_height = fields[4] if len(fields) == 5 else None
+        try:
+            profile = OutputProfile(name.strip(), width, quality, dpi, max_page_height)
+        except ValueError:
+            raise ValueError(f"输出规格 '{chunk}' 中的数值无效")
+        if profile.width <= 0 or profile.dpi <= 0:
+            raise ValueError(f"输出规格 '{chunk}' 中的宽度和 DPI 必须为正数")
+        if not 1 <= profile.jpeg_quality <= 100:
+            raise ValueError(f"输出规格 '{chunk}' 中的 JPEG 质量应在 1-100 之间")
+        if profile.max_page_height is not None and profile.max_page_height <= 0:
+            raise ValueError(f"输出规格 '{chunk}' 中的最大页高必须为正数")
+        profiles.append(profile)
+    if not profiles:
+        raise ValueError("未提供任何输出规格")
+    names = [p.name for p in profiles]
+    if len(set(names)) != len(names):
+        raise ValueError("输出规格名称不能重复")
+    return profiles
+
+
+def profile_file_suffix(profile, profiles):
+    """只有一个输出规格时不加后缀（保持原有文件名），多个规格时以 "_名称" 区分输出文件。"""
+    return "" if len(profiles) <= 1 else f"_{profile.name}"
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重复页面检测（感知哈希）
+爬取的章节里经常反复出现相同或几乎相同的页面（汉化组声明、广告、译注），
+它们会被重复合并、分析、编码并写入每一话的 PDF。这里为每一页在缩小的缩略图上计算
+dHash（默认）或 pHash，并在整个系列（同一根目录下的所有项目）中查找已出现过的页面:
+- "flag": 只报告重复页面
+- "skip": 在合并前跳过重复页面
+
+页面哈希按文件内容摘要缓存在根目录的 JSON 文件中，重跑时无需再次解码。
+纯色/几乎没有细节的页面（如条漫中的空白过渡页）不参与去重，以免误删排版用的留白。
+"""
+
+import hashlib
+import io
+import json
+import os
+
+from PIL import Image
+
+from backend.shared_utils.image_archive import ArchiveMember, source_display_name
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEDUP_OFF = "off"
+DEDUP_FLAG = "flag"
+DEDUP_SKIP = "skip"
+DEDUP_MODES = (DEDUP_OFF, DEDUP_FLAG, DEDUP_SKIP)
+
+HASH_DHASH = "dhash"
+HASH_PHASH = "phash"
+
+HASH_BITS = 64
+DEFAULT_MAX_DISTANCE = 4  # 64 位哈希的汉明距离不超过此值即视为重复
+FLAT_PAGE_MIN_STDDEV = 3.0  # 缩略图灰度标准差低于此值的页面视为纯色页，不参与去重
+CACHE_FILENAME = ".page_hash_cache.json"
+
+
+def _load_thumbnail(data, size):
+    """从图片字节解码出灰度缩略图；JPEG 使用 draft 在 DCT 域直接缩小解码。"""
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (size[0] * 4, size[1] * 4))
+        return img.convert("L").resize(size, Image.Resampling.BILINEAR)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(thumbnail_9x8):
+    """差值哈希：比较每行相邻像素的明暗关系（需要 9x8 的灰度缩略图）。"""
+    pixels = list(thumbnail_9x8.getdata())
+    bits = []
+    for row in range(8):
+        offset = row * 9
+        bits.extend(pixels[offset + col] > pixels[offset + col + 1] for col in range(8))
+    return _bits_to_int(bits)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def phash(thumbnail_32x32):
+    """DCT 感知哈希：取 32x32 缩略图二维 DCT 的左上 8x8 低频系数，与其中位数比较（需要 numpy）。"""
+    pixels = np.asarray(thumbnail_32x32, dtype=np.float64)
+    dct = _dct_matrix(32)
+    low_freq = (dct @ pixels @ dct.T)[:8, :8].flatten()
+    median = np.median(low_freq[1:])  # 排除直流分量
+    return _bits_to_int(low_freq > median)
+
+
+def compute_page_hash(data, method=HASH_DHASH):
+    """返回页面的 64 位感知哈希；纯色页面返回 None。"""
+    size = (32, 32) if method == HASH_PHASH else (9, 8)
+    thumbnail = _load_thumbnail(data, size)
+    values = list(thumbnail.getdata())
+    mean = sum(values) / len(values)
+    if (sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5 < FLAT_PAGE_MIN_STDDEV:
+        return None
+    if method == HASH_PHASH and np is not None:
+        return phash(thumbnail)
+    if method == HASH_PHASH:
+        thumbnail = _load_thumbnail(data, (9, 8))
+    return dhash(thumbnail)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _read_source_bytes(source):
+    if isinstance(source, ArchiveMember):
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+class PageDeduplicator:
+    """
+    在一个系列（一次运行中的所有项目）内查找重复页面。
+
+    近似查找使用多索引哈希：把 64 位哈希切成 max_distance + 1 段，
+    汉明距离不超过 max_distance 的两个哈希至少有一段完全相同，因此只需比较共享某一段的候选。
+    """
+
+    def __init__(self, cache_dir, method=HASH_DHASH, max_distance=DEFAULT_MAX_DISTANCE, mode=DEDUP_SKIP):
+        self.method = method
+        self.max_distance = max_distance
+        self.mode = mode
+        self.cache_path = os.path.join(cache_dir, CACHE_FILENAME)
+        self.cache = {}
+        self.cache_dirty = False
+        self.seen = {}  # 哈希 -> 首次出现的位置描述
+        segment_count = max_distance + 1
+        self._segment_bounds = [(HASH_BITS * i // segment_count, HASH_BITS * (i + 1) // segment_count) for i in range(segment_count)]
+        self._segment_index = [{} for _ in self._segment_bounds]
+        self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                self.cache = json.load(f).get(self.method, {})
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def save_cache(self):
+        """写回哈希缓存（仅在有新增时写入）。"""
+        if not self.cache_dirty:
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            payload = {}
+        payload[self.method] = self.cache
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.cache_path)
+            self.cache_dirty = False
+        except OSError as e:
+            print(f"    警告: 写入页面哈希缓存失败: {e}")
+
+    def page_hash(self, source):
+        """返回来源的感知哈希（按文件内容摘要缓存）；纯色页面或无法解码时返回 None。"""
+        data = _read_source_bytes(source)
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if digest in self.cache:
+            cached = self.cache[digest]
+            return int(cached, 16) if cached else None
+        try:
+            value = compute_page_hash(data, self.method)
+        except Exception:
+            value = None
+        self.cache[digest] = format(value, "016x") if value is not None else ""
+        self.cache_dirty = True
+        return value
+
+    def _segments(self, value):
+        return [(value >> (HASH_BITS - end)) & ((1 << (end - start)) - 1) for start, end in self._segment_bounds]
+
+    def find_duplicate(self, value):
+        """返回与 value 汉明距离不超过阈值的已见哈希对应的描述，没有则返回 None。"""
+        if value in self.seen:
+            return self.seen[value]
+        for index, segment in zip(self._segment_index, self._segments(value)):
+            for candidate in index.get(segment, ()):
+                if hamming_distance(candidate, value) <= self.max_distance:
+                    return self.seen[candidate]
+        return None
+
+    def register(self, value, label):
+        if value in self.seen:
+            return
+        self.seen[value] = label
+        for index, segment in zip(self._segment_index, self._segments(value)):
+            index.setdefault(segment, []).append(value)
+
+    def filter_pages(self, sources, project_name):
+        """
+        检查一个项目的页面，返回 (应保留的来源列表, [(重复来源, 首次出现位置), ...])。
+
+        "flag" 模式下保留全部页面，只返回重复列表。
+        """
+        kept, duplicates = [], []
+        for source in sources:
+            value = self.page_hash(source)
+            if value is None:
+                kept.append(source)
+                continue
+            first_seen = self.find_duplicate(value)
+            if first_seen is None:
+                self.register(value, f"{project_name}/{source_display_name(source)}")
+                kept.append(source)
+                continue
+            duplicates.append((source, first_seen))
+            if self.mode != DEDUP_SKIP:
+                kept.append(source)
+        self.save_cache()
+        return kept, duplicates
+
+
+def report_duplicates(duplicates, mode, indent="    "):
+    """打印重复页面报告。"""
+    if not duplicates:
+        return
+    action = "已跳过" if mode == DEDUP_SKIP else "已标记"
+    print(f"{indent}🔁 检测到 {len(duplicates)} 个重复页面（{action}）:")
+    for source, first_seen in duplicates:
+        print(f"{indent}  - {source_display_name(source)} ≈ {first_seen}")
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编译式替换规则引擎
+把一组按顺序链式执行的替换规则（文本规则 / 正则规则）在每次运行开始时编译一次，
+之后对每段文本只做一次扫描即可同时得到替换结果与原子化变更列表:
+- 相邻且互不影响的文本规则合并为一个前缀树形式的交替正则，一次扫描完成整组替换
+- 正则规则预编译，用同一次扫描同时记录匹配并生成替换结果（不再 finditer + sub 两遍）
+- 规则顺序严格保持：只有当合并后的结果与逐条执行完全一致时才会合并
+- apply_segments() 可以一次处理整章的所有段落：文本规则阶段在用分隔符拼接后的整章文本上只扫描一次，
+  再按分隔符位置把匹配归属回各段落；正则规则（可能含 ^、$、\s 等跨段落语义）仍逐段落执行
+
+传入 with_spans=True 时还会返回每处变更在原文与最终文本中的位置 (原文起, 原文止, 结果起, 结果止, 原文, 替换文本)，
+链式规则中后一条改写了前一条的结果时，位置会经 EditTrace 逐阶段映射，覆盖被改写的整个区域。
+
+编译结果可以通过 to_dict() / from_dict() 保存为 JSON 并直接恢复，无需重新分析规则之间的冲突。
+
+两条文本规则 A（在前）与 B（在后）可以合并的条件:
+- A 与 B 的查找文本互不包含、首尾也不重叠（同一位置不会同时命中两条规则）
+- A 的替换结果不会产生新的 B 匹配：替换文本与 B 的查找文本不包含、不首尾重叠，
+  且当 A 的替换文本为空（删除）时 B 的查找文本只有一个字符（删除不会拼出多字符的 B）
+"""
+
+import re
+from bisect import bisect_right
+
+MODE_TEXT = "text"
+MODE_REGEX = "regex"
+
+# 整章扫描时拼接段落用的分隔符：文本规则的查找/替换内容与段落中都不含该字符时，匹配不可能跨越段落
+SEGMENT_SEPARATOR = "\x00"
+_SEPARATOR_RE = re.compile(re.escape(SEGMENT_SEPARATOR))
+
+
+class _TextIndex:
+    """
+    一组文本的子串/首尾索引，用于判断一个新文本是否与其中任意一个"包含或首尾重叠"。
+    逐对比较是 O(规则数²)，这里每次判断只与新文本的长度及该组文本的总长度成线性关系。
+    """
+
+    __slots__ = ("texts", "lengths", "joined", "proper_prefixes", "proper_suffixes")
+
+    def __init__(self):
+        self.texts = set()
+        self.lengths = set()
+        self.joined = ""
+        self.proper_prefixes = set()
+        self.proper_suffixes = set()
+
+    def add(self, text):
+        self.texts.add(text)
+        self.lengths.add(len(text))
+        self.joined += SEGMENT_SEPARATOR + text
+        for k in range(1, len(text)):
+            self.proper_prefixes.add(text[:k])
+            self.proper_suffixes.add(text[-k:])
+
+    def overlaps(self, text):
+        """text 是否与组内某个文本存在包含关系，或一方的真后缀等于另一方的真前缀。"""
+        if text in self.joined:
+            return True
+        length = len(text)
+        for k in range(1, length):
+            if text[:k] in self.proper_suffixes or text[-k:] in self.proper_prefixes:
+                return True
+        texts = self.texts
+        return any(text[i:i + n] in texts for n in self.lengths if n < length for i in range(length - n + 1))
+
+
+class _LiteralGroup:
+    """正在合并的一组文本规则，以及判断新规则能否并入所需的索引。"""
+
+    __slots__ = ("literals", "patterns", "replacements", "has_deletion")
+
+    def __init__(self):
+        self.literals = []
+        self.patterns = _TextIndex()
+        self.replacements = _TextIndex()
+        self.has_deletion = False
+
+    def conflicts(self, text):
+        """
+        查找文本为 text 的新规则（在组内所有规则之后执行）并入本组后，结果是否可能与逐条执行不同:
+        与组内查找文本重叠（同一位置可能命中两条规则），或可能由组内的替换结果拼出（含删除后的拼接）。
+        """
+        if self.patterns.overlaps(text) or self.replacements.overlaps(text):
+            return True
+        return self.has_deletion and len(text) > 1
+
+    def add(self, literal):
+        text, replacement = literal
+        self.literals.append(literal)
+        self.patterns.add(text)
+        if replacement:
+            self.replacements.add(replacement)
+        else:
+            self.has_deletion = True
+
+
+def _trie_pattern(words):
+    """把一组互不为前缀的文本编译为前缀树形式的交替正则（公共前缀只匹配一次）。"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+
+    def node_pattern(node):
+        parts = []
+        while len(node) == 1:  # 单分支链直接展开，递归深度只与分叉数有关
+            char, node = next(iter(node.items()))
+            parts.append(re.escape(char))
+        if node:
+            branches = [re.escape(char) + node_pattern(child) for char, child in sorted(node.items())]
+            parts.append("(?:" + "|".join(branches) + ")")
+        return "".join(parts)
+
+    return node_pattern(trie)
+
+
+class _StageEdits:
+    """一个阶段对文本所做的编辑 [(输入起, 输入止, 输出起, 输出止, 原文, 替换文本), ...]（按位置排序、互不重叠）。"""
+
+    __slots__ = ("edits", "in_ends", "out_ends")
+
+    def __init__(self, edits):
+        self.edits = edits
+        self.in_ends = [edit[1] for edit in edits]
+        self.out_ends = [edit[3] for edit in edits]
+
+    def map(self, position, forward, right_bias):
+        """
+        把 position 映射穿过本阶段：forward=True 从输入映射到输出，否则从输出映射回输入。
+        落在某处编辑内部的位置映射到该编辑的起点（right_bias=False）或终点（right_bias=True）。
+        """
+        edits = self.edits
+        src_start, src_end, dst_start, dst_end = (0, 1, 2, 3) if forward else (2, 3, 0, 1)
+        k = bisect_right(self.in_ends if forward else self.out_ends, position)
+        if k < len(edits) and edits[k][src_start] < position:
+            return edits[k][dst_end] if right_bias else edits[k][dst_start]
+        if k == 0:
+            return position
+        previous = edits[k - 1]
+        return position + previous[dst_end] - previous[src_end]
+
+
+class EditTrace:
+    """记录一段文本依次经过的各阶段编辑，用于把每处变更映射回最初的原文与最终文本中的位置。"""
+
+    __slots__ = ("stages",)
+
+    def __init__(self):
+        self.stages = []
+
+    def add_stage(self, edits):
+        """edits 为 [(输入起, 输入止, 输出起, 输出止, 原文, 替换文本), ...]，坐标相对于该阶段的输入/输出文本。"""
+        if edits:
+            self.stages.append(_StageEdits(edits))
+
+    def spans(self):
+        """返回每处变更的 (原文起, 原文止, 结果起, 结果止, 原文, 替换文本) 列表（按阶段、位置排序）。"""
+        spans = []
+        for index, stage in enumerate(self.stages):
+            earlier = self.stages[index - 1::-1] if index else []
+            later = self.stages[index + 1:]
+            for in_start, in_end, out_start, out_end, original_text, replacement_text in stage.edits:
+                for previous in earlier:
+                    in_start = previous.map(in_start, False, False)
+                    in_end = previous.map(in_end, False, True)
+                for following in later:
+                    out_start = following.map(out_start, True, False)
+                    out_end = following.map(out_end, True, True)
+                spans.append((in_start, in_end, out_start, out_end, original_text, replacement_text))
+        return spans
+
+
+class ReplacementRule:
+    """一条替换规则：查找内容、替换内容与模式（"Text" / "Regex"）。"""
+
+    __slots__ = ("original", "replacement", "mode")
+
+    def __init__(self, original, replacement, mode):
+        self.original = original
+        self.replacement = replacement
+        self.mode = mode
+
+    def __iter__(self):
+        return iter((self.original, self.replacement, self.mode))
+
+    def __repr__(self):
+        return f"ReplacementRule({self.original!r}, {self.replacement!r}, {self.mode!r})"
+
+
+class _LiteralStage:
+    """一组可合并的文本规则：一次扫描完成整组替换。"""
+
+    __slots__ = ("pattern", "replacements", "joinable")
+
+    def __init__(self, literals):
+        self.replacements = dict(literals)
+        self.pattern = re.compile(_trie_pattern(self.replacements))
+        self.joinable = not any(SEGMENT_SEPARATOR in text for item in self.replacements.items() for text in item)
+
+    def _substitute(self, content):
+        """返回 (替换后的文本, 编辑列表 [(输入起, 输入止, 输出起, 输出止, 原文, 替换文本), ...])，只记录确有变化的匹配。"""
+        pieces = []
+        edits = []
+        last_end = 0
+        shift = 0
+        replacements = self.replacements
+        for match in self.pattern.finditer(content):
+            original_text = match.group(0)
+            replacement_text = replacements[original_text]
+            start, end = match.span()
+            if original_text != replacement_text:
+                edits.append((start, end, start + shift, start + shift + len(replacement_text), original_text, replacement_text))
+                shift += len(replacement_text) - len(original_text)
+            pieces.append(content[last_end:start])
+            pieces.append(replacement_text)
+            last_end = end
+        if not pieces:
+            return content, edits
+        pieces.append(content[last_end:])
+        return "".join(pieces), edits
+
+    def apply(self, content, changes, trace=None):
+        content, edits = self._substitute(content)
+        changes.extend((edit[4], edit[5]) for edit in edits)
+        if trace is not None:
+            trace.add_stage(edits)
+        return content
+
+    def to_dict(self):
+        return {"type": MODE_TEXT, "literals": list(self.replacements.items())}
+
+    def apply_joined(self, joined, segment_changes, segment_traces=None):
+        """
+        在拼接后的整章文本上扫描一次，变更按分隔符位置归属到 segment_changes[段落下标]；
+        传入 segment_traces 时把编辑坐标换算为段落内坐标后记入对应段落。
+        """
+        modified, edits = self._substitute(joined)
+        if not edits:
+            return modified
+        separators = [m.start() for m in _SEPARATOR_RE.finditer(joined)]
+        segment_edits = {}
+        for edit in edits:
+            index = bisect_right(separators, edit[0])
+            segment_changes[index].append((edit[4], edit[5]))
+            if segment_traces is not None:
+                segment_edits.setdefault(index, []).append(edit)
+        for index, stage_edits in segment_edits.items():
+            in_origin = separators[index - 1] + 1 if index else 0
+            out_origin = stage_edits[0][2] - stage_edits[0][0] + in_origin  # 本段之前的编辑造成的偏移
+            segment_traces[index].add_stage([
+                (in_start - in_origin, in_end - in_origin, out_start - out_origin, out_end - out_origin, original_text, replacement_text)
+                for in_start, in_end, out_start, out_end, original_text, replacement_text in stage_edits
+            ])
+        return modified
+
+
+class _RegexStage:
+    """一条预编译的正则规则。"""
+
+    __slots__ = ("source", "pattern", "template", "literal_template", "broken")
+
+    def __init__(self, source, pattern, template):
+        self.source = source
+        self.pattern = pattern
+        self.template = template
+        self.literal_template = "\\" not in template
+        self.broken = False
+
+    def to_dict(self):
+        return {"type": MODE_REGEX, "pattern": self.source, "replacement": self.template}
+
+    def apply(self, content, changes, trace=None):
+        if self.broken:
+            return content
+        edits = []
+        template = self.template
+        literal_template = self.literal_template
+        shift = 0
+
+        def substitute(match):
+            nonlocal shift
+            original_text = match.group(0)
+            replacement_text = template if literal_template else match.expand(template)
+            if original_text != replacement_text:
+                start, end = match.span()
+                edits.append((start, end, start + shift, start + shift + len(replacement_text), original_text, replacement_text))
+                shift += len(replacement_text) - len(original_text)
+            return replacement_text
+
+        try:
+            modified = self.pattern.sub(substitute, content)
+        except re.error as e:
+            # 替换模板错误（如引用了不存在的分组）只在首次匹配时才会暴露，此后整条规则跳过
+            print(f"\n[!] 正则表达式错误: '{self.source}'. 错误: {e}. 跳过。")
+            self.broken = True
+            return content
+        changes.extend((edit[4], edit[5]) for edit in edits)
+        if trace is not None:
+            trace.add_stage(edits)
+        return modified
+
+
+class RuleEngine:
+    """
+    编译后的替换规则。
+
+    rules 为按顺序排列的 (查找内容, 替换内容, 模式) 序列（或 ReplacementRule 列表），模式为 "Text" 或 "Regex"（不区分大小写）。
+    查找内容为空（或为 "nan"）的规则会被忽略；无法编译的正则规则会提示后跳过。
+    """
+
+    def __init__(self, rules):
+        self.stages = []
+        self.rule_count = 0
+        group = _LiteralGroup()
+
+        def flush_literals():
+            nonlocal group
+            if group.literals:
+                self.stages.append(_LiteralStage(group.literals))
+                group = _LiteralGroup()
+
+        for original, replacement, mode in rules:
+            if not isinstance(original, str) or original == "" or original == "nan":
+                continue
+            is_text = str(mode).lower() == MODE_TEXT
+            search_pattern = re.escape(original) if is_text else original
+            try:
+                compiled = re.compile(search_pattern)
+                if is_text:
+                    # 文本规则的替换内容同样按 re.sub 模板解析（如 \n、\g<0>），对固定文本只需展开一次
+                    literal = (original, compiled.sub(replacement, original))
+            except re.error as e:
+                print(f"\n[!] 正则表达式错误: '{search_pattern}'. 错误: {e}. 跳过。")
+                continue
+            self.rule_count += 1
+
+            if not is_text:
+                flush_literals()
+                self.stages.append(_RegexStage(search_pattern, compiled, replacement))
+                continue
+            if group.conflicts(original):
+                flush_literals()
+            group.add(literal)
+        flush_literals()
+
+    def to_dict(self):
+        """返回可 JSON 序列化的编译结果。"""
+        return {"rule_count": self.rule_count, "stages": [stage.to_dict() for stage in self.stages]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 to_dict() 的结果恢复规则引擎（只重新编译正则，不再分析规则冲突）。"""
+        engine = cls.__new__(cls)
+        engine.rule_count = data["rule_count"]
+        engine.stages = []
+        for stage in data["stages"]:
+            if stage["type"] == MODE_TEXT:
+                engine.stages.append(_LiteralStage([tuple(pair) for pair in stage["literals"]]))
+            else:
+                engine.stages.append(_RegexStage(stage["pattern"], re.compile(stage["pattern"]), stage["replacement"]))
+        return engine
+
+    @staticmethod
+    def _unique_changes(changes):
+        return [{"original_text": o, "replacement_text": r} for o, r in dict.fromkeys(changes)]
+
+    def apply(self, content, with_spans=False):
+        """
+        按规则顺序链式替换 content。
+        返回元组: (修改后的文本, 去重后的原子化变更列表 [{'original_text': ..., 'replacement_text': ...}])；
+        with_spans=True 时追加第三项：变更位置列表（见 EditTrace.spans）。
+        """
+        changes = []
+        trace = EditTrace() if with_spans else None
+        for stage in self.stages:
+            content = stage.apply(content, changes, trace)
+        if with_spans:
+            return content, self._unique_changes(changes), trace.spans()
+        return content, self._unique_changes(changes)
+
+    def apply_segments(self, segments, with_spans=False):
+        """
+        对一组段落（如一章的所有段落）执行替换，结果与逐段调用 apply() 完全相同。
+        返回与 segments 一一对应的 [(修改后的文本, 原子化变更列表), ...]（with_spans=True 时每项追加变更位置列表）。
+        """
+        segments = list(segments)
+        segment_changes = [[] for _ in segments]
+        segment_traces = [EditTrace() for _ in segments] if with_spans else None
+        can_join = len(segments) > 1 and not any(SEGMENT_SEPARATOR in segment for segment in segments)
+        joined = None  # 不为 None 时表示当前以拼接后的整章文本形式保存
+        for stage in self.stages:
+            if can_join and isinstance(stage, _LiteralStage) and stage.joinable:
+                if joined is None:
+                    joined = SEGMENT_SEPARATOR.join(segments)
+                joined = stage.apply_joined(joined, segment_changes, segment_traces)
+                continue
+            if joined is not None:
+                segments, joined = joined.split(SEGMENT_SEPARATOR), None
+            traces = segment_traces or [None] * len(segments)
+            segments = [stage.apply(segment, changes, trace) for segment, changes, trace in zip(segments, segment_changes, traces)]
+        if joined is not None:
+            segments = joined.split(SEGMENT_SEPARATOR)
+        if with_spans:
+            return [(segment, self._unique_changes(changes), trace.spans())
+                    for segment, changes, trace in zip(segments, segment_changes, segment_traces)]
+        return [(segment, self._unique_changes(changes)) for segment, changes in zip(segments, segment_changes)]
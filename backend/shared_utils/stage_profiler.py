@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+阶段性能分析器
+为漫画处理流程的各个阶段记录墙钟时间、CPU 时间、处理的百万像素数以及内存峰值
+（tracemalloc 追踪的 Python/NumPy 分配 + 后台线程采样的进程 RSS）。
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+import functools
+
+try:
+    import psutil
+except ImportError:  # psutil 不可用时退化为 resource 模块提供的进程级峰值
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块
+    resource = None
+
+# RSS 采样间隔（秒）
+RSS_SAMPLE_INTERVAL_SECONDS = 0.05
+
+# 当前正在记录的分析器（每个项目一个），未设置时所有埋点均为空操作
+_active_profiler = None
+
+
+def _current_rss_bytes():
+    """返回当前进程的 RSS（字节），无法获取时返回 0。"""
+    if psutil is not None:
+        try:
+            return psutil.Process(os.getpid()).memory_info().rss
+        except Exception:
+            return 0
+    return 0
+
+
+def _process_peak_rss_bytes():
+    """返回进程生命周期内的 RSS 峰值（字节），无法获取时返回 0。"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 上单位为 KB，macOS 上为字节
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        try:
+            info = psutil.Process(os.getpid()).memory_info()
+            return getattr(info, "peak_wset", info.rss)
+        except Exception:
+            return 0
+    return 0
+
+
+class StageProfiler:
+    """
+    记录单个项目内各阶段的耗时与内存峰值。
+
+    阶段可以嵌套：子阶段的 tracemalloc 峰值会并入父阶段，RSS 采样同时计入所有未结束的阶段。
+    同名阶段被多次调用时（例如 V2 失败后重打包两次）会分别记录，汇总时按名称累加。
+    """
+
+    def __init__(self, project_name, trace_python_allocations=True):
+        self.project_name = project_name
+        self.trace_python_allocations = trace_python_allocations
+        self.records = []
+        self._open_records = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+        self._wall_start = None
+        self._cpu_start = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    # --- 生命周期 ---
+    def start(self):
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        if self.trace_python_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if psutil is not None:
+            self._stop_event.clear()
+            self._sampler = threading.Thread(target=self._sample_rss, name="rss-sampler", daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        if self._sampler is not None:
+            self._stop_event.set()
+            self._sampler.join(timeout=1)
+            self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        if self._wall_start is not None:
+            self.wall_seconds = time.perf_counter() - self._wall_start
+            self.cpu_seconds = time.process_time() - self._cpu_start
+
+    def _sample_rss(self):
+        while not self._stop_event.wait(RSS_SAMPLE_INTERVAL_SECONDS):
+            self._record_rss(_current_rss_bytes())
+
+    def _record_rss(self, rss):
+        with self._lock:
+            for record in self._open_records:
+                if rss > record["peak_rss_bytes"]:
+                    record["peak_rss_bytes"] = rss
+
+    # --- 阶段记录 ---
+    def begin(self, stage_name):
+        rss = _current_rss_bytes()
+        if tracemalloc.is_tracing():
+            # 在重置峰值之前，把到目前为止的峰值并入外层阶段
+            _, traced_peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                if self._open_records:
+                    parent = self._open_records[-1]
+                    parent["_traced_peak"] = max(parent["_traced_peak"], traced_peak)
+            tracemalloc.reset_peak()
+        record = {
+            "stage": stage_name,
+            "wall_seconds": 0.0,
+            "cpu_seconds": 0.0,
+            "megapixels": 0.0,
+            "peak_traced_bytes": 0,
+            "peak_rss_bytes": rss,
+            "rss_start_bytes": rss,
+            "_wall_start": time.perf_counter(),
+            "_cpu_start": time.process_time(),
+            "_traced_peak": 0,
+        }
+        with self._lock:
+            self._open_records.append(record)
+        return record
+
+    def end(self, record):
+        record["wall_seconds"] = time.perf_counter() - record.pop("_wall_start")
+        record["cpu_seconds"] = time.process_time() - record.pop("_cpu_start")
+        self._record_rss(_current_rss_bytes())
+        traced_peak = record.pop("_traced_peak")
+        if tracemalloc.is_tracing():
+            traced_peak = max(traced_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        record["peak_traced_bytes"] = traced_peak
+        with self._lock:
+            if record in self._open_records:
+                self._open_records.remove(record)
+            if self._open_records:
+                parent = self._open_records[-1]
+                parent["_traced_peak"] = max(parent["_traced_peak"], traced_peak)
+        self.records.append(record)
+
+    def add_megapixels(self, width, height):
+        """把一张 width x height 的图片计入当前最内层阶段的处理量。"""
+        with self._lock:
+            if self._open_records:
+                self._open_records[-1]["megapixels"] += (width * height) / 1_000_000
+
+    # --- 汇总与输出 ---
+    @classmethod
+    def combine(cls, name, profilers):
+        """把多个项目的分析器合并为一个，仅用于汇总展示。"""
+        combined = cls(name, trace_python_allocations=any(p.trace_python_allocations for p in profilers))
+        for profiler in profilers:
+            combined.records.extend(profiler.records)
+            combined.wall_seconds += profiler.wall_seconds
+            combined.cpu_seconds += profiler.cpu_seconds
+        return combined
+
+    def slowest_stage(self):
+        return max(self.summarize(), key=lambda s: s["wall_seconds"], default=None)
+
+    def peak_rss_stage(self):
+        return max(self.summarize(), key=lambda s: s["peak_rss_bytes"], default=None)
+
+    def summarize(self):
+        """按阶段名汇总所有记录，返回按首次出现顺序排列的列表。"""
+        summary = {}
+        for record in self.records:
+            item = summary.setdefault(record["stage"], {
+                "stage": record["stage"], "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                "megapixels": 0.0, "peak_traced_bytes": 0, "peak_rss_bytes": 0,
+            })
+            item["calls"] += 1
+            item["wall_seconds"] += record["wall_seconds"]
+            item["cpu_seconds"] += record["cpu_seconds"]
+            item["megapixels"] += record["megapixels"]
+            item["peak_traced_bytes"] = max(item["peak_traced_bytes"], record["peak_traced_bytes"])
+            item["peak_rss_bytes"] = max(item["peak_rss_bytes"], record["peak_rss_bytes"])
+        return list(summary.values())
+
+    def to_dict(self):
+        stages = self.summarize()
+        peak_stage = self.peak_rss_stage()
+        return {
+            "project": self.project_name,
+            "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "process_peak_rss_bytes": _process_peak_rss_bytes(),
+            "rss_sampling": psutil is not None,
+            "python_allocation_tracing": self.trace_python_allocations,
+            "peak_rss_stage": peak_stage["stage"] if peak_stage and peak_stage["peak_rss_bytes"] else None,
+            "stages": stages,
+            "calls": self.records,
+        }
+
+    def write_json(self, output_path):
+        """把报告写为 JSON 文件，成功时返回路径，失败时返回 None。"""
+        try:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            return output_path
+        except (OSError, TypeError) as e:
+            print(f"    警告: 写入性能报告 '{output_path}' 失败: {e}")
+            return None
+
+    def format_summary_lines(self, indent="    "):
+        """返回适合打印到终端的阶段汇总行（未追踪 Python 分配时不显示 Python 峰值）。"""
+        lines = []
+        for item in self.summarize():
+            traced = (f"Python峰值 {item['peak_traced_bytes'] / 1048576:7.1f} MB | "
+                      if self.trace_python_allocations else "")
+            lines.append(
+                f"{indent}{item['stage']:<24} 墙钟 {item['wall_seconds']:7.2f}s | CPU {item['cpu_seconds']:7.2f}s | "
+                f"{item['megapixels']:8.1f} MP | {traced}RSS峰值 {item['peak_rss_bytes'] / 1048576:7.1f} MB"
+            )
+        return lines
+
+
+def set_active_profiler(profiler):
+    """设置当前生效的分析器；传入 None 关闭埋点。"""
+    global _active_profiler
+    _active_profiler = profiler
+
+
+def get_active_profiler():
+    return _active_profiler
+
+
+def add_megapixels(width, height):
+    """向当前生效的分析器报告处理的像素量；没有生效的分析器时为空操作。"""
+    if _active_profiler is not None:
+        _active_profiler.add_megapixels(width, height)
+
+
+def profile_stage(stage_name):
+    """装饰器：当存在生效的分析器时，把被装饰函数的一次调用记录为一个阶段。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active_profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            record = profiler.begin(stage_name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.end(record)
+        return wrapper
+    return decorator
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+繁体中文快速检测
+过去判断一本书是否需要繁转简，是对若干 2KB 样本调用 cc.convert 再比较结果：
+每次检测都要跑一遍完整的转换，而且只看样本，样本之外的繁体内容会被漏掉。
+
+这里预先计算"只在繁体中出现"的字符集合（frozenset），检测时对文本做一次线性扫描:
+- 字符集合从 OpenCC 的 t2s 字典（TSCharacters.txt）推导；安装的 OpenCC 不带文本字典时
+  （如 C++ 绑定），用转换器逐字转换一遍 CJK 统一表意文字区推导
+- 推导结果缓存在内存和临时目录的 JSON 文件中，每台机器只推导一次
+- 扫描按块进行，块内先用 isdisjoint 快速排除，繁体字数量达到阈值即提前结束，并给出繁体字比例
+
+用法:
+    detector = TraditionalChineseDetector.from_converter(cc)
+    result = detector.scan_epub(book)
+    if result.needs_conversion:
+        print(f"繁体字比例: {result.ratio:.2%}")
+"""
+
+import json
+import os
+import re
+import tempfile
+
+# 推导结果的磁盘缓存（位于系统临时目录，按字典文件或转换器来源判断是否有效）
+TC_CHARS_CACHE_FILENAME = "contentforge_tc_chars.json"
+TC_CHARS_CACHE_VERSION = 1
+# OpenCC 文本字典中繁体 -> 简体的单字对照表
+TS_CHARACTERS_DICT = "TSCharacters.txt"
+# 没有文本字典时逐字探测的码位范围（CJK 统一表意文字及扩展 A）
+PROBE_RANGES = ((0x3400, 0x4DBF), (0x4E00, 0x9FFF))
+# 扫描时每块的字符数（块内先做一次 isdisjoint 快速排除）
+SCAN_BLOCK_CHARS = 64 * 1024
+# 找到这么多个繁体字后停止扫描（结果足以判定，比例按已扫描部分计算）
+EARLY_EXIT_HITS = 200
+# 至少出现这么多个繁体字才判定需要转换
+MIN_TRADITIONAL_HITS = 1
+# 参与检测的 EPUB 文本成员后缀
+TEXT_MEMBER_SUFFIXES = ('.xhtml', '.html', '.opf', '.ncx')
+
+# 连续汉字串（按串匹配再累加长度，比逐字匹配快）
+_HAN_RUN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+# 内存缓存：来源标识 -> frozenset
+_traditional_chars_cache = {}
+
+
+def _find_ts_dictionary():
+    """在已安装的 OpenCC 包中查找 TSCharacters.txt，找不到返回 None。"""
+    try:
+        import opencc as opencc_module
+    except ImportError:
+        return None
+    for package_path in getattr(opencc_module, '__path__', []):
+        for root, _dirs, files in os.walk(package_path):
+            if TS_CHARACTERS_DICT in files:
+                return os.path.join(root, TS_CHARACTERS_DICT)
+    return None
+
+
+def _chars_from_dictionary(dict_path):
+    """从 TSCharacters.txt（每行: 繁体<TAB>简体 [简体...]）推导只在繁体中出现的字符。"""
+    traditional = set()
+    simplified = set()
+    with open(dict_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 2 or len(parts[0]) != 1:
+                continue
+            targets = parts[1:]
+            simplified.update(targets)
+            # 对照表里映射到自身的字（如"著"）在简体中同样合法，不算繁体专用字
+            if parts[0] not in targets:
+                traditional.add(parts[0])
+    return frozenset(traditional - simplified)
+
+
+def _chars_from_converter(cc):
+    """逐字转换 CJK 统一表意文字区推导繁体专用字（用换行分隔，避免触发词组转换）。"""
+    chars = [chr(code) for start, stop in PROBE_RANGES for code in range(start, stop + 1)]
+    converted = cc.convert('\n'.join(chars)).split('\n')
+    if len(converted) != len(chars):
+        # 转换器合并或拆分了行，退回逐字调用
+        converted = [cc.convert(ch) for ch in chars]
+    changed = {ch for ch, out in zip(chars, converted) if out != ch}
+    targets = {out for ch, out in zip(chars, converted) if out != ch}
+    return frozenset(changed - targets)
+
+
+def _converter_source(cc):
+    module = type(cc).__module__
+    try:
+        import opencc as opencc_module
+        version = getattr(opencc_module, '__version__', '')
+        module_file = getattr(opencc_module, '__file__', '') or ''
+    except ImportError:
+        version, module_file = '', ''
+    return f"probe:{module}.{type(cc).__name__}:{version}:{module_file}"
+
+
+def _load_cache(source):
+    cache_path = os.path.join(tempfile.gettempdir(), TC_CHARS_CACHE_FILENAME)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('version') == TC_CHARS_CACHE_VERSION and cached.get('source') == source:
+            return frozenset(cached['chars'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _save_cache(source, chars):
+    cache_path = os.path.join(tempfile.gettempdir(), TC_CHARS_CACHE_FILENAME)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': TC_CHARS_CACHE_VERSION, 'source': source, 'chars': ''.join(sorted(chars))},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[警告] 无法写入繁体字表缓存: {e}")
+
+
+def load_traditional_chars(cc=None):
+    """
+    返回只在繁体中文中出现的字符集合（frozenset）。
+    优先从 OpenCC 的 t2s 字典推导；没有文本字典时用转换器 cc 逐字探测（此时 cc 不能为 None）。
+    """
+    dict_path = _find_ts_dictionary()
+    if dict_path:
+        stat = os.stat(dict_path)
+        source = f"dict:{dict_path}:{stat.st_size}:{int(stat.st_mtime)}"
+    elif cc is not None:
+        source = _converter_source(cc)
+    else:
+        raise RuntimeError("找不到 OpenCC 的 t2s 字典，且未提供转换器，无法生成繁体字表。")
+
+    chars = _traditional_chars_cache.get(source)
+    if chars is None:
+        chars = _load_cache(source)
+        if chars is None:
+            chars = _chars_from_dictionary(dict_path) if dict_path else _chars_from_converter(cc)
+            _save_cache(source, chars)
+        _traditional_chars_cache[source] = chars
+    return chars
+
+
+def decode_text(data):
+    """按 UTF-8 解码成员内容，失败时按 GBK 解码并忽略无法识别的字节。"""
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('gbk', errors='ignore')
+
+
+class TcScanResult:
+    """一次扫描的结果：汉字数、繁体专用字数、是否因达到阈值提前停止。"""
+
+    __slots__ = ('han_chars', 'traditional_chars', 'stopped_early')
+
+    def __init__(self, han_chars=0, traditional_chars=0, stopped_early=False):
+        self.han_chars = han_chars
+        self.traditional_chars = traditional_chars
+        self.stopped_early = stopped_early
+
+    @property
+    def ratio(self):
+        """已扫描部分中繁体专用字占汉字的比例。"""
+        return self.traditional_chars / self.han_chars if self.han_chars else 0.0
+
+    @property
+    def needs_conversion(self):
+        return self.traditional_chars >= MIN_TRADITIONAL_HITS
+
+    def describe(self):
+        scope = "（已达到检测阈值，比例按已扫描部分计算）" if self.stopped_early else ""
+        return f"繁体字比例 {self.ratio:.2%}（{self.traditional_chars}/{self.han_chars}）{scope}"
+
+
+class TraditionalChineseDetector:
+    """基于繁体专用字集合的检测器，字符集合只推导一次，可在多个文件间复用。"""
+
+    def __init__(self, traditional_chars):
+        self.traditional_chars = frozenset(traditional_chars)
+        # str.translate 删除表：删除前后的长度差即块内繁体字数量
+        self._delete_table = dict.fromkeys(map(ord, self.traditional_chars))
+
+    @classmethod
+    def from_converter(cls, cc=None):
+        return cls(load_traditional_chars(cc))
+
+    def scan(self, texts, early_exit_hits=EARLY_EXIT_HITS):
+        """扫描可迭代的文本，繁体字数量达到 early_exit_hits 时提前结束。"""
+        result = TcScanResult()
+        for text in texts:
+            for start in range(0, len(text), SCAN_BLOCK_CHARS):
+                block = text[start:start + SCAN_BLOCK_CHARS]
+                result.han_chars += sum(map(len, _HAN_RUN_RE.findall(block)))
+                if self.traditional_chars.isdisjoint(block):
+                    continue
+                result.traditional_chars += len(block) - len(block.translate(self._delete_table))
+                if result.traditional_chars >= early_exit_hits:
+                    result.stopped_early = True
+                    return result
+        return result
+
+    def scan_epub(self, book, suffixes=TEXT_MEMBER_SUFFIXES, early_exit_hits=EARLY_EXIT_HITS):
+        """扫描 EpubRewriter 中的全部文本成员（按需逐个解压，提前结束时不再读取后续成员）。"""
+        def member_texts():
+            for name in book.names():
+                if name.endswith(suffixes):
+                    try:
+                        yield decode_text(book.read(name))
+                    except Exception:
+                        continue
+        return self.scan(member_texts(), early_exit_hits)
@@ -1,5 +1,6 @@
 import os
 import sys
+import multiprocessing
 import threading
 import time
 import socket
@@ -149,6 +150,10 @@ def on_closed():
 
 
 if __name__ == "__main__":
+    # In the frozen build, worker processes spawned by scripts (e.g. merge_pdfs --jobs)
+    # re-enter this entry point; let multiprocessing take over before any startup logic.
+    multiprocessing.freeze_support()
+
     # Check arguments for custom modes
     # Usage: ContentForge.exe run-script <script.py> [args]
     if len(sys.argv) > 1:
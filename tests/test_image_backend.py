@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""图片后端黄金图像测试：加速后端的缩放与编码结果须与 Pillow 后端等价。"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from backend.shared_utils import image_backend
+
+ACCELERATED_BACKENDS = [image_backend.BACKEND_OPENCV, image_backend.BACKEND_VIPS]
+TARGET_WIDTH = 600
+# JPEG 为有损编码，缩放结果的差异经过 JPEG 编解码后允许的平均误差
+JPEG_MEAN_TOLERANCE = image_backend.EQUIVALENCE_MEAN_TOLERANCE + 1.0
+
+
+def _require_backend(name):
+    # pyvips 在缺少 libvips 时抛出 OSError 而非 ImportError，因此以模块实际检测到的可用后端为准
+    if name not in image_backend.available_backends():
+        pytest.skip(f"图片后端 '{name}' 不可用")
+    return image_backend.get_image_backend(name)
+
+
+def _mean_diff(a, b):
+    return float(np.abs(np.asarray(a, dtype=np.int16) - np.asarray(b, dtype=np.int16)).mean())
+
+
+def _jpeg_roundtrip(img, quality=85):
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    buffer.seek(0)
+    with Image.open(buffer) as decoded:
+        decoded.load()
+        return decoded.copy()
+
+
+@pytest.fixture(scope="module")
+def golden_images():
+    return image_backend._golden_images()
+
+
+@pytest.mark.parametrize("backend_name", ACCELERATED_BACKENDS)
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_resize_matches_pillow(golden_images, backend_name, mode):
+    backend = _require_backend(backend_name)
+    golden = golden_images[mode]
+    size = (TARGET_WIDTH, golden.height * TARGET_WIDTH // golden.width)
+    expected = image_backend.get_image_backend(image_backend.BACKEND_PILLOW).resize(golden, size)
+    resized = backend.resize(golden, size)
+    assert resized.size == size
+    assert resized.mode == golden.mode
+    assert _mean_diff(resized, expected) <= image_backend.EQUIVALENCE_MEAN_TOLERANCE
+
+
+@pytest.mark.parametrize("backend_name", ACCELERATED_BACKENDS)
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_png_encode_is_lossless(tmp_path, golden_images, backend_name, mode):
+    backend = _require_backend(backend_name)
+    golden = golden_images[mode]
+    png_path = tmp_path / f"{backend_name}_{mode}.png"
+    backend.save_png(golden, str(png_path))
+    with Image.open(png_path) as decoded:
+        assert decoded.mode == golden.mode
+        assert np.array_equal(np.asarray(decoded), np.asarray(golden))
+
+
+@pytest.mark.parametrize("backend_name", ACCELERATED_BACKENDS)
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+def test_resized_jpeg_matches_pillow(golden_images, backend_name, mode):
+    """缩放后的页面以 JPEG 写入 PDF：经过 JPEG 编解码后与 Pillow 路径的平均误差仍在允许范围内。"""
+    backend = _require_backend(backend_name)
+    golden = golden_images[mode]
+    size = (TARGET_WIDTH, golden.height * TARGET_WIDTH // golden.width)
+    expected = _jpeg_roundtrip(image_backend.get_image_backend(image_backend.BACKEND_PILLOW).resize(golden, size))
+    actual = _jpeg_roundtrip(backend.resize(golden, size))
+    assert _mean_diff(actual, expected) <= JPEG_MEAN_TOLERANCE
+
+
+def test_verify_backend_equivalence_reports_all_available_backends(tmp_path):
+    results = image_backend.verify_backend_equivalence(target_width=TARGET_WIDTH, tmp_dir=str(tmp_path))
+    assert {row["backend"] for row in results} == set(image_backend.available_backends())
+    assert all(row["equivalent"] for row in results), results
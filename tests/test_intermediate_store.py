@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""中间格式不影响重打包分页：各中间格式生成的 PDF 页数与页高须与默认 PNG 片段（基线）一致。"""
+
+import os
+
+import numpy as np
+import pikepdf
+import pytest
+from PIL import Image
+
+from backend.comic_processing import image_processes_pipeline_v5 as pipeline
+from backend.shared_utils import intermediate_store
+
+WIDTH = 240
+SEGMENT_HEIGHTS = [180, 260, 140, 320, 200, 240, 160, 300, 220, 280]
+MAX_SIZE_MB = 0.08
+MAX_HEIGHT_PX = 1200
+
+
+def _make_segments():
+    """
+    生成压缩率各不相同的片段：上部为随机噪点，其余为平滑渐变（PNG 行过滤后压缩率远高于直接压缩原始数据），
+    使大小上限成为实际的分组条件，并能区分"默认 PNG 大小"与其他大小估算方式。
+    """
+    rng = np.random.default_rng(7)
+    segments = []
+    for index, height in enumerate(SEGMENT_HEIGHTS):
+        ys, xs = np.mgrid[0:height, 0:WIDTH]
+        pixels = np.stack([(xs * (index + 1)) % 256, (ys * 3 + xs) % 256, (xs + ys * (index + 2)) % 256], axis=2)
+        pixels = pixels.astype(np.uint8)
+        noisy_rows = height * (index % 3) // 6
+        pixels[:noisy_rows] = rng.integers(0, 256, size=(noisy_rows, WIDTH, 3), dtype=np.uint8)
+        segments.append(Image.fromarray(pixels))
+    return segments
+
+
+def _pdf_page_heights(pdf_path):
+    with pikepdf.open(pdf_path) as pdf:
+        return [float(page.mediabox[3]) - float(page.mediabox[1]) for page in pdf.pages]
+
+
+def _build_pdf(tmp_path, label, segments, save_segment, size_of):
+    split_dir = tmp_path / label / "split"
+    split_dir.mkdir(parents=True)
+    paths = [save_segment(segment, str(split_dir), f"page_split_part_{index}") for index, segment in enumerate(segments, 1)]
+    original_size_estimate = pipeline.intermediate_size_estimate
+    pipeline.intermediate_size_estimate = size_of
+    try:
+        repacked = pipeline.repack_split_images(paths, str(tmp_path / label / "repack"), "page", MAX_SIZE_MB, MAX_HEIGHT_PX)
+    finally:
+        pipeline.intermediate_size_estimate = original_size_estimate
+    pdf_path = pipeline.create_pdf_from_images(repacked, str(tmp_path / label), "out.pdf", gray_cache={})
+    return _pdf_page_heights(pdf_path)
+
+
+def _save_default_png(segment, output_dir, stem):
+    path = os.path.join(output_dir, stem + ".png")
+    segment.save(path, "PNG")
+    return path
+
+
+@pytest.mark.parametrize("intermediate_format", sorted(intermediate_store.INTERMEDIATE_EXTENSIONS))
+def test_pdf_pages_match_png_baseline(tmp_path, monkeypatch, intermediate_format):
+    segments = _make_segments()
+    # 基线：引入中间格式之前的行为，片段保存为默认压缩级别的 PNG，大小上限按文件大小计算
+    monkeypatch.setattr(pipeline, "INTERMEDIATE_FORMAT", intermediate_store.INTERMEDIATE_FORMAT_PNG_FAST)
+    baseline = _build_pdf(tmp_path, "baseline", segments, _save_default_png, os.path.getsize)
+
+    monkeypatch.setattr(pipeline, "INTERMEDIATE_FORMAT", intermediate_format)
+    heights = _build_pdf(
+        tmp_path, intermediate_format, segments,
+        lambda segment, output_dir, stem: intermediate_store.save_intermediate(segment, output_dir, stem, intermediate_format),
+        intermediate_store.intermediate_size_estimate,
+    )
+
+    assert 1 < len(baseline) < len(SEGMENT_HEIGHTS)
+    assert heights == baseline
+
+
+def test_reference_png_size_matches_default_png_file(tmp_path):
+    segment = _make_segments()[3]
+    path = tmp_path / "segment.png"
+    segment.save(path, "PNG")
+    assert intermediate_store.reference_png_size(segment) == path.stat().st_size
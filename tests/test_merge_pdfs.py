@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""merge_pdfs 去重候选收集与去重的测试。"""
+
+import pikepdf
+
+from backend.comic_processing import merge_pdfs
+
+ICC_DATA = b"fake-icc-profile" * 64
+
+
+def _build_pdf_with_direct_icc_arrays(image_count=2):
+    """构造若干页面，每页一张图片，图片的 /ColorSpace 是直接写在图片字典中的 [/ICCBased 流] 数组。"""
+    pdf = pikepdf.new()
+    for index in range(image_count):
+        # 每张图片各自带一份内容相同的 ICC 流（合并多个源 PDF 后的典型情况）
+        icc = pdf.make_stream(ICC_DATA, N=3)
+        image = pdf.make_stream(bytes([index]) * 3, Type=pikepdf.Name.XObject, Subtype=pikepdf.Name.Image,
+                                Width=1, Height=1, BitsPerComponent=8,
+                                ColorSpace=pikepdf.Array([pikepdf.Name.ICCBased, icc]))
+        page = pikepdf.Dictionary(Type=pikepdf.Name.Page, MediaBox=[0, 0, 10, 10],
+                                  Resources=pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=image)))
+        pdf.pages.append(pikepdf.Page(page))
+    return pdf
+
+
+def _icc_objgens(pdf):
+    return {objgen for objgen, kind in merge_pdfs._collect_dedupe_candidates(pdf).items() if kind == "icc"}
+
+
+def _image_icc_objgens(pdf):
+    return {page.Resources.XObject.Im0.ColorSpace[1].objgen for page in pdf.pages}
+
+
+def test_collects_icc_from_direct_image_colorspace_array():
+    pdf = _build_pdf_with_direct_icc_arrays()
+    assert _icc_objgens(pdf) == _image_icc_objgens(pdf)
+    assert len(_icc_objgens(pdf)) == 2
+
+
+def test_collects_icc_from_resource_colorspace_dict_and_indexed_base():
+    pdf = pikepdf.new()
+    icc_direct = pdf.make_stream(ICC_DATA, N=3)
+    icc_indexed = pdf.make_stream(ICC_DATA + b"indexed", N=3)
+    color_spaces = pikepdf.Dictionary(
+        CS0=pikepdf.Array([pikepdf.Name.ICCBased, icc_direct]),
+        CS1=pikepdf.Array([pikepdf.Name.Indexed, pikepdf.Array([pikepdf.Name.ICCBased, icc_indexed]), 1,
+                           pikepdf.String(b"\x00" * 6)]),
+    )
+    page = pikepdf.Dictionary(Type=pikepdf.Name.Page, MediaBox=[0, 0, 10, 10],
+                              Resources=pikepdf.Dictionary(ColorSpace=color_spaces))
+    pdf.pages.append(pikepdf.Page(page))
+    assert _icc_objgens(pdf) == {icc_direct.objgen, icc_indexed.objgen}
+
+
+def test_deduplicates_identical_icc_streams_in_direct_arrays():
+    pdf = _build_pdf_with_direct_icc_arrays(image_count=3)
+    merge_pdfs.deduplicate_streams(pdf)
+    assert len(_image_icc_objgens(pdf)) == 1
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""灰度页面检测：带有小面积彩色内容的页面不能被判定为灰度。"""
+
+import numpy as np
+from PIL import Image
+
+from backend.shared_utils.page_color import is_effectively_grayscale
+
+
+def _gray_page(height=1200, width=800, seed=3):
+    """带轻微色度噪声（低于通道差值阈值）的灰度页面。"""
+    rng = np.random.default_rng(seed)
+    gray = rng.integers(0, 256, size=(height, width, 1), dtype=np.int16)
+    noise = rng.integers(-4, 5, size=(height, width, 3), dtype=np.int16)
+    return np.clip(gray + noise, 0, 255).astype(np.uint8)
+
+
+def test_gray_page_with_chroma_noise_is_grayscale():
+    assert is_effectively_grayscale(Image.fromarray(_gray_page()))
+
+
+def test_small_color_patch_keeps_page_in_color():
+    pixels = _gray_page()
+    # 约占页面 0.04% 的红色印章
+    pixels[600:620, 400:420] = (220, 30, 30)
+    assert not is_effectively_grayscale(Image.fromarray(pixels))
+
+
+def test_outlier_tolerance_is_opt_in():
+    pixels = _gray_page()
+    pixels[600:620, 400:420] = (220, 30, 30)
+    assert is_effectively_grayscale(Image.fromarray(pixels), max_outlier_ratio=0.001)
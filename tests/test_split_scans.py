@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""V2 纯色行检测与 V4 主色调查找的向量化实现须与原逐像素实现给出完全相同的结果。"""
+
+import math
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from backend.comic_processing import image_processes_pipeline_v5 as pipeline
+
+
+# --- 原逐像素实现（作为参照） ---
+
+def _are_colors_close(color1, color2, tolerance):
+    if tolerance == 0:
+        return color1 == color2
+    r1, g1, b1 = color1
+    r2, g2, b2 = color2
+    return math.sqrt((r1 - r2) ** 2 + (g1 - g2) ** 2 + (b1 - b2) ** 2) <= tolerance
+
+
+def _is_solid_color_row(pixels, y, width, solid_colors_list, tolerance):
+    if width == 0:
+        return False
+    first_pixel_rgb = pixels[0, y][:3]
+    if not any(_are_colors_close(first_pixel_rgb, base_color, tolerance) for base_color in solid_colors_list):
+        return False
+    return all(_are_colors_close(pixels[x, y][:3], first_pixel_rgb, tolerance) for x in range(1, width))
+
+
+def _dominant_color_reference(pixels_quantized):
+    if pixels_quantized.size == 0:
+        return None, 0
+    unique_colors, counts = np.unique(pixels_quantized.reshape(-1, 3), axis=0, return_counts=True)
+    return tuple(unique_colors[np.argmax(counts)]), len(unique_colors)
+
+
+# --- 测试数据 ---
+
+def _banded_image(seed, mode, height=700, width=90):
+    """由纯色带（接近配置的背景色，带容差边界附近的抖动）与随机内容交替组成的长图。"""
+    rng = np.random.default_rng(seed)
+    band_colors = np.array([color[:3] for color in pipeline.SPLIT_BAND_COLORS_RGB], dtype=np.int32)
+    pixels = np.empty((height, width, 3), dtype=np.int32)
+    y = 0
+    while y < height:
+        band_height = min(int(rng.integers(5, 60)), height - y)
+        if rng.random() < 0.5:
+            base = band_colors[rng.integers(len(band_colors))]
+            # 一半的行加上跨越容差的抖动：这些行有的仍是纯色带，有的刚好超出
+            jitter = rng.integers(-30, 31, size=(band_height, width, 3))
+            pixels[y:y + band_height] = base + jitter * (rng.random((band_height, 1, 1)) < 0.5)
+        else:
+            pixels[y:y + band_height] = rng.integers(0, 256, size=(band_height, width, 3))
+        y += band_height
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    img = Image.fromarray(pixels)
+    return img.convert(mode) if mode != "RGB" else img
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+@pytest.mark.parametrize("tolerance", [0, pipeline.COLOR_MATCH_TOLERANCE])
+def test_solid_rows_match_per_pixel_scan(seed, mode, tolerance):
+    img = _banded_image(seed, mode)
+    pixels = img.load()
+    expected = [_is_solid_color_row(pixels, y, img.width, pipeline.SPLIT_BAND_COLORS_RGB, tolerance) for y in range(img.height)]
+    # 小的行块大小同时覆盖跨块边界的情况
+    actual = pipeline.find_solid_color_rows(img, pipeline.SPLIT_BAND_COLORS_RGB, tolerance, block_rows=64)
+    assert actual.tolist() == expected
+    assert any(expected) and not all(expected)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_dominant_color_matches_row_unique(seed):
+    rng = np.random.default_rng(seed)
+    factor = pipeline.QUANTIZATION_FACTOR
+    # 颜色种类少时容易出现计数并列，检查并列时选出的颜色也一致
+    levels = rng.integers(0, 256 // factor, size=int(rng.integers(2, 6))) * factor
+    quantized = rng.choice(levels, size=(int(rng.integers(1, 40)), 3)).astype(np.uint8)
+    expected_color, expected_count = _dominant_color_reference(quantized)
+    actual_color, actual_count = pipeline.get_dominant_color_numpy(quantized)
+    assert actual_count == expected_count
+    assert actual_color == expected_color
+    assert [value.dtype for value in actual_color] == [value.dtype for value in expected_color]
+
+
+def test_dominant_color_of_empty_block():
+    assert pipeline.get_dominant_color_numpy(np.empty((0, 3), dtype=np.uint8)) == (None, 0)